@@ -8,6 +8,11 @@ const mongoSanitize = require('express-mongo-sanitize');
 const hpp = require('hpp');
 require('dotenv').config({ path: path.join(__dirname, '.env') });
 
+// Spans de consultas y llamadas HTTP: el plugin de Mongoose debe registrarse
+// antes de que las rutas compilen los modelos
+const telemetry = require('./services/telemetryService');
+telemetry.instrument({ mongoose, axios: require('axios') });
+
 const app = express();
 
 // ==================== SEGURIDAD ====================
@@ -21,7 +26,7 @@ app.use(helmet({
 // Rate Limiting - Limitar peticiones por IP (DESARROLLO: límites altos)
 const limiter = rateLimit({
   windowMs: 15 * 60 * 1000, // 15 minutos
-  max: 1000, // Máximo 1000 peticiones por ventana (desarrollo)
+  max: parseInt(process.env.API_RATE_LIMIT_MAX, 10) || 1000, // Peticiones por ventana (desarrollo: 1000; pruebas de carga: más)
   message: 'Demasiadas peticiones desde esta IP, por favor intenta más tarde.',
   standardHeaders: true,
   legacyHeaders: false
@@ -80,6 +85,7 @@ const authRouter = require('./routes/auth');
 const usersRouter = require('./routes/user');
 const uploadRouter = require('./routes/upload');
 const analyzeRouter = require('./routes/analyze');
+const batchRouter = require('./routes/batch');
 const analysisRouter = require('./routes/analysis');
 const reportRouter = require('./routes/report');
 const adminRouter = require('./routes/admin');
@@ -92,6 +98,7 @@ const libraryRouter = require('./routes/library');
 const siteConfigRouter = require('./routes/siteconfig');
 const testRouter = require('./routes/test');
 const categoriesRouter = require('./routes/categories');
+const metricsRouter = require('./routes/metrics');
 
 app.use('/api/auth', authRouter);
 app.use('/api/users', usersRouter);
@@ -99,6 +106,7 @@ app.use('/api/user', usersRouter); // Alias para endpoints sin autenticación
 app.use('/api/siteconfig', siteConfigRouter);
 app.use('/api/uploads', uploadRouter);
 app.use('/api/analyze', analyzeRouter);
+app.use('/api/batch', batchRouter); // Importación masiva (ZIP o varios archivos)
 app.use('/api/analysis', analysisRouter); // NUEVO: Análisis públicos para WordPress
 app.use('/api/reports', reportRouter);
 app.use('/api/admin', adminRouter);
@@ -111,6 +119,9 @@ app.use('/api/library', libraryRouter);
 app.use('/api/categories', categoriesRouter);
 app.use('/api/test', testRouter); // NUEVO: Endpoints de prueba para OpenCV + Llama
 
+// Métricas para Prometheus (fuera de /api: sin rate limit)
+app.use('/metrics', metricsRouter);
+
 // Servir archivos estáticos de training
 app.use('/uploads/training', express.static(path.join(__dirname, 'uploads/training')));
 
@@ -141,7 +152,29 @@ mongoose.connect(mongoUri, {
   useNewUrlParser: true,
   useUnifiedTopology: true
 })
-  .then(() => console.log('Conectado a MongoDB'))
+  .then(() => {
+    console.log('Conectado a MongoDB');
+    // Iniciar la cola durable de análisis (recupera trabajos interrumpidos)
+    require('./services/analysisQueueService').start();
+    // Lotes cuya expansión de ZIP se interrumpió
+    require('./services/batchService').start();
+    // Estadísticas precalculadas de los paneles (reconciliación periódica)
+    require('./services/statsService').start();
+    // Índice residente del catálogo de referencia para el matching
+    const ufoFeatureIndex = require('./services/ufoFeatureIndexService');
+    ufoFeatureIndex.ensureLoaded()
+      .then(() => ufoFeatureIndex.watch())
+      .catch(err => console.error('⚠️ Error cargando índice del catálogo:', err.message));
+
+    const trainingVectorIndex = require('./services/trainingVectorIndexService');
+    trainingVectorIndex.ensureLoaded()
+      .then(() => trainingVectorIndex.watch())
+      .catch(err => console.error('⚠️ Error cargando índice vectorial de training:', err.message));
+
+    // Hashes perceptuales del histórico (re-subidas y fraudes conocidos)
+    require('./services/perceptualHashIndexService').ensureLoaded()
+      .catch(err => console.error('⚠️ Error cargando índice de hashes perceptuales:', err.message));
+  })
   .catch((error) => {
     console.error('Error conectando a MongoDB:', error);
     process.exit(1);
@@ -165,17 +198,11 @@ const io = new Server(server, {
   }
 });
 
-// Configurar Socket.IO
-io.on('connection', (socket) => {
-  console.log('Cliente conectado:', socket.id);
-
-  socket.on('disconnect', () => {
-    console.log('Cliente desconectado:', socket.id);
-  });
-});
-
-// Hacer io accesible globalmente
-global.io = io;
+// Configurar Socket.IO: salas por análisis/lote/usuario con suscripción
+// autenticada (también deja io accesible globalmente)
+const WebSocketService = require('./services/websocketService');
+WebSocketService.attach(io)
+  .catch(err => console.error('⚠️ Error configurando Socket.IO:', err.message));
 
 server.listen(PORT, '0.0.0.0', () => {
   console.log(`Servidor iniciado en puerto ${PORT}`);
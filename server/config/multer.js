@@ -1,6 +1,7 @@
 const multer = require('multer');
 const path = require('path');
 const fs = require('fs');
+const ingestService = require('../services/ingestService');
 
 // Crear directorios si no existen
 const uploadsDir = path.join(__dirname, '..', 'uploads');
@@ -13,8 +14,9 @@ const videosDir = path.join(uploadsDir, 'videos');
   }
 });
 
-// Configuración de almacenamiento
-const storage = multer.diskStorage({
+// Configuración de almacenamiento: escritura en streaming con hash,
+// EXIF y derivadas de resolución fija (services/ingestService.js)
+const storage = ingestService.storage({
   destination: (req, file, cb) => {
     // Determinar carpeta según tipo de archivo
     const fileType = file.mimetype.split('/')[0];
@@ -30,6 +30,24 @@ const analysisSchema = new mongoose.Schema({
     type: Date,
     default: Date.now
   },
+
+  // Ingesta en streaming (services/ingestService.js): hash del original,
+  // metadatos y derivadas crudas por resolución que consume el pipeline
+  ingest: {
+    sha256: String,
+    headerBytes: Number,
+    metadata: mongoose.Schema.Types.Mixed,
+    derivatives: [{
+      _id: false,
+      maxSize: Number,
+      width: Number,
+      height: Number,
+      channels: Number,
+      path: String
+    }],
+    durationMs: Number,
+    ingestedAt: Date
+  },
   
   // Datos EXIF (EXPANDIDO - Compatible con ExifTool)
   exifData: {
@@ -532,6 +550,102 @@ const analysisSchema = new mongoose.Schema({
     summary: String
   },
   
+  // Análisis de vídeo (services/videoAnalysisService.js): fotogramas clave
+  // analizados con las capas de imagen y agregación temporal
+  videoAnalysis: {
+    durationSec: Number,
+    analyzedSec: Number,   // Segundos decodificados (VIDEO_MAX_SECONDS)
+    truncated: Boolean,
+    width: Number,
+    height: Number,
+    fps: Number,
+    codec: String,
+    sampleFps: Number,
+    sampledFrames: Number,
+    keyframes: [{
+      _id: false,
+      index: Number,
+      time: Number,        // Segundo del vídeo
+      sceneScore: Number,  // Cambio respecto al fotograma clave anterior (0-1)
+      path: String,
+      category: String,
+      confidence: Number,
+      objectId: mongoose.Schema.Types.ObjectId,
+      matchPercentage: Number,
+      error: String
+    }],
+    representativeFrame: Number, // Índice en keyframes del que salen los resultados principales
+    trajectory: {
+      detectedRatio: Number,
+      pathLength: Number,
+      displacement: Number,
+      straightness: Number,
+      meanSpeed: Number,   // Anchos de imagen por segundo
+      maxSpeed: Number,
+      directionChanges: Number,
+      points: [{ _id: false, t: Number, x: Number, y: Number }]
+    },
+    brightness: {
+      min: Number,
+      max: Number,
+      mean: Number,
+      flickerIndex: Number,
+      blinkCount: Number,
+      curve: [{ _id: false, t: Number, mean: Number, peak: Number }]
+    },
+    stability: {
+      framesAnalyzed: Number,
+      category: String,
+      categoryAgreement: Number,
+      objectId: String,
+      objectAgreement: Number
+    },
+    processingMs: Number
+  },
+
+  // Coincidencias con análisis anteriores por hash perceptual
+  // (services/perceptualHashIndexService.js), calculadas antes de las capas
+  duplicateCheck: {
+    checkedAt: Date,
+    maxDistance: Number,
+    isRepost: Boolean,    // Hay análisis anteriores de (casi) la misma imagen
+    knownHoax: Boolean,   // Alguno de ellos se clasificó como fraude
+    matches: [{
+      _id: false,
+      analysisId: {
+        type: mongoose.Schema.Types.ObjectId,
+        ref: 'Analysis'
+      },
+      distance: Number,   // Bits distintos (Hamming, de 64)
+      similarity: Number, // 0-100
+      category: String,
+      isHoax: Boolean
+    }]
+  },
+
+  // Cargas pesadas guardadas aparte (services/analysisPayloadService.js):
+  // lo que los listados necesitan saber de ellas sin cargarlas
+  payload: {
+    storedAt: Date,
+    matchCount: Number // Longitud de matchResults
+  },
+
+  // Entradas de las capas de puntuación (características, embeddings,
+  // análisis previo a la fusión) para re-puntuar sin repetir el análisis
+  // (services/rescoringService.js). Se guarda aparte, con las cargas pesadas
+  scoringInputs: mongoose.Schema.Types.Mixed,
+
+  // Revisiones de catálogo, training, fenómenos y pesos con las que se
+  // puntuó por última vez; si alguna cambia, el veredicto está desfasado
+  scoring: {
+    catalogRevision: String,
+    trainingRevision: String,
+    phenomenaRevision: String,
+    confidenceVersion: Number,
+    scoredAt: Date,
+    rescoredAt: Date
+  },
+
   // Estado del análisis
   status: {
     type: String,
@@ -539,6 +653,27 @@ const analysisSchema = new mongoose.Schema({
     default: 'pending'
   },
   errorMessage: String,
+
+  // Resumen de tiempos del último análisis (services/telemetryService.js):
+  // spans agregados por tipo (layer, task, db, http) y nombre
+  timings: {
+    totalMs: Number,
+    cpuMs: Number,
+    decodedBytes: Number,
+    spans: [{
+      _id: false,
+      kind: String,
+      name: String,
+      count: Number,
+      ms: Number,
+      cpuMs: Number,
+      bytes: Number,
+      memKb: Number,
+      errors: Number,
+      status: String
+    }],
+    recordedAt: Date
+  },
   
   // Metadata adicional
   isPublic: {
@@ -550,6 +685,13 @@ const analysisSchema = new mongoose.Schema({
     default: 0
   },
   
+  // Lote de importación masiva al que pertenece (routes/batch.js)
+  batchId: {
+    type: mongoose.Schema.Types.ObjectId,
+    ref: 'AnalysisBatch',
+    default: null
+  },
+
   // NUEVO: Indicadores de uso para training
   usedForTraining: {
     type: Boolean,
@@ -576,5 +718,147 @@ const analysisSchema = new mongoose.Schema({
 analysisSchema.index({ userId: 1, createdAt: -1 });
 analysisSchema.index({ status: 1 });
 analysisSchema.index({ 'bestMatch.category': 1 });
+analysisSchema.index({ batchId: 1, status: 1 }, { partialFilterExpression: { batchId: { $type: 'objectId' } } });
+
+// Mantener los rollups de estadísticas (statsService): cada alta, cambio de
+// estado/categoría o borrado aplica su diferencia con $inc.
+// require diferido para evitar la dependencia circular modelo <-> servicio.
+const statsService = () => require('../services/statsService');
+
+const statsState = (doc) => ({ status: doc.status, category: doc.aiAnalysis?.category || null });
+
+analysisSchema.post('init', function(doc) {
+  if (doc.isSelected('status') && doc.isSelected('aiAnalysis')) {
+    doc.$locals.statsState = statsState(doc);
+  }
+});
+
+analysisSchema.pre('save', function(next) {
+  if (this.isNew || this.isModified('status') || this.isModified('aiAnalysis')) {
+    this.$locals.statsBefore = this.isNew ? null : this.$locals.statsState;
+    this.$locals.statsChanged = true;
+  }
+  next();
+});
+
+analysisSchema.post('save', function(doc) {
+  if (!doc.$locals.statsChanged) return;
+
+  const before = doc.$locals.statsBefore;
+  const after = statsState(doc);
+  doc.$locals.statsChanged = false;
+  doc.$locals.statsState = after;
+
+  // Documento cargado con proyección parcial: estado anterior desconocido
+  if (before === undefined) {
+    statsService().markDirty();
+    return;
+  }
+  statsService().recordAnalysisChange(before, after, doc);
+});
+
+analysisSchema.post('findOneAndDelete', function(doc) {
+  if (doc) statsService().recordAnalysisChange(statsState(doc), null, doc);
+});
+
+// Archivos generados a partir del original (derivadas de la ingesta y
+// fotogramas clave de los vídeos): se borran con el análisis, lo elimine quien
+// lo elimine (rutas de usuario o de administración)
+const ingestService = () => require('../services/ingestService');
+const videoAnalysisService = () => require('../services/videoAnalysisService');
+
+/**
+ * Borrar los archivos generados de un análisis (deleteMany no pasa por los
+ * hooks: quien lo use llama a esto con los documentos borrados)
+ * @param {Object} doc - Análisis con ingest, fileType y filePath
+ */
+analysisSchema.statics.removeFiles = function(doc) {
+  return Promise.all([
+    ingestService().removeDerivatives(doc.ingest),
+    doc.fileType === 'video' && doc.filePath ? videoAnalysisService().removeFrames(doc) : null
+  ]);
+};
+
+const removeAnalysisFiles = (model, doc) => {
+  model.removeFiles(doc)
+    .catch(error => console.error('Error al borrar los archivos generados del análisis:', error.message));
+};
+
+analysisSchema.post('findOneAndDelete', function(doc) {
+  if (doc) removeAnalysisFiles(this.model, doc);
+});
+
+analysisSchema.post('deleteOne', { document: true, query: false }, function(doc) {
+  removeAnalysisFiles(doc.constructor, doc);
+});
+
+// Escrituras por consulta (sin el documento anterior): reconciliar en breve
+analysisSchema.post(['updateOne', 'updateMany', 'deleteOne', 'deleteMany'], { document: false, query: true }, function() {
+  const update = this.getUpdate?.() || {};
+  if (this.op === 'deleteOne' || this.op === 'deleteMany' || 'status' in (update.$set || update) || update.$set?.['aiAnalysis.category']) {
+    statsService().markDirty();
+  }
+});
+
+// Índice de hashes perceptuales (perceptualHashIndexService)
+const perceptualHashIndex = () => require('../services/perceptualHashIndexService');
+
+analysisSchema.pre('save', function(next) {
+  this.$locals.phashChanged = this.isNew ||
+    ['visualAnalysis', 'status', 'aiAnalysis', 'isPublic'].some(path => this.isModified(path));
+  next();
+});
+
+analysisSchema.post('save', function(doc) {
+  if (doc.$locals.phashChanged) perceptualHashIndex().upsert(doc);
+});
+
+analysisSchema.post('findOneAndDelete', function(doc) {
+  if (doc) perceptualHashIndex().remove(doc._id);
+});
+
+analysisSchema.post(['updateOne', 'updateMany', 'deleteOne', 'deleteMany'], { document: false, query: true }, function() {
+  const update = this.getUpdate?.() || {};
+  const fields = Object.keys(update.$set || update);
+  if (this.op === 'deleteOne' || this.op === 'deleteMany' ||
+      fields.some(field => /^(visualAnalysis|aiAnalysis|isPublic)/.test(field))) {
+    perceptualHashIndex().scheduleReload();
+  }
+});
+
+// Cargas pesadas por capa en la colección AnalysisPayload
+// (analysisPayloadService): fuera del documento al guardar, de vuelta en
+// memoria después
+const analysisPayloads = () => require('../services/analysisPayloadService');
+
+analysisSchema.pre('save', async function() {
+  await analysisPayloads().detach(this);
+});
+
+analysisSchema.post('save', function(doc) {
+  analysisPayloads().restore(doc);
+});
+
+analysisSchema.post('save', function(error, doc, next) {
+  analysisPayloads().restore(this);
+  next(error);
+});
+
+analysisSchema.post('findOneAndDelete', function(doc) {
+  if (!doc) return;
+  analysisPayloads().remove([doc._id])
+    .catch(error => console.error('Error al borrar cargas del análisis:', error.message));
+});
+
+// Borrados por consulta: recoger los _id antes de que desaparezcan
+analysisSchema.pre(['deleteOne', 'deleteMany'], { document: false, query: true }, async function() {
+  this._payloadIds = await this.model.find(this.getFilter()).distinct('_id');
+});
+
+analysisSchema.post(['deleteOne', 'deleteMany'], { document: false, query: true }, function() {
+  if (!this._payloadIds?.length) return;
+  analysisPayloads().remove(this._payloadIds)
+    .catch(error => console.error('Error al borrar cargas de análisis:', error.message));
+});
 
 module.exports = mongoose.model('Analysis', analysisSchema);
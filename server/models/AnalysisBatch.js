@@ -0,0 +1,88 @@
+const mongoose = require('mongoose');
+
+/**
+ * Lote de análisis (importación masiva de un caso)
+ *
+ * Agrupa los Analysis creados a partir de un ZIP o de una subida de varios
+ * archivos. BatchService expande las fuentes, encola cada imagen en el
+ * carril 'batch' y recalcula el progreso a partir de los Analysis del lote.
+ */
+const analysisBatchSchema = new mongoose.Schema({
+  userId: {
+    type: mongoose.Schema.Types.ObjectId,
+    ref: 'User',
+    required: true,
+    index: true
+  },
+  name: {
+    type: String,
+    default: null
+  },
+
+  // extracting: expandiendo fuentes; processing: todas las imágenes encoladas
+  status: {
+    type: String,
+    enum: ['extracting', 'processing', 'completed', 'failed'],
+    default: 'extracting'
+  },
+
+  // Archivos recibidos (imágenes sueltas o ZIP)
+  sources: [{
+    _id: false,
+    fileName: String,
+    type: {
+      type: String,
+      enum: ['image', 'zip']
+    },
+    entries: Number
+  }],
+
+  // Imágenes del lote (se conoce al listar los ZIP, antes de extraerlos)
+  total: {
+    type: Number,
+    default: 0
+  },
+
+  // Progreso por estado de los Analysis del lote
+  counts: {
+    pending: { type: Number, default: 0 },
+    analyzing: { type: Number, default: 0 },
+    completed: { type: Number, default: 0 },
+    error: { type: Number, default: 0 }
+  },
+
+  // Entradas descartadas (no imagen, demasiado grandes, corruptas...)
+  skipped: [{
+    _id: false,
+    fileName: String,
+    reason: String
+  }],
+
+  summary: mongoose.Schema.Types.Mixed,
+  errorMessage: String,
+
+  // Archivos recibidos en disco (con sus derivadas), para limpiarlos si la
+  // expansión se interrumpe; no se devuelve en las consultas
+  uploads: {
+    type: [{
+      _id: false,
+      path: String,
+      derivatives: [String]
+    }],
+    select: false
+  },
+  // Latido de la expansión: un lote en 'extracting' sin latido reciente quedó
+  // huérfano (reinicio del proceso) y lo cierra BatchService.recoverStaleBatches
+  heartbeatAt: Date,
+
+  startedAt: Date,
+  finishedAt: Date
+}, {
+  timestamps: true
+});
+
+analysisBatchSchema.index({ userId: 1, createdAt: -1 });
+// Recuperación de expansiones interrumpidas
+analysisBatchSchema.index({ status: 1, heartbeatAt: 1 });
+
+module.exports = mongoose.model('AnalysisBatch', analysisBatchSchema);
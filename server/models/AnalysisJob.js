@@ -0,0 +1,92 @@
+const mongoose = require('mongoose');
+
+/**
+ * Trabajo de análisis en cola (persistente en MongoDB)
+ *
+ * Cada POST /api/analyze/:id crea un trabajo en lugar de lanzar el pipeline
+ * directamente. AnalysisQueueService los reclama de forma atómica según
+ * prioridad, los reintenta con backoff y recupera los que quedaron en
+ * 'processing' si el proceso se cayó.
+ */
+const analysisJobSchema = new mongoose.Schema({
+  analysisId: {
+    type: mongoose.Schema.Types.ObjectId,
+    ref: 'Analysis',
+    required: true,
+    index: true
+  },
+  userId: {
+    type: mongoose.Schema.Types.ObjectId,
+    ref: 'User',
+    default: null
+  },
+
+  // Carril de prioridad: re-análisis de administradores antes que subidas de
+  // usuarios, e importaciones masivas (lotes) detrás de ambos
+  lane: {
+    type: String,
+    enum: ['admin', 'user', 'batch'],
+    default: 'user'
+  },
+  priority: {
+    type: Number,
+    default: 0
+  },
+
+  status: {
+    type: String,
+    enum: ['queued', 'processing', 'completed', 'failed'],
+    default: 'queued'
+  },
+
+  // Reintentos
+  attempts: {
+    type: Number,
+    default: 0
+  },
+  maxAttempts: {
+    type: Number,
+    default: 3
+  },
+  runAt: {
+    type: Date,
+    default: Date.now
+  },
+  lastError: {
+    type: String,
+    default: null
+  },
+
+  // Bloqueo del worker que lo procesa (latido periódico en lockedAt)
+  lockedBy: {
+    type: String,
+    default: null
+  },
+  lockedAt: {
+    type: Date,
+    default: null
+  },
+
+  // Tiempos para métricas de latencia
+  startedAt: Date,
+  finishedAt: Date
+}, {
+  timestamps: true
+});
+
+// Reclamo del siguiente trabajo: estado + prioridad + antigüedad
+analysisJobSchema.index({ status: 1, priority: -1, runAt: 1 });
+// Recuperación de trabajos con bloqueo vencido
+analysisJobSchema.index({ status: 1, lockedAt: 1 });
+// Como mucho un trabajo pendiente por análisis (dos peticiones simultáneas
+// no pueden encolarlo dos veces)
+analysisJobSchema.index(
+  { analysisId: 1 },
+  {
+    name: 'analysisId_pending_unique',
+    unique: true,
+    partialFilterExpression: { status: { $in: ['queued', 'processing'] } }
+  }
+);
+
+module.exports = mongoose.model('AnalysisJob', analysisJobSchema);
@@ -0,0 +1,34 @@
+const mongoose = require('mongoose');
+
+/**
+ * Cargas pesadas de un análisis, separadas del documento Analysis
+ *
+ * Analysis queda como resumen compacto (lo que leen los listados, el estado y
+ * las estadísticas) y los subárboles grandes de cada capa viven aquí, uno por
+ * clave, serializados en BSON y comprimidos. AnalysisPayloadService los
+ * escribe al guardar el análisis y los carga solo cuando se piden.
+ */
+const analysisPayloadSchema = new mongoose.Schema({
+  analysisId: {
+    type: mongoose.Schema.Types.ObjectId,
+    ref: 'Analysis',
+    required: true,
+    unique: true
+  },
+
+  // clave de carga -> Buffer (BSON + gzip); claves en analysisPayloadService
+  layers: {
+    type: mongoose.Schema.Types.Mixed,
+    default: {}
+  },
+  // clave de carga -> bytes sin comprimir
+  sizes: {
+    type: mongoose.Schema.Types.Mixed,
+    default: {}
+  }
+}, {
+  timestamps: true,
+  minimize: false
+});
+
+module.exports = mongoose.model('AnalysisPayload', analysisPayloadSchema);
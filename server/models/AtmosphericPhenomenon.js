@@ -149,4 +149,22 @@ atmosphericPhenomenonSchema.statics.findByConditions = function(conditions) {
   return this.find(query).sort({ reportFrequency: -1 });
 };
 
+// Rollup de estadísticas de la biblioteca (statsService), caché del catálogo
+// público (libraryCatalogService) y modelo compilado de la comparación
+// atmosférica (atmosphericComparisonService).
+// require diferido para evitar la dependencia circular modelo <-> servicio.
+const statsService = () => require('../services/statsService');
+const libraryCatalog = () => require('../services/libraryCatalogService');
+const atmosphericComparison = () => require('../services/atmosphericComparisonService');
+
+function libraryChanged() {
+  statsService().libraryChanged();
+  libraryCatalog().invalidate();
+  atmosphericComparison().invalidate();
+}
+
+atmosphericPhenomenonSchema.post('save', libraryChanged);
+atmosphericPhenomenonSchema.post('insertMany', libraryChanged);
+atmosphericPhenomenonSchema.post(['findOneAndUpdate', 'findOneAndDelete', 'updateOne', 'updateMany', 'deleteOne', 'deleteMany'], { document: false, query: true }, libraryChanged);
+
 module.exports = mongoose.model('AtmosphericPhenomenon', atmosphericPhenomenonSchema);
@@ -0,0 +1,67 @@
+const mongoose = require('mongoose');
+
+/**
+ * Entrada persistente de la caché de capas de análisis
+ *
+ * Guarda el resultado de una capa (JSON comprimido) direccionado por el
+ * contenido de la imagen. LayerCacheService la usa como segundo nivel detrás
+ * de su LRU en memoria, de modo que los resultados sobreviven a reinicios y
+ * se comparten entre instancias.
+ */
+const layerCacheEntrySchema = new mongoose.Schema({
+  // layer:versión:hash de contenido:entradas
+  key: {
+    type: String,
+    required: true,
+    unique: true
+  },
+  layer: {
+    type: String,
+    required: true
+  },
+  version: {
+    type: Number,
+    required: true
+  },
+  contentHash: {
+    type: String,
+    required: true,
+    index: true
+  },
+  // Clave alternativa por hash perceptual (capas que lo admiten)
+  perceptualKey: {
+    type: String,
+    default: null,
+    index: { sparse: true }
+  },
+
+  // Resultado serializado (JSON + gzip)
+  payload: {
+    type: Buffer,
+    required: true
+  },
+  sizeBytes: {
+    type: Number,
+    default: 0
+  },
+
+  hits: {
+    type: Number,
+    default: 0
+  },
+  lastHitAt: Date,
+
+  // Expiración (índice TTL de MongoDB)
+  expiresAt: {
+    type: Date,
+    required: true
+  }
+}, {
+  timestamps: true
+});
+
+layerCacheEntrySchema.index({ expiresAt: 1 }, { expireAfterSeconds: 0 });
+// Purga de versiones antiguas de una capa
+layerCacheEntrySchema.index({ layer: 1, version: 1 });
+
+module.exports = mongoose.model('LayerCacheEntry', layerCacheEntrySchema);
@@ -29,7 +29,7 @@ const notificationSchema = new mongoose.Schema({
   },
   relatedModel: {
     type: String,
-    enum: ['Analysis', 'Report', 'User', null],
+    enum: ['Analysis', 'AnalysisBatch', 'Report', 'User', null],
     default: null
   },
   isRead: {
@@ -70,6 +70,8 @@ const reportSchema = new mongoose.Schema({
   pdfFileName: String,
   pdfUrl: String,
   pdfGeneratedDate: Date,
+  // Clave de caché del PDF (contenido + versión del análisis + plantilla)
+  pdfCacheKey: String,
   
   // Envío por email
   sentByEmail: {
@@ -0,0 +1,52 @@
+const mongoose = require('mongoose');
+
+/**
+ * Estadísticas precalculadas (rollups) de los paneles
+ *
+ * StatsService mantiene aquí unos pocos documentos pequeños que los
+ * endpoints de estadísticas leen en lugar de agregar las colecciones
+ * completas:
+ * - 'analyses': contadores globales (total, por estado, por categoría)
+ * - 'analyses:day:<YYYY-MM-DD>': cubeta diaria (creados, completados, errores)
+ * - 'analyses:user:<userId>': análisis por usuario (usuarios más activos)
+ * - 'library': fenómenos y objetos activos por categoría
+ * - 'lease:reconcile': bloqueo de la reconciliación entre procesos
+ */
+const statsRollupSchema = new mongoose.Schema({
+  _id: {
+    type: String
+  },
+  kind: {
+    type: String,
+    enum: ['analyses', 'analysesDaily', 'analysesByUser', 'library', 'lease'],
+    required: true
+  },
+  day: {
+    type: String,
+    default: null
+  },
+  userId: {
+    type: mongoose.Schema.Types.ObjectId,
+    ref: 'User',
+    default: null
+  },
+
+  // Contadores (se actualizan con $inc sobre rutas anidadas)
+  counts: {
+    type: mongoose.Schema.Types.Mixed,
+    default: {}
+  },
+
+  reconciledAt: Date,
+  leaseUntil: Date
+}, {
+  timestamps: true,
+  minimize: false
+});
+
+// Cubetas de los últimos días
+statsRollupSchema.index({ kind: 1, day: 1 });
+// Usuarios más activos
+statsRollupSchema.index({ kind: 1, 'counts.total': -1 });
+
+module.exports = mongoose.model('StatsRollup', statsRollupSchema);
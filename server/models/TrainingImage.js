@@ -93,7 +93,19 @@ const trainingImageSchema = new mongoose.Schema({
     movementPattern: String,    // Patrón de movimiento típico
     lightPattern: String,       // Patrón de luces (si aplica)
     commonAltitude: String,     // Altitud típica
-    commonSpeed: String         // Velocidad típica
+    commonSpeed: String,        // Velocidad típica
+    autoExtracted: mongoose.Schema.Types.Mixed // Características extraídas al subir
+  },
+
+  // Embedding visual de longitud fija (Float32 little-endian), calculado al
+  // guardar. Lo consume trainingVectorIndexService; no se envía en las consultas.
+  embedding: {
+    type: Buffer,
+    select: false
+  },
+
+  embeddingVersion: {
+    type: Number
   },
 
   // Metadatos técnicos
@@ -279,8 +291,46 @@ trainingImageSchema.virtual('fullImageUrl').get(function() {
   return this.imageUrl;
 });
 
-// Asegurar que los virtuals se serialicen
-trainingImageSchema.set('toJSON', { virtuals: true });
+// Asegurar que los virtuals se serialicen (el embedding binario no se expone)
+trainingImageSchema.set('toJSON', {
+  virtuals: true,
+  transform: (doc, ret) => {
+    delete ret.embedding;
+    return ret;
+  }
+});
 trainingImageSchema.set('toObject', { virtuals: true });
 
+// Índice vectorial en memoria (trainingVectorIndexService).
+// require diferido para evitar la dependencia circular modelo <-> servicio.
+const vectorIndex = () => require('../services/trainingVectorIndexService');
+
+// Calcular el embedding al crear la imagen o al cambiar su archivo
+trainingImageSchema.pre('save', async function() {
+  const index = vectorIndex();
+  if (!this.isNew && !this.isModified('imageUrl') && this.embeddingVersion === index.EMBEDDING_VERSION) {
+    return;
+  }
+  await index.embedTrainingImage(this);
+});
+
+trainingImageSchema.post('save', function(doc) {
+  vectorIndex().upsert(doc);
+});
+
+trainingImageSchema.post('findOneAndUpdate', function(doc) {
+  if (doc) {
+    vectorIndex().refresh(doc._id).catch(err => console.error('⚠️ Error actualizando índice de training:', err.message));
+  }
+});
+
+trainingImageSchema.post('findOneAndDelete', function(doc) {
+  if (doc) vectorIndex().remove(doc._id);
+});
+
+trainingImageSchema.post('deleteOne', { document: false, query: true }, function() {
+  const { _id } = this.getFilter() || {};
+  if (_id) vectorIndex().remove(_id);
+});
+
 module.exports = mongoose.model('TrainingImage', trainingImageSchema);
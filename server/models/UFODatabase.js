@@ -170,4 +170,53 @@ ufoDatabaseSchema.index({ category: 1 });
 ufoDatabaseSchema.index({ name: 'text', description: 'text' });
 ufoDatabaseSchema.index({ visualPatterns: 1 });
 
+// Mantener sincronizado el índice en memoria del catálogo (ufoFeatureIndexService).
+// require diferido para evitar la dependencia circular modelo <-> servicio.
+const featureIndex = () => require('../services/ufoFeatureIndexService');
+
+ufoDatabaseSchema.post('save', function(doc) {
+  featureIndex().upsert(doc);
+});
+
+ufoDatabaseSchema.post('findOneAndUpdate', function(doc) {
+  // Los contadores de matching no afectan al índice
+  const update = this.getUpdate() || {};
+  const keys = Object.keys(update);
+  if (keys.length === 1 && update.$inc && Object.keys(update.$inc).every(k => k === 'matchCount')) {
+    return;
+  }
+  if (doc) {
+    featureIndex().refresh(doc._id).catch(err => console.error('⚠️ Error actualizando índice del catálogo:', err.message));
+  }
+});
+
+ufoDatabaseSchema.post('findOneAndDelete', function(doc) {
+  if (doc) featureIndex().remove(doc._id);
+});
+
+ufoDatabaseSchema.post('deleteOne', { document: false, query: true }, function() {
+  const { _id } = this.getFilter() || {};
+  if (_id) featureIndex().remove(_id);
+});
+
+// Rollup de estadísticas de la biblioteca (statsService) y caché del catálogo
+// público (libraryCatalogService): se refrescan tras cualquier cambio salvo
+// los contadores de matching
+const statsService = () => require('../services/statsService');
+const libraryCatalog = () => require('../services/libraryCatalogService');
+
+function libraryChanged() {
+  const update = this.getUpdate?.() || {};
+  const keys = Object.keys(update);
+  if (keys.length === 1 && update.$inc && Object.keys(update.$inc).every(k => k === 'matchCount')) {
+    return;
+  }
+  statsService().libraryChanged();
+  libraryCatalog().invalidate();
+}
+
+ufoDatabaseSchema.post('save', libraryChanged);
+ufoDatabaseSchema.post('insertMany', libraryChanged);
+ufoDatabaseSchema.post(['findOneAndUpdate', 'findOneAndDelete', 'updateOne', 'updateMany', 'deleteOne', 'deleteMany'], { document: false, query: true }, libraryChanged);
+
 module.exports = mongoose.model('UFODatabase', ufoDatabaseSchema);
@@ -6,6 +6,10 @@ const Report = require('../models/Report');
 const UFODatabase = require('../models/UFODatabase');
 const auth = require('../middleware/auth');
 const isAdmin = require('../middleware/isAdmin');
+const CacheService = require('../services/cacheService');
+const telemetry = require('../services/telemetryService');
+const statsService = require('../services/statsService');
+const analysisPayloads = require('../services/analysisPayloadService');
 
 /**
  * RUTAS DE ADMINISTRACIÓN
@@ -20,72 +24,35 @@ router.use(isAdmin);
 // GET /api/admin/stats
 router.get('/stats', async (req, res) => {
   try {
-    // Estadísticas generales
-    const totalUsers = await User.countDocuments();
-    const activeUsers = await User.countDocuments({ isActive: true });
-    const adminUsers = await User.countDocuments({ role: 'admin' });
-    
-    const totalAnalyses = await Analysis.countDocuments();
-    const completedAnalyses = await Analysis.countDocuments({ status: 'completed' });
-    const pendingAnalyses = await Analysis.countDocuments({ status: { $in: ['pending', 'analyzing'] } });
-    const errorAnalyses = await Analysis.countDocuments({ status: 'error' });
-    
-    const totalReports = await Report.countDocuments();
-    const generatedReports = await Report.countDocuments({ status: 'generated' });
-    
-    const totalUFOObjects = await UFODatabase.countDocuments();
-    const verifiedObjects = await UFODatabase.countDocuments({ isVerified: true });
-    
-    // Usuarios registrados en los últimos 30 días
+    // Estadísticas generales (usuarios, reportes y catálogo: conteos por índice)
     const thirtyDaysAgo = new Date();
     thirtyDaysAgo.setDate(thirtyDaysAgo.getDate() - 30);
-    const newUsersLast30Days = await User.countDocuments({
-      createdAt: { $gte: thirtyDaysAgo }
-    });
-    
-    // Análisis por categoría
-    const analysesByCategory = await Analysis.aggregate([
-      { $match: { status: 'completed' } },
-      { $group: { _id: '$aiAnalysis.category', count: { $sum: 1 } } },
-      { $sort: { count: -1 } }
-    ]);
-    
-    // Análisis por fecha (últimos 7 días)
-    const sevenDaysAgo = new Date();
-    sevenDaysAgo.setDate(sevenDaysAgo.getDate() - 7);
-    const analysesLast7Days = await Analysis.aggregate([
-      { $match: { createdAt: { $gte: sevenDaysAgo } } },
-      {
-        $group: {
-          _id: { $dateToString: { format: '%Y-%m-%d', date: '$createdAt' } },
-          count: { $sum: 1 }
-        }
-      },
-      { $sort: { _id: 1 } }
-    ]);
-    
-    // Usuarios más activos (top 5)
-    const topUsers = await Analysis.aggregate([
-      { $group: { _id: '$userId', analysisCount: { $sum: 1 } } },
-      { $sort: { analysisCount: -1 } },
-      { $limit: 5 },
-      {
-        $lookup: {
-          from: 'users',
-          localField: '_id',
-          foreignField: '_id',
-          as: 'user'
-        }
-      },
-      { $unwind: '$user' },
-      {
-        $project: {
-          username: '$user.username',
-          email: '$user.email',
-          analysisCount: 1
-        }
-      }
+
+    const [
+      totalUsers,
+      activeUsers,
+      adminUsers,
+      newUsersLast30Days,
+      totalReports,
+      generatedReports,
+      totalUFOObjects,
+      verifiedObjects,
+      analyses
+    ] = await Promise.all([
+      User.countDocuments(),
+      User.countDocuments({ isActive: true }),
+      User.countDocuments({ role: 'admin' }),
+      // Usuarios registrados en los últimos 30 días
+      User.countDocuments({ createdAt: { $gte: thirtyDaysAgo } }),
+      Report.countDocuments(),
+      Report.countDocuments({ status: 'generated' }),
+      UFODatabase.countDocuments(),
+      UFODatabase.countDocuments({ isVerified: true }),
+      // Análisis: rollups precalculados (statsService) en lugar de agregar
+      // la colección completa en cada petición
+      statsService.getAnalysisStats({ days: 7, topUsers: 5 })
     ]);
+    const { topUsers, ...analysisStats } = analyses;
     
     res.json({
       stats: {
@@ -95,14 +62,7 @@ router.get('/stats', async (req, res) => {
           admins: adminUsers,
           newLast30Days: newUsersLast30Days
         },
-        analyses: {
-          total: totalAnalyses,
-          completed: completedAnalyses,
-          pending: pendingAnalyses,
-          errors: errorAnalyses,
-          byCategory: analysesByCategory,
-          last7Days: analysesLast7Days
-        },
+        analyses: analysisStats,
         reports: {
           total: totalReports,
           generated: generatedReports
@@ -111,7 +71,8 @@ router.get('/stats', async (req, res) => {
           total: totalUFOObjects,
           verified: verifiedObjects
         },
-        topUsers
+        topUsers,
+        caches: CacheService.getSummary()
       }
     });
     
@@ -124,6 +85,87 @@ router.get('/stats', async (req, res) => {
   }
 });
 
+// POST /api/admin/stats/reconcile - Recalcular las estadísticas precalculadas
+router.post('/stats/reconcile', async (req, res) => {
+  try {
+    await statsService.reconcile({ force: true });
+    res.json({ message: 'Estadísticas recalculadas', ...statsService.getStats() });
+  } catch (error) {
+    console.error('Error al recalcular estadísticas:', error);
+    res.status(500).json({ error: 'Error al recalcular estadísticas' });
+  }
+});
+
+// GET /api/admin/cache - Estado de las cachés (aciertos, expulsiones, memoria, latencia)
+router.get('/cache', (req, res) => {
+  res.json(CacheService.getSummary());
+});
+
+// GET /api/admin/performance - Percentiles por capa y sub-análisis
+// live: muestras recientes de este proceso; stored: últimos análisis guardados (?limit=200)
+router.get('/performance', async (req, res) => {
+  try {
+    const limit = Math.min(parseInt(req.query.limit) || 200, 1000);
+    // Orden por _id (índice): los más recientes con resumen de tiempos
+    const recent = await Analysis.find({ 'timings.recordedAt': { $exists: true } })
+      .sort({ _id: -1 })
+      .limit(limit)
+      .select('timings.totalMs timings.spans')
+      .lean();
+
+    const byLayer = {};
+    const totals = [];
+    for (const { timings } of recent) {
+      totals.push(timings.totalMs);
+      for (const span of timings.spans) {
+        if (span.kind !== 'layer' || span.count === 0) continue;
+        (byLayer[span.name] = byLayer[span.name] || []).push(span.ms);
+      }
+    }
+
+    const percentile = (values, q) => {
+      const sorted = [...values].sort((a, b) => a - b);
+      return sorted[Math.min(sorted.length - 1, Math.floor(q * sorted.length))] || 0;
+    };
+
+    res.json({
+      live: {
+        analyses: telemetry.getSummary('analysis'),
+        layers: telemetry.getSummary('layer'),
+        tasks: telemetry.getSummary('task'),
+        db: telemetry.getSummary('db'),
+        http: telemetry.getSummary('http')
+      },
+      stored: {
+        analyses: recent.length,
+        totalMs: { p50: percentile(totals, 0.5), p95: percentile(totals, 0.95) },
+        layers: Object.entries(byLayer).map(([name, values]) => ({
+          name,
+          count: values.length,
+          p50: percentile(values, 0.5),
+          p95: percentile(values, 0.95),
+          max: Math.max(...values)
+        })).sort((a, b) => b.p95 - a.p95)
+      }
+    });
+
+  } catch (error) {
+    console.error('Error al obtener rendimiento:', error);
+    res.status(500).json({ error: 'Error al obtener métricas de rendimiento' });
+  }
+});
+
+// DELETE /api/admin/cache/:namespace - Vaciar un espacio de caché
+router.delete('/cache/:namespace', (req, res) => {
+  const stats = CacheService.getStats(req.params.namespace);
+  if (!stats) {
+    return res.status(404).json({ error: 'Espacio de caché no encontrado' });
+  }
+
+  const removed = CacheService.namespace(req.params.namespace).clear();
+  res.json({ message: `Caché ${req.params.namespace} vaciada`, removed });
+});
+
 // ==================== GESTIÓN DE USUARIOS ====================
 
 // GET /api/admin/users - Listar todos los usuarios
@@ -237,8 +279,11 @@ router.delete('/users/:id', async (req, res) => {
       }
     }
     
-    // Eliminar usuario y sus datos relacionados
+    // Eliminar usuario y sus datos relacionados. deleteMany no pasa por los
+    // hooks de documento: sus archivos generados se borran aquí
+    const analyses = await Analysis.find({ userId: user._id }).select('ingest fileType filePath').lean();
     await Analysis.deleteMany({ userId: user._id });
+    await Promise.all(analyses.map(analysis => Analysis.removeFiles(analysis)));
     await Report.deleteMany({ userId: user._id });
     await User.deleteOne({ _id: user._id });
     
@@ -268,7 +313,9 @@ router.get('/analyses', async (req, res) => {
     
     const skip = (page - 1) * limit;
     
+    // Solo el resumen: las cargas pesadas de cada capa no salen en la tabla
     const analyses = await Analysis.find(filter)
+      .select(analysisPayloads.summaryProjection())
       .populate('userId', 'username email')
       .sort({ createdAt: -1 })
       .limit(parseInt(limit))
@@ -307,8 +354,9 @@ router.delete('/analyses/:id', async (req, res) => {
     // Eliminar reportes asociados
     await Report.deleteMany({ analysisId: analysis._id });
     
-    // Eliminar análisis
-    await Analysis.deleteOne({ _id: analysis._id });
+    // Eliminar análisis (findByIdAndDelete: descuenta el análisis de las
+    // estadísticas y borra sus derivadas)
+    await Analysis.findByIdAndDelete(analysis._id);
     
     res.json({
       message: 'Análisis y reportes asociados eliminados exitosamente'
@@ -1,6 +1,7 @@
 const express = require('express');
 const router = express.Router();
 const auth = require('../middleware/auth');
+const isAdmin = require('../middleware/isAdmin');
 const Analysis = require('../models/Analysis');
 const aiService = require('../services/aiService');
 const localAiService = require('../services/localAiService'); // Análisis local GRATIS
@@ -15,6 +16,21 @@ const forensicAnalysisService = require('../services/forensicAnalysisService');
 const weatherService = require('../services/weatherService');
 const atmosphericComparisonService = require('../services/atmosphericComparisonService');
 const WebSocketService = require('../services/websocketService');
+const ImageContext = require('../services/imageContextService');
+const analysisQueue = require('../services/analysisQueueService');
+const LayerSchedulerService = require('../services/layerSchedulerService');
+const layerCache = require('../services/layerCacheService');
+const ufoFeatureIndex = require('../services/ufoFeatureIndexService');
+const trainingVectorIndex = require('../services/trainingVectorIndexService');
+const perceptualHashIndex = require('../services/perceptualHashIndexService');
+const videoAnalysisService = require('../services/videoAnalysisService');
+const batchService = require('../services/batchService');
+const telemetry = require('../services/telemetryService');
+const analysisPayloads = require('../services/analysisPayloadService');
+const rescoring = require('../services/rescoringService');
+
+// La cola durable ejecuta performAnalysis con concurrencia acotada
+analysisQueue.setProcessor(performAnalysis);
 
 // POST /api/analyze/:id - Iniciar análisis de una imagen/video
 router.post('/:id', auth, async (req, res) => {
@@ -35,10 +51,10 @@ router.post('/:id', auth, async (req, res) => {
       return res.status(403).json({ error: 'No tienes permiso para analizar este archivo.' });
     }
 
-    // Verificar que el archivo sea una imagen (por ahora solo imágenes)
-    if (analysis.fileType !== 'image') {
-      return res.status(400).json({ 
-        error: 'Por ahora solo se pueden analizar imágenes. El análisis de videos estará disponible próximamente.' 
+    // Los vídeos se decodifican con ffmpeg (services/videoAnalysisService.js)
+    if (analysis.fileType === 'video' && !(await videoAnalysisService.isAvailable())) {
+      return res.status(503).json({
+        error: 'El análisis de vídeo no está disponible: el servidor no tiene ffmpeg instalado.'
       });
     }
 
@@ -51,15 +67,19 @@ router.post('/:id', auth, async (req, res) => {
     analysis.status = 'analyzing';
     await analysis.save();
 
-    // Iniciar análisis en background (no bloquear la respuesta)
-    performAnalysis(analysisId).catch(err => {
-      console.error('Error en análisis background:', err);
+    // Encolar análisis (la cola lo ejecuta en background sin bloquear la respuesta)
+    const job = await analysisQueue.enqueue(analysisId, {
+      userId: analysis.userId,
+      lane: userRole === 'admin' ? 'admin' : 'user'
     });
 
+    WebSocketService.emitProgress(analysisId, 0, 'Análisis en cola');
+
     res.json({
       message: 'Análisis iniciado exitosamente.',
       analysisId: analysis._id,
-      status: 'analyzing'
+      status: 'analyzing',
+      jobId: job._id
     });
 
   } catch (error) {
@@ -72,13 +92,18 @@ router.post('/:id', auth, async (req, res) => {
 });
 
 // GET /api/analyze/:id/status - Obtener estado del análisis
+// Mientras el análisis está en curso solo se lee el resumen (proyección, sin
+// cargas pesadas); al terminar se añade analysisData con el detalle de las
+// capas, salvo con ?details=false.
 router.get('/:id/status', auth, async (req, res) => {
   try {
     const userId = req.userId;
     const userRole = req.userRole;
     const analysisId = req.params.id;
 
-    const analysis = await Analysis.findById(analysisId);
+    const analysis = await Analysis.findById(analysisId)
+      .select(analysisPayloads.summaryProjection('-__v -filePath'))
+      .lean();
 
     if (!analysis) {
       return res.status(404).json({ error: 'Análisis no encontrado.' });
@@ -89,6 +114,15 @@ router.get('/:id/status', auth, async (req, res) => {
       return res.status(403).json({ error: 'No tienes permiso para ver este análisis.' });
     }
 
+    const finished = analysis.status === 'completed' || analysis.status === 'error';
+    const withDetails = finished && req.query.details !== 'false';
+    if (withDetails) {
+      await analysisPayloads.attach(analysis);
+    }
+
+    // Sin detalle, el número de coincidencias sale del resumen
+    const matchCount = analysis.matchResults?.length ?? analysis.payload?.matchCount ?? 0;
+
     res.json({
       status: analysis.status,
       fileName: analysis.fileName,
@@ -97,15 +131,19 @@ router.get('/:id/status', auth, async (req, res) => {
       fileSize: analysis.fileSize,
       hasExifData: !!analysis.exifData && Object.keys(analysis.exifData).length > 0,
       hasAiAnalysis: !!analysis.aiAnalysis && !!analysis.aiAnalysis.category,
-      hasMatches: analysis.matchResults && analysis.matchResults.length > 0,
+      hasMatches: matchCount > 0,
       errorMessage: analysis.errorMessage,
-      analysisData: {
+      queue: await analysisQueue.getJobStatus(analysisId),
+      // Tiempos por capa del último análisis (telemetría; la usa el modo de
+      // carga de test/test_api_complete.py)
+      timings: analysis.timings,
+      analysisData: withDetails ? {
         exifData: analysis.exifData,
         aiAnalysis: analysis.aiAnalysis,
         visualAnalysis: analysis.visualAnalysis,
         forensicAnalysis: analysis.forensicAnalysis,
         scientificComparison: {
-          totalMatches: analysis.matchResults ? analysis.matchResults.length : 0,
+          totalMatches: matchCount,
           bestMatch: analysis.bestMatch
         },
         trainingEnhancement: analysis.trainingEnhancement,
@@ -117,8 +155,10 @@ router.get('/:id/status', auth, async (req, res) => {
         confidenceBreakdown: analysis.confidenceBreakdown,
         confidenceAdjustments: analysis.confidenceAdjustments,
         confidenceExplanation: analysis.confidenceExplanation,
-        matchResults: analysis.matchResults
-      }
+        matchResults: analysis.matchResults,
+        duplicateCheck: analysis.duplicateCheck,
+        videoAnalysis: analysis.videoAnalysis
+      } : null
     });
 
   } catch (error) {
@@ -127,6 +167,69 @@ router.get('/:id/status', auth, async (req, res) => {
   }
 });
 
+// GET /api/analyze/:id/similar - Análisis anteriores de la misma imagen (o casi)
+// ?distance=<bits distintos, máx. 16>&limit=<máx. 50>
+router.get('/:id/similar', auth, async (req, res) => {
+  try {
+    const analysis = await Analysis.findById(req.params.id)
+      .select('userId visualAnalysis.perceptualHash')
+      .lean();
+
+    if (!analysis) {
+      return res.status(404).json({ error: 'Análisis no encontrado.' });
+    }
+
+    const isAdminUser = req.userRole === 'admin';
+    if (!isAdminUser && analysis.userId.toString() !== req.userId) {
+      return res.status(403).json({ error: 'No tienes permiso para ver este análisis.' });
+    }
+
+    const perceptualHash = analysis.visualAnalysis?.perceptualHash;
+    if (!perceptualHash) {
+      return res.status(409).json({ error: 'El análisis todavía no tiene hash perceptual.' });
+    }
+
+    const requested = parseInt(req.query.distance, 10);
+    const maxDistance = Math.min(Math.max(Number.isNaN(requested) ? DUPLICATE_MAX_DISTANCE : requested, 0), 16);
+    const limit = Math.min(Math.max(parseInt(req.query.limit, 10) || 20, 1), 50);
+    const matches = await perceptualHashIndex.search(perceptualHash, {
+      maxDistance,
+      limit,
+      excludeId: analysis._id
+    });
+
+    // Los análisis de otros usuarios solo se identifican si son públicos
+    const results = matches.map(({ userId, fileName, isPublic, createdAt, ...match }) => {
+      const visible = isAdminUser || isPublic || userId === req.userId;
+      return visible
+        ? { ...match, fileName, createdAt, own: userId === req.userId }
+        : { ...match, analysisId: null, own: false };
+    });
+
+    res.json({
+      perceptualHash,
+      maxDistance,
+      isRepost: results.length > 0,
+      knownHoax: results.some(match => match.isHoax),
+      matches: results
+    });
+
+  } catch (error) {
+    console.error('Error buscando análisis similares:', error);
+    res.status(500).json({ error: 'Error al buscar análisis similares.' });
+  }
+});
+
+// GET /api/analyze/queue/metrics - Profundidad y latencia de la cola (admin)
+router.get('/queue/metrics', auth, isAdmin, async (req, res) => {
+  try {
+    res.json(await analysisQueue.getMetrics());
+  } catch (error) {
+    console.error('Error al obtener métricas de la cola:', error);
+    res.status(500).json({ error: 'Error al obtener métricas de la cola.' });
+  }
+});
+
 // GET /api/analyze/config - Verificar configuración de API
 router.get('/config', auth, async (req, res) => {
   try {
@@ -149,10 +252,24 @@ router.get('/config', auth, async (req, res) => {
 
 /**
  * Función auxiliar para realizar el análisis completo
- * Se ejecuta en background
+ * Se ejecuta en background desde la cola de análisis
+ * @param {string} analysisId - ID del análisis
+ * @param {Object} options - { finalAttempt } si es false, un error deja el
+ *   análisis en 'analyzing' para que la cola lo reintente
  */
-async function performAnalysis(analysisId) {
+async function performAnalysis(analysisId, options = {}) {
+  // Traza del análisis: capas, sub-análisis, consultas y HTTP se miden como
+  // spans y se resumen en analysis.timings
+  const trace = telemetry.startTrace();
+  return telemetry.runInTrace(trace, () =>
+    telemetry.span('analysis', 'performAnalysis', () => runAnalysis(analysisId, options, trace))
+  );
+}
+
+async function runAnalysis(analysisId, options, trace) {
+  const { finalAttempt = true } = options;
   let analysis;
+  let imageContext = null;
   
   try {
     analysis = await Analysis.findById(analysisId);
@@ -167,427 +284,830 @@ async function performAnalysis(analysisId) {
     WebSocketService.emitAnalysisStarted(analysisId, analysis.userId);
     WebSocketService.emitProgress(analysisId, 0, 'Iniciando análisis');
 
-    // 1. Extraer datos EXIF (solo para imágenes)
+    // 0. Imagen compartida por todas las capas: derivadas de la ingesta o,
+    // si no existen, el original decodificado UNA sola vez
     if (analysis.fileType === 'image') {
-      console.log('Extrayendo datos EXIF...');
-      WebSocketService.emitProgress(analysisId, 10, 'Capa 1: Extrayendo metadatos EXIF');
-      
-      const exifResult = await exifService.extractExifData(analysis.filePath);
-      
-      if (exifResult.success) {
-        analysis.exifData = exifResult.data;
-        console.log('Datos EXIF extraídos exitosamente');
-        WebSocketService.emitLayerComplete(analysisId, 1, 'EXIF', { 
-          hasGPS: !!exifResult.data.gpsLatitude,
-          hasTimestamp: !!exifResult.data.timestamp 
-        });
-      } else {
-        console.log('No se pudieron extraer datos EXIF:', exifResult.error);
+      try {
+        imageContext = await ImageContext.forAnalysis(analysis);
+      } catch (contextError) {
+        // Las capas vuelven a abrir el archivo por su cuenta
+        console.error('⚠️ No se pudo decodificar la imagen compartida:', contextError.message);
       }
     }
 
-    // 1.5. ANÁLISIS VISUAL AVANZADO (independiente de EXIF)
-    console.log('🔬 Ejecutando análisis visual avanzado...');
-    WebSocketService.emitProgress(analysisId, 20, 'Capa 2: Análisis visual avanzado');
-    
-    let visualAnalysis = null;
-    try {
-      visualAnalysis = await visualAnalysisService.analyzeVisualFeatures(analysis.filePath);
-      analysis.visualAnalysis = visualAnalysis;
-      console.log(`✅ Análisis visual completado: ${visualAnalysis.objectType.category} (${visualAnalysis.objectType.confidence}% confianza visual)`);
-      
-      WebSocketService.emitLayerComplete(analysisId, 2, 'Análisis Visual', {
-        category: visualAnalysis.objectType.category,
-        confidence: visualAnalysis.objectType.confidence
-      });
-    } catch (visualError) {
-      console.error('⚠️ Error en análisis visual:', visualError.message);
+    // Revisiones de catálogo, training, fenómenos y pesos con las que se
+    // puntúa; la re-puntuación del histórico las compara con las actuales
+    const revisions = analysis.fileType === 'image'
+      ? await rescoring.currentRevisions().catch(() => null)
+      : null;
+
+    // 0.5. Re-subidas y fraudes conocidos: comparar el hash perceptual con el
+    // histórico antes de lanzar las capas caras
+    if (imageContext) {
+      await checkDuplicates(analysis, imageContext);
     }
 
-    // 1.6. ANÁLISIS FORENSE AVANZADO (detección de manipulación)
-    console.log('🔬 Ejecutando análisis forense de imagen...');
-    WebSocketService.emitProgress(analysisId, 30, 'Capa 3: Análisis forense');
-    
-    let forensicAnalysis = null;
-    try {
-      forensicAnalysis = await forensicAnalysisService.analyzeImage(analysis.filePath);
-      analysis.forensicAnalysis = forensicAnalysis;
-      console.log(`✅ Análisis forense completado: ${forensicAnalysis.verdict} (${forensicAnalysis.manipulationScore}/100 manipulación)`);
-      
-      WebSocketService.emitLayerComplete(analysisId, 3, 'Análisis Forense', {
-        verdict: forensicAnalysis.verdict,
-        manipulationScore: forensicAnalysis.manipulationScore
+    // Capas del pipeline como grafo de dependencias: las que solo necesitan
+    // el archivo (EXIF, visual, forense, IA local) corren en paralelo; las que
+    // solo necesitan GPS/fecha (validación externa, meteorología) arrancan en
+    // cuanto termina EXIF; la fusión de confianza espera solo a sus entradas.
+    let layers = analysis.fileType === 'video'
+      ? buildVideoLayers(analysis)
+      : buildAnalysisLayers(analysis, imageContext);
+
+    // Re-subidas de la misma imagen: las capas se sirven desde la caché
+    if (imageContext) {
+      layers = layerCache.wrapLayers(layers, LAYER_CACHE, {
+        contentHash: imageContext.getSha256(),
+        perceptualHash: layerCache.perceptual
+          ? await imageContext.getPerceptualHash().catch(() => null)
+          : null
       });
-    } catch (forensicError) {
-      console.error('⚠️ Error en análisis forense:', forensicError.message);
     }
+    layers = telemetry.wrapLayers(layers);
+    const layerNames = Object.keys(layers);
+    let settledLayers = 0;
 
-    // 1.7. ANÁLISIS LOCAL CON IA (100% GRATIS, SIN LÍMITES)
-    console.log('🤖 Ejecutando análisis local de IA (OpenCV + JIMP)...');
-    WebSocketService.emitProgress(analysisId, 35, 'Capa 3.5: Análisis IA local (gratis, sin límites)');
-    
-    let localAiAnalysis = null;
-    try {
-      localAiAnalysis = await localAiService.analyzeImage(analysis.filePath);
-      analysis.localAiAnalysis = localAiAnalysis;
-      
-      if (localAiAnalysis.success) {
-        console.log(`✅ Análisis IA local completado: ${localAiAnalysis.classification} (${localAiAnalysis.confidence}% confianza)`);
-        console.log(`📊 Costooperación: $${localAiAnalysis.cost} - Método: ${localAiAnalysis.method}`);
-        
-        WebSocketService.emitLayerComplete(analysisId, '3.5', 'Análisis IA Local', {
-          category: localAiAnalysis.classification,
-          confidence: localAiAnalysis.confidence,
-          cost: 0,
-          objectsDetected: localAiAnalysis.objects?.length || 0
-        });
+    // Capas pendientes por resolución declarada (imageSizes): al terminar la
+    // última que la usa, sus buffers se sueltan
+    const pendingBySize = new Map();
+    for (const layer of Object.values(layers)) {
+      for (const size of layer.imageSizes || []) {
+        pendingBySize.set(size, (pendingBySize.get(size) || 0) + 1);
       }
-    } catch (localAiError) {
-      console.error('⚠️ Error en análisis IA local:', localAiError.message);
-      // No es crítico, continuar con otros análisis
     }
 
-    // 2. Analizar con sistema de comparación CIENTÍFICA
-    console.log('🔬 Analizando con comparación científica...');
-    WebSocketService.emitProgress(analysisId, 40, 'Capa 4: Comparación científica (1,064 objetos)');
+    const { states: layerStates } = await LayerSchedulerService.run(layers, {
+      onStart: (name) => {
+        const progress = Math.round(10 + (settledLayers / layerNames.length) * 80);
+        WebSocketService.emitProgress(analysisId, progress, layers[name].progressMessage);
+      },
+      onSettled: (name) => {
+        settledLayers++;
+
+        for (const size of layers[name].imageSizes || []) {
+          const pending = pendingBySize.get(size) - 1;
+          pendingBySize.set(size, pending);
+          if (pending === 0 && imageContext) imageContext.releaseSize(size);
+        }
+      }
+    });
+
+    console.log('⏱️  Tiempos por capa:', Object.entries(layerStates)
+      .map(([name, state]) => `${name}=${state.status === 'completed' ? `${state.durationMs}ms` : state.status}`)
+      .join(', '));
+
+    // 4. Actualizar estado
+    analysis.timings = trace.summary(layerStates);
+    analysis.status = 'completed';
+    analysis.errorMessage = null;
+    if (revisions) {
+      rescoring.stampRevisions(analysis, revisions);
+    }
     
-    const analysisResult = await scientificComparisonService.analyzeImageScientifically(
-      analysis.filePath,
-      analysis.exifData
-    );
+    await analysis.save();
+    console.log(`✅ Análisis guardado: ${analysis.fileName}`);
     
-    let preliminaryAnalysis;
+    // Emitir evento de análisis completado
+    WebSocketService.emitProgress(analysisId, 100, 'Análisis completado');
+    WebSocketService.emitAnalysisComplete(analysisId, {
+      status: 'completed',
+      confidence: analysis.aiAnalysis?.confidence || 0,
+      category: analysis.aiAnalysis?.category || 'unknown'
+    });
+
+    // 5. Enviar notificación al usuario (los lotes notifican una vez al terminar)
+    if (analysis.batchId) {
+      await batchService.itemSettled(analysis)
+        .catch(err => console.error('⚠️ Error actualizando lote:', err.message));
+    } else {
+      await NotificationService.notifyAnalysisCompleted(
+        analysis.userId,
+        analysis._id,
+        {
+          fileName: analysis.fileName,
+          category: analysis.aiAnalysis?.category || 'unknown',
+          confidence: analysis.aiAnalysis?.confidence || 0
+        }
+      );
+    }
+
+  } catch (error) {
+    console.error('Error en análisis:', error);
     
-    if (analysisResult.success) {
-      preliminaryAnalysis = analysisResult.data;
-      console.log(`✅ Análisis completado: ${analysisResult.data.category} (${analysisResult.data.confidence}%)`);
+    if (analysis && finalAttempt) {
+      analysis.timings = trace.summary();
+      analysis.status = 'error';
+      analysis.errorMessage = error.message;
+      await analysis.save();
       
-      WebSocketService.emitLayerComplete(analysisId, 4, 'Comparación Científica', {
-        category: analysisResult.data.category,
-        confidence: analysisResult.data.confidence,
-        matches: analysisResult.data.rawResponse?.allMatches?.length || 0
+      // Emitir evento de error por WebSocket
+      WebSocketService.emitAnalysisError(analysisId, {
+        message: error.message,
+        stack: error.stack
       });
-      
-      // 3. Asignar mejor coincidencia
-      if (analysisResult.data.rawResponse?.bestMatch) {
-        const bestMatch = analysisResult.data.rawResponse.bestMatch;
-        analysis.bestMatch = {
-          objectId: bestMatch.objectId,
-          category: bestMatch.category,
-          matchPercentage: bestMatch.matchPercentage
-        };
-        
-        // Guardar todos los matches
-        analysis.matchResults = analysisResult.data.rawResponse.allMatches || [];
+
+      if (analysis.batchId) {
+        await batchService.itemSettled(analysis)
+          .catch(err => console.error('⚠️ Error actualizando lote:', err.message));
       }
-    } else {
-      // Fallback: análisis básico
-      console.log('⚠️ Sistema de comparación falló, generando análisis básico...');
-      preliminaryAnalysis = {
-        provider: 'basic',
-        model: 'Basic Analysis',
-        description: 'Análisis básico realizado. Los datos EXIF están disponibles.',
-        detectedObjects: ['Objeto no identificado'],
-        confidence: 30,
-        category: 'unknown',
-        isUnusual: true,
-        unusualFeatures: ['Análisis automático no disponible'],
-        recommendations: ['Análisis manual recomendado'],
-        processedDate: new Date()
-      };
+    } else if (analysis) {
+      WebSocketService.emitProgress(analysisId, 0, 'Error en el análisis, se reintentará');
     }
 
-    // 2.5. MEJORAR CON DATOS DE ENTRENAMIENTO
-    console.log('🎓 Mejorando análisis con datos de entrenamiento...');
-    WebSocketService.emitProgress(analysisId, 50, 'Capa 5: Mejora con entrenamiento');
-    
-    const trainingEnhancement = await trainingLearningService.enhanceAnalysisWithTraining(
-      analysis.filePath,
-      preliminaryAnalysis,
-      analysis.exifData
+    // La cola decide si reintentar o marcar el trabajo como fallido
+    throw error;
+  } finally {
+    // Liberar buffers decodificados
+    if (imageContext) {
+      imageContext.release();
+    }
+  }
+}
+
+// Distancia de Hamming máxima (de 64 bits) para considerar dos imágenes la misma
+const DUPLICATE_MAX_DISTANCE = parseInt(process.env.PHASH_DUPLICATE_DISTANCE, 10) || 5;
+const DUPLICATE_MAX_MATCHES = 10;
+
+/**
+ * Buscar análisis anteriores de la misma imagen (o casi) y anotarlos en
+ * analysis.duplicateCheck. Un fallo aquí no detiene el análisis.
+ * @param {Object} analysis - Documento Analysis en proceso
+ * @param {ImageContext} imageContext - Imagen ya decodificada
+ */
+async function checkDuplicates(analysis, imageContext) {
+  const analysisId = analysis._id.toString();
+
+  try {
+    const perceptualHash = await imageContext.getPerceptualHash();
+    const matches = await telemetry.span('task', 'duplicates.search', () =>
+      perceptualHashIndex.search(perceptualHash, {
+        maxDistance: DUPLICATE_MAX_DISTANCE,
+        limit: DUPLICATE_MAX_MATCHES,
+        excludeId: analysisId
+      })
     );
 
-    // Usar análisis mejorado si está disponible
-    if (trainingEnhancement.enhanced) {
-      analysis.aiAnalysis = trainingEnhancement.enhancedAnalysis;
-      console.log(`✨ Análisis mejorado con entrenamiento: confianza aumentada de ${trainingEnhancement.originalAnalysis.confidence}% a ${trainingEnhancement.enhancedAnalysis.confidence}%`);
-      
-      WebSocketService.emitLayerComplete(analysisId, 5, 'Training Enhancement', {
-        enhanced: true,
-        improvementDelta: trainingEnhancement.improvementDelta,
-        matchCount: trainingEnhancement.enhancedAnalysis.trainingData?.matchCount || 0
-      });
-      
-      // Guardar datos de mejora para auditoría
-      analysis.trainingEnhancement = {
-        enhanced: true,
-        improvementDelta: trainingEnhancement.improvementDelta,
-        trainingMatchCount: trainingEnhancement.enhancedAnalysis.trainingData?.matchCount || 0,
-        enhancedAt: new Date()
-      };
-    } else {
-      analysis.aiAnalysis = preliminaryAnalysis;
-      console.log('ℹ️ No se pudo mejorar con datos de entrenamiento');
-      
-      WebSocketService.emitLayerComplete(analysisId, 5, 'Training Enhancement', {
-        enhanced: false
+    // El hash queda guardado aunque la capa visual falle
+    analysis.set('visualAnalysis.perceptualHash', perceptualHash);
+    analysis.duplicateCheck = {
+      checkedAt: new Date(),
+      maxDistance: DUPLICATE_MAX_DISTANCE,
+      isRepost: matches.length > 0,
+      knownHoax: matches.some(match => match.isHoax),
+      matches: matches.map(({ analysisId: id, distance, similarity, category, isHoax }) =>
+        ({ analysisId: id, distance, similarity, category, isHoax }))
+    };
+
+    if (matches.length > 0) {
+      console.log(`🧬 ${matches.length} análisis anteriores de la misma imagen (distancia mínima ${matches[0].distance})${analysis.duplicateCheck.knownHoax ? ' - FRAUDE CONOCIDO' : ''}`);
+      WebSocketService.emitLayerComplete(analysisId, 0, 'Duplicados', {
+        matches: matches.length,
+        bestSimilarity: matches[0].similarity,
+        knownHoax: analysis.duplicateCheck.knownHoax
       });
-      
-      analysis.trainingEnhancement = {
-        enhanced: false,
-        reason: trainingEnhancement.error || 'No hay datos de entrenamiento disponibles'
-      };
     }
+  } catch (error) {
+    console.error('⚠️ Error buscando duplicados:', error.message);
+  }
+}
+
+// Tiempo máximo por capa (ms); una capa que lo excede se descarta y el resto continúa
+const LAYER_TIMEOUTS = {
+  exif: 15000,
+  visual: 20000,
+  forensic: 45000,
+  localAi: 45000,
+  scientific: 90000,
+  training: 60000,
+  externalValidation: 30000,
+  weather: 20000,
+  atmospheric: 15000,
+  confidence: 10000,
+  videoFrames: 300000
+};
+
+// Caché por contenido de cada capa (services/layerCacheService.js).
+// version: subirla al cambiar el algoritmo de la capa invalida solo esa capa.
+// inputs: datos, además de la imagen, de los que depende el resultado.
+// cacheable(valor, results): si el resultado se puede guardar.
+// Las capas con datos externos (APIs) caducan en una hora; atmospheric y
+// confidence son baratas y dependen de las anteriores, no se cachean.
+const EXTERNAL_CACHE_TTL_SECONDS = 3600;
+
+const LAYER_CACHE = {
+  exif: { version: 1 },
+  visual: { version: 1, perceptual: true },
+  forensic: { version: 1 },
+  localAi: { version: 1 },
+  scientific: {
+    version: 2,
+    inputs: async () => {
+      await Promise.all([ufoFeatureIndex.ensureLoaded(), trainingVectorIndex.ensureLoaded()]);
+      return `${ufoFeatureIndex.revision}|${trainingVectorIndex.revision}`;
+    },
+    cacheable: ({ analysisResult }) => analysisResult.success
+  },
+  training: {
+    version: 2,
+    // Parte del veredicto de scientific: la clave incluye su resultado y no se
+    // guarda la mejora hecha sobre el análisis básico de respaldo (un fallo
+    // puntual de scientific no debe fijar un veredicto degradado en la caché)
+    inputs: async ({ scientific }) => {
+      await Promise.all([ufoFeatureIndex.ensureLoaded(), trainingVectorIndex.ensureLoaded()]);
+      const { category, confidence } = scientific?.preliminaryAnalysis || {};
+      return `${ufoFeatureIndex.revision}|${trainingVectorIndex.revision}|${category}|${confidence}`;
+    },
+    cacheable: (enhancement, { scientific }) => Boolean(scientific?.analysisResult?.success)
+  },
+  externalValidation: { version: 1, ttlSeconds: EXTERNAL_CACHE_TTL_SECONDS },
+  weather: { version: 1, ttlSeconds: EXTERNAL_CACHE_TTL_SECONDS }
+};
+
+/**
+ * Definir las capas del análisis y sus dependencias
+ * Cada capa devuelve su resultado en run() y lo vuelca sobre el documento
+ * en onComplete(), que solo se invoca si la capa terminó a tiempo.
+ * imageSizes declara las resoluciones de ImageContext que usa la capa.
+ * @param {Object} analysis - Documento Analysis en proceso
+ * @param {ImageContext} imageContext - Imagen ya decodificada (puede ser null)
+ * @param {Object} options - { emit: false para no notificar cada capa por
+ *   WebSocket (fotogramas clave de un vídeo: no tienen sala propia) }
+ * @returns {Object} Grafo de capas para LayerSchedulerService
+ */
+function buildAnalysisLayers(analysis, imageContext, { emit = true } = {}) {
+  const analysisId = analysis._id.toString();
+  const emitLayerComplete = emit ? WebSocketService.emitLayerComplete : () => {};
+
+  return {
+    // 1. Extraer datos EXIF (solo para imágenes)
+    exif: {
+      progressMessage: 'Capa 1: Extrayendo metadatos EXIF',
+      timeoutMs: LAYER_TIMEOUTS.exif,
+      run: () => {
+        if (analysis.fileType !== 'image') return null;
+        console.log('Extrayendo datos EXIF...');
+        return exifService.extractExifData(analysis.filePath, imageContext);
+      },
+      onComplete: (exifResult) => {
+        if (!exifResult) return;
+
+        if (exifResult.success) {
+          analysis.exifData = exifResult.data;
+          console.log('Datos EXIF extraídos exitosamente');
+          emitLayerComplete(analysisId, 1, 'EXIF', {
+            hasGPS: !!exifResult.data.gpsLatitude,
+            hasTimestamp: !!exifResult.data.timestamp
+          });
+        } else {
+          console.log('No se pudieron extraer datos EXIF:', exifResult.error);
+        }
+      }
+    },
+
+    // 1.5. ANÁLISIS VISUAL AVANZADO (independiente de EXIF)
+    visual: {
+      progressMessage: 'Capa 2: Análisis visual avanzado',
+      imageSizes: [ImageContext.SIZES.MEDIUM],
+      timeoutMs: LAYER_TIMEOUTS.visual,
+      run: () => {
+        console.log('🔬 Ejecutando análisis visual avanzado...');
+        return visualAnalysisService.analyzeVisualFeatures(analysis.filePath, imageContext);
+      },
+      onComplete: (visualAnalysis) => {
+        analysis.visualAnalysis = visualAnalysis;
+        console.log(`✅ Análisis visual completado: ${visualAnalysis.objectType.category} (${visualAnalysis.objectType.confidence}% confianza visual)`);
+
+        emitLayerComplete(analysisId, 2, 'Análisis Visual', {
+          category: visualAnalysis.objectType.category,
+          confidence: visualAnalysis.objectType.confidence
+        });
+      }
+    },
+
+    // 1.6. ANÁLISIS FORENSE AVANZADO (detección de manipulación)
+    forensic: {
+      progressMessage: 'Capa 3: Análisis forense',
+      imageSizes: [ImageContext.SIZES.LARGE],
+      timeoutMs: LAYER_TIMEOUTS.forensic,
+      run: () => {
+        console.log('🔬 Ejecutando análisis forense de imagen...');
+        return forensicAnalysisService.analyzeImage(analysis.filePath, imageContext);
+      },
+      onComplete: (forensicAnalysis) => {
+        analysis.forensicAnalysis = forensicAnalysis;
+        console.log(`✅ Análisis forense completado: ${forensicAnalysis.verdict} (${forensicAnalysis.manipulationScore}/100 manipulación)`);
+
+        emitLayerComplete(analysisId, 3, 'Análisis Forense', {
+          verdict: forensicAnalysis.verdict,
+          manipulationScore: forensicAnalysis.manipulationScore
+        });
+      }
+    },
+
+    // 1.7. ANÁLISIS LOCAL CON IA (100% GRATIS, SIN LÍMITES)
+    // No es crítico: si falla, continuar con otros análisis
+    localAi: {
+      progressMessage: 'Capa 3.5: Análisis IA local (gratis, sin límites)',
+      imageSizes: [ImageContext.SIZES.LARGE],
+      timeoutMs: LAYER_TIMEOUTS.localAi,
+      run: () => {
+        console.log('🤖 Ejecutando análisis local de IA (OpenCV + JIMP)...');
+        return localAiService.analyzeImage(analysis.filePath, { imageContext });
+      },
+      onComplete: (localAiAnalysis) => {
+        analysis.localAiAnalysis = localAiAnalysis;
+
+        if (localAiAnalysis.success) {
+          console.log(`✅ Análisis IA local completado: ${localAiAnalysis.classification} (${localAiAnalysis.confidence}% confianza)`);
+          console.log(`📊 Costooperación: $${localAiAnalysis.cost} - Método: ${localAiAnalysis.method}`);
+
+          emitLayerComplete(analysisId, '3.5', 'Análisis IA Local', {
+            category: localAiAnalysis.classification,
+            confidence: localAiAnalysis.confidence,
+            cost: 0,
+            objectsDetected: localAiAnalysis.objects?.length || 0
+          });
+        }
+      }
+    },
+
+    // 2. Analizar con sistema de comparación CIENTÍFICA (usa EXIF si está disponible)
+    scientific: {
+      waitFor: ['exif'],
+      critical: true,
+      progressMessage: 'Capa 4: Comparación científica (1,064 objetos)',
+      imageSizes: [ImageContext.SIZES.LARGE, ImageContext.SIZES.SMALL],
+      timeoutMs: LAYER_TIMEOUTS.scientific,
+      run: async () => {
+        console.log('🔬 Analizando con comparación científica...');
+
+        const analysisResult = await scientificComparisonService.analyzeImageScientifically(
+          analysis.filePath,
+          analysis.exifData,
+          imageContext
+        );
+
+        if (analysisResult.success) {
+          return { analysisResult, preliminaryAnalysis: analysisResult.data };
+        }
+
+        // Fallback: análisis básico
+        console.log('⚠️ Sistema de comparación falló, generando análisis básico...');
+        return {
+          analysisResult,
+          preliminaryAnalysis: scientificComparisonService.basicPreliminaryAnalysis()
+        };
+      },
+      onComplete: ({ analysisResult }) => {
+        rescoring.recordInputs(analysis, 'scientific', analysisResult.inputs);
+        if (!analysisResult.success) return;
+
+        console.log(`✅ Análisis completado: ${analysisResult.data.category} (${analysisResult.data.confidence}%)`);
+
+        emitLayerComplete(analysisId, 4, 'Comparación Científica', {
+          category: analysisResult.data.category,
+          confidence: analysisResult.data.confidence,
+          matches: analysisResult.data.rawResponse?.allMatches?.length || 0
+        });
+
+        // 3. Asignar mejor coincidencia
+        if (analysisResult.data.rawResponse?.bestMatch) {
+          const bestMatch = analysisResult.data.rawResponse.bestMatch;
+          analysis.bestMatch = {
+            objectId: bestMatch.objectId,
+            category: bestMatch.category,
+            matchPercentage: bestMatch.matchPercentage
+          };
+
+          // Guardar todos los matches
+          analysis.matchResults = analysisResult.data.rawResponse.allMatches || [];
+        }
+      }
+    },
+
+    // 2.5. MEJORAR CON DATOS DE ENTRENAMIENTO
+    training: {
+      deps: ['scientific'],
+      critical: true,
+      progressMessage: 'Capa 5: Mejora con entrenamiento',
+      imageSizes: [ImageContext.SIZES.LARGE, ImageContext.SIZES.SMALL],
+      timeoutMs: LAYER_TIMEOUTS.training,
+      run: (results) => {
+        console.log('🎓 Mejorando análisis con datos de entrenamiento...');
+        return trainingLearningService.enhanceAnalysisWithTraining(
+          analysis.filePath,
+          results.scientific.preliminaryAnalysis,
+          analysis.exifData,
+          imageContext
+        );
+      },
+      onComplete: (trainingEnhancement) => {
+        rescoring.recordInputs(analysis, 'training', trainingEnhancement.inputs);
+
+        // Usar análisis mejorado si está disponible (y guardar datos de mejora para auditoría)
+        trainingLearningService.applyEnhancement(analysis, trainingEnhancement);
+        if (trainingEnhancement.enhanced) {
+          console.log(`✨ Análisis mejorado con entrenamiento: confianza aumentada de ${trainingEnhancement.originalAnalysis.confidence}% a ${trainingEnhancement.enhancedAnalysis.confidence}%`);
+
+          emitLayerComplete(analysisId, 5, 'Training Enhancement', {
+            enhanced: true,
+            improvementDelta: trainingEnhancement.improvementDelta,
+            matchCount: trainingEnhancement.enhancedAnalysis.trainingData?.matchCount || 0
+          });
+        } else {
+          console.log('ℹ️ No se pudo mejorar con datos de entrenamiento');
+
+          emitLayerComplete(analysisId, 5, 'Training Enhancement', {
+            enhanced: false
+          });
+        }
+      }
+    },
 
     // 3.5. VALIDACIÓN EXTERNA (si hay coordenadas GPS y timestamp)
-    if (analysis.exifData?.location && (analysis.exifData.captureDate || analysis.exifData.captureTime)) {
-      const { latitude, longitude, altitude } = analysis.exifData.location;
-      const datetime = analysis.exifData.captureDate || analysis.exifData.captureTime;
-      
-      if (latitude && longitude && datetime) {
+    externalValidation: {
+      waitFor: ['exif'],
+      progressMessage: 'Capa 6: Validación externa',
+      timeoutMs: LAYER_TIMEOUTS.externalValidation,
+      run: async () => {
+        if (!(analysis.exifData?.location && (analysis.exifData.captureDate || analysis.exifData.captureTime))) {
+          console.log('ℹ️ No hay datos de ubicación/fecha para validación externa');
+          return null;
+        }
+
+        const { latitude, longitude, altitude } = analysis.exifData.location;
+        const datetime = analysis.exifData.captureDate || analysis.exifData.captureTime;
+
+        if (!(latitude && longitude && datetime)) {
+          console.log('ℹ️ No hay coordenadas GPS completas para validación externa');
+          return null;
+        }
+
         console.log('🌍 Iniciando validación externa con APIs...');
-        WebSocketService.emitProgress(analysisId, 60, 'Capa 6: Validación externa');
         console.log(`   Coordenadas: ${latitude}, ${longitude}`);
         console.log(`   Fecha/hora: ${datetime}`);
-        
-        try {
-          const validationResult = await externalValidationService.validateSighting(
+
+        // Imágenes de un mismo lote con igual posición y hora comparten la consulta
+        const validationResult = await batchService.shared(
+          analysis.batchId,
+          'externalValidation',
+          `${latitude},${longitude},${altitude}|${new Date(datetime).getTime() || datetime}`,
+          () => externalValidationService.validateSighting(
             { lat: latitude, lng: longitude },
             datetime,
             altitude
-          );
-
-          // Guardar resultados de validación externa
-          analysis.externalValidation = {
-            performed: true,
-            performedAt: new Date(),
-            coordinates: { latitude, longitude },
-            timestamp: datetime,
-            results: validationResult,
-            hasMatches: validationResult.matches && validationResult.matches.length > 0,
-            matchCount: validationResult.matches ? validationResult.matches.length : 0,
-            confidence: validationResult.confidence || 0
-          };
+          )
+        );
 
-          WebSocketService.emitLayerComplete(analysisId, 6, 'Validación Externa', {
-            matchCount: validationResult.matches ? validationResult.matches.length : 0,
-            hasMatches: validationResult.matches && validationResult.matches.length > 0
-          });
+        return { latitude, longitude, datetime, validationResult };
+      },
+      onComplete: (result) => {
+        if (!result) return;
+        const { latitude, longitude, datetime, validationResult } = result;
 
-          // Si hay coincidencias, agregar a recomendaciones
-          if (validationResult.matches && validationResult.matches.length > 0) {
-            if (!analysis.aiAnalysis.recommendations) {
-              analysis.aiAnalysis.recommendations = [];
-            }
-            
-            const matchTypes = [...new Set(validationResult.matches.map(m => m.type))];
-            analysis.aiAnalysis.recommendations.push(
-              `VALIDACIÓN EXTERNA: Se detectaron ${validationResult.matches.length} coincidencia(s) con objetos conocidos: ${matchTypes.join(', ')}`
-            );
-          }
-
-          console.log(`✅ Validación externa completada: ${validationResult.matchCount} coincidencias encontradas`);
-        } catch (validationError) {
-          console.error('❌ Error en validación externa:', validationError.message);
-          analysis.externalValidation = {
-            performed: true,
-            performedAt: new Date(),
-            error: validationError.message,
-            hasMatches: false
-          };
-        }
-      } else {
-        console.log('ℹ️ No hay coordenadas GPS completas para validación externa');
+        // Guardar resultados de validación externa
+        analysis.externalValidation = {
+          performed: true,
+          performedAt: new Date(),
+          coordinates: { latitude, longitude },
+          timestamp: datetime,
+          results: validationResult,
+          hasMatches: validationResult.matches && validationResult.matches.length > 0,
+          matchCount: validationResult.matches ? validationResult.matches.length : 0,
+          confidence: validationResult.confidence || 0
+        };
+
+        emitLayerComplete(analysisId, 6, 'Validación Externa', {
+          matchCount: validationResult.matches ? validationResult.matches.length : 0,
+          hasMatches: validationResult.matches && validationResult.matches.length > 0
+        });
+
+        console.log(`✅ Validación externa completada: ${validationResult.matchCount} coincidencias encontradas`);
+      },
+      onError: (validationError) => {
+        analysis.externalValidation = {
+          performed: true,
+          performedAt: new Date(),
+          error: validationError.message,
+          hasMatches: false
+        };
       }
-    } else {
-      console.log('ℹ️ No hay datos de ubicación/fecha para validación externa');
-    }
+    },
+
+    // 3.6. ANÁLISIS METEOROLÓGICO (si hay coordenadas GPS)
+    weather: {
+      waitFor: ['exif'],
+      progressMessage: 'Capa 7: Análisis meteorológico',
+      timeoutMs: LAYER_TIMEOUTS.weather,
+      run: () => {
+        const { latitude, longitude } = analysis.exifData?.location || {};
+        if (!(latitude && longitude)) return null;
 
-    // 3.6. ANÁLISIS METEOROLÓGICO Y ATMOSFÉRICO
-    if (analysis.exifData?.location) {
-      const { latitude, longitude } = analysis.exifData.location;
-      
-      if (latitude && longitude) {
         console.log('🌤️  Obteniendo datos meteorológicos...');
-        WebSocketService.emitProgress(analysisId, 70, 'Capa 7: Análisis meteorológico');
-        
-        try {
-          const weatherData = await weatherService.getCurrentWeather(latitude, longitude);
-          
-          if (!weatherData.error) {
-            analysis.weatherData = weatherData;
-            console.log(`✅ Datos meteorológicos obtenidos: ${weatherData.conditions.description}, ${weatherData.temperature.current}°C`);
-            
-            WebSocketService.emitLayerComplete(analysisId, 7, 'Análisis Meteorológico', {
-              temperature: weatherData.temperature.current,
-              conditions: weatherData.conditions.description
-            });
-            
-            // Agregar análisis atmosférico a recomendaciones
-            if (weatherData.analysis) {
-              if (!analysis.aiAnalysis.recommendations) {
-                analysis.aiAnalysis.recommendations = [];
-              }
-              
-              if (weatherData.analysis.weather_explanation_probability === 'high' || 
-                  weatherData.analysis.weather_explanation_probability === 'very_high') {
-                analysis.aiAnalysis.recommendations.push(
-                  `⚠️ ALERTA METEOROLÓGICA: Condiciones climáticas con alta probabilidad de explicar el avistamiento`
-                );
-              }
-              
-              if (weatherData.analysis.warnings.length > 0) {
-                weatherData.analysis.warnings.forEach(warning => {
-                  analysis.aiAnalysis.recommendations.push(`🌤️  ${warning}`);
-                });
-              }
-            }
-            
-            // Comparar con fenómenos atmosféricos
-            console.log('☁️  Comparando con fenómenos atmosféricos conocidos...');
-            WebSocketService.emitProgress(analysisId, 80, 'Capa 8: Comparación atmosférica (23 fenómenos)');
-            
-            const atmosphericComparison = await atmosphericComparisonService.compareWithAtmosphericPhenomena(
-              analysis.visualAnalysis,
-              weatherData,
-              analysis.exifData
-            );
-            
-            if (!atmosphericComparison.error) {
-              analysis.atmosphericComparison = atmosphericComparison;
-              
-              if (atmosphericComparison.hasStrongMatch) {
-                const bestMatch = atmosphericComparison.bestMatch;
-                console.log(`🌩️  COINCIDENCIA ATMOSFÉRICA FUERTE: ${bestMatch.phenomenon.name} (${bestMatch.score}% confianza)`);
-                
-                WebSocketService.emitLayerComplete(analysisId, 8, 'Comparación Atmosférica', {
-                  phenomenon: bestMatch.phenomenon.name,
-                  score: bestMatch.score,
-                  hasStrongMatch: true
-                });
-                
-                if (!analysis.aiAnalysis.recommendations) {
-                  analysis.aiAnalysis.recommendations = [];
-                }
-                
-                analysis.aiAnalysis.recommendations.unshift(
-                  `☁️  FENÓMENO ATMOSFÉRICO: Alta probabilidad de ser "${bestMatch.phenomenon.name}" - ${bestMatch.phenomenon.description}`
-                );
-                
-                // Si la coincidencia es muy fuerte, ajustar categoría
-                if (bestMatch.score > 80) {
-                  analysis.aiAnalysis.category = 'natural';
-                  analysis.aiAnalysis.description = `Posible ${bestMatch.phenomenon.name}. ${bestMatch.explanation}`;
-                }
-              } else {
-                console.log(`ℹ️ Comparación atmosférica: ${atmosphericComparison.totalMatches} coincidencias encontradas`);
-                WebSocketService.emitLayerComplete(analysisId, 8, 'Comparación Atmosférica', {
-                  matchCount: atmosphericComparison.totalMatches,
-                  hasStrongMatch: false
-                });
-              }
-            }
-            
-          } else {
-            console.log('⚠️ Datos meteorológicos no disponibles:', weatherData.error);
-          }
-          
-        } catch (weatherError) {
-          console.error('❌ Error obteniendo datos meteorológicos:', weatherError.message);
+        // Tiempo actual: en un lote se comparte por celda de ~1 km
+        return batchService.shared(
+          analysis.batchId,
+          'weather',
+          `${latitude.toFixed(2)},${longitude.toFixed(2)}`,
+          () => weatherService.getCurrentWeather(latitude, longitude)
+        );
+      },
+      onComplete: (weatherData) => {
+        if (!weatherData) return;
+
+        if (weatherData.error) {
+          console.log('⚠️ Datos meteorológicos no disponibles:', weatherData.error);
+          return;
         }
+
+        analysis.weatherData = weatherData;
+        console.log(`✅ Datos meteorológicos obtenidos: ${weatherData.conditions.description}, ${weatherData.temperature.current}°C`);
+
+        emitLayerComplete(analysisId, 7, 'Análisis Meteorológico', {
+          temperature: weatherData.temperature.current,
+          conditions: weatherData.conditions.description
+        });
       }
-    }
+    },
+
+    // 3.6.1. Comparar con fenómenos atmosféricos (clima + características visuales)
+    atmospheric: {
+      deps: ['weather'],
+      waitFor: ['visual'],
+      progressMessage: 'Capa 8: Comparación atmosférica (23 fenómenos)',
+      timeoutMs: LAYER_TIMEOUTS.atmospheric,
+      run: (results) => {
+        const weatherData = results.weather;
+        if (!weatherData || weatherData.error) return null;
+
+        console.log('☁️  Comparando con fenómenos atmosféricos conocidos...');
+        return atmosphericComparisonService.compareWithAtmosphericPhenomena(
+          analysis.visualAnalysis,
+          weatherData,
+          analysis.exifData
+        );
+      },
+      onComplete: (atmosphericComparison) => {
+        if (!atmosphericComparison || atmosphericComparison.error) return;
+
+        analysis.atmosphericComparison = atmosphericComparison;
+
+        if (atmosphericComparison.hasStrongMatch) {
+          const bestMatch = atmosphericComparison.bestMatch;
+          console.log(`🌩️  COINCIDENCIA ATMOSFÉRICA FUERTE: ${bestMatch.phenomenon.name} (${bestMatch.score}% confianza)`);
+
+          emitLayerComplete(analysisId, 8, 'Comparación Atmosférica', {
+            phenomenon: bestMatch.phenomenon.name,
+            score: bestMatch.score,
+            hasStrongMatch: true
+          });
+        } else {
+          console.log(`ℹ️ Comparación atmosférica: ${atmosphericComparison.totalMatches} coincidencias encontradas`);
+          emitLayerComplete(analysisId, 8, 'Comparación Atmosférica', {
+            matchCount: atmosphericComparison.totalMatches,
+            hasStrongMatch: false
+          });
+        }
+      }
+    },
 
     // 3.7. CALCULAR CONFIANZA PONDERADA (fusionar todos los datos)
-    console.log('🎯 Calculando confianza ponderada con todos los datos...');
-    WebSocketService.emitProgress(analysisId, 90, 'Capa 9: Fusión de confianza');
-    
-    try {
-      const weightedResult = confidenceCalculatorService.calculateWeightedConfidence(
-        analysis.aiAnalysis,
-        analysis.externalValidation || {},
-        analysis.trainingEnhancement || {},
-        analysis.exifData || {},
-        analysis.visualAnalysis || null // NUEVO: incluir análisis visual
-      );
+    // Espera solo a sus entradas reales; no bloquea el análisis si falla
+    confidence: {
+      deps: ['training'],
+      waitFor: ['visual', 'externalValidation', 'weather', 'atmospheric'],
+      progressMessage: 'Capa 9: Fusión de confianza',
+      timeoutMs: LAYER_TIMEOUTS.confidence,
+      run: () => {
+        // Entradas de la fusión para re-puntuarla sin repetir el análisis
+        rescoring.recordInputs(analysis, 'fusion', rescoring.fusionInputs(analysis.aiAnalysis));
 
-      // Actualizar análisis con resultados ponderados
-      const originalConfidence = analysis.aiAnalysis.confidence;
-      const originalCategory = analysis.aiAnalysis.category;
+        // Volcar recomendaciones de contexto (en el mismo orden que el pipeline secuencial)
+        confidenceCalculatorService.applyContextRecommendations(analysis);
 
-      analysis.aiAnalysis.confidence = weightedResult.finalConfidence;
-      analysis.aiAnalysis.category = weightedResult.finalCategory;
-      
-      WebSocketService.emitLayerComplete(analysisId, 9, 'Confianza Ponderada', {
-        finalConfidence: weightedResult.finalConfidence,
-        originalConfidence: originalConfidence,
-        adjustments: weightedResult.adjustments
-      });
-      analysis.aiAnalysis.description = weightedResult.finalDescription;
+        console.log('🎯 Calculando confianza ponderada con todos los datos...');
+        return confidenceCalculatorService.calculateWeightedConfidence(
+          analysis.aiAnalysis,
+          analysis.externalValidation || {},
+          analysis.trainingEnhancement || {},
+          analysis.exifData || {},
+          analysis.visualAnalysis || null // NUEVO: incluir análisis visual
+        );
+      },
+      onComplete: (weightedResult) => {
+        // Actualizar análisis con resultados ponderados
+        const originalConfidence = analysis.aiAnalysis.confidence;
+        const originalCategory = analysis.aiAnalysis.category;
 
-      // Guardar desglose de confianza para auditoría
-      analysis.confidenceBreakdown = weightedResult.breakdown;
-      analysis.confidenceAdjustments = weightedResult.adjustments;
-      analysis.confidenceExplanation = weightedResult.explanation;
+        // Confianza, categoría, descripción, desglose para auditoría y explicación
+        confidenceCalculatorService.applyWeightedResult(analysis, weightedResult);
 
-      // Agregar explicación a recomendaciones
-      if (!analysis.aiAnalysis.recommendations) {
-        analysis.aiAnalysis.recommendations = [];
+        emitLayerComplete(analysisId, 9, 'Confianza Ponderada', {
+          finalConfidence: weightedResult.finalConfidence,
+          originalConfidence: originalConfidence,
+          adjustments: weightedResult.adjustments
+        });
+
+        console.log(`🎯 Confianza ajustada: ${originalConfidence}% → ${weightedResult.finalConfidence}%`);
+        if (originalCategory !== weightedResult.finalCategory) {
+          console.log(`📝 Categoría ajustada: "${originalCategory}" → "${weightedResult.finalCategory}"`);
+        }
       }
-      analysis.aiAnalysis.recommendations.push(
-        `CONFIANZA PONDERADA: ${weightedResult.explanation}`
-      );
+    }
+  };
+}
+
+// ==================== VÍDEO ====================
+
+// Capas de imagen que se ejecutan sobre cada fotograma clave
+const KEYFRAME_LAYERS = ['visual', 'localAi', 'scientific', 'training'];
+// Fotogramas clave analizados a la vez (sus kernels van al pool de workers)
+const VIDEO_FRAME_CONCURRENCY = Math.max(1, parseInt(process.env.VIDEO_FRAME_CONCURRENCY, 10) || 2);
+
+/**
+ * Capas del análisis de un vídeo: metadatos del contenedor en lugar de EXIF,
+ * fotogramas clave analizados con las capas de imagen y, sobre el resultado
+ * agregado, las mismas capas de contexto y fusión que una imagen
+ * @param {Object} analysis - Documento Analysis en proceso (fileType 'video')
+ * @returns {Object} Grafo de capas para LayerSchedulerService
+ */
+function buildVideoLayers(analysis) {
+  const analysisId = analysis._id.toString();
+  const imageLayers = buildAnalysisLayers(analysis, null);
+
+  return {
+    exif: {
+      progressMessage: 'Capa 1: Metadatos del vídeo',
+      timeoutMs: LAYER_TIMEOUTS.exif,
+      run: () => videoAnalysisService.probe(analysis.filePath),
+      onComplete: (probe) => {
+        analysis.exifData = videoAnalysisService.metadataToExif(probe);
+        WebSocketService.emitLayerComplete(analysisId, 1, 'Metadatos de vídeo', {
+          durationSec: probe.durationSec,
+          hasGPS: !!analysis.exifData.location,
+          hasTimestamp: !!analysis.exifData.captureDate
+        });
+      }
+    },
+
+    frames: {
+      waitFor: ['exif'],
+      critical: true,
+      progressMessage: 'Capa 2: Fotogramas clave del vídeo',
+      timeoutMs: LAYER_TIMEOUTS.videoFrames,
+      run: (results) => analyzeVideoFrames(analysis, results.exif),
+      onComplete: ({ representative, videoAnalysis, recommendations }) => {
+        analysis.visualAnalysis = representative.visualAnalysis;
+        analysis.localAiAnalysis = representative.localAiAnalysis;
+        analysis.aiAnalysis = representative.aiAnalysis;
+        analysis.aiAnalysis.recommendations = [
+          ...(representative.aiAnalysis.recommendations || []),
+          ...recommendations
+        ];
+        analysis.trainingEnhancement = representative.trainingEnhancement;
+        if (representative.bestMatch) {
+          analysis.bestMatch = representative.bestMatch;
+          analysis.matchResults = representative.matchResults || [];
+        }
+        analysis.videoAnalysis = videoAnalysis;
 
-      console.log(`🎯 Confianza ajustada: ${originalConfidence}% → ${weightedResult.finalConfidence}%`);
-      if (originalCategory !== weightedResult.finalCategory) {
-        console.log(`📝 Categoría ajustada: "${originalCategory}" → "${weightedResult.finalCategory}"`);
+        console.log(`✅ Vídeo analizado: ${videoAnalysis.keyframes.length} fotogramas clave de ${videoAnalysis.sampledFrames} muestreados, ${videoAnalysis.stability.category} (${Math.round(videoAnalysis.stability.categoryAgreement * 100)}% de acuerdo)`);
+        WebSocketService.emitLayerComplete(analysisId, 2, 'Análisis de Vídeo', {
+          keyframes: videoAnalysis.keyframes.length,
+          category: videoAnalysis.stability.category,
+          categoryAgreement: videoAnalysis.stability.categoryAgreement,
+          blinkCount: videoAnalysis.brightness.blinkCount
+        });
       }
+    },
 
-    } catch (confidenceError) {
-      console.error('❌ Error al calcular confianza ponderada:', confidenceError.message);
-      // No bloquear el análisis si falla el cálculo de confianza
+    externalValidation: imageLayers.externalValidation,
+    weather: imageLayers.weather,
+    atmospheric: { ...imageLayers.atmospheric, waitFor: ['frames'] },
+    confidence: {
+      ...imageLayers.confidence,
+      deps: ['frames'],
+      waitFor: ['externalValidation', 'weather', 'atmospheric']
     }
+  };
+}
 
-    // 4. Actualizar estado
-    analysis.status = 'completed';
-    analysis.errorMessage = null;
-    
-    await analysis.save();
-    console.log(`✅ Análisis guardado: ${analysis.fileName}`);
-    
-    // Emitir evento de análisis completado
-    WebSocketService.emitProgress(analysisId, 100, 'Análisis completado');
-    WebSocketService.emitAnalysisComplete(analysisId, {
-      status: 'completed',
-      confidence: analysis.aiAnalysis?.confidence || 0,
-      category: analysis.aiAnalysis?.category || 'unknown'
-    });
+/**
+ * Muestrear el vídeo, analizar sus fotogramas clave y agregar en el tiempo
+ * @param {Object} analysis - Documento Analysis en proceso
+ * @param {Object} probe - Metadatos de ffprobe (capa exif), si los hay
+ * @returns {Promise<{representative, videoAnalysis, recommendations}>}
+ */
+async function analyzeVideoFrames(analysis, probe) {
+  const analysisId = analysis._id.toString();
+  const startedAt = Date.now();
 
-    // 5. Enviar notificación al usuario
-    await NotificationService.notifyAnalysisCompleted(
-      analysis.userId,
-      analysis._id,
-      {
-        fileName: analysis.fileName,
-        category: analysis.aiAnalysis?.category || 'unknown',
-        confidence: analysis.aiAnalysis?.confidence || 0
+  const extraction = await videoAnalysisService.extract(analysis.filePath, {
+    probe,
+    framesDir: videoAnalysisService.framesDir(analysis),
+    onProgress: (fraction) => {
+      WebSocketService.emitProgress(analysisId, Math.round(10 + fraction * 30), 'Muestreando fotogramas del vídeo');
+    }
+  });
+  const { keyframes } = extraction;
+
+  // Fotogramas clave en paralelo con concurrencia acotada
+  const frames = new Array(keyframes.length);
+  let next = 0;
+  let done = 0;
+  const worker = async () => {
+    while (next < keyframes.length) {
+      const i = next++;
+      try {
+        frames[i] = await analyzeKeyframe(analysis, keyframes[i]);
+      } finally {
+        keyframes[i].context.release();
       }
-    );
+      done++;
+      WebSocketService.emitProgress(analysisId, Math.round(40 + (done / keyframes.length) * 40), `Fotograma clave ${done}/${keyframes.length}`);
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(VIDEO_FRAME_CONCURRENCY, keyframes.length) }, worker));
 
-  } catch (error) {
-    console.error('Error en análisis:', error);
-    
-    if (analysis) {
-      analysis.status = 'error';
-      analysis.errorMessage = error.message;
-      await analysis.save();
-      
-      // Emitir evento de error por WebSocket
-      WebSocketService.emitAnalysisError(analysisId, {
-        message: error.message,
-        stack: error.stack
-      });
+  const summaries = frames.map(({ frame, error }, i) => ({
+    index: keyframes[i].index,
+    time: keyframes[i].time,
+    sceneScore: keyframes[i].sceneScore,
+    path: keyframes[i].path,
+    category: frame.aiAnalysis?.category || null,
+    confidence: frame.aiAnalysis?.confidence ?? null,
+    objectId: frame.bestMatch?.objectId || null,
+    matchPercentage: frame.bestMatch?.matchPercentage ?? null,
+    error
+  }));
+
+  const analyzed = summaries.filter(summary => summary.category);
+  if (analyzed.length === 0) {
+    throw new Error('Ningún fotograma clave del vídeo pudo analizarse');
+  }
+
+  // Resultados principales: el fotograma más seguro de la categoría mayoritaria
+  const stability = videoAnalysisService.summarizeStability(analyzed);
+  let representativeFrame = -1;
+  summaries.forEach((summary, i) => {
+    if (summary.category !== stability.category) return;
+    if (representativeFrame < 0 || summary.confidence > summaries[representativeFrame].confidence) {
+      representativeFrame = i;
     }
+  });
+
+  const trajectory = videoAnalysisService.summarizeTrajectory(extraction.timeline);
+  const brightness = videoAnalysisService.summarizeBrightness(extraction.timeline);
+
+  return {
+    representative: frames[representativeFrame].frame,
+    recommendations: videoAnalysisService.temporalRecommendations({ trajectory, brightness, stability }),
+    videoAnalysis: {
+      durationSec: extraction.probe.durationSec,
+      analyzedSec: extraction.analyzedSec,
+      truncated: extraction.truncated,
+      width: extraction.probe.width,
+      height: extraction.probe.height,
+      fps: extraction.probe.fps,
+      codec: extraction.probe.codec,
+      sampleFps: videoAnalysisService.sampleFps,
+      sampledFrames: extraction.sampledFrames,
+      keyframes: summaries,
+      representativeFrame,
+      trajectory,
+      brightness,
+      stability,
+      processingMs: Date.now() - startedAt
+    }
+  };
+}
+
+/**
+ * Ejecutar las capas de imagen sobre un fotograma clave. Los resultados se
+ * vuelcan en un objeto de análisis propio del fotograma (no en el documento)
+ */
+async function analyzeKeyframe(analysis, keyframe) {
+  const frame = {
+    _id: `${analysis._id}:keyframe${keyframe.index}`,
+    filePath: keyframe.path,
+    fileType: 'image',
+    exifData: analysis.exifData,
+    batchId: null
+  };
+
+  const imageLayers = buildAnalysisLayers(frame, keyframe.context, { emit: false });
+  const layers = { exif: { timeoutMs: LAYER_TIMEOUTS.exif, run: () => null } };
+  for (const name of KEYFRAME_LAYERS) {
+    layers[name] = imageLayers[name];
+  }
+
+  try {
+    await LayerSchedulerService.run(telemetry.wrapLayers(layers));
+    return { frame };
+  } catch (error) {
+    console.error(`⚠️ Fotograma clave ${keyframe.index} sin analizar:`, error.message);
+    return { frame, error: error.message };
   }
 }
 
@@ -0,0 +1,217 @@
+const express = require('express');
+const router = express.Router();
+const multer = require('multer');
+const path = require('path');
+const fs = require('fs');
+const auth = require('../middleware/auth');
+const AnalysisBatch = require('../models/AnalysisBatch');
+const batchService = require('../services/batchService');
+const ingestService = require('../services/ingestService');
+
+// Las imágenes van al mismo directorio que las subidas individuales; los ZIP
+// a un directorio temporal del que se borran tras expandirse
+const imagesDir = path.join(__dirname, '..', 'uploads', 'images');
+const archivesDir = path.join(__dirname, '..', 'uploads', 'batches');
+[imagesDir, archivesDir].forEach(dir => fs.mkdirSync(dir, { recursive: true }));
+
+const ZIP_TYPES = ['application/zip', 'application/x-zip-compressed', 'multipart/x-zip'];
+const IMAGE_TYPES = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp'];
+
+const MAX_ARCHIVE_MB = parseInt(process.env.BATCH_MAX_ARCHIVE_MB, 10) || 500;
+const MAX_FILES = parseInt(process.env.BATCH_MAX_FILES, 10) || 200;
+
+const upload = multer({
+  storage: ingestService.storage({
+    destination: (req, file, cb) => {
+      cb(null, ZIP_TYPES.includes(file.mimetype) ? archivesDir : imagesDir);
+    },
+    filename: (req, file, cb) => {
+      const sanitizedName = file.originalname.replace(/[^a-zA-Z0-9.-]/g, '_');
+      cb(null, `${Date.now()}-${req.userId || 'anonymous'}-${sanitizedName}`);
+    }
+  }),
+  fileFilter: (req, file, cb) => {
+    if (IMAGE_TYPES.includes(file.mimetype) || ZIP_TYPES.includes(file.mimetype)) {
+      cb(null, true);
+    } else {
+      cb(new Error(`Tipo de archivo no permitido en un lote: ${file.mimetype}. Solo imágenes (jpg, png, gif, webp) o archivos ZIP.`), false);
+    }
+  },
+  limits: {
+    fileSize: MAX_ARCHIVE_MB * 1024 * 1024,
+    files: MAX_FILES
+  }
+});
+
+/**
+ * Cargar un lote verificando que pertenece al usuario (o es admin)
+ */
+async function findBatch(req, res) {
+  const batch = await AnalysisBatch.findById(req.params.id);
+
+  if (!batch) {
+    res.status(404).json({ error: 'Lote no encontrado.' });
+    return null;
+  }
+  if (req.userRole !== 'admin' && batch.userId.toString() !== req.userId) {
+    res.status(403).json({ error: 'No tienes permiso para ver este lote.' });
+    return null;
+  }
+  return batch;
+}
+
+// POST /api/batch - Crear un lote con imágenes sueltas y/o archivos ZIP (campo "files")
+router.post('/', auth, upload.array('files', MAX_FILES), async (req, res) => {
+  try {
+    if (!req.files || req.files.length === 0) {
+      return res.status(400).json({ error: 'No se ha proporcionado ningún archivo.' });
+    }
+
+    const batch = await batchService.createBatch({
+      userId: req.userId,
+      name: req.body.name || null,
+      files: req.files
+    });
+
+    res.status(202).json({
+      message: 'Lote creado. Las imágenes se analizarán en segundo plano.',
+      batch: {
+        id: batch._id,
+        name: batch.name,
+        status: batch.status,
+        total: batch.total,
+        sources: batch.sources,
+        skipped: batch.skipped
+      },
+      // Canal de WebSocket con el resultado de cada imagen
+      channel: `batch:${batch._id}`
+    });
+
+  } catch (error) {
+    console.error('Error al crear lote:', error);
+
+    if (req.files) {
+      await Promise.all(req.files.map(file => ingestService.remove(file.path, file.ingest)));
+    }
+    res.status(500).json({ error: 'Error al crear el lote.' });
+  }
+});
+
+// GET /api/batch - Lotes del usuario
+router.get('/', auth, async (req, res) => {
+  try {
+    const { limit = 20, offset = 0 } = req.query;
+    const filter = { userId: req.userId };
+
+    const [batches, total] = await Promise.all([
+      AnalysisBatch.find(filter)
+        .sort({ createdAt: -1 })
+        .skip(parseInt(offset))
+        .limit(parseInt(limit))
+        .select('-skipped -summary.errors')
+        .lean(),
+      AnalysisBatch.countDocuments(filter)
+    ]);
+
+    res.json({
+      batches,
+      pagination: {
+        total,
+        limit: parseInt(limit),
+        offset: parseInt(offset),
+        hasMore: total > (parseInt(offset) + parseInt(limit))
+      }
+    });
+
+  } catch (error) {
+    console.error('Error al obtener lotes:', error);
+    res.status(500).json({ error: 'Error al obtener los lotes.' });
+  }
+});
+
+// GET /api/batch/:id - Estado, progreso, resumen e imágenes del lote
+router.get('/:id', auth, async (req, res) => {
+  try {
+    let batch = await findBatch(req, res);
+    if (!batch) return;
+
+    // Recalcular por si algún análisis terminó fuera del pipeline
+    // (p. ej. trabajo recuperado sin intentos restantes)
+    if (batch.status === 'processing') {
+      batch = await batchService.refresh(batch._id) || batch;
+    }
+
+    const { status, limit = 100, offset = 0 } = req.query;
+    const items = await batchService.getItems(batch, {
+      status: status || null,
+      limit: Math.min(parseInt(limit) || 100, 500),
+      offset: parseInt(offset) || 0
+    });
+
+    res.json({
+      batch,
+      progress: batch.total > 0
+        ? Math.round(((batch.counts.completed + batch.counts.error) / batch.total) * 100)
+        : 100,
+      items
+    });
+
+  } catch (error) {
+    console.error('Error al obtener lote:', error);
+    if (error.kind === 'ObjectId') {
+      return res.status(400).json({ error: 'ID de lote inválido.' });
+    }
+    res.status(500).json({ error: 'Error al obtener el lote.' });
+  }
+});
+
+// GET /api/batch/:id/summary - Solo el resumen (categorías, confianza, errores)
+router.get('/:id/summary', auth, async (req, res) => {
+  try {
+    let batch = await findBatch(req, res);
+    if (!batch) return;
+
+    if (batch.status === 'processing') {
+      batch = await batchService.refresh(batch._id) || batch;
+    }
+
+    res.json({
+      id: batch._id,
+      status: batch.status,
+      total: batch.total,
+      counts: batch.counts,
+      skipped: batch.skipped.length,
+      summary: batch.summary || await batchService.summarize(batch),
+      startedAt: batch.startedAt,
+      finishedAt: batch.finishedAt
+    });
+
+  } catch (error) {
+    console.error('Error al obtener resumen del lote:', error);
+    if (error.kind === 'ObjectId') {
+      return res.status(400).json({ error: 'ID de lote inválido.' });
+    }
+    res.status(500).json({ error: 'Error al obtener el resumen del lote.' });
+  }
+});
+
+// Manejo de errores de Multer
+router.use((error, req, res, next) => {
+  if (error instanceof multer.MulterError) {
+    if (error.code === 'LIMIT_FILE_SIZE') {
+      return res.status(400).json({ error: `Archivo demasiado grande. Tamaño máximo: ${MAX_ARCHIVE_MB}MB.` });
+    }
+    if (error.code === 'LIMIT_FILE_COUNT') {
+      return res.status(400).json({ error: `Demasiados archivos. Máximo: ${MAX_FILES}.` });
+    }
+    return res.status(400).json({ error: `Error al subir archivos: ${error.message}` });
+  }
+
+  if (error.message && error.message.includes('Tipo de archivo no permitido')) {
+    return res.status(400).json({ error: error.message });
+  }
+
+  next(error);
+});
+
+module.exports = router;
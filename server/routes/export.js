@@ -3,6 +3,7 @@ const router = express.Router();
 const auth = require('../middleware/auth');
 const Analysis = require('../models/Analysis');
 const PDFService = require('../services/pdfService');
+const analysisPayloads = require('../services/analysisPayloadService');
 
 // POST /api/export/:id/generate - Generar y descargar PDF del análisis
 router.post('/:id/generate', auth, async (req, res) => {
@@ -11,6 +12,7 @@ router.post('/:id/generate', auth, async (req, res) => {
     console.log(`[export] Generar PDF para analysisId=${id} solicitado por user=${req.userId}`);
     const analysis = await Analysis.findById(id).lean();
     if (!analysis) return res.status(404).json({ error: 'Análisis no encontrado.' });
+    await analysisPayloads.attach(analysis);
 
     // Create PDF document stream
     const doc = PDFService.createAnalysisPdfDoc(analysis);
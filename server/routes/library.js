@@ -3,6 +3,8 @@ const router = express.Router();
 const UFODatabase = require('../models/UFODatabase');
 const AtmosphericPhenomenon = require('../models/AtmosphericPhenomenon');
 const TrainingImage = require('../models/TrainingImage');
+const statsService = require('../services/statsService');
+const libraryCatalog = require('../services/libraryCatalogService');
 const auth = require('../middleware/auth');
 const isAdmin = require('../middleware/isAdmin');
 const multer = require('multer');
@@ -15,6 +17,20 @@ const fs = require('fs').promises;
  * Endpoints para la biblioteca visual de fenómenos y objetos
  */
 
+// Catálogo público: respuestas cacheadas con ETag (services/libraryCatalogService.js)
+const CATALOG_MAX_AGE_SEC = parseInt(process.env.LIBRARY_HTTP_MAX_AGE_SEC, 10) || 60;
+
+function sendCatalog(req, res, { body, etag }) {
+  res.set('ETag', etag);
+  res.set('Cache-Control', `public, max-age=${CATALOG_MAX_AGE_SEC}`);
+
+  // If-None-Match coincide: el cliente ya tiene esta versión
+  if (req.fresh) {
+    return res.status(304).end();
+  }
+  res.type('json').send(body);
+}
+
 // ============================================
 // FENÓMENOS ATMOSFÉRICOS
 // ============================================
@@ -22,77 +38,16 @@ const fs = require('fs').promises;
 /**
  * GET /api/library/phenomena
  * Listar fenómenos atmosféricos con paginación y filtros
+ * ?cursor=<pagination.nextCursor> para la página siguiente (o ?page=N)
  */
 router.get('/phenomena', async (req, res) => {
   try {
-    const {
-      page = 1,
-      limit = 12,
-      category,
-      search,
-      rarity,
-      sortBy = 'name'
-    } = req.query;
-
-    const skip = (parseInt(page) - 1) * parseInt(limit);
-    
-    // Construir filtro
-    const filter = { isActive: true };
-    
-    if (category) {
-      filter.category = category;
-    }
-    
-    if (rarity) {
-      filter.rarity = rarity;
-    }
-    
-    if (search) {
-      filter.$or = [
-        { name: { $regex: search, $options: 'i' } },
-        { description: { $regex: search, $options: 'i' } },
-        { keywords: { $in: [new RegExp(search, 'i')] } }
-      ];
-    }
-
-    // Ordenamiento
-    let sort = {};
-    switch (sortBy) {
-      case 'name':
-        sort = { name: 1 };
-        break;
-      case 'rarity':
-        sort = { 'occurrenceConditions.frequency': -1 };
-        break;
-      case 'category':
-        sort = { category: 1, name: 1 };
-        break;
-      default:
-        sort = { name: 1 };
-    }
-
-    // Ejecutar query
-    const phenomena = await AtmosphericPhenomenon
-      .find(filter)
-      .sort(sort)
-      .skip(skip)
-      .limit(parseInt(limit))
-      .select('-scientificExplanation -photographyTips -__v');
-
-    const total = await AtmosphericPhenomenon.countDocuments(filter);
-
-    res.json({
-      success: true,
-      data: phenomena,
-      pagination: {
-        page: parseInt(page),
-        limit: parseInt(limit),
-        total,
-        pages: Math.ceil(total / parseInt(limit))
-      }
-    });
+    sendCatalog(req, res, await libraryCatalog.list('phenomena', req.query));
 
   } catch (error) {
+    if (error.code === 'INVALID_CURSOR') {
+      return res.status(400).json({ success: false, error: error.message });
+    }
     console.error('Error listando fenómenos:', error);
     res.status(500).json({
       success: false,
@@ -107,7 +62,7 @@ router.get('/phenomena', async (req, res) => {
  */
 router.get('/phenomena/:id', async (req, res) => {
   try {
-    const phenomenon = await AtmosphericPhenomenon.findById(req.params.id);
+    const phenomenon = await libraryCatalog.detail('phenomena', req.params.id);
     
     if (!phenomenon) {
       return res.status(404).json({
@@ -116,10 +71,7 @@ router.get('/phenomena/:id', async (req, res) => {
       });
     }
 
-    res.json({
-      success: true,
-      data: phenomenon
-    });
+    sendCatalog(req, res, phenomenon);
 
   } catch (error) {
     console.error('Error obteniendo fenómeno:', error);
@@ -136,16 +88,9 @@ router.get('/phenomena/:id', async (req, res) => {
  */
 router.get('/phenomena/stats/categories', async (req, res) => {
   try {
-    const categories = await AtmosphericPhenomenon.aggregate([
-      { $match: { isActive: true } },
-      {
-        $group: {
-          _id: '$category',
-          count: { $sum: 1 }
-        }
-      },
-      { $sort: { count: -1 } }
-    ]);
+    // Rollup precalculado (statsService), ya ordenado por número de elementos
+    const { phenomena } = await statsService.getLibraryStats();
+    const categories = phenomena.byCategory;
 
     const categoryMap = {
       'optical': 'Fenómenos Ópticos',
@@ -182,87 +127,16 @@ router.get('/phenomena/stats/categories', async (req, res) => {
 /**
  * GET /api/library/objects
  * Listar objetos científicos con paginación y filtros
+ * ?cursor=<pagination.nextCursor> para la página siguiente (o ?page=N)
  */
 router.get('/objects', async (req, res) => {
   try {
-    const {
-      page = 1,
-      limit = 12,
-      category,
-      search,
-      verified,
-      isManualEntry,
-      sortBy = 'name'
-    } = req.query;
-
-    const skip = (parseInt(page) - 1) * parseInt(limit);
-    
-    // Construir filtro
-    const filter = { isActive: true };
-    
-    if (category) {
-      filter.category = category;
-    }
-    
-    if (verified === 'true') {
-      filter.isVerified = true;
-    }
-
-    if (isManualEntry !== undefined && isManualEntry !== '') {
-      filter.isManualEntry = isManualEntry === 'true';
-    }
-    
-    if (search) {
-      filter.$or = [
-        { name: { $regex: search, $options: 'i' } },
-        { description: { $regex: search, $options: 'i' } },
-        { visualPatterns: { $in: [new RegExp(search, 'i')] } }
-      ];
-    }
-
-    // Ordenamiento
-    let sort = {};
-    switch (sortBy) {
-      case 'name':
-        sort = { name: 1 };
-        break;
-      case 'frequency':
-        sort = { frequency: -1 };
-        break;
-      case 'category':
-        sort = { category: 1, name: 1 };
-        break;
-      case 'recent':
-        sort = { createdAt: -1 };
-        break;
-      default:
-        sort = { name: 1 };
-    }
-
-    // Ejecutar query
-    const objects = await UFODatabase
-      .find(filter)
-      .sort(sort)
-      .skip(skip)
-      .limit(parseInt(limit))
-      .select('-scientificFeatures -__v');
-
-    const total = await UFODatabase.countDocuments(filter);
-    const totalPages = Math.ceil(total / parseInt(limit));
-
-    res.json({
-      success: true,
-      data: objects,
-      pagination: {
-        page: parseInt(page),
-        limit: parseInt(limit),
-        total,
-        totalPages: totalPages,
-        pages: totalPages
-      }
-    });
+    sendCatalog(req, res, await libraryCatalog.list('objects', req.query));
 
   } catch (error) {
+    if (error.code === 'INVALID_CURSOR') {
+      return res.status(400).json({ success: false, error: error.message });
+    }
     console.error('Error listando objetos:', error);
     res.status(500).json({
       success: false,
@@ -277,7 +151,7 @@ router.get('/objects', async (req, res) => {
  */
 router.get('/objects/:id', async (req, res) => {
   try {
-    const object = await UFODatabase.findById(req.params.id);
+    const object = await libraryCatalog.detail('objects', req.params.id);
     
     if (!object) {
       return res.status(404).json({
@@ -286,10 +160,7 @@ router.get('/objects/:id', async (req, res) => {
       });
     }
 
-    res.json({
-      success: true,
-      data: object
-    });
+    sendCatalog(req, res, object);
 
   } catch (error) {
     console.error('Error obteniendo objeto:', error);
@@ -306,16 +177,9 @@ router.get('/objects/:id', async (req, res) => {
  */
 router.get('/objects/stats/categories', async (req, res) => {
   try {
-    const categories = await UFODatabase.aggregate([
-      { $match: { isActive: true } },
-      {
-        $group: {
-          _id: '$category',
-          count: { $sum: 1 }
-        }
-      },
-      { $sort: { count: -1 } }
-    ]);
+    // Rollup precalculado (statsService), ya ordenado por número de elementos
+    const { objects } = await statsService.getLibraryStats();
+    const categories = objects.byCategory;
 
     const categoryMap = {
       'aircraft': '✈️ Aeronaves',
@@ -356,35 +220,14 @@ router.get('/objects/stats/categories', async (req, res) => {
  */
 router.get('/stats', async (req, res) => {
   try {
-    const [
-      totalPhenomena,
-      totalObjects,
-      phenomenaByCategory,
-      objectsByCategory
-    ] = await Promise.all([
-      AtmosphericPhenomenon.countDocuments({ isActive: true }),
-      UFODatabase.countDocuments({ isActive: true }),
-      AtmosphericPhenomenon.aggregate([
-        { $match: { isActive: true } },
-        { $group: { _id: '$category', count: { $sum: 1 } } }
-      ]),
-      UFODatabase.aggregate([
-        { $match: { isActive: true } },
-        { $group: { _id: '$category', count: { $sum: 1 } } }
-      ])
-    ]);
+    // Rollup precalculado (statsService): se actualiza al cambiar la biblioteca
+    const { phenomena, objects } = await statsService.getLibraryStats();
 
     res.json({
       success: true,
       data: {
-        phenomena: {
-          total: totalPhenomena,
-          byCategory: phenomenaByCategory
-        },
-        objects: {
-          total: totalObjects,
-          byCategory: objectsByCategory
-        }
+        phenomena,
+        objects
       }
     });
 
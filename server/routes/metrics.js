@@ -0,0 +1,102 @@
+const express = require('express');
+const router = express.Router();
+const telemetry = require('../services/telemetryService');
+const CacheService = require('../services/cacheService');
+const WebSocketService = require('../services/websocketService');
+const ingestService = require('../services/ingestService');
+const analysisQueue = require('../services/analysisQueueService');
+const reportRenderService = require('../services/reportRenderService');
+const perceptualHashIndex = require('../services/perceptualHashIndexService');
+const videoAnalysisService = require('../services/videoAnalysisService');
+
+/**
+ * MÉTRICAS PARA PROMETHEUS
+ * GET /metrics - Formato de texto de Prometheus
+ *
+ * Exige "Authorization: Bearer <METRICS_TOKEN>". Sin METRICS_TOKEN la ruta
+ * está deshabilitada: detrás de un proxy inverso todas las peticiones llegan
+ * desde la propia máquina, así que el origen local no sirve como control.
+ */
+
+function isAuthorized(req) {
+  return req.headers.authorization === `Bearer ${process.env.METRICS_TOKEN}`;
+}
+
+function cacheMetrics() {
+  const namespaces = Object.values(CacheService.getSummary().namespaces);
+  const samples = (value) => namespaces.map(stats => ({
+    labels: { namespace: stats.name },
+    value: value(stats)
+  }));
+
+  return [
+    {
+      name: 'uap_cache_hits_total',
+      type: 'counter',
+      help: 'Aciertos de caché (incluye stale, negativos y coalescidos)',
+      samples: samples(s => s.hits + s.staleHits + s.negativeHits + s.coalesced)
+    },
+    { name: 'uap_cache_misses_total', type: 'counter', help: 'Fallos de caché', samples: samples(s => s.misses) },
+    { name: 'uap_cache_evictions_total', type: 'counter', help: 'Entradas expulsadas por presupuesto', samples: samples(s => s.evictions) },
+    { name: 'uap_cache_bytes', type: 'gauge', help: 'Memoria estimada de la caché', samples: samples(s => s.bytes) },
+    { name: 'uap_cache_entries', type: 'gauge', help: 'Entradas en caché', samples: samples(s => s.entries) }
+  ];
+}
+
+async function queueMetrics() {
+  try {
+    const { depth, oldestQueuedAgeMs } = await analysisQueue.getMetrics();
+    const samples = [];
+    for (const [status, lanes] of Object.entries(depth)) {
+      for (const [lane, count] of Object.entries(lanes)) {
+        samples.push({ labels: { status, lane }, value: count });
+      }
+    }
+
+    return [
+      { name: 'uap_queue_jobs', type: 'gauge', help: 'Trabajos de análisis por estado y carril', samples },
+      { name: 'uap_queue_oldest_queued_seconds', type: 'gauge', help: 'Antigüedad del trabajo en cola más antiguo', samples: [{ value: oldestQueuedAgeMs / 1000 }] }
+    ];
+  } catch (error) {
+    // Sin MongoDB se sirven el resto de métricas
+    return [];
+  }
+}
+
+router.get('/', async (req, res) => {
+  if (!process.env.METRICS_TOKEN) {
+    return res.status(404).json({ error: 'Métricas deshabilitadas (configura METRICS_TOKEN)' });
+  }
+  if (!isAuthorized(req)) {
+    return res.status(403).json({ error: 'Acceso a métricas no autorizado' });
+  }
+
+  const ws = WebSocketService.getStats();
+  const ingest = ingestService.getStats();
+  const reports = reportRenderService.getStats();
+  const phash = perceptualHashIndex.getStats();
+  const video = videoAnalysisService.getStats();
+
+  const extra = [
+    ...cacheMetrics(),
+    ...await queueMetrics(),
+    { name: 'uap_ws_connected_clients', type: 'gauge', help: 'Clientes de WebSocket conectados', samples: [{ value: ws.connectedClients }] },
+    { name: 'uap_ws_events_emitted_total', type: 'counter', help: 'Eventos de WebSocket enviados', samples: [{ value: ws.emitted }] },
+    { name: 'uap_ingest_files_total', type: 'counter', help: 'Subidas ingeridas', samples: [{ value: ingest.ingested }] },
+    { name: 'uap_ingest_bytes_total', type: 'counter', help: 'Bytes ingeridos', samples: [{ value: ingest.bytes }] },
+    { name: 'uap_reports_rendered_total', type: 'counter', help: 'Informes PDF generados', samples: [{ value: reports.rendered }] },
+    { name: 'uap_reports_cache_hits_total', type: 'counter', help: 'Informes PDF servidos desde caché', samples: [{ value: reports.cacheHits }] },
+    { name: 'uap_reports_queued', type: 'gauge', help: 'Informes PDF en espera de un worker', samples: [{ value: reports.queued }] },
+    { name: 'uap_phash_index_entries', type: 'gauge', help: 'Análisis en el índice de hashes perceptuales', samples: [{ value: phash.entries }] },
+    { name: 'uap_phash_queries_total', type: 'counter', help: 'Búsquedas de duplicados por hash perceptual', samples: [{ value: phash.queries }] },
+    { name: 'uap_phash_visited_nodes_avg', type: 'gauge', help: 'Nodos del BK-tree visitados por búsqueda (media)', samples: [{ value: phash.avgVisitedNodes }] },
+    { name: 'uap_video_analyses_total', type: 'counter', help: 'Vídeos muestreados', samples: [{ value: video.videos }] },
+    { name: 'uap_video_frames_sampled_total', type: 'counter', help: 'Fotogramas de vídeo muestreados', samples: [{ value: video.sampledFrames }] },
+    { name: 'uap_video_keyframes_total', type: 'counter', help: 'Fotogramas clave analizados', samples: [{ value: video.keyframes }] }
+  ];
+
+  res.set('Content-Type', 'text/plain; version=0.0.4; charset=utf-8');
+  res.send(telemetry.renderPrometheus(extra));
+});
+
+module.exports = router;
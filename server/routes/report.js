@@ -1,12 +1,17 @@
 const express = require('express');
 const router = express.Router();
+const mongoose = require('mongoose');
 const Report = require('../models/Report');
 const Analysis = require('../models/Analysis');
 const auth = require('../middleware/auth');
-const pdfGenerator = require('../services/pdfGenerator');
+const reportRenderService = require('../services/reportRenderService');
 const NotificationService = require('../services/notificationService');
+const archiver = require('archiver');
 const fs = require('fs');
-const path = require('path');
+const { once } = require('events');
+const { pipeline } = require('stream');
+
+const EXPORT_MAX = parseInt(process.env.REPORT_EXPORT_MAX, 10) || 100;
 
 /**
  * RUTAS DE REPORTES
@@ -94,6 +99,9 @@ router.post('/', auth, async (req, res) => {
 
 // ==================== GENERAR PDF ====================
 // POST /api/reports/:id/generate
+// El PDF se genera en segundo plano (services/reportRenderService.js):
+// responde 202 al encolarlo y la descarga lo recibe a medida que se produce.
+// Si no cambió nada desde la última generación, se reutiliza (200).
 router.post('/:id/generate', auth, async (req, res) => {
   try {
     // Buscar el reporte
@@ -120,51 +128,109 @@ router.post('/:id/generate', auth, async (req, res) => {
     const User = require('../models/User');
     const user = await User.findById(req.userId).select('username email firstName lastName');
 
-    // Cambiar estado a "generando"
-    report.status = 'generating';
-    await report.save();
+    const result = await reportRenderService.generate(report, analysis, user);
 
-    // Generar PDF
-    try {
-      const pdfPath = await pdfGenerator.generateReport(report, analysis, user);
-      
-      // Actualizar reporte con la ruta del PDF
-      report.pdfPath = pdfPath;
-      report.pdfFileName = path.basename(pdfPath);
-      report.pdfUrl = `/api/reports/${report._id}/download`;
-      report.pdfGeneratedDate = new Date();
-      report.status = 'generated';
-      await report.save();
-
-      // Enviar notificación al usuario
-      await NotificationService.notifyReportGenerated(
+    // Enviar notificación al usuario cuando el PDF esté listo
+    result.done
+      .then(() => NotificationService.notifyReportGenerated(
         req.userId,
         report._id,
         {
           title: report.reportData?.title || 'Reporte UAP',
           reportNumber: report.reportNumber
         }
-      );
+      ))
+      .catch(error => console.error('Error al generar PDF:', error.message));
+
+    res.status(result.cached ? 200 : 202).json({
+      message: result.cached ? 'PDF generado exitosamente' : 'Generando PDF',
+      report,
+      cached: result.cached,
+      downloadUrl: report.pdfUrl
+    });
+
+  } catch (error) {
+    if (error.code === 'REPORT_QUEUE_FULL') {
+      return res.status(503).json({
+        error: 'Hay demasiados informes en generación, inténtalo más tarde'
+      });
+    }
+
+    console.error('Error al generar PDF:', error);
+    res.status(500).json({
+      error: 'Error al generar PDF',
+      details: error.message
+    });
+  }
+});
+
+// ==================== EXPORTAR VARIOS PDF (ZIP) ====================
+// POST /api/reports/export - Body: { ids: [...] } (sin ids: últimos informes generados)
+// Los PDF se añaden al ZIP de uno en uno: los que están en caché se copian
+// y el resto se genera en los workers mientras se descarga.
+router.post('/export', auth, async (req, res) => {
+  try {
+    const ids = Array.isArray(req.body?.ids) ? req.body.ids.slice(0, EXPORT_MAX) : null;
+    if (ids && !ids.every(id => mongoose.isValidObjectId(id))) {
+      return res.status(400).json({
+        error: 'IDs de reporte no válidos'
+      });
+    }
+
+    const filter = { userId: req.userId };
+    if (ids) {
+      filter._id = { $in: ids };
+    } else {
+      filter.status = { $in: ['generated', 'sent'] };
+    }
+
+    const reports = await Report.find(filter)
+      .sort({ createdAt: -1 })
+      .limit(EXPORT_MAX);
 
-      res.json({
-        message: 'PDF generado exitosamente',
-        report,
-        downloadUrl: report.pdfUrl
+    if (reports.length === 0) {
+      return res.status(404).json({
+        error: 'No hay reportes para exportar'
       });
+    }
 
-    } catch (pdfError) {
-      // Error al generar PDF
-      report.status = 'error';
-      report.errorMessage = pdfError.message;
-      await report.save();
+    const date = new Date().toISOString().slice(0, 10);
+    res.setHeader('Content-Type', 'application/zip');
+    res.setHeader('Content-Disposition', `attachment; filename="UAP-Reports-${date}.zip"`);
 
-      throw pdfError;
+    // Los PDF ya van comprimidos: se almacenan sin recomprimir
+    const archive = archiver('zip', { store: true });
+    archive.on('error', (error) => {
+      console.error('Error al exportar reportes:', error.message);
+      res.destroy(error);
+    });
+    archive.pipe(res);
+
+    const failed = [];
+    for (const report of reports) {
+      if (res.destroyed) break;
+
+      try {
+        const { stream, fileName } = await reportRenderService.open(report);
+        archive.append(stream, { name: fileName });
+        await once(archive, 'entry');
+      } catch (error) {
+        failed.push(`${report.reportNumber}: ${error.message}`);
+      }
+    }
+
+    if (failed.length > 0) {
+      archive.append(failed.join('\n'), { name: 'ERRORES.txt' });
     }
+    await archive.finalize();
 
   } catch (error) {
-    console.error('Error al generar PDF:', error);
+    console.error('Error al exportar reportes:', error);
+    if (res.headersSent) {
+      return res.destroy(error);
+    }
     res.status(500).json({
-      error: 'Error al generar PDF',
+      error: 'Error al exportar reportes',
       details: error.message
     });
   }
@@ -258,20 +324,26 @@ router.get('/:id/download', auth, async (req, res) => {
       });
     }
 
-    if (!report.pdfPath || !fs.existsSync(report.pdfPath)) {
+    // Sin generar todavía: el PDF se pide antes con /generate
+    if (report.status === 'draft') {
       return res.status(404).json({
         error: 'PDF no encontrado. Genera el PDF primero.'
       });
     }
 
+    // Renderizado en curso, archivo en caché o nueva generación
+    const { stream, fileName } = await reportRenderService.open(report);
+
     // Establecer headers para descarga
-    const fileName = report.pdfFileName || `UAP-Report-${report.reportNumber}.pdf`;
     res.setHeader('Content-Type', 'application/pdf');
     res.setHeader('Content-Disposition', `attachment; filename="${fileName}"`);
 
-    // Enviar archivo
-    const fileStream = fs.createReadStream(report.pdfPath);
-    fileStream.pipe(res);
+    // Enviar archivo a medida que se genera
+    pipeline(stream, res, (error) => {
+      if (error && error.code !== 'ERR_STREAM_PREMATURE_CLOSE') {
+        console.error('Error al descargar PDF:', error.message);
+      }
+    });
 
   } catch (error) {
     console.error('Error al descargar PDF:', error);
@@ -5,6 +5,8 @@ const upload = require('../config/multer');
 const auth = require('../middleware/auth');
 const Analysis = require('../models/Analysis');
 const CacheService = require('../services/cacheService');
+const ingestService = require('../services/ingestService');
+const analysisPayloads = require('../services/analysisPayloadService');
 const path = require('path');
 const fs = require('fs');
 
@@ -34,6 +36,7 @@ router.post('/', auth, upload.single('file'), async (req, res) => {
     }
 
     // Crear registro en la base de datos
+    const { exif = null, ...ingest } = file.ingest || {};
     const analysis = new Analysis({
       userId,
       fileName: file.originalname,
@@ -42,7 +45,9 @@ router.post('/', auth, upload.single('file'), async (req, res) => {
       fileSize: file.size,
       uploadDate: new Date(),
       status: 'pending',
-      sightingContext: sightingContext || {} // Guardar contexto si existe
+      sightingContext: sightingContext || {}, // Guardar contexto si existe
+      ingest: file.ingest ? ingest : undefined,
+      exifData: exif || undefined // EXIF leído de las cabeceras durante la subida
     });
 
     await analysis.save();
@@ -60,7 +65,8 @@ router.post('/', auth, upload.single('file'), async (req, res) => {
         fileSize: analysis.fileSize,
         uploadDate: analysis.uploadDate,
         status: analysis.status,
-        hasContext: !!sightingContext
+        hasContext: !!sightingContext,
+        hasExif: !!exif
       },
       image: {
         filename: file.filename, // Nombre del archivo en el servidor
@@ -71,11 +77,10 @@ router.post('/', auth, upload.single('file'), async (req, res) => {
   } catch (error) {
     console.error('Error al subir archivo:', error);
     
-    // Si hay error, eliminar el archivo subido
+    // Si hay error, eliminar el archivo subido y sus derivadas
     if (req.file) {
-      fs.unlink(req.file.path, (err) => {
-        if (err) console.error('Error al eliminar archivo:', err);
-      });
+      ingestService.remove(req.file.path, req.file.ingest)
+        .catch(err => console.error('Error al eliminar archivo:', err));
     }
 
     res.status(500).json({ error: 'Error al subir el archivo.' });
@@ -93,18 +98,21 @@ router.get('/', auth, async (req, res) => {
     if (status) filter.status = status;
     if (fileType) filter.fileType = fileType;
 
-    // Obtener análisis con paginación
+    // Obtener análisis con paginación: solo el resumen, sin las cargas
+    // pesadas de cada capa ni la ruta completa del archivo
     const analyses = await Analysis.find(filter)
       .sort({ createdAt: -1 })
       .limit(parseInt(limit))
       .skip(parseInt(offset))
-      .select('-__v -filePath'); // No enviar ruta completa del archivo
+      .select(analysisPayloads.summaryProjection('-__v -filePath'))
+      .lean();
 
     // Contar total
     const total = await Analysis.countDocuments(filter);
 
     res.json({
-      analyses,
+      // Misma forma que toJSON del modelo (id en lugar de _id)
+      analyses: analyses.map(({ _id, ...analysis }) => ({ ...analysis, id: _id })),
       pagination: {
         total,
         limit: parseInt(limit),
@@ -127,8 +135,7 @@ router.get('/:id', auth, async (req, res) => {
     const analysisId = req.params.id;
 
     const analysis = await Analysis.findById(analysisId)
-      .populate('userId', 'username email firstName lastName')
-      .populate('matchResults.objectId');
+      .populate('userId', 'username email firstName lastName');
 
     if (!analysis) {
       return res.status(404).json({ error: 'Análisis no encontrado.' });
@@ -143,6 +150,10 @@ router.get('/:id', auth, async (req, res) => {
     analysis.views += 1;
     await analysis.save();
 
+    // Detalle completo: cargas pesadas de la colección aparte
+    await analysisPayloads.attach(analysis);
+    await analysis.populate('matchResults.objectId');
+
     res.json(analysis);
 
   } catch (error) {
@@ -179,7 +190,7 @@ router.delete('/:id', auth, async (req, res) => {
       });
     }
 
-    // Eliminar de la base de datos
+    // Eliminar de la base de datos (el hook del modelo borra las derivadas)
     await Analysis.findByIdAndDelete(analysisId);
 
     res.json({ message: 'Análisis eliminado exitosamente.' });
@@ -0,0 +1,222 @@
+/**
+ * Benchmark de la comparación atmosférica: puntuación fila a fila
+ * (calculateMatchScore sobre cada documento) frente al puntuador por lotes
+ * sobre el modelo columnar (compilePhenomena + scoreBatch).
+ *
+ * Comprueba que ambos devuelven exactamente los mismos resultados (mismos
+ * fenómenos, puntuaciones, desgloses y orden) y mide el tiempo de cada uno.
+ * Sale con código 1 si encuentra alguna diferencia.
+ *
+ * Uso:
+ *   node server/scripts/benchAtmosphericScoring.js [--phenomena 500] [--sightings 5000] [--seed 42] [--db]
+ *
+ * --db usa los fenómenos activos de MongoDB (MONGO_URI) en lugar de
+ * generarlos; los avistamientos son siempre sintéticos. El tiempo de carga
+ * desde la base de datos no entra en la comparación.
+ */
+
+require('dotenv').config();
+const mongoose = require('mongoose');
+const AtmosphericPhenomenon = require('../models/AtmosphericPhenomenon');
+const atmosphericComparison = require('../services/atmosphericComparisonService');
+const { compilePhenomena } = atmosphericComparison;
+
+function parseArgs(argv) {
+  const args = { phenomena: 500, sightings: 5000, seed: 42, db: false };
+  for (let i = 0; i < argv.length; i++) {
+    const arg = argv[i];
+    if (arg === '--db') args.db = true;
+    else if (arg === '--phenomena') args.phenomena = parseInt(argv[++i], 10);
+    else if (arg === '--sightings') args.sightings = parseInt(argv[++i], 10);
+    else if (arg === '--seed') args.seed = parseInt(argv[++i], 10);
+  }
+  return args;
+}
+
+// Generador determinista (mulberry32) para poder repetir una ejecución
+function createRandom(seed) {
+  let state = seed >>> 0;
+  return () => {
+    state = (state + 0x6D2B79F5) >>> 0;
+    let t = state;
+    t = Math.imul(t ^ (t >>> 15), t | 1);
+    t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+}
+
+const SHAPES = ['circular', 'oval', 'lens', 'pillar', 'arc', 'curtain', 'irregular', 'point', 'streak', 'disk', 'varied', 'wave-like'];
+const COLORS = ['white', 'red', 'orange', 'green', 'blue', 'purple', 'rainbow', 'yellow', 'gray'];
+const BRIGHTNESS = ['dim', 'moderate', 'bright', 'very_bright', 'variable'];
+const TEXTURES = ['smooth', 'wispy', 'sharp', 'diffuse'];
+const WEATHER = ['clear', 'cloudy', 'partly_cloudy', 'rainy', 'snowy', 'stormy', 'foggy'];
+const TIMES = ['dawn', 'day', 'dusk', 'night', 'any'];
+const REGIONS = ['polar', 'temperate', 'tropical', 'worldwide'];
+const SEASONS = ['winter', 'summer', 'spring', 'fall', 'year-round'];
+const CATEGORIES = ['cloud', 'optical', 'aurora', 'meteor', 'electrical', 'celestial'];
+const RARITIES = ['very_common', 'common', 'uncommon', 'rare', 'very_rare'];
+const OBJECT_CATEGORIES = ['celestial', 'aircraft', 'drone', 'satellite', 'bird', 'balloon', 'natural', 'unknown'];
+const WEATHER_MAIN = ['clear', 'clouds', 'mist', 'fog', 'rain', 'drizzle', 'snow', 'thunderstorm'];
+
+function createGenerators(random) {
+  const pick = (list) => list[Math.floor(random() * list.length)];
+  const some = (list, max) => {
+    const count = Math.floor(random() * (max + 1));
+    return Array.from({ length: count }, () => pick(list));
+  };
+  const maybe = (value, probability = 0.8) => (random() < probability ? value : undefined);
+
+  const phenomenon = (index) => ({
+    name: `${random() < 0.1 ? 'Pilar' : 'Fenómeno'} sintético ${index}`,
+    category: pick(CATEGORIES),
+    description: `Descripción del fenómeno ${index}`,
+    visualCharacteristics: {
+      shape: maybe(pick(SHAPES)),
+      colors: some(COLORS, 3),
+      brightness: maybe(pick(BRIGHTNESS)),
+      texture: maybe(pick(TEXTURES))
+    },
+    conditions: {
+      weather: some(WEATHER, 3),
+      timeOfDay: some(TIMES, 2),
+      geographicRegions: some(REGIONS, 2),
+      seasonality: some(SEASONS, 2)
+    },
+    rarity: maybe(pick(RARITIES)),
+    isActive: true
+  });
+
+  const sighting = () => ({
+    visualAnalysis: maybe({
+      objectType: maybe({ category: pick(OBJECT_CATEGORIES) }),
+      dominantColors: maybe(some(COLORS, 4).map(color => (random() < 0.3 ? `Light ${color}` : color))),
+      averageBrightness: maybe(Math.floor(random() * 256)),
+      texture: maybe(pick(TEXTURES))
+    }, 0.9),
+    weatherData: maybe(random() < 0.05
+      ? pick([{ error: 'Sin API key' }, {}])
+      : {
+          conditions: { main: pick(WEATHER_MAIN) },
+          clouds: { coverage: Math.floor(random() * 100) },
+          precipitation: { rain_1h: random() < 0.2 ? random() * 5 : 0, snow_1h: random() < 0.1 ? random() : 0 }
+        }),
+    exifData: maybe({
+      timestamp: maybe(new Date(Date.UTC(2024, 0, 1) + Math.floor(random() * 365 * 86400000)).toISOString())
+    })
+  });
+
+  return { phenomenon, sighting };
+}
+
+/**
+ * Implementación fila a fila (la comparación previa al modelo columnar)
+ */
+function rankRowByRow(phenomena, { visualAnalysis, weatherData, exifData }) {
+  try {
+    const matches = [];
+    for (const phenomenon of phenomena) {
+      const score = atmosphericComparison.calculateMatchScore(phenomenon, visualAnalysis, weatherData, exifData);
+      if (score.total > 30) {
+        matches.push({
+          phenomenon: {
+            name: phenomenon.name,
+            category: phenomenon.category,
+            description: phenomenon.description,
+            rarity: phenomenon.rarity
+          },
+          score: score.total,
+          breakdown: score.breakdown,
+          confidence: atmosphericComparison.scoreToConfidence(score.total),
+          explanation: atmosphericComparison.generateExplanation(phenomenon, score)
+        });
+      }
+    }
+    matches.sort((a, b) => b.score - a.score);
+
+    return {
+      totalMatches: matches.length,
+      bestMatch: matches[0] || null,
+      topMatches: matches.slice(0, 5),
+      hasStrongMatch: matches.length > 0 && matches[0].score > 70,
+      summary: atmosphericComparison.generateSummary(matches)
+    };
+  } catch (error) {
+    return {
+      error: 'Error al comparar con fenómenos atmosféricos',
+      details: error.message
+    };
+  }
+}
+
+async function loadPhenomena(args, generators) {
+  if (!args.db) {
+    const plain = Array.from({ length: args.phenomena }, (_, index) => generators.phenomenon(index));
+    // Documentos hidratados (sin base de datos) para la versión fila a fila
+    return { plain, documents: plain.map(raw => new AtmosphericPhenomenon(raw)) };
+  }
+
+  await mongoose.connect(process.env.MONGO_URI || 'mongodb://localhost:27017/uap-db');
+  const plain = await AtmosphericPhenomenon.find({ isActive: true }).lean();
+  return { plain, documents: plain.map(doc => AtmosphericPhenomenon.hydrate(doc)) };
+}
+
+async function main() {
+  const args = parseArgs(process.argv.slice(2));
+  const generators = createGenerators(createRandom(args.seed));
+
+  const { plain, documents } = await loadPhenomena(args, generators);
+  const sightings = Array.from({ length: args.sightings }, generators.sighting);
+  console.log(`📊 ${documents.length} fenómenos × ${sightings.length} avistamientos${args.db ? ' (fenómenos de MongoDB)' : ''}`);
+
+  // Silenciar los console.error de los avistamientos que fallan (los dos
+  // caminos devuelven el mismo objeto de error)
+  const consoleError = console.error;
+  console.error = () => {};
+
+  let start = process.hrtime.bigint();
+  const expected = sightings.map(sighting => rankRowByRow(documents, sighting));
+  const rowMs = Number(process.hrtime.bigint() - start) / 1e6;
+
+  start = process.hrtime.bigint();
+  const model = compilePhenomena(plain);
+  const compileMs = Number(process.hrtime.bigint() - start) / 1e6;
+
+  start = process.hrtime.bigint();
+  const actual = await atmosphericComparison.scoreBatch(sightings, { model });
+  const batchMs = Number(process.hrtime.bigint() - start) / 1e6;
+
+  console.error = consoleError;
+
+  let mismatches = 0;
+  expected.forEach((result, index) => {
+    const a = JSON.stringify(result);
+    const b = JSON.stringify(actual[index]);
+    if (a !== b) {
+      if (mismatches < 3) {
+        console.error(`❌ Diferencia en el avistamiento ${index}:\n   fila a fila: ${a}\n   por lotes:   ${b}`);
+      }
+      mismatches++;
+    }
+  });
+
+  const withMatches = expected.filter(result => result.totalMatches > 0).length;
+  const errors = expected.filter(result => result.error).length;
+  console.log(`   Avistamientos con coincidencias: ${withMatches} · con error: ${errors}`);
+  console.log(`   Fila a fila:  ${rowMs.toFixed(1)}ms (${(rowMs * 1000 / sightings.length).toFixed(1)}µs/avistamiento)`);
+  console.log(`   Compilación:  ${compileMs.toFixed(1)}ms`);
+  console.log(`   Por lotes:    ${batchMs.toFixed(1)}ms (${(batchMs * 1000 / sightings.length).toFixed(1)}µs/avistamiento)`);
+  console.log(`   Aceleración:  ×${(rowMs / (compileMs + batchMs)).toFixed(1)}`);
+
+  if (args.db) await mongoose.disconnect();
+
+  if (mismatches > 0) {
+    console.error(`❌ ${mismatches} avistamientos con resultados distintos`);
+    process.exit(1);
+  }
+  console.log('✅ Resultados idénticos');
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
@@ -0,0 +1,177 @@
+/**
+ * Benchmark de la extracción de características científicas: las seis
+ * funciones extract* por separado (implementación de referencia) frente al
+ * motor fusionado de dos recorridos (fusedScientificFeatures).
+ *
+ * Comprueba que ambos devuelven exactamente los mismos valores (Object.is
+ * campo a campo, incluidos los histogramas) y mide el tiempo de cada uno en
+ * el hilo principal, sin el pool de workers. Sale con código 1 si encuentra
+ * alguna diferencia.
+ *
+ * Uso:
+ *   node server/scripts/benchFeatureExtraction.js [--images 200] [--width 400] [--height 300] [--seed 42]
+ *   node server/scripts/benchFeatureExtraction.js --corpus /tmp/uap_corpus [--limit 200]
+ *
+ * --corpus decodifica las imágenes del corpus sintético
+ * (test/generate_corpus.py) a 400 px como hace el análisis; sin él se
+ * generan cielos sintéticos en memoria.
+ */
+
+require('dotenv').config();
+const fs = require('fs');
+const path = require('path');
+const { scientificFeaturesReference, fusedScientificFeatures } = require('../services/pixelKernels');
+
+function parseArgs(argv) {
+  const args = { images: 200, width: 400, height: 300, seed: 42, corpus: null, limit: 200 };
+  for (let i = 0; i < argv.length; i++) {
+    const arg = argv[i];
+    if (arg === '--images') args.images = parseInt(argv[++i], 10);
+    else if (arg === '--width') args.width = parseInt(argv[++i], 10);
+    else if (arg === '--height') args.height = parseInt(argv[++i], 10);
+    else if (arg === '--seed') args.seed = parseInt(argv[++i], 10);
+    else if (arg === '--corpus') args.corpus = argv[++i];
+    else if (arg === '--limit') args.limit = parseInt(argv[++i], 10);
+  }
+  return args;
+}
+
+// Generador determinista (mulberry32) para poder repetir una ejecución
+function createRandom(seed) {
+  let state = seed >>> 0;
+  return () => {
+    state = (state + 0x6D2B79F5) >>> 0;
+    let t = state;
+    t = Math.imul(t ^ (t >>> 15), t | 1);
+    t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+    return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+  };
+}
+
+/**
+ * Cielo sintético RGB: degradado, ruido y algunas luces brillantes
+ */
+function syntheticSky(random, width, height) {
+  const data = Buffer.alloc(width * height * 3);
+  const top = [random() * 80, random() * 100, 20 + random() * 200];
+  const bottom = [random() * 255, random() * 200, random() * 255];
+  const noise = random() * 20;
+  const lights = Array.from({ length: Math.floor(random() * 6) }, () => ({
+    x: random() * width,
+    y: random() * height,
+    radius: 1 + random() * 12,
+    color: [150 + random() * 105, 150 + random() * 105, 150 + random() * 105]
+  }));
+
+  for (let y = 0; y < height; y++) {
+    const t = y / Math.max(1, height - 1);
+    for (let x = 0; x < width; x++) {
+      const idx = (y * width + x) * 3;
+      for (let c = 0; c < 3; c++) {
+        let value = top[c] + (bottom[c] - top[c]) * t + (random() - 0.5) * noise;
+        for (const light of lights) {
+          if ((x - light.x) ** 2 + (y - light.y) ** 2 <= light.radius ** 2) value = light.color[c];
+        }
+        data[idx + c] = Math.max(0, Math.min(255, Math.round(value)));
+      }
+    }
+  }
+
+  return { data, info: { width, height, channels: 3 } };
+}
+
+async function loadCorpus(args) {
+  const sharp = require('sharp');
+  const ImageContext = require('../services/imageContextService');
+  const records = fs.readFileSync(path.join(args.corpus, 'manifest.jsonl'), 'utf8')
+    .split('\n')
+    .filter(line => line.trim())
+    .slice(0, args.limit)
+    .map(line => JSON.parse(line));
+
+  const images = [];
+  for (const record of records) {
+    const { data, info } = await sharp(path.join(args.corpus, record.file))
+      .resize(ImageContext.SIZES.SMALL, ImageContext.SIZES.SMALL, { fit: 'inside', withoutEnlargement: true })
+      .removeAlpha()
+      .raw()
+      .toBuffer({ resolveWithObject: true });
+    images.push({ data, info: { width: info.width, height: info.height, channels: info.channels } });
+  }
+  return images;
+}
+
+/**
+ * Primera diferencia entre dos resultados (null si son idénticos)
+ */
+function firstDifference(expected, actual, keyPath = '') {
+  if (expected && typeof expected === 'object') {
+    const keys = Object.keys(expected);
+    if (!actual || typeof actual !== 'object' || keys.join() !== Object.keys(actual).join()) {
+      return `${keyPath || 'raíz'}: claves distintas`;
+    }
+    for (const key of keys) {
+      const difference = firstDifference(expected[key], actual[key], keyPath ? `${keyPath}.${key}` : key);
+      if (difference) return difference;
+    }
+    return null;
+  }
+  return Object.is(expected, actual) ? null : `${keyPath}: ${expected} != ${actual}`;
+}
+
+function timeRuns(images, extract, rounds) {
+  let best = Infinity;
+  let results = null;
+  for (let round = 0; round < rounds; round++) {
+    const start = process.hrtime.bigint();
+    results = images.map(({ data, info }) => extract(data, info));
+    best = Math.min(best, Number(process.hrtime.bigint() - start) / 1e6);
+  }
+  return { ms: best, results };
+}
+
+async function main() {
+  const args = parseArgs(process.argv.slice(2));
+
+  let images;
+  if (args.corpus) {
+    images = await loadCorpus(args);
+    console.log(`📊 ${images.length} imágenes del corpus ${args.corpus}`);
+  } else {
+    const random = createRandom(args.seed);
+    images = Array.from({ length: args.images }, () => syntheticSky(random, args.width, args.height));
+    console.log(`📊 ${images.length} cielos sintéticos de ${args.width}x${args.height}`);
+  }
+
+  const pixels = images.reduce((sum, { info }) => sum + info.width * info.height, 0);
+
+  // Mejor de 3 rondas: la primera calienta el JIT
+  const reference = timeRuns(images, scientificFeaturesReference, 3);
+  const fused = timeRuns(images, fusedScientificFeatures, 3);
+
+  let mismatches = 0;
+  reference.results.forEach((expected, index) => {
+    const difference = firstDifference(expected, fused.results[index]);
+    if (difference) {
+      if (mismatches < 3) {
+        console.error(`❌ Diferencia en la imagen ${index}: ${difference}`);
+      }
+      mismatches++;
+    }
+  });
+
+  console.log(`   Por familias: ${reference.ms.toFixed(1)}ms (${(reference.ms / images.length).toFixed(2)}ms/imagen, ${(reference.ms * 1e6 / pixels).toFixed(1)}ns/píxel)`);
+  console.log(`   Fusionado:    ${fused.ms.toFixed(1)}ms (${(fused.ms / images.length).toFixed(2)}ms/imagen, ${(fused.ms * 1e6 / pixels).toFixed(1)}ns/píxel)`);
+  console.log(`   Aceleración:  ×${(reference.ms / fused.ms).toFixed(1)}`);
+
+  if (mismatches > 0) {
+    console.error(`❌ ${mismatches} imágenes con características distintas`);
+    process.exit(1);
+  }
+  console.log('✅ Características idénticas');
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
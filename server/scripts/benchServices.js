@@ -0,0 +1,471 @@
+/**
+ * Benchmark offline de los servicios de análisis sobre un corpus sintético
+ * con ground truth (test/generate_corpus.py), sin HTTP ni MongoDB.
+ *
+ * Cada imagen se decodifica una vez (ImageContext, como en el pipeline) y
+ * se mide cada servicio por separado y en serie:
+ *   decode     ImageContext.fromFile
+ *   exif       exifService.extractExifData          (GPS y software de edición)
+ *   features   featureExtractionService.extractScientificFeatures
+ *   forensic   forensicAnalysisService.analyzeImage (copy-move inyectado)
+ *   visual     visualAnalysisService.analyzeVisualFeatures (categoría esperada)
+ *   embedding  trainingVectorIndexService.embedImage
+ * y después los matchers en memoria: una de cada 4 imágenes forma la
+ * referencia y el resto son consultas (acierto si el top-1 es del mismo
+ * tipo de objeto):
+ *   catalog    ufoFeatureIndexService.topK sobre las características
+ *   training   TrainingVectorIndexService.search (exacto) sobre los embeddings
+ *
+ * El resultado (rendimiento + precisión) se compara con una línea base
+ * guardada: una caída de rendimiento o de precisión por encima de la
+ * tolerancia hace salir con código 1. Las líneas base dependen de la
+ * máquina y del corpus; se crean con --save-baseline.
+ *
+ * Uso:
+ *   node server/scripts/benchServices.js --corpus /tmp/uap_corpus [--limit 500]
+ *     [--services visual,forensic,catalog] [--baseline <archivo>] [--save-baseline]
+ *     [--tolerance 15] [--accuracy-tolerance 2] [--output resultados.json] [--verbose]
+ *
+ * --baseline por defecto es <corpus>/baseline.json. --tolerance es el % de
+ * caída de imágenes/s (o de subida del p95) admitido; --accuracy-tolerance,
+ * los puntos porcentuales de precisión.
+ */
+
+require('dotenv').config();
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const crypto = require('crypto');
+
+const ImageContext = require('../services/imageContextService');
+const exifService = require('../services/exifService');
+const featureExtractionService = require('../services/featureExtractionService');
+const forensicAnalysisService = require('../services/forensicAnalysisService');
+const visualAnalysisService = require('../services/visualAnalysisService');
+const ufoFeatureIndex = require('../services/ufoFeatureIndexService');
+const { TrainingVectorIndexService, embedImage } = require('../services/trainingVectorIndexService');
+const workerPool = require('../services/workerPoolService');
+
+const SERVICES = ['decode', 'exif', 'features', 'forensic', 'visual', 'embedding', 'catalog', 'training'];
+const REFERENCE_EVERY = 4;
+
+function parseArgs(argv) {
+  const args = {
+    corpus: null,
+    limit: 0,
+    services: [...SERVICES],
+    baseline: null,
+    saveBaseline: false,
+    tolerance: 15,
+    accuracyTolerance: 2,
+    output: null,
+    verbose: false
+  };
+  for (let i = 0; i < argv.length; i++) {
+    const arg = argv[i];
+    if (arg === '--corpus') args.corpus = argv[++i];
+    else if (arg === '--limit') args.limit = parseInt(argv[++i], 10);
+    else if (arg === '--services') args.services = argv[++i].split(',').map(name => name.trim());
+    else if (arg === '--baseline') args.baseline = argv[++i];
+    else if (arg === '--save-baseline') args.saveBaseline = true;
+    else if (arg === '--tolerance') args.tolerance = parseFloat(argv[++i]);
+    else if (arg === '--accuracy-tolerance') args.accuracyTolerance = parseFloat(argv[++i]);
+    else if (arg === '--output') args.output = argv[++i];
+    else if (arg === '--verbose') args.verbose = true;
+  }
+
+  if (!args.corpus) {
+    throw new Error('Falta --corpus (directorio generado con test/generate_corpus.py)');
+  }
+  const unknown = args.services.filter(name => !SERVICES.includes(name));
+  if (unknown.length > 0) {
+    throw new Error(`Servicios desconocidos: ${unknown.join(', ')} (válidos: ${SERVICES.join(', ')})`);
+  }
+  // Los matchers necesitan las características / embeddings de cada imagen
+  if (args.services.includes('catalog') && !args.services.includes('features')) args.services.push('features');
+  if (args.services.includes('training') && !args.services.includes('embedding')) args.services.push('embedding');
+
+  args.baseline = args.baseline || path.join(args.corpus, 'baseline.json');
+  return args;
+}
+
+function loadManifest(corpus, limit) {
+  const lines = fs.readFileSync(path.join(corpus, 'manifest.jsonl'), 'utf8')
+    .split('\n')
+    .filter(line => line.trim());
+  const records = lines.map(line => JSON.parse(line));
+  const selected = limit > 0 ? records.slice(0, limit) : records;
+
+  // Huella del corpus: la precisión solo es comparable sobre las mismas imágenes
+  const fingerprint = crypto.createHash('sha1');
+  for (const record of selected) fingerprint.update(`${record.file}:${record.seed}\n`);
+
+  return { records: selected, fingerprint: fingerprint.digest('hex').slice(0, 16) };
+}
+
+function percentile(sorted, p) {
+  if (sorted.length === 0) return 0;
+  const index = Math.min(sorted.length - 1, Math.ceil((p / 100) * sorted.length) - 1);
+  return sorted[Math.max(0, index)];
+}
+
+function round(value, decimals = 2) {
+  const factor = 10 ** decimals;
+  return Math.round(value * factor) / factor;
+}
+
+function ratio(part, total) {
+  return total > 0 ? round((part / total) * 100, 1) : null;
+}
+
+/**
+ * Acumulador de tiempos y errores de un servicio
+ */
+function createTimer() {
+  return { samples: [], errors: 0 };
+}
+
+async function timed(timer, fn) {
+  const start = process.hrtime.bigint();
+  try {
+    return await fn();
+  } catch (error) {
+    timer.errors++;
+    return null;
+  } finally {
+    timer.samples.push(Number(process.hrtime.bigint() - start) / 1e6);
+  }
+}
+
+function summarizeTimer(timer) {
+  const sorted = [...timer.samples].sort((a, b) => a - b);
+  const totalMs = sorted.reduce((sum, ms) => sum + ms, 0);
+  return {
+    samples: sorted.length,
+    errors: timer.errors,
+    totalMs: round(totalMs, 1),
+    throughput: totalMs > 0 ? round(sorted.length / (totalMs / 1000)) : null,
+    latency: {
+      mean: sorted.length > 0 ? round(totalMs / sorted.length, 3) : 0,
+      p50: round(percentile(sorted, 50), 3),
+      p95: round(percentile(sorted, 95), 3),
+      max: round(sorted[sorted.length - 1] || 0, 3)
+    }
+  };
+}
+
+// ==================== PRECISIÓN ====================
+
+function binaryMetrics(counts) {
+  const { tp, fp, fn, tn } = counts;
+  const precision = tp + fp > 0 ? tp / (tp + fp) : null;
+  const recall = tp + fn > 0 ? tp / (tp + fn) : null;
+  const f1 = precision && recall ? (2 * precision * recall) / (precision + recall) : 0;
+  return {
+    precision: precision === null ? null : round(precision * 100, 1),
+    recall: recall === null ? null : round(recall * 100, 1),
+    f1: round(f1 * 100, 1),
+    accuracy: ratio(tp + tn, tp + fp + fn + tn),
+    counts
+  };
+}
+
+function countBinary(counts, expected, predicted) {
+  if (expected && predicted) counts.tp++;
+  else if (!expected && predicted) counts.fp++;
+  else if (expected && !predicted) counts.fn++;
+  else counts.tn++;
+}
+
+/**
+ * Evaluar los matchers: top-1 del mismo tipo de objeto y acierto en el top-5
+ */
+function evaluateMatcher(queries, search) {
+  const timer = createTimer();
+  let top1 = 0;
+  let top5 = 0;
+
+  for (const { label, query } of queries) {
+    const start = process.hrtime.bigint();
+    const labels = search(query);
+    timer.samples.push(Number(process.hrtime.bigint() - start) / 1e6);
+
+    if (labels[0] === label) top1++;
+    if (labels.slice(0, 5).includes(label)) top5++;
+  }
+
+  return {
+    ...summarizeTimer(timer),
+    accuracy: {
+      top1: ratio(top1, queries.length),
+      top5: ratio(top5, queries.length)
+    },
+    queries: queries.length
+  };
+}
+
+// ==================== EJECUCIÓN ====================
+
+async function runImages(args, records, log) {
+  const enabled = new Set(args.services);
+  const timers = Object.fromEntries(SERVICES.map(name => [name, createTimer()]));
+  const outputs = [];
+
+  const visual = { correct: 0, total: 0, confusion: {} };
+  const forensic = { tp: 0, fp: 0, fn: 0, tn: 0 };
+  const exifGps = { tp: 0, fp: 0, fn: 0, tn: 0 };
+  const exifEdited = { tp: 0, fp: 0, fn: 0, tn: 0 };
+
+  for (let i = 0; i < records.length; i++) {
+    const record = records[i];
+    const filePath = path.join(args.corpus, record.file);
+    const output = { record, features: null, embedding: null };
+
+    const context = await timed(timers.decode, () => ImageContext.fromFile(filePath));
+    if (!context) {
+      outputs.push(output);
+      continue;
+    }
+
+    try {
+      if (enabled.has('exif')) {
+        const result = await timed(timers.exif, () => exifService.extractExifData(filePath, context));
+        const data = result?.data || {};
+        countBinary(exifGps, Boolean(record.exif.gps), Boolean(data.location));
+        countBinary(exifEdited, record.exif.variant === 'edited', /Editada con/.test(data.manipulationDetails || ''));
+      }
+
+      if (enabled.has('features')) {
+        output.features = await timed(timers.features,
+          () => featureExtractionService.extractScientificFeatures(filePath, context));
+      }
+
+      if (enabled.has('forensic')) {
+        const result = await timed(timers.forensic, () => forensicAnalysisService.analyzeImage(filePath, context));
+        countBinary(forensic, record.copyMove.applied, Boolean(result?.cloneDetection?.isSuspicious));
+      }
+
+      if (enabled.has('visual')) {
+        const result = await timed(timers.visual, () => visualAnalysisService.analyzeVisualFeatures(filePath, context));
+        const predicted = result?.objectType?.category || 'error';
+        const row = visual.confusion[record.expectedCategory] || (visual.confusion[record.expectedCategory] = {});
+        row[predicted] = (row[predicted] || 0) + 1;
+        visual.total++;
+        if (predicted === record.expectedCategory) visual.correct++;
+      }
+
+      if (enabled.has('embedding')) {
+        output.embedding = await timed(timers.embedding, () => embedImage(filePath, context));
+      }
+    } finally {
+      context.release();
+    }
+
+    outputs.push(output);
+    if ((i + 1) % 50 === 0 || i + 1 === records.length) {
+      log(`   ${i + 1}/${records.length} imágenes`);
+    }
+  }
+
+  const services = {};
+  for (const name of SERVICES) {
+    if (name === 'catalog' || name === 'training' || !(name === 'decode' || enabled.has(name))) continue;
+    services[name] = summarizeTimer(timers[name]);
+  }
+  if (services.exif) {
+    services.exif.accuracy = {
+      gps: binaryMetrics(exifGps).accuracy,
+      editedSoftware: binaryMetrics(exifEdited).f1
+    };
+  }
+  if (services.forensic) {
+    const metrics = binaryMetrics(forensic);
+    services.forensic.accuracy = { copyMoveF1: metrics.f1, copyMovePrecision: metrics.precision, copyMoveRecall: metrics.recall };
+    services.forensic.copyMove = metrics.counts;
+  }
+  if (services.visual) {
+    services.visual.accuracy = { category: ratio(visual.correct, visual.total) };
+    services.visual.confusion = visual.confusion;
+  }
+
+  return { services, outputs };
+}
+
+function runMatchers(args, outputs, services) {
+  const enabled = new Set(args.services);
+  const references = outputs.filter(output => output.record.index % REFERENCE_EVERY === 0);
+  const queries = outputs.filter(output => output.record.index % REFERENCE_EVERY !== 0);
+
+  if (enabled.has('catalog')) {
+    for (const { record, features } of references) {
+      if (!features) continue;
+      ufoFeatureIndex.add({
+        _id: `corpus-${record.index}`,
+        name: record.file,
+        category: record.objectType,
+        scientificFeatures: features,
+        visualPatterns: []
+      });
+    }
+    services.catalog = {
+      ...evaluateMatcher(
+        queries.filter(output => output.features).map(output => ({ label: output.record.objectType, query: output.features })),
+        features => ufoFeatureIndex.topK(features, 5).matches.map(match => match.object.category)
+      ),
+      references: ufoFeatureIndex.entries.size
+    };
+  }
+
+  if (enabled.has('training')) {
+    const index = new TrainingVectorIndexService({ mode: 'exact' });
+    for (const { record, embedding } of references) {
+      if (!embedding) continue;
+      index.add({ _id: `corpus-${record.index}`, category: record.objectType, keywords: [], tags: [] }, embedding);
+    }
+    services.training = {
+      ...evaluateMatcher(
+        queries.filter(output => output.embedding).map(output => ({ label: output.record.objectType, query: output.embedding })),
+        embedding => index.search(embedding, 5).map(hit => hit.image.category)
+      ),
+      references: index.entries.size
+    };
+  }
+}
+
+// ==================== LÍNEA BASE ====================
+
+/**
+ * Comparar con la línea base: rendimiento (img/s y p95, en %) y precisión
+ * (en puntos porcentuales)
+ * @returns {Array<{service, metric, baseline, current, change, regression}>}
+ */
+function compareWithBaseline(results, baseline, args) {
+  const rows = [];
+  const sameCorpus = baseline.corpus?.fingerprint === results.corpus.fingerprint;
+
+  for (const [name, current] of Object.entries(results.services)) {
+    const previous = baseline.services?.[name];
+    if (!previous) continue;
+
+    if (previous.throughput && current.throughput) {
+      const change = ((current.throughput - previous.throughput) / previous.throughput) * 100;
+      rows.push({ service: name, metric: 'img/s', baseline: previous.throughput, current: current.throughput, change: `${round(change, 1)}%`, regression: change < -args.tolerance });
+    }
+    if (previous.latency?.p95 && current.latency?.p95) {
+      const change = ((current.latency.p95 - previous.latency.p95) / previous.latency.p95) * 100;
+      rows.push({ service: name, metric: 'p95 ms', baseline: previous.latency.p95, current: current.latency.p95, change: `${round(change, 1)}%`, regression: change > args.tolerance });
+    }
+
+    if (!sameCorpus) continue;
+    for (const [metric, value] of Object.entries(current.accuracy || {})) {
+      const before = previous.accuracy?.[metric];
+      if (typeof before !== 'number' || typeof value !== 'number') continue;
+      const change = value - before;
+      rows.push({ service: name, metric, baseline: before, current: value, change: `${round(change, 1)} pp`, regression: change < -args.accuracyTolerance });
+    }
+  }
+
+  return { rows, sameCorpus };
+}
+
+function printSummary(results, log) {
+  log('\n📊 Servicios');
+  log('   servicio     img/s      p50 ms     p95 ms   errores  precisión');
+  for (const [name, service] of Object.entries(results.services)) {
+    const accuracy = Object.entries(service.accuracy || {})
+      .map(([metric, value]) => `${metric}=${value === null ? '-' : `${value}%`}`)
+      .join(' ');
+    log(`   ${name.padEnd(10)} ${String(service.throughput ?? '-').padStart(8)} ${String(service.latency.p50).padStart(10)} ${String(service.latency.p95).padStart(10)} ${String(service.errors).padStart(9)}  ${accuracy}`);
+  }
+
+  if (results.services.visual) {
+    log('\n🎯 Matriz de confusión visual (esperada -> detectada)');
+    for (const [expected, row] of Object.entries(results.services.visual.confusion)) {
+      const cells = Object.entries(row).sort((a, b) => b[1] - a[1]).map(([predicted, count]) => `${predicted}:${count}`);
+      log(`   ${expected.padEnd(20)} ${cells.join('  ')}`);
+    }
+  }
+}
+
+async function main() {
+  const args = parseArgs(process.argv.slice(2));
+  const log = console.log;
+  const { records, fingerprint } = loadManifest(args.corpus, args.limit);
+  log(`📦 Corpus ${args.corpus}: ${records.length} imágenes (huella ${fingerprint})`);
+  log(`   Servicios: ${args.services.join(', ')}`);
+
+  // Los servicios registran cada paso por consola: silenciarlos durante la medida
+  const consoleMethods = { log: console.log, warn: console.warn, error: console.error };
+  if (!args.verbose) {
+    console.log = console.warn = console.error = () => {};
+  }
+
+  const wallStart = Date.now();
+  let services;
+  try {
+    const run = await runImages(args, records, log);
+    services = run.services;
+    runMatchers(args, run.outputs, services);
+  } finally {
+    Object.assign(console, consoleMethods);
+    await workerPool.shutdown();
+  }
+
+  const results = {
+    version: 1,
+    createdAt: new Date().toISOString(),
+    corpus: { path: path.resolve(args.corpus), images: records.length, fingerprint },
+    environment: {
+      node: process.version,
+      platform: `${os.platform()} ${os.arch()}`,
+      cpu: os.cpus()[0]?.model || null,
+      cpus: os.cpus().length
+    },
+    wallMs: Date.now() - wallStart,
+    services
+  };
+
+  printSummary(results, log);
+
+  if (args.output) {
+    fs.writeFileSync(args.output, JSON.stringify(results, null, 2));
+    log(`\n💾 Resultados guardados en ${args.output}`);
+  }
+
+  if (args.saveBaseline) {
+    fs.writeFileSync(args.baseline, JSON.stringify(results, null, 2));
+    log(`\n📌 Línea base guardada en ${args.baseline}`);
+    return;
+  }
+
+  if (!fs.existsSync(args.baseline)) {
+    log(`\nℹ️  Sin línea base en ${args.baseline} (créala con --save-baseline)`);
+    return;
+  }
+
+  const baseline = JSON.parse(fs.readFileSync(args.baseline, 'utf8'));
+  const { rows, sameCorpus } = compareWithBaseline(results, baseline, args);
+
+  log(`\n📐 Comparación con la línea base (${baseline.createdAt}, tolerancia ${args.tolerance}% / ${args.accuracyTolerance} pp)`);
+  if (!sameCorpus) {
+    console.warn('⚠️  La línea base es de otro corpus (huella distinta): solo se compara el rendimiento');
+  }
+  if (baseline.environment?.cpu !== results.environment.cpu) {
+    console.warn(`⚠️  La línea base se midió en otra CPU (${baseline.environment?.cpu})`);
+  }
+  for (const row of rows) {
+    log(`   ${row.regression ? '❌' : '✅'} ${row.service.padEnd(10)} ${row.metric.padEnd(18)} ${String(row.baseline).padStart(9)} -> ${String(row.current).padEnd(9)} (${row.change})`);
+  }
+
+  const regressions = rows.filter(row => row.regression);
+  if (regressions.length > 0) {
+    console.error(`\n❌ ${regressions.length} regresiones respecto a la línea base`);
+    process.exit(1);
+  }
+  log('\n✅ Sin regresiones');
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
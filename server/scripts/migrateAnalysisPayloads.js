@@ -0,0 +1,99 @@
+/**
+ * Migración: saca las cargas pesadas de los análisis existentes del
+ * documento Analysis y las guarda en la colección AnalysisPayload
+ * (services/analysisPayloadService.js).
+ *
+ * Los análisis nuevos ya se guardan así; este script solo hace falta una vez
+ * para los anteriores. Es idempotente: omite los que ya tienen
+ * payload.storedAt. No modifica updatedAt (la caché de informes PDF depende
+ * de él).
+ *
+ * Uso:
+ *   node server/scripts/migrateAnalysisPayloads.js [--dry-run] [--limit 1000]
+ */
+
+require('dotenv').config();
+const mongoose = require('mongoose');
+const Analysis = require('../models/Analysis');
+const analysisPayloads = require('../services/analysisPayloadService');
+
+const { PAYLOAD_PATHS } = analysisPayloads;
+
+function parseArgs(argv) {
+  const args = { dryRun: false, limit: 0 };
+  for (let i = 0; i < argv.length; i++) {
+    const arg = argv[i];
+    if (arg === '--dry-run') args.dryRun = true;
+    else if (arg === '--limit') args.limit = parseInt(argv[++i], 10);
+  }
+  return args;
+}
+
+function getPath(source, path) {
+  return path.split('.').reduce((node, part) => (node == null ? undefined : node[part]), source);
+}
+
+function isEmpty(value) {
+  if (value === null || value === undefined) return true;
+  if (Array.isArray(value)) return value.length === 0;
+  if (typeof value === 'object' && !(value instanceof Date)) return Object.keys(value).length === 0;
+  return false;
+}
+
+async function main() {
+  const args = parseArgs(process.argv.slice(2));
+  await mongoose.connect(process.env.MONGO_URI || 'mongodb://localhost:27017/uap-db');
+  console.log(`✅ Conectado a MongoDB${args.dryRun ? ' (--dry-run: sin escribir)' : ''}`);
+
+  const cursor = Analysis.find({ 'payload.storedAt': { $exists: false } })
+    .select(PAYLOAD_PATHS.join(' '))
+    .limit(args.limit || 0)
+    .lean()
+    .cursor();
+
+  let scanned = 0;
+  let migrated = 0;
+  let bytes = 0;
+
+  for await (const doc of cursor) {
+    scanned++;
+    const values = {};
+    for (const path of PAYLOAD_PATHS) {
+      const value = getPath(doc, path);
+      if (!isEmpty(value)) values[path] = value;
+    }
+    if (Object.keys(values).length === 0) continue;
+
+    if (args.dryRun) {
+      bytes += mongoose.mongo.BSON.calculateObjectSize(values);
+    } else {
+      // Primero la copia aparte; solo después se quita del documento
+      bytes += await analysisPayloads.store(doc._id, values);
+      await Analysis.updateOne(
+        { _id: doc._id },
+        {
+          $unset: Object.fromEntries(Object.keys(values).map(path => [path, ''])),
+          $set: {
+            'payload.storedAt': new Date(),
+            'payload.matchCount': values.matchResults?.length || 0
+          }
+        },
+        { timestamps: false }
+      );
+    }
+    migrated++;
+
+    if (migrated % 500 === 0) {
+      console.log(`   ${migrated} análisis migrados (${(bytes / 1048576).toFixed(1)} MB)`);
+    }
+  }
+
+  console.log(`📊 ${scanned} análisis revisados, ${migrated} con cargas pesadas`);
+  console.log(`   ${(bytes / 1048576).toFixed(1)} MB ${args.dryRun ? 'por mover' : 'movidos'} a AnalysisPayload`);
+  await mongoose.disconnect();
+}
+
+main().catch((error) => {
+  console.error('❌ Error en la migración:', error);
+  process.exit(1);
+});
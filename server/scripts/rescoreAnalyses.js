@@ -0,0 +1,142 @@
+/**
+ * Re-puntúa los análisis desfasados tras cambiar el catálogo, el set de
+ * training, los fenómenos atmosféricos o los pesos de la fusión de confianza
+ * (services/rescoringService.js), sin repetir el análisis de las imágenes.
+ *
+ * Guarda un checkpoint tras cada lote; con --resume continúa desde el último
+ * análisis procesado (si las revisiones no han cambiado entretanto). Con
+ * --dry-run no escribe nada y --diff guarda en JSON Lines los veredictos que
+ * cambiarían.
+ *
+ * Uso:
+ *   node server/scripts/rescoreAnalyses.js [--dry-run] [--diff cambios.jsonl]
+ *     [--batch 100] [--rate 20] [--limit 5000] [--resume]
+ *     [--checkpoint rescore-checkpoint.json] [--verbose]
+ */
+
+require('dotenv').config();
+const fs = require('fs');
+const mongoose = require('mongoose');
+const { RescoringService } = require('../services/rescoringService');
+
+function parseArgs(argv) {
+  const args = {
+    dryRun: false,
+    diff: null,
+    batch: undefined,
+    rate: undefined,
+    limit: 0,
+    resume: false,
+    checkpoint: 'rescore-checkpoint.json',
+    verbose: false
+  };
+  for (let i = 0; i < argv.length; i++) {
+    const arg = argv[i];
+    if (arg === '--dry-run') args.dryRun = true;
+    else if (arg === '--diff') args.diff = argv[++i];
+    else if (arg === '--batch') args.batch = parseInt(argv[++i], 10);
+    else if (arg === '--rate') args.rate = parseInt(argv[++i], 10);
+    else if (arg === '--limit') args.limit = parseInt(argv[++i], 10);
+    else if (arg === '--resume') args.resume = true;
+    else if (arg === '--checkpoint') args.checkpoint = argv[++i];
+    else if (arg === '--verbose') args.verbose = true;
+  }
+  return args;
+}
+
+function loadCheckpoint(file, revisions, dryRun) {
+  if (!fs.existsSync(file)) return null;
+  const checkpoint = JSON.parse(fs.readFileSync(file, 'utf8'));
+  if (JSON.stringify(checkpoint.revisions) !== JSON.stringify(revisions) || checkpoint.dryRun !== dryRun) {
+    console.log('⚠️ El checkpoint es de otras revisiones o de otro modo, se empieza desde el principio');
+    return null;
+  }
+  return checkpoint;
+}
+
+async function main() {
+  const args = parseArgs(process.argv.slice(2));
+  await mongoose.connect(process.env.MONGO_URI || 'mongodb://localhost:27017/uap-db');
+  console.log(`✅ Conectado a MongoDB${args.dryRun ? ' (--dry-run: sin escribir)' : ''}`);
+
+  const rescoring = new RescoringService({ batchSize: args.batch, ratePerSec: args.rate });
+  const revisions = await rescoring.currentRevisions();
+  console.log('📚 Revisiones actuales:', revisions);
+
+  const checkpoint = (args.resume && loadCheckpoint(args.checkpoint, revisions, args.dryRun)) || {
+    revisions,
+    dryRun: args.dryRun,
+    lastId: null,
+    processed: 0,
+    rescored: 0,
+    changed: 0,
+    missing: 0,
+    errors: 0
+  };
+  if (checkpoint.lastId) {
+    console.log(`↪️  Reanudando tras ${checkpoint.lastId} (${checkpoint.processed} ya procesados)`);
+  }
+
+  const diff = args.diff ? fs.createWriteStream(args.diff, { flags: checkpoint.lastId ? 'a' : 'w' }) : null;
+
+  // Los servicios de puntuación registran cada paso; aquí solo el progreso
+  const log = console.log;
+  if (!args.verbose) console.log = () => {};
+
+  const startedAt = Date.now();
+  let runProcessed = 0;
+
+  try {
+    while (!args.limit || runProcessed < args.limit) {
+      const limit = args.limit ? Math.min(rescoring.batchSize, args.limit - runProcessed) : rescoring.batchSize;
+      const { lastId, results } = await rescoring.rescoreBatch(revisions, {
+        afterId: checkpoint.lastId,
+        limit,
+        dryRun: args.dryRun
+      });
+      if (!lastId) break;
+
+      for (const result of results) {
+        if (result.missing.length > 0) checkpoint.missing++;
+        else if (result.error) checkpoint.errors++;
+        else checkpoint.rescored++;
+
+        if (result.changed) {
+          checkpoint.changed++;
+          diff?.write(JSON.stringify(result) + '\n');
+        }
+      }
+
+      checkpoint.lastId = lastId.toString();
+      checkpoint.processed += results.length;
+      runProcessed += results.length;
+      fs.writeFileSync(args.checkpoint, JSON.stringify(checkpoint, null, 2));
+
+      const perSec = runProcessed / Math.max(1, (Date.now() - startedAt) / 1000);
+      log(`   ${checkpoint.processed} revisados, ${checkpoint.rescored} re-puntuados, ${checkpoint.changed} con cambios (${perSec.toFixed(1)}/s)`);
+    }
+  } finally {
+    console.log = log;
+    diff?.end();
+  }
+
+  console.log(`📊 ${checkpoint.processed} análisis desfasados revisados`);
+  console.log(`   ${checkpoint.rescored} ${args.dryRun ? 'se re-puntuarían' : 're-puntuados'}, ${checkpoint.changed} con veredicto distinto`);
+  if (checkpoint.missing > 0) {
+    console.log(`   ⚠️ ${checkpoint.missing} sin entradas guardadas (necesitan un re-análisis completo)`);
+  }
+  if (checkpoint.errors > 0) {
+    console.log(`   ❌ ${checkpoint.errors} con errores`);
+  }
+  const unscored = await rescoring.countUnscored();
+  if (unscored > 0) {
+    console.log(`   ℹ️ ${unscored} análisis completados sin revisiones (vídeos o anteriores a la re-puntuación): solo con re-análisis completo`);
+  }
+
+  await mongoose.disconnect();
+}
+
+main().catch((error) => {
+  console.error('❌ Error en la re-puntuación:', error);
+  process.exit(1);
+});
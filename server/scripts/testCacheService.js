@@ -0,0 +1,75 @@
+/**
+ * Comprobaciones de CacheNamespace.getOrSet con el respaldo compartido
+ * ('local'), sin base de datos ni red:
+ * - Un acierto del respaldo compartido no deja la carga en vuelo: tras
+ *   caducar, la siguiente lectura vuelve a llamar al loader
+ * - Un loader que falla de forma síncrona tampoco la deja en vuelo
+ *
+ * Sale con código 1 si alguna comprobación falla.
+ *
+ * Uso:
+ *   node server/scripts/testCacheService.js
+ */
+
+process.env.CACHE_SHARED_BACKEND = 'local';
+const { CacheNamespace } = require('../services/cacheService');
+
+const TTL_MS = 50;
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+const failures = [];
+function check(condition, message) {
+  console.log(`${condition ? '✅' : '❌'} ${message}`);
+  if (!condition) failures.push(message);
+}
+
+async function sharedHitThenReload() {
+  // Dos espacios con el mismo nombre = dos procesos sobre el mismo respaldo
+  const writer = new CacheNamespace('check-shared', { ttlMs: TTL_MS, shared: true });
+  const reader = new CacheNamespace('check-shared', { ttlMs: TTL_MS, shared: true });
+
+  writer.set('key', 'v1');
+  await sleep(5);
+
+  let loads = 0;
+  const loader = async () => `v${++loads + 1}`;
+
+  const first = await reader.getOrSet('key', loader);
+  check(first === 'v1' && loads === 0, 'acierto del respaldo compartido sin llamar al loader');
+  check(reader.inFlight.size === 0, 'sin cargas en vuelo tras el acierto compartido');
+
+  await sleep(TTL_MS * 2);
+
+  const second = await reader.getOrSet('key', loader);
+  const third = await reader.getOrSet('key', loader);
+  check(second === 'v2' && loads === 1, 'tras caducar se recarga con el loader');
+  check(third === 'v2' && loads === 1, 'la recarga queda en caché');
+}
+
+async function synchronousLoaderError() {
+  const cache = new CacheNamespace('check-sync-error', { ttlMs: TTL_MS });
+
+  const failed = await cache.getOrSet('key', () => { throw new Error('fallo'); })
+    .then(() => false, () => true);
+  check(failed, 'el error síncrono del loader se propaga');
+  check(cache.inFlight.size === 0, 'sin cargas en vuelo tras un error síncrono');
+
+  const value = await cache.getOrSet('key', async () => 'ok');
+  check(value === 'ok', 'la siguiente lectura vuelve a cargar');
+}
+
+async function main() {
+  await sharedHitThenReload();
+  await synchronousLoaderError();
+
+  if (failures.length > 0) {
+    console.error(`\n❌ ${failures.length} comprobación(es) fallida(s)`);
+    process.exit(1);
+  }
+  console.log('\n✅ Caché correcta');
+}
+
+main().catch((error) => {
+  console.error('❌ Error en las comprobaciones:', error);
+  process.exit(1);
+});
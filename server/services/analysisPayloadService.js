@@ -0,0 +1,275 @@
+/**
+ * CARGAS PESADAS DE LOS ANÁLISIS (colección aparte, carga bajo demanda)
+ *
+ * El documento Analysis se queda con el resumen (estado, mejor coincidencia,
+ * confianza, tiempos, hash perceptual...) y los subárboles grandes de cada
+ * capa -tags EXIF sin procesar, respuestas completas, coincidencias del
+ * catálogo, detalles forenses, fotogramas de vídeo- se guardan en un
+ * documento AnalysisPayload por análisis, en BSON comprimido con gzip.
+ *
+ * - Escritura transparente: los hooks de save de Analysis llaman a detach()
+ *   antes de guardar y a restore() después, así el pipeline sigue trabajando
+ *   con el documento completo en memoria
+ * - Lectura bajo demanda: attach() añade a documentos u objetos lean solo las
+ *   cargas pedidas; listados y estado en curso no las leen (summaryProjection)
+ * - Documentos anteriores a la separación: mantienen las cargas dentro hasta
+ *   pasar scripts/migrateAnalysisPayloads.js; attach() solo sobrescribe lo
+ *   que existe en la colección aparte, así que ambos formatos conviven
+ */
+
+const zlib = require('zlib');
+const { promisify } = require('util');
+const mongoose = require('mongoose');
+const AnalysisPayload = require('../models/AnalysisPayload');
+
+const gzip = promisify(zlib.gzip);
+const gunzip = promisify(zlib.gunzip);
+const { BSON } = mongoose.mongo;
+
+// Clave en AnalysisPayload -> ruta en Analysis. Ninguna se consulta ni se
+// indexa: todo lo que filtra u ordena se queda en el resumen.
+const PAYLOADS = {
+  exifRawTags: 'exifData.rawTags',
+  aiRawResponse: 'aiAnalysis.rawResponse',
+  localObjects: 'localAiAnalysis.objects',
+  localCharacteristics: 'localAiAnalysis.characteristics',
+  localTechnicalDetails: 'localAiAnalysis.technicalDetails',
+  matchResults: 'matchResults',
+  externalResults: 'externalValidation.results',
+  lightColorAnalysis: 'visualAnalysis.lightPatterns.colorAnalysis',
+  objectTypeScores: 'visualAnalysis.objectType.allScores',
+  cloneDetails: 'forensicAnalysis.cloneDetection.details',
+  videoKeyframes: 'videoAnalysis.keyframes',
+  videoTrajectory: 'videoAnalysis.trajectory.points',
+  videoBrightness: 'videoAnalysis.brightness.curve',
+  scoringInputs: 'scoringInputs'
+};
+
+const PAYLOAD_PATHS = Object.values(PAYLOADS);
+const KEY_BY_PATH = Object.fromEntries(Object.entries(PAYLOADS).map(([key, path]) => [path, key]));
+
+/**
+ * Un valor merece guardarse aparte si no está vacío
+ */
+function hasContent(value) {
+  if (value === null || value === undefined) return false;
+  if (Array.isArray(value)) return value.length > 0;
+  if (typeof value === 'object' && !(value instanceof Date)) return Object.keys(value).length > 0;
+  return true;
+}
+
+/**
+ * Valor plano de una ruta de Mongoose (arrays y subdocumentos a objetos)
+ */
+function plain(value) {
+  return value && typeof value.toObject === 'function'
+    ? value.toObject({ depopulate: true })
+    : value;
+}
+
+/**
+ * Buffer / BSON Binary -> Buffer
+ */
+function toBuffer(value) {
+  if (value && value._bsontype === 'Binary') {
+    return Buffer.from(value.buffer);
+  }
+  return value;
+}
+
+/**
+ * Asigna una ruta con puntos en un objeto plano, creando los intermedios
+ */
+function setPath(target, path, value) {
+  const parts = path.split('.');
+  let node = target;
+  for (const part of parts.slice(0, -1)) {
+    if (!node[part] || typeof node[part] !== 'object') node[part] = {};
+    node = node[part];
+  }
+  node[parts[parts.length - 1]] = value;
+}
+
+/**
+ * Lee una ruta con puntos de un documento o de un objeto plano
+ */
+function getPath(source, path) {
+  if (source instanceof mongoose.Document) return source.get(path);
+  return path.split('.').reduce((node, part) => (node == null ? undefined : node[part]), source);
+}
+
+/**
+ * Añade una carga a un documento (sin marcarla como modificada) o a un
+ * objeto plano
+ */
+function assign(item, path, value) {
+  if (item instanceof mongoose.Document) {
+    item.set(path, value);
+    item.unmarkModified(path);
+  } else {
+    setPath(item, path, value);
+  }
+}
+
+class AnalysisPayloadService {
+  /**
+   * Proyección de exclusión para leer solo el resumen
+   * @param {string} [extra] - Exclusiones adicionales ('-__v -filePath')
+   * @returns {string}
+   */
+  summaryProjection(extra = '') {
+    return [...PAYLOAD_PATHS.map(path => `-${path}`), extra].join(' ').trim();
+  }
+
+  /**
+   * Escribe (o borra, si están vacías) las cargas de un análisis
+   * @param {ObjectId} analysisId
+   * @param {Object} values - ruta de Analysis -> valor plano
+   * @returns {Promise<number>} Bytes sin comprimir guardados
+   */
+  async store(analysisId, values) {
+    const $set = {};
+    const $unset = {};
+    let bytes = 0;
+
+    for (const [path, value] of Object.entries(values)) {
+      const key = KEY_BY_PATH[path];
+      if (!hasContent(value)) {
+        $unset[`layers.${key}`] = '';
+        $unset[`sizes.${key}`] = '';
+        continue;
+      }
+      const raw = BSON.serialize({ value });
+      $set[`layers.${key}`] = await gzip(raw);
+      $set[`sizes.${key}`] = raw.length;
+      bytes += raw.length;
+    }
+
+    const update = {};
+    if (Object.keys($set).length > 0) update.$set = $set;
+    if (Object.keys($unset).length > 0) update.$unset = $unset;
+    if (Object.keys(update).length === 0) return 0;
+
+    // Sin nada que escribir no se crea el documento aparte
+    await AnalysisPayload.updateOne({ analysisId }, update, { upsert: Boolean(update.$set) });
+    return bytes;
+  }
+
+  /**
+   * Hook pre('save') de Analysis: guarda aparte las cargas nuevas o
+   * modificadas y las quita del documento que se va a escribir
+   * @param {Document} doc
+   */
+  async detach(doc) {
+    const values = {};
+    for (const path of PAYLOAD_PATHS) {
+      if (doc.isNew ? hasContent(doc.get(path)) : doc.isModified(path)) {
+        values[path] = plain(doc.get(path));
+      }
+    }
+    const paths = Object.keys(values);
+    if (paths.length === 0) return;
+
+    await this.store(doc._id, values);
+
+    // Guardar en memoria lo que se quita para devolverlo tras el save
+    const stash = {};
+    for (const path of paths) {
+      if (!hasContent(values[path])) continue;
+      stash[path] = values[path];
+      doc.set(path, undefined);
+    }
+    doc.$locals.payloadStash = stash;
+
+    doc.set('payload.storedAt', new Date());
+    if (paths.includes('matchResults')) {
+      doc.set('payload.matchCount', values.matchResults?.length || 0);
+    }
+  }
+
+  /**
+   * Hook post('save') de Analysis (también si falla): devuelve al documento
+   * en memoria las cargas que detach() quitó, sin marcarlas como modificadas
+   * @param {Document} doc
+   */
+  restore(doc) {
+    const stash = doc.$locals.payloadStash;
+    if (!stash) return;
+    doc.$locals.payloadStash = null;
+
+    for (const [path, value] of Object.entries(stash)) {
+      doc.set(path, value);
+      doc.unmarkModified(path);
+    }
+  }
+
+  /**
+   * Añade las cargas guardadas aparte a documentos o a objetos lean
+   * @param {Object|Object[]} target - Documento(s) de Analysis u objetos lean
+   * @param {string[]} [paths] - Rutas de Analysis a cargar (todas por defecto)
+   * @returns {Promise<Object|Object[]>} El mismo target
+   */
+  async attach(target, paths = PAYLOAD_PATHS) {
+    const items = (Array.isArray(target) ? target : [target]).filter(Boolean);
+    const keys = paths.map(path => KEY_BY_PATH[path]).filter(Boolean);
+    if (items.length === 0 || keys.length === 0) return target;
+
+    const projection = { analysisId: 1 };
+    for (const key of keys) projection[`layers.${key}`] = 1;
+
+    const stored = await AnalysisPayload.find({ analysisId: { $in: items.map(item => item._id) } })
+      .select(projection)
+      .lean();
+    const layersById = new Map(stored.map(entry => [entry.analysisId.toString(), entry.layers || {}]));
+
+    const legacy = [];
+    for (const item of items) {
+      const layers = layersById.get(item._id.toString());
+      if (!layers) {
+        // Sin migrar y leído con summaryProjection: las cargas siguen dentro
+        if (!getPath(item, 'payload.storedAt') && keys.every(key => getPath(item, PAYLOADS[key]) === undefined)) {
+          legacy.push(item);
+        }
+        continue;
+      }
+
+      for (const key of keys) {
+        if (!layers[key]) continue;
+        const { value } = BSON.deserialize(await gunzip(toBuffer(layers[key])));
+        assign(item, PAYLOADS[key], value);
+      }
+    }
+
+    if (legacy.length > 0) {
+      const inline = await mongoose.model('Analysis')
+        .find({ _id: { $in: legacy.map(item => item._id) } })
+        .select(keys.map(key => PAYLOADS[key]).join(' '))
+        .lean();
+      const inlineById = new Map(inline.map(entry => [entry._id.toString(), entry]));
+
+      for (const item of legacy) {
+        const entry = inlineById.get(item._id.toString());
+        if (!entry) continue;
+        for (const key of keys) {
+          const value = getPath(entry, PAYLOADS[key]);
+          if (value !== undefined) assign(item, PAYLOADS[key], value);
+        }
+      }
+    }
+
+    return target;
+  }
+
+  /**
+   * Borra las cargas de los análisis eliminados
+   * @param {ObjectId[]} analysisIds
+   */
+  async remove(analysisIds) {
+    if (analysisIds.length === 0) return;
+    await AnalysisPayload.deleteMany({ analysisId: { $in: analysisIds } });
+  }
+}
+
+module.exports = new AnalysisPayloadService();
+module.exports.AnalysisPayloadService = AnalysisPayloadService;
+module.exports.PAYLOAD_PATHS = PAYLOAD_PATHS;
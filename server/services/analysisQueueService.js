@@ -0,0 +1,377 @@
+/**
+ * COLA DURABLE DE ANÁLISIS (MongoDB)
+ *
+ * Sustituye el lanzamiento "fire-and-forget" de performAnalysis:
+ * - Concurrencia acotada (ANALYSIS_QUEUE_CONCURRENCY pipelines a la vez)
+ * - Carriles de prioridad: 'admin' (re-análisis) antes que 'user' (subidas),
+ *   y 'batch' (importaciones masivas) detrás para no bloquear a los usuarios
+ * - Reintentos con backoff exponencial (ANALYSIS_QUEUE_MAX_ATTEMPTS)
+ * - Recuperación de trabajos 'processing' cuyo latido se detuvo (caída
+ *   o reinicio del proceso)
+ * - Métricas de profundidad de cola y latencia
+ *
+ * El procesador (performAnalysis) se registra desde routes/analyze.js con
+ * setProcessor(); el progreso sigue emitiéndose por WebSocketService y el
+ * estado del Analysis sigue consultándose en /api/analyze/:id/status.
+ */
+
+const os = require('os');
+const AnalysisJob = require('../models/AnalysisJob');
+const Analysis = require('../models/Analysis');
+const { envInt } = require('../utils/env');
+
+const LANE_PRIORITY = {
+  admin: 10,
+  user: 0,
+  batch: -10
+};
+
+// Muestras de latencia conservadas para percentiles
+const LATENCY_SAMPLES = 200;
+
+function summarize(samples) {
+  if (samples.length === 0) {
+    return { count: 0, avg: 0, p50: 0, p95: 0, max: 0 };
+  }
+
+  const sorted = [...samples].sort((a, b) => a - b);
+  const pick = (q) => sorted[Math.min(sorted.length - 1, Math.floor(q * sorted.length))];
+
+  return {
+    count: sorted.length,
+    avg: Math.round(sorted.reduce((s, v) => s + v, 0) / sorted.length),
+    p50: pick(0.5),
+    p95: pick(0.95),
+    max: sorted[sorted.length - 1]
+  };
+}
+
+class AnalysisQueueService {
+  constructor(options = {}) {
+    this.concurrency = options.concurrency ?? envInt('ANALYSIS_QUEUE_CONCURRENCY', 2);
+    this.pollIntervalMs = options.pollIntervalMs ?? envInt('ANALYSIS_QUEUE_POLL_MS', 1000);
+    this.maxAttempts = options.maxAttempts ?? envInt('ANALYSIS_QUEUE_MAX_ATTEMPTS', 3);
+    this.backoffMs = options.backoffMs ?? envInt('ANALYSIS_QUEUE_BACKOFF_MS', 5000);
+    this.lockTimeoutMs = options.lockTimeoutMs ?? envInt('ANALYSIS_QUEUE_LOCK_TIMEOUT_MS', 120000);
+
+    this.workerId = `${os.hostname()}:${process.pid}`;
+    this.processor = null;
+    this.active = new Map(); // jobId -> { job, heartbeat }
+    this.pollTimer = null;
+    this.filling = false;
+    this.lastRecovery = 0;
+
+    this.counters = {
+      enqueued: 0,
+      completed: 0,
+      failed: 0,
+      retried: 0,
+      recovered: 0
+    };
+    this.waitSamples = [];
+    this.runSamples = [];
+  }
+
+  /**
+   * Registrar la función que ejecuta un análisis
+   * @param {Function} processor - async (analysisId, { attempt, maxAttempts, finalAttempt })
+   */
+  setProcessor(processor) {
+    this.processor = processor;
+  }
+
+  /**
+   * Iniciar el sondeo de la cola (llamar tras conectar a MongoDB)
+   */
+  async start() {
+    if (this.pollTimer) return;
+
+    console.log(`📥 Cola de análisis iniciada (concurrencia: ${this.concurrency}, worker: ${this.workerId})`);
+
+    await this.recoverStaleJobs();
+    this.pollTimer = setInterval(() => this.fill(), this.pollIntervalMs);
+    this.pollTimer.unref();
+    this.fill();
+  }
+
+  /**
+   * Detener el sondeo (los trabajos en curso terminan por su cuenta)
+   */
+  stop() {
+    clearInterval(this.pollTimer);
+    this.pollTimer = null;
+  }
+
+  /**
+   * Encolar un análisis
+   * @param {string} analysisId - ID del Analysis
+   * @param {Object} options - { userId, lane: 'admin' | 'user' | 'batch' }
+   * @returns {Promise<Object>} Trabajo creado (o el ya existente si está pendiente)
+   */
+  async enqueue(analysisId, options = {}) {
+    const { userId = null, lane = 'user' } = options;
+
+    const existing = await AnalysisJob.findOne({
+      analysisId,
+      status: { $in: ['queued', 'processing'] }
+    });
+    if (existing) {
+      return existing;
+    }
+
+    let job;
+    try {
+      job = await AnalysisJob.create({
+        analysisId,
+        userId,
+        lane,
+        priority: LANE_PRIORITY[lane] ?? 0,
+        maxAttempts: this.maxAttempts,
+        runAt: new Date()
+      });
+    } catch (error) {
+      // Otra petición lo encoló entre la consulta y el alta (índice único parcial)
+      if (error.code !== 11000) throw error;
+      const pending = await AnalysisJob.findOne({
+        analysisId,
+        status: { $in: ['queued', 'processing'] }
+      });
+      if (pending) return pending;
+      throw error;
+    }
+
+    this.counters.enqueued++;
+    console.log(`📥 Análisis ${analysisId} encolado (carril: ${lane})`);
+
+    this.fill();
+    return job;
+  }
+
+  /**
+   * Reclamar trabajos mientras haya capacidad libre
+   */
+  async fill() {
+    if (!this.processor || this.filling) return;
+    this.filling = true;
+
+    try {
+      if (Date.now() - this.lastRecovery > this.lockTimeoutMs / 2) {
+        await this.recoverStaleJobs();
+      }
+
+      while (this.active.size < this.concurrency) {
+        const job = await this.claimNext();
+        if (!job) break;
+        this.runJob(job);
+      }
+    } catch (error) {
+      console.error('❌ Error sondeando la cola de análisis:', error.message);
+    } finally {
+      this.filling = false;
+    }
+  }
+
+  /**
+   * Reclamo atómico del siguiente trabajo listo (mayor prioridad, más antiguo)
+   */
+  async claimNext() {
+    const now = new Date();
+
+    return AnalysisJob.findOneAndUpdate(
+      { status: 'queued', runAt: { $lte: now } },
+      {
+        $set: {
+          status: 'processing',
+          lockedBy: this.workerId,
+          lockedAt: now,
+          startedAt: now
+        },
+        $inc: { attempts: 1 }
+      },
+      { sort: { priority: -1, runAt: 1 }, new: true }
+    );
+  }
+
+  /**
+   * Ejecutar un trabajo reclamado
+   */
+  async runJob(job) {
+    const jobId = job._id.toString();
+    const startedAt = Date.now();
+
+    this.pushSample(this.waitSamples, startedAt - new Date(job.runAt).getTime());
+
+    // Latido: mantiene el bloqueo vigente mientras el pipeline corre
+    const heartbeat = setInterval(() => {
+      AnalysisJob.updateOne(
+        { _id: job._id, lockedBy: this.workerId },
+        { $set: { lockedAt: new Date() } }
+      ).catch(err => console.error('⚠️ Error en latido de trabajo:', err.message));
+    }, Math.max(1000, Math.floor(this.lockTimeoutMs / 3)));
+    heartbeat.unref();
+
+    this.active.set(jobId, { job, heartbeat });
+
+    const finalAttempt = job.attempts >= job.maxAttempts;
+
+    try {
+      await this.processor(job.analysisId.toString(), {
+        attempt: job.attempts,
+        maxAttempts: job.maxAttempts,
+        finalAttempt
+      });
+
+      await AnalysisJob.updateOne(
+        { _id: job._id },
+        { $set: { status: 'completed', finishedAt: new Date(), lockedBy: null, lockedAt: null, lastError: null } }
+      );
+      this.counters.completed++;
+
+    } catch (error) {
+      if (finalAttempt) {
+        console.error(`❌ Análisis ${job.analysisId} falló tras ${job.attempts} intento(s):`, error.message);
+        await AnalysisJob.updateOne(
+          { _id: job._id },
+          { $set: { status: 'failed', finishedAt: new Date(), lockedBy: null, lockedAt: null, lastError: error.message } }
+        ).catch(() => {});
+        // Por si el procesador falló antes de poder marcar el análisis
+        await Analysis.updateOne(
+          { _id: job.analysisId, status: { $ne: 'error' } },
+          { $set: { status: 'error', errorMessage: error.message } }
+        ).catch(() => {});
+        this.counters.failed++;
+      } else {
+        const delay = this.backoffMs * Math.pow(2, job.attempts - 1);
+        console.warn(`🔁 Reintentando análisis ${job.analysisId} en ${Math.round(delay / 1000)}s (intento ${job.attempts}/${job.maxAttempts})`);
+        await AnalysisJob.updateOne(
+          { _id: job._id },
+          { $set: { status: 'queued', runAt: new Date(Date.now() + delay), lockedBy: null, lockedAt: null, lastError: error.message } }
+        ).catch(() => {});
+        this.counters.retried++;
+      }
+    } finally {
+      clearInterval(heartbeat);
+      this.active.delete(jobId);
+      this.pushSample(this.runSamples, Date.now() - startedAt);
+      this.fill();
+    }
+  }
+
+  /**
+   * Devolver a la cola los trabajos cuyo worker dejó de latir.
+   * Si ya agotaron los intentos, se marcan como fallidos.
+   */
+  async recoverStaleJobs() {
+    this.lastRecovery = Date.now();
+    const staleBefore = new Date(Date.now() - this.lockTimeoutMs);
+
+    try {
+      const stale = await AnalysisJob.find({
+        status: 'processing',
+        lockedAt: { $lt: staleBefore }
+      });
+
+      for (const job of stale) {
+        const exhausted = job.attempts >= job.maxAttempts;
+        const reason = `Trabajo interrumpido (worker ${job.lockedBy} sin latido)`;
+
+        // Condición sobre lockedAt: otro proceso pudo recuperarlo antes
+        const result = await AnalysisJob.updateOne(
+          { _id: job._id, status: 'processing', lockedAt: job.lockedAt },
+          {
+            $set: exhausted
+              ? { status: 'failed', finishedAt: new Date(), lockedBy: null, lockedAt: null, lastError: reason }
+              : { status: 'queued', runAt: new Date(), lockedBy: null, lockedAt: null, lastError: reason }
+          }
+        );
+        if (result.modifiedCount === 0) continue;
+
+        this.counters.recovered++;
+        console.warn(`♻️ Trabajo de análisis ${job.analysisId} recuperado (${exhausted ? 'sin intentos restantes' : 'reencolado'})`);
+
+        if (exhausted) {
+          this.counters.failed++;
+          await Analysis.updateOne(
+            { _id: job.analysisId },
+            { $set: { status: 'error', errorMessage: reason } }
+          );
+        }
+      }
+    } catch (error) {
+      console.error('❌ Error recuperando trabajos de análisis:', error.message);
+    }
+  }
+
+  /**
+   * Estado del trabajo más reciente de un análisis (para /:id/status)
+   */
+  async getJobStatus(analysisId) {
+    const job = await AnalysisJob.findOne({ analysisId }).sort({ createdAt: -1 }).lean();
+    if (!job) return null;
+
+    const status = {
+      status: job.status,
+      lane: job.lane,
+      attempts: job.attempts,
+      maxAttempts: job.maxAttempts,
+      lastError: job.lastError
+    };
+
+    if (job.status === 'queued') {
+      const ahead = await AnalysisJob.countDocuments({
+        status: 'queued',
+        $or: [
+          { priority: { $gt: job.priority } },
+          { priority: job.priority, runAt: { $lt: job.runAt } }
+        ]
+      });
+      status.position = ahead + 1;
+      status.runAt = job.runAt;
+    }
+
+    return status;
+  }
+
+  /**
+   * Métricas de la cola: profundidad por carril/estado y latencias
+   */
+  async getMetrics() {
+    const [byStatus, oldestQueued] = await Promise.all([
+      AnalysisJob.aggregate([
+        { $match: { status: { $in: ['queued', 'processing', 'failed'] } } },
+        { $group: { _id: { status: '$status', lane: '$lane' }, count: { $sum: 1 } } }
+      ]),
+      AnalysisJob.findOne({ status: 'queued' }).sort({ runAt: 1 }).select('runAt').lean()
+    ]);
+
+    const depth = {
+      queued: { admin: 0, user: 0, batch: 0 },
+      processing: { admin: 0, user: 0, batch: 0 },
+      failed: { admin: 0, user: 0, batch: 0 }
+    };
+    for (const { _id, count } of byStatus) {
+      if (depth[_id.status]) depth[_id.status][_id.lane] = count;
+    }
+
+    return {
+      workerId: this.workerId,
+      concurrency: this.concurrency,
+      active: this.active.size,
+      depth,
+      oldestQueuedAgeMs: oldestQueued ? Math.max(0, Date.now() - new Date(oldestQueued.runAt).getTime()) : 0,
+      counters: { ...this.counters },
+      latency: {
+        waitMs: summarize(this.waitSamples),
+        runMs: summarize(this.runSamples)
+      }
+    };
+  }
+
+  pushSample(samples, value) {
+    samples.push(value);
+    if (samples.length > LATENCY_SAMPLES) samples.shift();
+  }
+}
+
+module.exports = new AnalysisQueueService();
+module.exports.AnalysisQueueService = AnalysisQueueService;
@@ -1,67 +1,477 @@
+const crypto = require('crypto');
 const AtmosphericPhenomenon = require('../models/AtmosphericPhenomenon');
+const { envInt } = require('../utils/env');
 
 /**
  * Servicio de Comparación Atmosférica
  * Compara características visuales del avistamiento con fenómenos atmosféricos conocidos
+ *
+ * Los fenómenos activos se compilan una vez (y tras cada cambio de la
+ * colección, vía los hooks del modelo) en columnas de arrays tipados:
+ * forma, colores, brillo, textura, condiciones meteorológicas y momentos
+ * del día como identificadores de vocabulario y máscaras de bits. El
+ * puntuador por lotes (scoreBatch) calcula primero los rasgos de cada
+ * avistamiento contra esos vocabularios y después recorre las columnas en
+ * un único bucle plano por avistamiento, con exactamente la misma
+ * aritmética que calculateMatchScore (implementación de referencia fila a
+ * fila; scripts/benchAtmosphericScoring.js verifica la equivalencia).
  */
+
+// Los cambios hechos desde otro proceso se ven como mucho tras este tiempo
+const COMPILED_TTL_MS = envInt('ATMOSPHERIC_COMPILED_TTL_SEC', 300) * 1000;
+
+const MATCH_THRESHOLD = 30;  // Umbral de coincidencia significativa
+
+const BRIGHTNESS_RANGES = {
+  'dim': { min: 0, max: 0.3 },
+  'moderate': { min: 0.3, max: 0.6 },
+  'bright': { min: 0.6, max: 0.85 },
+  'very_bright': { min: 0.85, max: 1.0 },
+  'variable': { min: 0, max: 1.0 }
+};
+const BRIGHTNESS_LEVELS = Object.keys(BRIGHTNESS_RANGES);
+
+// Mapeo de condiciones del fenómeno a weatherData.conditions.main
+const WEATHER_MAP = {
+  'clear': ['clear'],
+  'cloudy': ['clouds', 'mist', 'fog'],
+  'partly_cloudy': ['clouds'],
+  'rainy': ['rain', 'drizzle'],
+  'snowy': ['snow'],
+  'stormy': ['thunderstorm'],
+  'foggy': ['fog', 'mist']
+};
+
+// Bits de momento del día
+const TIME_BITS = { dawn: 1, day: 2, dusk: 4, night: 8 };
+const ANY_TIME = 15;
+
+// Indicadores por fenómeno
+const FLAG_CLOUD_OPTICAL = 1;
+const FLAG_PRECIPITATION = 2;
+const FLAG_AURORA = 4;
+const FLAG_PILLAR = 8;
+const FLAG_YEAR_ROUND = 16;
+const FLAG_WORLDWIDE = 32;
+
+/**
+ * Vocabulario string -> id
+ */
+class Vocabulary {
+  constructor() {
+    this.ids = new Map();
+    this.values = [];
+  }
+
+  id(value) {
+    if (!this.ids.has(value)) {
+      this.ids.set(value, this.values.length);
+      this.values.push(value);
+    }
+    return this.ids.get(value);
+  }
+
+  get size() {
+    return this.values.length;
+  }
+}
+
+/**
+ * Compilar fenómenos (objetos planos) a la representación columnar
+ * @param {Array<Object>} phenomena - Fenómenos activos en orden de consulta
+ * @returns {Object} Modelo compilado para scoreBatch
+ */
+function compilePhenomena(phenomena) {
+  const count = phenomena.length;
+  const shapes = new Vocabulary();
+  const colors = new Vocabulary();
+  const textures = new Vocabulary();
+  const weathers = new Vocabulary();
+
+  const shapeId = new Int32Array(count).fill(-1);
+  const brightnessId = new Int32Array(count).fill(-1);
+  const textureId = new Int32Array(count).fill(-1);
+  const timeMask = new Uint8Array(count);
+  const flags = new Uint8Array(count);
+  const colorOffsets = new Int32Array(count + 1);
+  const weatherOffsets = new Int32Array(count + 1);
+  const colorIds = [];
+  const weatherIds = [];
+  const meta = new Array(count);
+
+  phenomena.forEach((phenomenon, p) => {
+    // Mismos valores por defecto que un documento Mongoose (arrays vacíos)
+    const visual = phenomenon.visualCharacteristics || {};
+    const conditions = phenomenon.conditions || {};
+    const weather = conditions.weather || [];
+    const timeOfDay = conditions.timeOfDay || [];
+
+    if (visual.shape) shapeId[p] = shapes.id(visual.shape);
+    if (visual.brightness) {
+      const level = BRIGHTNESS_LEVELS.indexOf(visual.brightness);
+      brightnessId[p] = level >= 0 ? level : BRIGHTNESS_LEVELS.length;  // Desconocido: 0 puntos
+    }
+    if (visual.texture) textureId[p] = textures.id(visual.texture);
+
+    for (const color of visual.colors || []) {
+      colorIds.push(colors.id(String(color).toLowerCase()));
+    }
+    colorOffsets[p + 1] = colorIds.length;
+
+    for (const condition of weather) {
+      weatherIds.push(weathers.id(condition));
+    }
+    weatherOffsets[p + 1] = weatherIds.length;
+
+    timeMask[p] = timeOfDay.includes('any')
+      ? ANY_TIME
+      : timeOfDay.reduce((mask, time) => mask | (TIME_BITS[time] || 0), 0);
+
+    if (phenomenon.category === 'cloud' || phenomenon.category === 'optical') flags[p] |= FLAG_CLOUD_OPTICAL;
+    if (weather.includes('rainy') || weather.includes('snowy')) flags[p] |= FLAG_PRECIPITATION;
+    if (phenomenon.category === 'aurora') flags[p] |= FLAG_AURORA;
+    if (phenomenon.name.includes('Pilar')) flags[p] |= FLAG_PILLAR;
+    if ((conditions.seasonality || []).includes('year-round')) flags[p] |= FLAG_YEAR_ROUND;
+    if ((conditions.geographicRegions || []).includes('worldwide')) flags[p] |= FLAG_WORLDWIDE;
+
+    meta[p] = {
+      name: phenomenon.name,
+      category: phenomenon.category,
+      description: phenomenon.description,
+      // Valor por defecto del esquema (las consultas lean no lo aplican)
+      rarity: phenomenon.rarity === undefined ? 'common' : phenomenon.rarity
+    };
+  });
+
+  const anyFlag = (flag) => flags.some(value => value & flag);
+
+  return {
+    // Huella del contenido compilado; la usa la re-puntuación del histórico
+    revision: crypto.createHash('md5').update(JSON.stringify(phenomena)).digest('hex').slice(0, 12),
+    count,
+    shapes,
+    colors,
+    textures,
+    weathers,
+    shapeId,
+    brightnessId,
+    textureId,
+    timeMask,
+    flags,
+    colorOffsets,
+    colorIds: Int32Array.from(colorIds),
+    weatherOffsets,
+    weatherIds: Int32Array.from(weatherIds),
+    hasCloudOptical: anyFlag(FLAG_CLOUD_OPTICAL),
+    hasPrecipitation: anyFlag(FLAG_PRECIPITATION),
+    meta
+  };
+}
+
+/**
+ * Puntuar todos los fenómenos del modelo para los rasgos de un avistamiento.
+ * Misma aritmética (y mismo orden de operaciones) que calculateMatchScore.
+ * Deja en `top` los índices de las 5 mejores coincidencias, en orden estable
+ * (a igual puntuación, la primera en el orden de los fenómenos), con su
+ * puntuación y desglose en scratch.totals / scratch.breakdowns.
+ * @returns {number} Número total de coincidencias sobre el umbral
+ */
+function scanColumns(model, scratch, top, features) {
+  const {
+    count, shapeId, brightnessId, textureId, timeMask, flags,
+    colorOffsets, colorIds, weatherOffsets, weatherIds
+  } = model;
+  const { shapeHit, colorHit, weatherHit, brightness, totals, breakdowns } = scratch;
+  const {
+    hasVisual, useShape, colorMode, useBrightness, sightingTexture,
+    hasWeather, cloudy, precipitation, hasTime, timeBit, night, twilight, hasExif
+  } = features;
+  let totalMatches = 0;
+
+  for (let p = 0; p < count; p++) {
+    const flag = flags[p];
+
+    let visual = 0;
+    if (hasVisual) {
+      let visualScore = 0;
+      if (useShape && shapeId[p] >= 0 && shapeHit[shapeId[p]] === 1) visualScore += 25;
+      if (colorMode !== 0) {
+        let colorMatch = 0;
+        if (colorMode === 2) {
+          let hits = 0;
+          for (let k = colorOffsets[p]; k < colorOffsets[p + 1]; k++) hits += colorHit[colorIds[k]];
+          colorMatch = hits / (colorOffsets[p + 1] - colorOffsets[p]);  // Sin colores: NaN, como el original
+        }
+        visualScore += colorMatch * 25;
+      }
+      if (useBrightness && brightnessId[p] >= 0) visualScore += brightness[brightnessId[p]] * 15;
+      if (sightingTexture >= 0 && textureId[p] === sightingTexture) visualScore += 15;
+      visual = Math.min(40, visualScore * 0.5);
+    }
+
+    let weather = 0;
+    if (hasWeather) {
+      let weatherScore = 0;
+      for (let k = weatherOffsets[p]; k < weatherOffsets[p + 1]; k++) {
+        if (weatherHit[weatherIds[k]] === 1) {
+          weatherScore += 15;
+          break;
+        }
+      }
+      if ((flag & FLAG_CLOUD_OPTICAL) !== 0 && cloudy) weatherScore += 10;
+      if ((flag & FLAG_PRECIPITATION) !== 0 && precipitation) weatherScore += 15;
+      weather = Math.min(30, weatherScore);
+    }
+
+    let time = 0;
+    if (hasTime) {
+      let timeScore = 0;
+      if ((timeMask[p] & timeBit) !== 0) timeScore += 20;
+      if ((flag & FLAG_AURORA) !== 0 && night) timeScore += 10;
+      if ((flag & FLAG_PILLAR) !== 0 && twilight) timeScore += 10;
+      time = Math.min(20, timeScore);
+    }
+
+    let location = 0;
+    if (hasExif) {
+      location = Math.min(10, ((flag & FLAG_YEAR_ROUND) !== 0 ? 5 : 0) + ((flag & FLAG_WORLDWIDE) !== 0 ? 5 : 0));
+    }
+
+    const total = Math.round(visual + weather + time + location);
+    if (!(total > MATCH_THRESHOLD)) continue;
+
+    totalMatches++;
+    if (top.length === 5 && total <= totals[top[4]]) continue;
+
+    totals[p] = total;
+    const offset = p * 4;
+    breakdowns[offset] = visual;
+    breakdowns[offset + 1] = weather;
+    breakdowns[offset + 2] = time;
+    breakdowns[offset + 3] = location;
+
+    let position = top.length;
+    while (position > 0 && totals[top[position - 1]] < total) position--;
+    top.splice(position, 0, p);
+    if (top.length > 5) top.pop();
+  }
+
+  return totalMatches;
+}
+
 class AtmosphericComparisonService {
+  constructor() {
+    this.compiled = null;
+    this.compiledAt = 0;
+    this.loading = null;
+    this.generation = 0;
+  }
 
   /**
    * Comparar análisis con fenómenos atmosféricos
    */
   async compareWithAtmosphericPhenomena(visualAnalysis, weatherData, exifData) {
+    const [result] = await this.scoreBatch([{ visualAnalysis, weatherData, exifData }]);
+    return result;
+  }
+
+  /**
+   * Comparar muchos avistamientos contra todos los fenómenos activos
+   * (re-puntuación del histórico). Devuelve, en el mismo orden, lo mismo que
+   * compareWithAtmosphericPhenomena para cada uno.
+   * @param {Array<{visualAnalysis, weatherData, exifData}>} sightings
+   * @param {Object} options - { model }: modelo de compilePhenomena (por
+   *   defecto, el de los fenómenos activos)
+   * @returns {Promise<Array<Object>>}
+   */
+  async scoreBatch(sightings, options = {}) {
+    let model;
     try {
-      const matches = [];
-      
-      // Obtener todos los fenómenos activos
-      const phenomena = await AtmosphericPhenomenon.find({ isActive: true });
-
-      for (const phenomenon of phenomena) {
-        const score = this.calculateMatchScore(
-          phenomenon,
-          visualAnalysis,
-          weatherData,
-          exifData
-        );
+      model = options.model || await this.getCompiled();
+    } catch (error) {
+      console.error('Error en comparación atmosférica:', error);
+      return sightings.map(() => ({
+        error: 'Error al comparar con fenómenos atmosféricos',
+        details: error.message
+      }));
+    }
+
+    // Buffers de trabajo reutilizados entre avistamientos
+    const scratch = {
+      shapeHit: new Uint8Array(model.shapes.size),
+      colorHit: new Uint8Array(model.colors.size),
+      weatherHit: new Uint8Array(model.weathers.size),
+      brightness: new Float64Array(BRIGHTNESS_LEVELS.length + 1),
+      totals: new Int32Array(model.count),
+      breakdowns: new Float64Array(model.count * 4)
+    };
+
+    return sightings.map(({ visualAnalysis, weatherData, exifData }) => {
+      try {
+        return this.rankCompiled(model, scratch, visualAnalysis, weatherData, exifData);
+      } catch (error) {
+        console.error('Error en comparación atmosférica:', error);
+        return {
+          error: 'Error al comparar con fenómenos atmosféricos',
+          details: error.message
+        };
+      }
+    });
+  }
 
-        if (score.total > 30) {  // Umbral de coincidencia significativa
-          matches.push({
-            phenomenon: {
-              name: phenomenon.name,
-              category: phenomenon.category,
-              description: phenomenon.description,
-              rarity: phenomenon.rarity
-            },
-            score: score.total,
-            breakdown: score.breakdown,
-            confidence: this.scoreToConfidence(score.total),
-            explanation: this.generateExplanation(phenomenon, score)
+  /**
+   * Puntuar un avistamiento contra el modelo compilado
+   */
+  rankCompiled(model, scratch, visualAnalysis, weatherData, exifData) {
+    const { count } = model;
+    const { shapeHit, colorHit, weatherHit, brightness, totals, breakdowns } = scratch;
+
+    // ---- Rasgos del avistamiento (una vez, no por fenómeno) ----
+    const hasVisual = !!visualAnalysis;
+    let useShape = false;
+    let colorMode = 0;       // 0: sin colores, 1: lista vacía (0 puntos), 2: comparar
+    let useBrightness = false;
+    let sightingTexture = -1;
+
+    if (hasVisual) {
+      if (visualAnalysis.objectType) {
+        useShape = true;
+        shapeHit.fill(0);
+        for (const shape of this.mapCategoryToShape(visualAnalysis.objectType.category)) {
+          const id = model.shapes.ids.get(shape);
+          if (id !== undefined) shapeHit[id] = 1;
+        }
+      }
+
+      if (visualAnalysis.dominantColors) {
+        colorMode = visualAnalysis.dominantColors.length > 0 ? 2 : 1;
+        if (colorMode === 2 && model.colors.size > 0) {
+          const analysisColors = Array.from(visualAnalysis.dominantColors, color => color.toLowerCase());
+          model.colors.values.forEach((color, id) => {
+            colorHit[id] = analysisColors.some(ac => ac.includes(color)) ? 1 : 0;
           });
         }
       }
 
-      // Ordenar por puntuación
-      matches.sort((a, b) => b.score - a.score);
+      if (visualAnalysis.averageBrightness) {
+        useBrightness = true;
+        BRIGHTNESS_LEVELS.forEach((level, id) => {
+          brightness[id] = this.compareBrightness(level, visualAnalysis.averageBrightness);
+        });
+        brightness[BRIGHTNESS_LEVELS.length] = 0;
+      }
 
-      return {
-        totalMatches: matches.length,
-        bestMatch: matches[0] || null,
-        topMatches: matches.slice(0, 5),
-        hasStrongMatch: matches.length > 0 && matches[0].score > 70,
-        summary: this.generateSummary(matches)
-      };
+      if (visualAnalysis.texture) {
+        const id = model.textures.ids.get(visualAnalysis.texture);
+        sightingTexture = id === undefined ? -2 : id;
+      }
+    }
 
-    } catch (error) {
-      console.error('Error en comparación atmosférica:', error);
+    const hasWeather = !!(weatherData && !weatherData.error);
+    let cloudy = false;
+    let precipitation = false;
+    if (hasWeather && count > 0) {
+      const actualWeather = weatherData.conditions.main;
+      model.weathers.values.forEach((condition, id) => {
+        weatherHit[id] = (WEATHER_MAP[condition] || [condition]).includes(actualWeather) ? 1 : 0;
+      });
+      if (model.hasCloudOptical) cloudy = weatherData.clouds.coverage > 20;
+      if (model.hasPrecipitation) {
+        precipitation = weatherData.precipitation.rain_1h > 0 || weatherData.precipitation.snow_1h > 0;
+      }
+    }
+
+    const hasTime = !!(exifData && exifData.timestamp);
+    let timeBit = 0;
+    let timeOfDay = null;
+    if (hasTime) {
+      timeOfDay = this.getTimeOfDay(new Date(exifData.timestamp).getHours());
+      timeBit = TIME_BITS[timeOfDay];
+    }
+    const hasExif = !!exifData;
+
+    // ---- Barrido por columnas ----
+    const top = [];
+    const totalMatches = scanColumns(model, scratch, top, {
+      hasVisual, useShape, colorMode, useBrightness, sightingTexture,
+      hasWeather, cloudy, precipitation,
+      hasTime, timeBit,
+      night: timeOfDay === 'night',
+      twilight: timeOfDay === 'dawn' || timeOfDay === 'dusk',
+      hasExif
+    });
+
+    const matches = top.map(p => {
+      const phenomenon = { ...model.meta[p] };
+      const offset = p * 4;
+      const score = {
+        total: totals[p],
+        breakdown: {
+          visual: breakdowns[offset],
+          weather: breakdowns[offset + 1],
+          time: breakdowns[offset + 2],
+          location: breakdowns[offset + 3]
+        }
+      };
       return {
-        error: 'Error al comparar con fenómenos atmosféricos',
-        details: error.message
+        phenomenon,
+        score: score.total,
+        breakdown: score.breakdown,
+        confidence: this.scoreToConfidence(score.total),
+        explanation: this.generateExplanation(phenomenon, score)
       };
+    });
+
+    return {
+      totalMatches,
+      bestMatch: matches[0] || null,
+      topMatches: matches,
+      hasStrongMatch: matches.length > 0 && matches[0].score > 70,
+      summary: this.generateSummary(matches)
+    };
+  }
+
+  /**
+   * Modelo compilado de los fenómenos activos (se recompila tras invalidate()
+   * o al caducar ATMOSPHERIC_COMPILED_TTL_SEC)
+   */
+  async getCompiled() {
+    if (this.compiled && Date.now() - this.compiledAt < COMPILED_TTL_MS) {
+      return this.compiled;
+    }
+
+    if (!this.loading) {
+      const generation = this.generation;
+      this.loading = AtmosphericPhenomenon.find({ isActive: true })
+        .select('name category description rarity visualCharacteristics conditions')
+        .lean()
+        .then((phenomena) => {
+          const compiled = compilePhenomena(phenomena);
+          // Si la colección cambió durante la carga, no se reutiliza
+          if (generation === this.generation) {
+            this.compiled = compiled;
+            this.compiledAt = Date.now();
+          }
+          return compiled;
+        })
+        .finally(() => {
+          this.loading = null;
+        });
     }
+    return this.loading;
+  }
+
+  /**
+   * Descartar el modelo compilado (hooks de AtmosphericPhenomenon)
+   */
+  invalidate() {
+    this.generation++;
+    this.compiled = null;
   }
 
   /**
-   * Calcular puntuación de coincidencia
+   * Calcular puntuación de coincidencia (implementación de referencia, un
+   * fenómeno cada vez sobre el documento completo)
    */
   calculateMatchScore(phenomenon, visualAnalysis, weatherData, exifData) {
     const breakdown = {
@@ -224,15 +634,7 @@ class AtmosphericComparisonService {
    * Comparar brillo
    */
   compareBrightness(phenomenonBrightness, analysisBrightness) {
-    const brightnessMap = {
-      'dim': { min: 0, max: 0.3 },
-      'moderate': { min: 0.3, max: 0.6 },
-      'bright': { min: 0.6, max: 0.85 },
-      'very_bright': { min: 0.85, max: 1.0 },
-      'variable': { min: 0, max: 1.0 }
-    };
-
-    const range = brightnessMap[phenomenonBrightness];
+    const range = BRIGHTNESS_RANGES[phenomenonBrightness];
     if (!range) return 0;
 
     const normalized = analysisBrightness / 255;  // Normalizar a 0-1
@@ -253,19 +655,8 @@ class AtmosphericComparisonService {
    * Comparar condiciones climáticas
    */
   compareWeatherConditions(phenomenonWeather, actualWeather) {
-    // Mapeo de condiciones
-    const weatherMap = {
-      'clear': ['clear'],
-      'cloudy': ['clouds', 'mist', 'fog'],
-      'partly_cloudy': ['clouds'],
-      'rainy': ['rain', 'drizzle'],
-      'snowy': ['snow'],
-      'stormy': ['thunderstorm'],
-      'foggy': ['fog', 'mist']
-    };
-
     for (const condition of phenomenonWeather) {
-      const mappedConditions = weatherMap[condition] || [condition];
+      const mappedConditions = WEATHER_MAP[condition] || [condition];
       if (mappedConditions.includes(actualWeather)) {
         return 1.0;
       }
@@ -341,3 +732,5 @@ class AtmosphericComparisonService {
 }
 
 module.exports = new AtmosphericComparisonService();
+module.exports.AtmosphericComparisonService = AtmosphericComparisonService;
+module.exports.compilePhenomena = compilePhenomena;
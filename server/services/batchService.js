@@ -0,0 +1,453 @@
+/**
+ * LOTES DE ANÁLISIS (importación masiva de casos)
+ *
+ * Un lote recibe imágenes sueltas o archivos ZIP en una sola petición y:
+ * - Expande los ZIP en streaming (sin descomprimirlos en memoria) pasando
+ *   cada imagen por la ingesta (hash, EXIF, derivadas)
+ * - Crea un Analysis por imagen y lo encola en el carril 'batch' de la cola
+ *   durable, detrás de las subidas interactivas
+ * - Comparte trabajo entre las imágenes del lote: el catálogo y el set de
+ *   training se cargan una vez (índices residentes) y las consultas externas
+ *   con las mismas entradas (validación, meteorología) se resuelven una vez
+ *   por lote (shared)
+ * - Emite el resultado de cada imagen por WebSocket (canal batch:<id>) y
+ *   un resumen al terminar
+ *
+ * El progreso se recalcula siempre a partir de los Analysis del lote, de
+ * modo que reintentos y re-análisis no descuadran los contadores.
+ */
+
+const path = require('path');
+const crypto = require('crypto');
+const mongoose = require('mongoose');
+const AnalysisBatch = require('../models/AnalysisBatch');
+const Analysis = require('../models/Analysis');
+const analysisQueue = require('./analysisQueueService');
+const ingestService = require('./ingestService');
+const ZipArchiveService = require('./zipArchiveService');
+const WebSocketService = require('./websocketService');
+const NotificationService = require('./notificationService');
+const CacheService = require('./cacheService');
+const { envInt } = require('../utils/env');
+
+const IMAGE_TYPES = {
+  '.jpg': 'image/jpeg',
+  '.jpeg': 'image/jpeg',
+  '.png': 'image/png',
+  '.gif': 'image/gif',
+  '.webp': 'image/webp'
+};
+
+// Errores listados en el resumen del lote
+const SUMMARY_ERRORS = 20;
+
+function sanitizeName(name) {
+  return name.replace(/[^a-zA-Z0-9.-]/g, '_');
+}
+
+class BatchService {
+  constructor(options = {}) {
+    this.maxItems = options.maxItems ?? envInt('BATCH_MAX_ITEMS', 500);
+    this.maxImageBytes = options.maxImageBytes ?? envInt('BATCH_MAX_IMAGE_MB', 50) * 1024 * 1024;
+    this.imagesDir = options.imagesDir ?? path.join(__dirname, '..', 'uploads', 'images');
+    this.extractTimeoutMs = options.extractTimeoutMs ?? envInt('BATCH_EXTRACT_TIMEOUT_MS', 300000);
+    this.recoveryTimer = null;
+
+    // Trabajo compartido entre imágenes del lote ('<batchId>:<tipo>:<huella>').
+    // Caduca por TTL y está acotado: con varios procesos de la cola solo uno
+    // cierra el lote, y un lote puede no cerrarse nunca
+    this.sharedWork = CacheService.namespace('batchWork', {
+      ttlMs: envInt('BATCH_SHARED_TTL_SEC', 1800) * 1000,
+      maxEntries: envInt('BATCH_SHARED_MAX_ENTRIES', 2000)
+    });
+  }
+
+  /**
+   * Tipo MIME de imagen según la extensión (null si no es imagen admitida)
+   */
+  imageType(fileName) {
+    return IMAGE_TYPES[path.extname(fileName).toLowerCase()] || null;
+  }
+
+  /**
+   * Crear un lote a partir de los archivos recibidos (ya ingeridos por multer)
+   * y expandirlo en segundo plano
+   * @param {Object} params - { userId, name, files: [req.files] }
+   * @returns {Promise<Object>} Documento AnalysisBatch
+   */
+  async createBatch({ userId, name = null, files }) {
+    const sources = [];
+    const skipped = [];
+    const plan = [];
+
+    for (const file of files) {
+      if (file.mimetype.startsWith('image/')) {
+        sources.push({ fileName: file.originalname, type: 'image', entries: 1 });
+        const reason = file.size > this.maxImageBytes ? 'Imagen demasiado grande'
+          : plan.length >= this.maxItems ? `Límite de ${this.maxItems} imágenes por lote`
+            : null;
+
+        if (reason) {
+          skipped.push({ fileName: file.originalname, reason });
+          await ingestService.remove(file.path, file.ingest);
+        } else {
+          plan.push({ kind: 'file', file });
+        }
+        continue;
+      }
+
+      // ZIP: se lista el directorio central ahora para conocer el total
+      let entries;
+      try {
+        entries = await ZipArchiveService.listEntries(file.path);
+      } catch (error) {
+        skipped.push({ fileName: file.originalname, reason: error.message });
+        await ingestService.remove(file.path, file.ingest);
+        continue;
+      }
+
+      let selected = 0;
+      for (const entry of entries) {
+        const baseName = path.posix.basename(entry.name);
+        if (entry.isDirectory || entry.name.startsWith('__MACOSX/') || baseName.startsWith('.')) continue;
+
+        const reason = !this.imageType(baseName) ? 'No es una imagen admitida'
+          : entry.encrypted ? 'Entrada cifrada'
+            : entry.size > this.maxImageBytes ? 'Imagen demasiado grande'
+              : plan.length >= this.maxItems ? `Límite de ${this.maxItems} imágenes por lote`
+                : null;
+
+        if (reason) {
+          skipped.push({ fileName: `${file.originalname}/${entry.name}`, reason });
+          continue;
+        }
+
+        plan.push({ kind: 'zip', zip: file, entry });
+        selected++;
+      }
+      sources.push({ fileName: file.originalname, type: 'zip', entries: selected });
+    }
+
+    const batch = await AnalysisBatch.create({
+      userId,
+      name: name || (files.length === 1 ? files[0].originalname : null),
+      status: 'extracting',
+      sources,
+      skipped,
+      total: plan.length,
+      uploads: files.map(file => ({
+        path: file.path,
+        derivatives: (file.ingest?.derivatives || []).map(d => d.path)
+      })),
+      heartbeatAt: new Date(),
+      startedAt: new Date()
+    });
+
+    console.log(`📦 Lote ${batch._id}: ${plan.length} imagen(es) de ${files.length} archivo(s), ${skipped.length} descartada(s)`);
+
+    // Índices residentes (catálogo y training): una sola carga para todo el lote
+    const ufoFeatureIndex = require('./ufoFeatureIndexService');
+    const trainingVectorIndex = require('./trainingVectorIndexService');
+    Promise.all([ufoFeatureIndex.ensureLoaded(), trainingVectorIndex.ensureLoaded()])
+      .catch(error => console.error('⚠️ Error precargando índices para el lote:', error.message));
+
+    const zips = files.filter(file => !file.mimetype.startsWith('image/'));
+    this.expand(batch, plan, zips).catch(error => {
+      console.error(`❌ Error expandiendo lote ${batch._id}:`, error.message);
+    });
+
+    return batch;
+  }
+
+  /**
+   * Crear y encolar los Analysis del lote (extrayendo los ZIP en streaming)
+   */
+  async expand(batch, plan, zips) {
+    const batchId = batch._id;
+
+    try {
+      for (const item of plan) {
+        try {
+          const source = item.kind === 'file'
+            ? item.file
+            : await this.extractEntry(batch, item.zip, item.entry);
+
+          const { exif = null, ...ingest } = source.ingest || {};
+          const analysis = await Analysis.create({
+            userId: batch.userId,
+            batchId,
+            fileName: source.originalname,
+            fileType: 'image',
+            filePath: source.path,
+            fileSize: source.size,
+            uploadDate: new Date(),
+            status: 'analyzing',
+            ingest: source.ingest ? ingest : undefined,
+            exifData: exif || undefined
+          });
+
+          await analysisQueue.enqueue(analysis._id, { userId: batch.userId, lane: 'batch' });
+        } catch (error) {
+          const fileName = item.kind === 'file' ? item.file.originalname : `${item.zip.originalname}/${item.entry.name}`;
+          console.error(`⚠️ Lote ${batchId}: no se pudo importar ${fileName}:`, error.message);
+
+          if (item.kind === 'file') {
+            await ingestService.remove(item.file.path, item.file.ingest);
+          }
+          await AnalysisBatch.updateOne(
+            { _id: batchId },
+            { $inc: { total: -1 }, $push: { skipped: { fileName, reason: error.message } } }
+          );
+        }
+
+        await AnalysisBatch.updateOne({ _id: batchId }, { $set: { heartbeatAt: new Date() } });
+      }
+
+      await AnalysisBatch.updateOne(
+        { _id: batchId, status: 'extracting' },
+        { $set: { status: 'processing' } }
+      );
+    } catch (error) {
+      await AnalysisBatch.updateOne(
+        { _id: batchId },
+        { $set: { status: 'failed', errorMessage: error.message, finishedAt: new Date() } }
+      );
+      throw error;
+    } finally {
+      await Promise.all(zips.map(zip => ingestService.remove(zip.path, zip.ingest)));
+      CacheService.invalidateAnalysisCache();
+      CacheService.invalidateUserCache(batch.userId.toString());
+    }
+
+    // Lotes pequeños pueden haber terminado mientras se extraían los ZIP
+    await this.refresh(batchId);
+  }
+
+  // ==================== RECUPERACIÓN ====================
+
+  /**
+   * Recuperar al arrancar (y después periódicamente) los lotes cuya expansión
+   * se interrumpió
+   */
+  start() {
+    if (this.recoveryTimer) return;
+    this.recoverStaleBatches();
+    this.recoveryTimer = setInterval(() => this.recoverStaleBatches(), this.extractTimeoutMs);
+    this.recoveryTimer.unref();
+  }
+
+  /**
+   * Cerrar los lotes en 'extracting' sin latido reciente: el plan de
+   * expansión solo vivía en memoria, así que no se puede retomar. Las
+   * imágenes ya creadas siguen su curso (el lote pasa a 'processing' con ese
+   * total) y el resto se descarta; sin ninguna, el lote falla. Los archivos
+   * recibidos que no llegaron a ser un Analysis se borran.
+   */
+  async recoverStaleBatches() {
+    const staleBefore = new Date(Date.now() - this.extractTimeoutMs);
+
+    try {
+      const stale = await AnalysisBatch.find({
+        status: 'extracting',
+        heartbeatAt: { $lt: staleBefore }
+      }).select('+uploads');
+
+      for (const batch of stale) {
+        const imported = await Analysis.find({ batchId: batch._id }).select('filePath').lean();
+        const reason = 'Expansión interrumpida (reinicio del servidor)';
+        const missing = batch.total - imported.length;
+
+        // Condición sobre heartbeatAt: otro proceso pudo recuperarlo antes
+        const result = await AnalysisBatch.updateOne(
+          { _id: batch._id, status: 'extracting', heartbeatAt: batch.heartbeatAt },
+          imported.length > 0
+            ? {
+              $set: { status: 'processing', total: imported.length },
+              $push: { skipped: { fileName: `${missing} imagen(es) sin importar`, reason } }
+            }
+            : { $set: { status: 'failed', errorMessage: reason, finishedAt: new Date() } }
+        );
+        if (result.modifiedCount === 0) continue;
+
+        console.warn(`♻️ Lote ${batch._id} recuperado: ${imported.length} de ${batch.total} imagen(es) importadas`);
+
+        const kept = new Set(imported.map(analysis => analysis.filePath));
+        await Promise.all(batch.uploads
+          .filter(upload => !kept.has(upload.path))
+          .map(upload => ingestService.remove(upload.path, {
+            derivatives: upload.derivatives.map(derivative => ({ path: derivative }))
+          })));
+
+        if (imported.length > 0) {
+          await this.refresh(batch._id);
+        }
+      }
+    } catch (error) {
+      console.error('⚠️ Error recuperando lotes interrumpidos:', error.message);
+    }
+  }
+
+  /**
+   * Extraer una imagen del ZIP directamente a la ingesta
+   * @returns {Promise<Object>} Equivalente a req.file ({ originalname, path, size, ingest })
+   */
+  async extractEntry(batch, zip, entry) {
+    const originalname = path.posix.basename(entry.name);
+    // Sufijo aleatorio: entradas con el mismo nombre en carpetas distintas del
+    // ZIP pueden extraerse en el mismo milisegundo
+    const filename = `${Date.now()}-${crypto.randomBytes(4).toString('hex')}-${batch.userId}-${sanitizeName(originalname)}`;
+    const filePath = path.join(this.imagesDir, filename);
+
+    const stream = await ZipArchiveService.openEntry(zip.path, entry);
+    const ingest = await ingestService.ingest(stream, filePath, this.imageType(originalname));
+
+    return { originalname, path: filePath, size: ingest.fileSize, ingest };
+  }
+
+  /**
+   * Resolver una sola vez por lote un cálculo con las mismas entradas
+   * (fuera de un lote, simplemente lo ejecuta)
+   * @param {string} batchId - Lote del análisis (puede ser null)
+   * @param {string} scope - Tipo de cálculo (p. ej. 'externalValidation')
+   * @param {string} key - Huella de las entradas
+   * @param {Function} fn - async () => resultado
+   */
+  shared(batchId, scope, key, fn) {
+    if (!batchId) return fn();
+
+    // Los fallos no se guardan: la siguiente imagen lo reintenta
+    return this.sharedWork.getOrSet(`${batchId}:${scope}:${key}`, fn);
+  }
+
+  /**
+   * Registrar que una imagen del lote terminó (completada o fallida)
+   * @param {Object} analysis - Documento Analysis con batchId
+   */
+  async itemSettled(analysis) {
+    const batch = await this.refresh(analysis.batchId);
+    if (!batch) return;
+
+    WebSocketService.emitBatchItem(analysis.batchId.toString(), {
+      analysisId: analysis._id,
+      fileName: analysis.fileName,
+      status: analysis.status,
+      category: analysis.aiAnalysis?.category || null,
+      confidence: analysis.aiAnalysis?.confidence || 0,
+      errorMessage: analysis.errorMessage || null
+    }, { total: batch.total, ...batch.counts });
+  }
+
+  /**
+   * Recalcular el progreso desde los Analysis del lote y cerrarlo si terminó
+   * @returns {Promise<Object|null>} Lote actualizado
+   */
+  async refresh(batchId) {
+    const byStatus = await Analysis.aggregate([
+      { $match: { batchId: new mongoose.Types.ObjectId(batchId.toString()) } },
+      { $group: { _id: '$status', count: { $sum: 1 } } }
+    ]);
+
+    const counts = { pending: 0, analyzing: 0, completed: 0, error: 0 };
+    for (const { _id, count } of byStatus) {
+      if (_id in counts) counts[_id] = count;
+      else counts.pending += count;
+    }
+
+    const batch = await AnalysisBatch.findByIdAndUpdate(batchId, { $set: { counts } }, { new: true });
+    if (!batch) return null;
+
+    if (batch.status === 'processing' && counts.completed + counts.error >= batch.total) {
+      return (await this.finalize(batch)) || batch;
+    }
+    return batch;
+  }
+
+  /**
+   * Cerrar el lote con su resumen (una sola vez aunque varias imágenes
+   * terminen a la vez)
+   */
+  async finalize(batch) {
+    const summary = await this.summarize(batch);
+
+    const finished = await AnalysisBatch.findOneAndUpdate(
+      { _id: batch._id, status: 'processing' },
+      { $set: { status: 'completed', summary, finishedAt: new Date() } },
+      { new: true }
+    );
+    if (!finished) return null;
+
+    const prefix = `${batch._id}:`;
+    this.sharedWork.deleteWhere(key => key.startsWith(prefix));
+
+    console.log(`📦 Lote ${batch._id} completado: ${finished.counts.completed} ok, ${finished.counts.error} con error`);
+    WebSocketService.emitBatchComplete(batch._id.toString(), finished);
+    await NotificationService.notifyBatchCompleted(batch.userId, batch._id, {
+      name: finished.name,
+      completed: finished.counts.completed,
+      errors: finished.counts.error
+    });
+
+    return finished;
+  }
+
+  /**
+   * Resumen del lote: categorías, confianza media y errores
+   */
+  async summarize(batch) {
+    const batchId = batch._id;
+
+    const [categories, errors] = await Promise.all([
+      Analysis.aggregate([
+        { $match: { batchId, status: 'completed' } },
+        {
+          $group: {
+            _id: { $ifNull: ['$aiAnalysis.category', 'unknown'] },
+            count: { $sum: 1 },
+            avgConfidence: { $avg: '$aiAnalysis.confidence' }
+          }
+        },
+        { $sort: { count: -1 } }
+      ]),
+      Analysis.find({ batchId, status: 'error' })
+        .select('fileName errorMessage')
+        .limit(SUMMARY_ERRORS)
+        .lean()
+    ]);
+
+    const completed = categories.reduce((sum, c) => sum + c.count, 0);
+    const weightedConfidence = categories.reduce((sum, c) => sum + (c.avgConfidence || 0) * c.count, 0);
+
+    return {
+      categories: categories.map(c => ({
+        category: c._id,
+        count: c.count,
+        avgConfidence: Math.round(c.avgConfidence || 0)
+      })),
+      avgConfidence: completed > 0 ? Math.round(weightedConfidence / completed) : 0,
+      errors: errors.map(e => ({ analysisId: e._id, fileName: e.fileName, errorMessage: e.errorMessage })),
+      durationMs: Date.now() - new Date(batch.startedAt || batch.createdAt).getTime()
+    };
+  }
+
+  /**
+   * Estado del lote con sus imágenes (paginadas)
+   * @param {Object} batch - Documento AnalysisBatch
+   * @param {Object} options - { status, limit, offset }
+   */
+  async getItems(batch, options = {}) {
+    const { status = null, limit = 100, offset = 0 } = options;
+
+    const filter = { batchId: batch._id };
+    if (status) filter.status = status;
+
+    return Analysis.find(filter)
+      .sort({ createdAt: 1 })
+      .skip(offset)
+      .limit(limit)
+      .select('fileName status errorMessage aiAnalysis.category aiAnalysis.confidence createdAt updatedAt')
+      .lean();
+  }
+}
+
+module.exports = new BatchService();
+module.exports.BatchService = BatchService;
@@ -1,21 +1,520 @@
-const NodeCache = require('node-cache');
-
-// Crear instancias de caché con diferentes TTL
-const caches = {
-  // Caché de corta duración (5 minutos) para datos que cambian frecuentemente
-  short: new NodeCache({ stdTTL: 300, checkperiod: 60 }),
-  
-  // Caché de media duración (15 minutos) para patrones y estadísticas
-  medium: new NodeCache({ stdTTL: 900, checkperiod: 120 }),
-  
-  // Caché de larga duración (1 hora) para datos que raramente cambian
-  long: new NodeCache({ stdTTL: 3600, checkperiod: 300 }),
-  
-  // Caché para sesiones (30 minutos)
-  session: new NodeCache({ stdTTL: 1800, checkperiod: 180 })
+/**
+ * SUBSISTEMA DE CACHÉ UNIFICADO
+ *
+ * Todas las cachés en memoria del servidor son espacios de nombres de este
+ * servicio (CacheService.namespace(nombre, opciones)):
+ * - Presupuesto por espacio en bytes (tamaño estimado de cada valor) y/o
+ *   en número de entradas, con expulsión LRU o LFU (aproximada por muestreo)
+ * - TTL por entrada; barrido periódico de caducadas (CACHE_SWEEP_INTERVAL_SEC)
+ *   además de la limpieza al leer, para que la memoria no crezca con los días
+ * - getOrSet(): un solo cálculo por clave aunque lleguen varias peticiones a
+ *   la vez, caché negativa de fallos (negativeTtlMs) y stale-while-revalidate
+ *   (staleMs: se devuelve el valor caducado mientras se recalcula de fondo)
+ * - Respaldo compartido opcional para varios procesos (CACHE_SHARED_BACKEND):
+ *   'local' usa un almacén en proceso que serializa como lo haría Redis;
+ *   cualquier otro valor es un módulo que exporta { get, set, del }
+ * - Contadores por espacio (aciertos, fallos, expulsiones, latencia de carga y
+ *   latencia muestreada de lectura) en lugar de un console.log por consulta;
+ *   se exponen en /api/admin/stats y /api/admin/cache
+ *
+ * Los valores se guardan por referencia: quien los lee no debe modificarlos.
+ *
+ * Se mantiene la API estática anterior (get/set/del/getOrSet por tipo
+ * 'short' | 'medium' | 'long' | 'session'), ahora sobre espacios de nombres.
+ */
+
+const path = require('path');
+const { envInt } = require('../utils/env');
+
+const SWEEP_INTERVAL_MS = envInt('CACHE_SWEEP_INTERVAL_SEC', 60) * 1000;
+// Medir la latencia de 1 de cada N lecturas (0 = no medir)
+const LATENCY_SAMPLE_EVERY = envInt('CACHE_LATENCY_SAMPLE_EVERY', 64);
+// Candidatos examinados al expulsar con LFU (los más antiguos)
+const LFU_SAMPLE = 16;
+
+const ISO_DATE = /^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?Z$/;
+
+/**
+ * Tamaño aproximado de un valor en memoria (strings UTF-16 en V8)
+ */
+function estimateSize(value) {
+  if (value === undefined || value === null) return 16;
+  if (typeof value === 'string') return value.length * 2 + 16;
+  if (typeof value !== 'object') return 16;
+  if (Buffer.isBuffer(value)) return value.length + 64;
+
+  try {
+    return JSON.stringify(value).length * 2 + 64;
+  } catch (error) {
+    return 1024;
+  }
+}
+
+/**
+ * JSON -> valor, restaurando las fechas (el respaldo compartido serializa)
+ */
+function reviveDates(key, value) {
+  return typeof value === 'string' && ISO_DATE.test(value) ? new Date(value) : value;
+}
+
+/**
+ * Sustituto local del respaldo compartido: mismas semánticas que un almacén
+ * externo (valores serializados con TTL), útil en desarrollo y pruebas
+ */
+class LocalSharedBackend {
+  constructor() {
+    this.store = new Map();
+  }
+
+  async get(key) {
+    const entry = this.store.get(key);
+    if (!entry) return null;
+    if (entry.expiresAt <= Date.now()) {
+      this.store.delete(key);
+      return null;
+    }
+    return entry.json;
+  }
+
+  async set(key, json, ttlMs) {
+    this.store.set(key, { json, expiresAt: Date.now() + ttlMs });
+  }
+
+  async del(key) {
+    this.store.delete(key);
+  }
+}
+
+function loadSharedBackend() {
+  const backendModule = process.env.CACHE_SHARED_BACKEND;
+  if (!backendModule) return null;
+  if (backendModule === 'local') return new LocalSharedBackend();
+
+  try {
+    const backend = require(backendModule.startsWith('.')
+      ? path.resolve(__dirname, '..', backendModule)
+      : backendModule);
+    console.log(`🗄️  Respaldo compartido de caché: ${backendModule}`);
+    return typeof backend === 'function' ? backend() : backend;
+  } catch (error) {
+    // Sin respaldo cada proceso mantiene su propia caché
+    console.error(`⚠️ No se pudo cargar el respaldo de caché (${backendModule}):`, error.message);
+    return null;
+  }
+}
+
+const sharedBackend = loadSharedBackend();
+
+class CacheNamespace {
+  /**
+   * @param {string} name - Nombre del espacio
+   * @param {Object} options - { ttlMs, maxBytes, maxEntries, policy ('lru'|'lfu'),
+   *   staleMs, negativeTtlMs, shared, sizeOf(valor), onRemove(clave, valor) }
+   */
+  constructor(name, options = {}) {
+    this.name = name;
+    this.ttlMs = options.ttlMs ?? 5 * 60 * 1000;
+    this.maxBytes = options.maxBytes ?? null;
+    this.maxEntries = options.maxEntries ?? null;
+    this.policy = options.policy === 'lfu' ? 'lfu' : 'lru';
+    this.staleMs = options.staleMs ?? 0;
+    this.negativeTtlMs = options.negativeTtlMs ?? 0;
+    this.shared = Boolean(options.shared && sharedBackend);
+    this.sizeOf = options.sizeOf ?? estimateSize;
+    this.onRemove = options.onRemove ?? null;
+
+    // key -> { value, error, size, expiresAt, staleUntil, uses }
+    this.entries = new Map();
+    this.bytes = 0;
+    this.inFlight = new Map();
+    this.lookups = 0;
+
+    this.counters = {
+      hits: 0,
+      staleHits: 0,
+      negativeHits: 0,
+      misses: 0,
+      coalesced: 0,
+      sets: 0,
+      evictions: 0,
+      expirations: 0,
+      loads: 0,
+      loadErrors: 0,
+      loadMsTotal: 0,
+      loadMsMax: 0,
+      sharedHits: 0,
+      sharedErrors: 0,
+      sampledLookups: 0,
+      sampledLookupNs: 0
+    };
+  }
+
+  /**
+   * Valor vigente de una clave (undefined si no está o ha caducado)
+   */
+  get(key) {
+    const sample = LATENCY_SAMPLE_EVERY > 0 && ++this.lookups % LATENCY_SAMPLE_EVERY === 0;
+    const start = sample ? process.hrtime.bigint() : 0n;
+
+    const entry = this.lookup(key);
+    let value;
+    if (entry && !entry.error && entry.expiresAt > Date.now()) {
+      this.counters.hits++;
+      value = entry.value;
+    } else {
+      this.counters.misses++;
+    }
+
+    if (sample) {
+      this.counters.sampledLookups++;
+      this.counters.sampledLookupNs += Number(process.hrtime.bigint() - start);
+    }
+    return value;
+  }
+
+  has(key) {
+    const entry = this.entries.get(key);
+    return Boolean(entry && !entry.error && entry.expiresAt > Date.now());
+  }
+
+  /**
+   * Guardar un valor
+   * @param {string} key - Clave
+   * @param {*} value - Valor (se guarda por referencia)
+   * @param {number} ttlMs - TTL de esta entrada (opcional)
+   * @returns {boolean} false si el valor excede el presupuesto del espacio
+   */
+  set(key, value, ttlMs = null) {
+    const stored = this.store(key, { value, error: null }, ttlMs ?? this.ttlMs);
+    if (stored && this.shared) this.writeShared(key, value, ttlMs ?? this.ttlMs);
+    return stored;
+  }
+
+  /**
+   * Devolver el valor cacheado o cargarlo
+   * @param {string} key - Clave
+   * @param {Function} loader - async () => valor
+   * @param {Object} options - { ttlMs, negativeTtlMs, cacheable(valor) }
+   * @returns {Promise<*>}
+   */
+  async getOrSet(key, loader, options = {}) {
+    const entry = this.lookup(key);
+    const now = Date.now();
+
+    if (entry) {
+      if (entry.expiresAt > now) {
+        if (entry.error) {
+          this.counters.negativeHits++;
+          throw new Error(entry.error);
+        }
+        this.counters.hits++;
+        return entry.value;
+      }
+
+      // Caducado pero dentro de la ventana stale: responder ya y recargar de fondo
+      if (!entry.error && entry.staleUntil > now) {
+        this.counters.staleHits++;
+        if (!this.inFlight.has(key)) {
+          this.load(key, loader, options).catch(() => {});
+        }
+        return entry.value;
+      }
+    }
+
+    if (this.inFlight.has(key)) {
+      this.counters.coalesced++;
+      return this.inFlight.get(key);
+    }
+
+    this.counters.misses++;
+    return this.load(key, loader, options);
+  }
+
+  load(key, loader, options) {
+    // La entrada en vuelo se quita en cualquier salida (también en un acierto
+    // del respaldo compartido o si el loader falla de forma síncrona); si no,
+    // getOrSet seguiría devolviendo esta promesa ya resuelta para siempre
+    const promise = this.runLoad(key, loader, options).finally(() => {
+      if (this.inFlight.get(key) === promise) this.inFlight.delete(key);
+    });
+
+    this.inFlight.set(key, promise);
+    return promise;
+  }
+
+  async runLoad(key, loader, options) {
+    if (this.shared) {
+      const shared = await this.readShared(key);
+      if (shared !== undefined) {
+        this.store(key, { value: shared.value, error: null }, shared.ttlMs);
+        return shared.value;
+      }
+    }
+
+    const start = Date.now();
+    this.counters.loads++;
+    try {
+      const value = await loader();
+      this.recordLoad(Date.now() - start);
+
+      const cacheable = options.cacheable ? options.cacheable(value) : value !== undefined;
+      if (cacheable) this.set(key, value, options.ttlMs ?? null);
+      return value;
+    } catch (error) {
+      this.recordLoad(Date.now() - start);
+      this.counters.loadErrors++;
+
+      const negativeTtlMs = options.negativeTtlMs ?? this.negativeTtlMs;
+      if (negativeTtlMs > 0) {
+        this.store(key, { value: undefined, error: error.message }, negativeTtlMs);
+      }
+      throw error;
+    }
+  }
+
+  del(key) {
+    const removed = this.remove(key) ? 1 : 0;
+    if (this.shared) {
+      sharedBackend.del(this.sharedKey(key)).catch(() => this.counters.sharedErrors++);
+    }
+    return removed;
+  }
+
+  /**
+   * Borrar las claves que cumplan una condición
+   * @returns {number} Entradas eliminadas
+   */
+  deleteWhere(predicate) {
+    let removed = 0;
+    for (const key of Array.from(this.entries.keys())) {
+      if (predicate(key)) removed += this.del(key);
+    }
+    return removed;
+  }
+
+  keys() {
+    return Array.from(this.entries.keys());
+  }
+
+  clear() {
+    const removed = this.entries.size;
+    for (const key of Array.from(this.entries.keys())) {
+      this.remove(key);
+    }
+    return removed;
+  }
+
+  /**
+   * Descartar las entradas caducadas (incluida la ventana stale)
+   * @returns {number} Entradas eliminadas
+   */
+  prune() {
+    const now = Date.now();
+    let removed = 0;
+    for (const [key, entry] of this.entries) {
+      if (Math.max(entry.expiresAt, entry.staleUntil) <= now) {
+        this.remove(key);
+        removed++;
+      }
+    }
+    this.counters.expirations += removed;
+    return removed;
+  }
+
+  getStats() {
+    const c = this.counters;
+    const lookups = c.hits + c.staleHits + c.negativeHits + c.misses + c.coalesced;
+    return {
+      name: this.name,
+      policy: this.policy,
+      entries: this.entries.size,
+      bytes: this.bytes,
+      maxBytes: this.maxBytes,
+      maxEntries: this.maxEntries,
+      inFlight: this.inFlight.size,
+      shared: this.shared,
+      hits: c.hits,
+      staleHits: c.staleHits,
+      negativeHits: c.negativeHits,
+      misses: c.misses,
+      coalesced: c.coalesced,
+      hitRate: lookups > 0 ? Math.round(((lookups - c.misses) / lookups) * 1000) / 1000 : 0,
+      sets: c.sets,
+      evictions: c.evictions,
+      expirations: c.expirations,
+      loads: c.loads,
+      loadErrors: c.loadErrors,
+      avgLoadMs: c.loads > 0 ? Math.round(c.loadMsTotal / c.loads) : 0,
+      maxLoadMs: c.loadMsMax,
+      avgLookupUs: c.sampledLookups > 0
+        ? Math.round(c.sampledLookupNs / c.sampledLookups / 100) / 10
+        : null,
+      sharedHits: c.sharedHits,
+      sharedErrors: c.sharedErrors
+    };
+  }
+
+  // ==================== INTERNOS ====================
+
+  lookup(key) {
+    const entry = this.entries.get(key);
+    if (!entry) return null;
+
+    const now = Date.now();
+    if (Math.max(entry.expiresAt, entry.staleUntil) <= now) {
+      this.remove(key);
+      this.counters.expirations++;
+      return null;
+    }
+
+    entry.uses++;
+    if (this.policy === 'lru') {
+      // Reinsertar al final: el Map conserva el orden de uso
+      this.entries.delete(key);
+      this.entries.set(key, entry);
+    }
+    return entry;
+  }
+
+  store(key, { value, error }, ttlMs) {
+    const size = error ? 64 : this.sizeOf(value);
+    if (this.maxBytes !== null && size > this.maxBytes) {
+      this.remove(key);
+      return false;
+    }
+
+    const previous = this.entries.get(key);
+    this.remove(key, false);
+
+    const expiresAt = Date.now() + ttlMs;
+    this.entries.set(key, {
+      value,
+      error,
+      size,
+      expiresAt,
+      staleUntil: error ? expiresAt : expiresAt + this.staleMs,
+      uses: previous ? previous.uses : 0
+    });
+    this.bytes += size;
+    if (!error) this.counters.sets++;
+
+    while ((this.maxBytes !== null && this.bytes > this.maxBytes) ||
+           (this.maxEntries !== null && this.entries.size > this.maxEntries)) {
+      this.remove(this.victim());
+      this.counters.evictions++;
+    }
+    return true;
+  }
+
+  /**
+   * Clave a expulsar: la menos reciente (LRU) o la menos usada entre las
+   * LFU_SAMPLE más antiguas (LFU aproximado, sin estructuras extra)
+   */
+  victim() {
+    const keys = this.entries.keys();
+    if (this.policy === 'lru') return keys.next().value;
+
+    let victim = null;
+    let minUses = Infinity;
+    for (let i = 0; i < LFU_SAMPLE; i++) {
+      const { value: key, done } = keys.next();
+      if (done) break;
+      const { uses } = this.entries.get(key);
+      if (uses < minUses) {
+        minUses = uses;
+        victim = key;
+      }
+    }
+    return victim;
+  }
+
+  remove(key, notify = true) {
+    const entry = this.entries.get(key);
+    if (!entry) return false;
+
+    this.entries.delete(key);
+    this.bytes -= entry.size;
+    if (notify && this.onRemove && !entry.error) {
+      this.onRemove(key, entry.value);
+    }
+    return true;
+  }
+
+  recordLoad(ms) {
+    this.counters.loadMsTotal += ms;
+    if (ms > this.counters.loadMsMax) this.counters.loadMsMax = ms;
+  }
+
+  sharedKey(key) {
+    return `${this.name}:${key}`;
+  }
+
+  async readShared(key) {
+    try {
+      const json = await sharedBackend.get(this.sharedKey(key));
+      if (json === null || json === undefined) return undefined;
+
+      const { value, expiresAt } = JSON.parse(json, reviveDates);
+      const ttlMs = new Date(expiresAt).getTime() - Date.now();
+      if (ttlMs <= 0) return undefined;
+
+      this.counters.sharedHits++;
+      return { value, ttlMs };
+    } catch (error) {
+      this.counters.sharedErrors++;
+      return undefined;
+    }
+  }
+
+  writeShared(key, value, ttlMs) {
+    let json;
+    try {
+      json = JSON.stringify({ value, expiresAt: Date.now() + ttlMs });
+    } catch (error) {
+      return;
+    }
+    Promise.resolve()
+      .then(() => sharedBackend.set(this.sharedKey(key), json, ttlMs))
+      .catch(() => this.counters.sharedErrors++);
+  }
+}
+
+const namespaces = new Map();
+
+// Espacios de la API por tipo (mismos TTL que antes, ahora con presupuesto)
+const TIERS = {
+  // Corta duración (5 minutos) para datos que cambian frecuentemente
+  short: { ttlMs: 300 * 1000, maxBytes: envInt('CACHE_SHORT_MB', 32) * 1024 * 1024 },
+  // Media duración (15 minutos) para patrones y estadísticas
+  medium: { ttlMs: 900 * 1000, maxBytes: envInt('CACHE_MEDIUM_MB', 32) * 1024 * 1024 },
+  // Larga duración (1 hora) para datos que raramente cambian
+  long: { ttlMs: 3600 * 1000, maxBytes: envInt('CACHE_LONG_MB', 32) * 1024 * 1024 },
+  // Sesiones (30 minutos)
+  session: { ttlMs: 1800 * 1000, maxBytes: envInt('CACHE_SESSION_MB', 8) * 1024 * 1024 }
 };
 
 class CacheService {
+  /**
+   * Obtener (o crear) un espacio de nombres
+   * @param {string} name - Nombre del espacio
+   * @param {Object} options - Ver CacheNamespace (solo se aplican al crearlo)
+   * @returns {CacheNamespace}
+   */
+  static namespace(name, options = {}) {
+    if (!namespaces.has(name)) {
+      namespaces.set(name, new CacheNamespace(name, options));
+    }
+    return namespaces.get(name);
+  }
+
+  static tier(type) {
+    if (!TIERS[type]) {
+      console.error(`Tipo de caché inválido: ${type}`);
+      return null;
+    }
+    return CacheService.namespace(type, TIERS[type]);
+  }
+
   /**
    * Obtener valor de caché
    * @param {string} type - Tipo de caché (short, medium, long, session)
@@ -23,18 +522,8 @@ class CacheService {
    * @returns {any} Valor almacenado o undefined
    */
   static get(type, key) {
-    if (!caches[type]) {
-      console.error(`Tipo de caché inválido: ${type}`);
-      return undefined;
-    }
-    
-    const value = caches[type].get(key);
-    if (value !== undefined) {
-      console.log(`✅ Cache HIT: ${type}/${key}`);
-    } else {
-      console.log(`❌ Cache MISS: ${type}/${key}`);
-    }
-    return value;
+    const cache = CacheService.tier(type);
+    return cache ? cache.get(key) : undefined;
   }
 
   /**
@@ -42,23 +531,12 @@ class CacheService {
    * @param {string} type - Tipo de caché (short, medium, long, session)
    * @param {string} key - Clave del valor
    * @param {any} value - Valor a almacenar
-   * @param {number} ttl - TTL personalizado (opcional)
+   * @param {number} ttl - TTL personalizado en segundos (opcional)
    * @returns {boolean} true si se guardó exitosamente
    */
   static set(type, key, value, ttl = null) {
-    if (!caches[type]) {
-      console.error(`Tipo de caché inválido: ${type}`);
-      return false;
-    }
-    
-    const success = ttl 
-      ? caches[type].set(key, value, ttl)
-      : caches[type].set(key, value);
-    
-    if (success) {
-      console.log(`💾 Cache SET: ${type}/${key}`);
-    }
-    return success;
+    const cache = CacheService.tier(type);
+    return cache ? cache.set(key, value, ttl ? ttl * 1000 : null) : false;
   }
 
   /**
@@ -68,16 +546,8 @@ class CacheService {
    * @returns {number} Número de keys eliminadas
    */
   static del(type, key) {
-    if (!caches[type]) {
-      console.error(`Tipo de caché inválido: ${type}`);
-      return 0;
-    }
-    
-    const deleted = caches[type].del(key);
-    if (deleted > 0) {
-      console.log(`🗑️  Cache DEL: ${type}/${key}`);
-    }
-    return deleted;
+    const cache = CacheService.tier(type);
+    return cache ? cache.del(key) : 0;
   }
 
   /**
@@ -87,14 +557,8 @@ class CacheService {
    * @returns {number} Número de keys eliminadas
    */
   static delMultiple(type, keys) {
-    if (!caches[type]) {
-      console.error(`Tipo de caché inválido: ${type}`);
-      return 0;
-    }
-    
-    const deleted = caches[type].del(keys);
-    console.log(`🗑️  Cache DEL Multiple: ${type}/ (${deleted} keys)`);
-    return deleted;
+    const cache = CacheService.tier(type);
+    return cache ? keys.reduce((deleted, key) => deleted + cache.del(key), 0) : 0;
   }
 
   /**
@@ -102,67 +566,67 @@ class CacheService {
    * @param {string} type - Tipo de caché
    */
   static flush(type) {
-    if (!caches[type]) {
-      console.error(`Tipo de caché inválido: ${type}`);
-      return;
-    }
-    
-    caches[type].flushAll();
-    console.log(`🧹 Cache FLUSH: ${type}`);
+    const cache = CacheService.tier(type);
+    if (cache) cache.clear();
   }
 
   /**
-   * Limpiar todos los cachés
+   * Limpiar todos los cachés (todos los espacios de nombres)
    */
   static flushAll() {
-    Object.keys(caches).forEach(type => {
-      caches[type].flushAll();
-    });
+    Object.keys(TIERS).forEach(type => CacheService.tier(type));
+    for (const cache of namespaces.values()) {
+      cache.clear();
+    }
     console.log('🧹 Cache FLUSH ALL');
   }
 
   /**
    * Obtener estadísticas de caché
-   * @param {string} type - Tipo de caché (opcional)
+   * @param {string} type - Tipo o espacio de nombres (opcional)
    * @returns {object} Estadísticas
    */
   static getStats(type = null) {
     if (type) {
-      if (!caches[type]) {
-        console.error(`Tipo de caché inválido: ${type}`);
-        return null;
-      }
-      return caches[type].getStats();
+      const cache = namespaces.get(type) || CacheService.tier(type);
+      return cache ? cache.getStats() : null;
     }
-    
-    // Retornar stats de todos los cachés
+
     const stats = {};
-    Object.keys(caches).forEach(cacheType => {
-      stats[cacheType] = caches[cacheType].getStats();
-    });
+    for (const [name, cache] of namespaces) {
+      stats[name] = cache.getStats();
+    }
     return stats;
   }
 
+  /**
+   * Resumen de todas las cachés (para el panel de administración)
+   */
+  static getSummary() {
+    const byNamespace = CacheService.getStats();
+    const values = Object.values(byNamespace);
+    return {
+      sharedBackend: sharedBackend ? (process.env.CACHE_SHARED_BACKEND || null) : null,
+      totalBytes: values.reduce((sum, s) => sum + s.bytes, 0),
+      totalEntries: values.reduce((sum, s) => sum + s.entries, 0),
+      namespaces: byNamespace
+    };
+  }
+
   /**
    * Obtener o crear (si no existe)
    * @param {string} type - Tipo de caché
    * @param {string} key - Clave del valor
    * @param {function} fetchFunction - Función async para obtener el valor si no está en caché
-   * @param {number} ttl - TTL personalizado (opcional)
+   * @param {number} ttl - TTL personalizado en segundos (opcional)
    * @returns {Promise<any>} Valor del caché o resultado de fetchFunction
    */
   static async getOrSet(type, key, fetchFunction, ttl = null) {
-    // Intentar obtener de caché
-    const cachedValue = this.get(type, key);
-    if (cachedValue !== undefined) {
-      return cachedValue;
-    }
-    
-    // Si no está en caché, ejecutar función de fetch
+    const cache = CacheService.tier(type);
+    if (!cache) return fetchFunction();
+
     try {
-      const value = await fetchFunction();
-      this.set(type, key, value, ttl);
-      return value;
+      return await cache.getOrSet(key, fetchFunction, { ttlMs: ttl ? ttl * 1000 : null });
     } catch (error) {
       console.error(`Error en getOrSet para ${type}/${key}:`, error.message);
       throw error;
@@ -179,7 +643,6 @@ class CacheService {
     this.del('short', `user_reports_${userId}`);
     this.del('short', `user_notifications_${userId}`);
     this.del('session', `user_profile_${userId}`);
-    console.log(`🗑️  Invalidado caché de usuario: ${userId}`);
   }
 
   /**
@@ -191,10 +654,9 @@ class CacheService {
       this.del('short', `analysis_${analysisId}`);
       this.del('short', `analysis_status_${analysisId}`);
     }
-    
+
     // Invalidar cachés de patrones y estadísticas
     this.flush('medium');
-    console.log('🗑️  Invalidado caché de análisis');
   }
 
   /**
@@ -202,7 +664,18 @@ class CacheService {
    */
   static invalidateReportsCache() {
     this.flush('short');
-    console.log('🗑️  Invalidado caché de reportes');
+  }
+
+  /**
+   * Barrer las entradas caducadas de todos los espacios
+   * @returns {number} Entradas eliminadas
+   */
+  static sweep() {
+    let removed = 0;
+    for (const cache of namespaces.values()) {
+      removed += cache.prune();
+    }
+    return removed;
   }
 
   /**
@@ -221,4 +694,10 @@ class CacheService {
   }
 }
 
+if (SWEEP_INTERVAL_MS > 0) {
+  setInterval(() => CacheService.sweep(), SWEEP_INTERVAL_MS).unref();
+}
+
 module.exports = CacheService;
+module.exports.CacheNamespace = CacheNamespace;
+module.exports.LocalSharedBackend = LocalSharedBackend;
@@ -11,6 +11,11 @@
  * para evitar falsos positivos (ej: "todo es Venus")
  */
 
+// Versión de los pesos y reglas de fusión. Subirla al cambiarlos: los
+// análisis guardados con otra versión se re-puntúan
+// (scripts/rescoreAnalyses.js) sin repetir el análisis de la imagen.
+const VERSION = 2;
+
 class ConfidenceCalculatorService {
   
   /**
@@ -128,6 +133,83 @@ class ConfidenceCalculatorService {
     return result;
   }
 
+  /**
+   * Añadir a aiAnalysis las recomendaciones de validación externa, meteorología
+   * y comparación atmosférica. Se ejecuta cuando aiAnalysis ya existe (tras la
+   * mejora con entrenamiento) y antes de la fusión de confianza.
+   */
+  applyContextRecommendations(analysis) {
+    if (!analysis.aiAnalysis.recommendations) {
+      analysis.aiAnalysis.recommendations = [];
+    }
+    const recommendations = analysis.aiAnalysis.recommendations;
+
+    // Validación externa: si hay coincidencias, agregar a recomendaciones
+    const validationResult = analysis.externalValidation?.results;
+    if (validationResult?.matches && validationResult.matches.length > 0) {
+      const matchTypes = [...new Set(validationResult.matches.map(m => m.type))];
+      recommendations.push(
+        `VALIDACIÓN EXTERNA: Se detectaron ${validationResult.matches.length} coincidencia(s) con objetos conocidos: ${matchTypes.join(', ')}`
+      );
+    }
+
+    // Agregar análisis atmosférico a recomendaciones
+    const weatherData = analysis.weatherData;
+    if (weatherData?.analysis) {
+      if (weatherData.analysis.weather_explanation_probability === 'high' ||
+          weatherData.analysis.weather_explanation_probability === 'very_high') {
+        recommendations.push(
+          `⚠️ ALERTA METEOROLÓGICA: Condiciones climáticas con alta probabilidad de explicar el avistamiento`
+        );
+      }
+
+      if (weatherData.analysis.warnings.length > 0) {
+        weatherData.analysis.warnings.forEach(warning => {
+          recommendations.push(`🌤️  ${warning}`);
+        });
+      }
+    }
+
+    const atmosphericComparison = analysis.atmosphericComparison;
+    if (atmosphericComparison?.hasStrongMatch) {
+      const bestMatch = atmosphericComparison.bestMatch;
+
+      recommendations.unshift(
+        `☁️  FENÓMENO ATMOSFÉRICO: Alta probabilidad de ser "${bestMatch.phenomenon.name}" - ${bestMatch.phenomenon.description}`
+      );
+
+      // Si la coincidencia es muy fuerte, ajustar categoría
+      if (bestMatch.score > 80) {
+        analysis.aiAnalysis.category = 'natural';
+        analysis.aiAnalysis.description = `Posible ${bestMatch.phenomenon.name}. ${bestMatch.explanation}`;
+      }
+    }
+  }
+
+  /**
+   * Volcar el resultado de calculateWeightedConfidence sobre el análisis
+   * @param {Object} analysis - Documento Analysis
+   * @param {object} weightedResult - Resultado de calculateWeightedConfidence
+   */
+  applyWeightedResult(analysis, weightedResult) {
+    analysis.aiAnalysis.confidence = weightedResult.finalConfidence;
+    analysis.aiAnalysis.category = weightedResult.finalCategory;
+    analysis.aiAnalysis.description = weightedResult.finalDescription;
+
+    // Guardar desglose de confianza para auditoría
+    analysis.confidenceBreakdown = weightedResult.breakdown;
+    analysis.confidenceAdjustments = weightedResult.adjustments;
+    analysis.confidenceExplanation = weightedResult.explanation;
+
+    // Agregar explicación a recomendaciones
+    if (!analysis.aiAnalysis.recommendations) {
+      analysis.aiAnalysis.recommendations = [];
+    }
+    analysis.aiAnalysis.recommendations.push(
+      `CONFIANZA PONDERADA: ${weightedResult.explanation}`
+    );
+  }
+
   /**
    * Calcular score de validación externa (0-100)
    * Mayor peso a coincidencias directas con objetos conocidos
@@ -591,3 +673,5 @@ class ConfidenceCalculatorService {
 }
 
 module.exports = new ConfidenceCalculatorService();
+module.exports.ConfidenceCalculatorService = ConfidenceCalculatorService;
+module.exports.VERSION = VERSION;
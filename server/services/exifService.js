@@ -4,13 +4,14 @@ const ExifParser = require('exif-parser');
 /**
  * Extrae datos EXIF de una imagen (EXPANDIDO - estilo ExifTool)
  * @param {string} filePath - Ruta completa del archivo
+ * @param {ImageContext} imageContext - Contexto con las cabeceras ya leídas (opcional)
  * @returns {Object} Datos EXIF extraídos con TODOS los campos disponibles
  */
-async function extractExifData(filePath) {
+async function extractExifData(filePath, imageContext = null) {
   try {
-    // Leer archivo
-    const buffer = fs.readFileSync(filePath);
-    const stats = fs.statSync(filePath);
+    // Leer archivo (con contexto basta con las cabeceras: el EXIF va al principio)
+    const buffer = imageContext ? await imageContext.getHeader() : fs.readFileSync(filePath);
+    const stats = imageContext ? { size: imageContext.fileSize } : fs.statSync(filePath);
     
     // Parsear EXIF
     const parser = ExifParser.create(buffer);
@@ -91,8 +92,8 @@ async function extractExifData(filePath) {
       
       // ===== DIMENSIONES Y CALIDAD =====
       quality: tags.Quality || null,
-      imageWidth: result.imageSize?.width || tags.ImageWidth || tags.ExifImageWidth || null,
-      imageHeight: result.imageSize?.height || tags.ImageHeight || tags.ExifImageHeight || null,
+      imageWidth: result.imageSize?.width || tags.ImageWidth || tags.ExifImageWidth || imageContext?.metadata?.width || null,
+      imageHeight: result.imageSize?.height || tags.ImageHeight || tags.ExifImageHeight || imageContext?.metadata?.height || null,
       xResolution: tags.XResolution || null,
       yResolution: tags.YResolution || null,
       resolutionUnit: getResolutionUnit(tags.ResolutionUnit),
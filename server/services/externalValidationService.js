@@ -2,6 +2,84 @@ const axios = require('axios');
 const moment = require('moment');
 const SunCalc = require('suncalc');
 const freeFlightAPIs = require('./freeFlightAPIs');
+const CacheService = require('./cacheService');
+const { envInt } = require('../utils/env');
+
+const HOUR_MS = 60 * 60 * 1000;
+const GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz';
+
+/**
+ * Teselas y cubos de tiempo por fuente. Los avistamientos que caen en la
+ * misma tesela (geohash) y el mismo cubo comparten una sola consulta, hecha
+ * desde el centro de la tesela y el inicio del cubo; las coincidencias se
+ * calculan después con las coordenadas exactas de cada avistamiento.
+ * - aircraft: geohash 5 (~5 km) frente al radio de 100 km; 1 min de cubo
+ * - satellites: geohash 4 (~40 km) frente a 70° sobre el horizonte; N2YO
+ *   da posiciones actuales, así que el cubo es el de la consulta
+ * - celestial: efemérides (horarios de sol/luna, iluminación) por tesela/hora
+ */
+const SOURCES = {
+  aircraft: {
+    precision: 5,
+    bucketMs: envInt('EXTERNAL_AIRCRAFT_BUCKET_SEC', 60) * 1000,
+    ttlMs: envInt('EXTERNAL_AIRCRAFT_TTL_SEC', 300) * 1000
+  },
+  satellites: {
+    precision: 4,
+    bucketMs: envInt('EXTERNAL_SATELLITE_BUCKET_SEC', 300) * 1000,
+    ttlMs: envInt('EXTERNAL_SATELLITE_TTL_SEC', 900) * 1000
+  },
+  celestial: {
+    precision: 5,
+    bucketMs: HOUR_MS,
+    ttlMs: 24 * HOUR_MS
+  }
+};
+
+/**
+ * Codificar coordenadas en geohash
+ * @param {number} lat - Latitud
+ * @param {number} lng - Longitud
+ * @param {number} precision - Caracteres del hash
+ * @returns {{hash: string, center: {lat: number, lng: number}}}
+ */
+function geohash(lat, lng, precision) {
+  const latRange = [-90, 90];
+  const lngRange = [-180, 180];
+  let hash = '';
+  let bits = 0;
+  let value = 0;
+  let even = true;
+
+  while (hash.length < precision) {
+    const range = even ? lngRange : latRange;
+    const coordinate = even ? lng : lat;
+    const mid = (range[0] + range[1]) / 2;
+
+    value <<= 1;
+    if (coordinate >= mid) {
+      value |= 1;
+      range[0] = mid;
+    } else {
+      range[1] = mid;
+    }
+    even = !even;
+
+    if (++bits === 5) {
+      hash += GEOHASH_ALPHABET[value];
+      bits = 0;
+      value = 0;
+    }
+  }
+
+  return {
+    hash,
+    center: {
+      lat: (latRange[0] + latRange[1]) / 2,
+      lng: (lngRange[0] + lngRange[1]) / 2
+    }
+  };
+}
 
 /**
  * Servicio de Validación Externa
@@ -22,9 +100,38 @@ class ExternalValidationService {
       aviationstack: process.env.AVIATIONSTACK_KEY         // Vuelos (100 req/mes gratis)
     };
 
-    // Cache de resultados (5 minutos)
-    this.cache = new Map();
-    this.cacheDuration = 5 * 60 * 1000;
+    // Cache por tesela/cubo de tiempo (LRU acotado). Los fallos se recuerdan
+    // menos tiempo para no martillear una API caída; los avistamientos
+    // simultáneos de la misma tesela esperan la misma consulta
+    this.cache = CacheService.namespace('externalValidation', {
+      maxEntries: envInt('EXTERNAL_CACHE_MAX_ENTRIES', 5000),
+      maxBytes: envInt('EXTERNAL_CACHE_MB', 32) * 1024 * 1024,
+      negativeTtlMs: envInt('EXTERNAL_NEGATIVE_TTL_SEC', 60) * 1000,
+      shared: true
+    });
+  }
+
+  /**
+   * Obtener el resultado de una fuente para la tesela y el cubo de tiempo de
+   * un avistamiento, consultando como mucho una vez por tesela/cubo
+   * @param {string} source - Clave de SOURCES
+   * @param {Object} coordinates - { lat, lng } del avistamiento
+   * @param {Date|string|number} timestamp - Momento del avistamiento
+   * @param {Function} fetch - async ({ center, bucketStart }) => valor
+   * @returns {Promise<*>} Valor compartido (no mutar)
+   */
+  async tileLookup(source, coordinates, timestamp, fetch) {
+    const { precision, bucketMs, ttlMs } = SOURCES[source];
+    const time = new Date(timestamp).getTime();
+    const bucket = Math.floor((Number.isNaN(time) ? Date.now() : time) / bucketMs);
+    const { hash, center } = geohash(coordinates.lat, coordinates.lng, precision);
+    const key = `${source}:${hash}:${bucket}`;
+
+    return this.cache.getOrSet(
+      key,
+      () => fetch({ center, bucketStart: new Date(bucket * bucketMs) }),
+      { ttlMs }
+    );
   }
 
   /**
@@ -118,24 +225,11 @@ class ExternalValidationService {
    */
   async checkAircraft(coordinates, timestamp, altitude = null) {
     try {
-      const cacheKey = `aircraft_${coordinates.lat}_${coordinates.lng}_${timestamp}`;
-      
-      // Verificar cache
-      if (this.cache.has(cacheKey)) {
-        const cached = this.cache.get(cacheKey);
-        if (Date.now() - cached.timestamp < this.cacheDuration) {
-          return cached.data;
-        }
-      }
-
-      console.log('✈️ Consultando múltiples APIs GRATUITAS de vuelos...');
-
-      // Usar nuevo servicio con múltiples APIs gratis
-      const flightData = await freeFlightAPIs.getAllFlights(
-        coordinates,
-        timestamp,
-        { aviationStackKey: this.apis.aviationstack }
-      );
+      // Una consulta por tesela y minuto; los avistamientos cercanos la comparten
+      const flightData = await this.tileLookup('aircraft', coordinates, timestamp, ({ center, bucketStart }) => {
+        console.log('✈️ Consultando múltiples APIs GRATUITAS de vuelos...');
+        return this.fetchFlights(center, bucketStart);
+      });
 
       const matches = [];
       const { lat, lng } = coordinates;
@@ -176,12 +270,6 @@ class ExternalValidationService {
         totalFound: matches.length
       };
 
-      // Guardar en cache
-      this.cache.set(cacheKey, {
-        timestamp: Date.now(),
-        data: result
-      });
-
       return result;
 
     } catch (error) {
@@ -194,6 +282,23 @@ class ExternalValidationService {
     }
   }
 
+  /**
+   * Vuelos alrededor del centro de una tesela. Si ninguna fuente responde se
+   * trata como fallo, para que la caché negativa lo recuerde poco tiempo.
+   */
+  async fetchFlights(center, timestamp) {
+    const flightData = await freeFlightAPIs.getAllFlights(
+      center,
+      timestamp,
+      { aviationStackKey: this.apis.aviationstack }
+    );
+
+    if (flightData.sources.length === 0) {
+      throw new Error('Ninguna API de vuelos respondió con datos');
+    }
+    return flightData;
+  }
+
   /**
    * Verificar satélites visibles (N2YO API)
    * Requiere API key gratuita de https://www.n2yo.com/api/
@@ -205,48 +310,38 @@ class ExternalValidationService {
         return this.checkSatellitesCelestrak(coordinates, timestamp);
       }
 
-      const cacheKey = `satellites_${coordinates.lat}_${coordinates.lng}_${timestamp}`;
-      
-      // Verificar cache
-      if (this.cache.has(cacheKey)) {
-        const cached = this.cache.get(cacheKey);
-        if (Date.now() - cached.timestamp < this.cacheDuration) {
-          return cached.data;
-        }
-      }
+      const satellites = await this.tileLookup('satellites', coordinates, timestamp, async ({ center }) => {
+        const altitude = 0; // Altitud del observador (nivel del mar)
+        const searchRadius = 70; // Grados sobre el horizonte (70° = visible)
+        const category = 0; // 0 = todos los satélites
 
-      const { lat, lng } = coordinates;
-      const altitude = 0; // Altitud del observador (nivel del mar)
-      const searchRadius = 70; // Grados sobre el horizonte (70° = visible)
-      const category = 0; // 0 = todos los satélites
+        // Consultar N2YO API
+        const url = `https://api.n2yo.com/rest/v1/satellite/above/${center.lat}/${center.lng}/${altitude}/${searchRadius}/${category}/&apiKey=${this.apis.n2yo}`;
 
-      // Consultar N2YO API
-      const url = `https://api.n2yo.com/rest/v1/satellite/above/${lat}/${lng}/${altitude}/${searchRadius}/${category}/&apiKey=${this.apis.n2yo}`;
-      
-      console.log(`🛰️  Consultando N2YO API para satélites visibles`);
-      
-      const response = await axios.get(url, {
-        timeout: 10000
+        console.log(`🛰️  Consultando N2YO API para satélites visibles`);
+
+        const response = await axios.get(url, {
+          timeout: 10000
+        });
+        return (response.data && response.data.above) || [];
       });
 
       const matches = [];
 
-      if (response.data && response.data.above) {
-        for (const sat of response.data.above) {
-          matches.push({
-            source: 'N2YO',
-            name: sat.satname,
-            noradId: sat.satid,
-            latitude: sat.satlat,
-            longitude: sat.satlng,
-            altitude: sat.satalt,
-            azimuth: sat.sataz,
-            elevation: sat.satel,
-            rightAscension: sat.ra,
-            declination: sat.dec,
-            confidence: sat.satel > 30 ? 'high' : 'medium' // Mayor elevación = más visible
-          });
-        }
+      for (const sat of satellites) {
+        matches.push({
+          source: 'N2YO',
+          name: sat.satname,
+          noradId: sat.satid,
+          latitude: sat.satlat,
+          longitude: sat.satlng,
+          altitude: sat.satalt,
+          azimuth: sat.sataz,
+          elevation: sat.satel,
+          rightAscension: sat.ra,
+          declination: sat.dec,
+          confidence: sat.satel > 30 ? 'high' : 'medium' // Mayor elevación = más visible
+        });
       }
 
       const result = {
@@ -256,12 +351,6 @@ class ExternalValidationService {
         totalFound: matches.length
       };
 
-      // Guardar en cache
-      this.cache.set(cacheKey, {
-        timestamp: Date.now(),
-        data: result
-      });
-
       return result;
 
     } catch (error) {
@@ -329,11 +418,19 @@ class ExternalValidationService {
    */
   async checkCelestialObjects(coordinates, timestamp) {
     try {
-      console.log('🌙 Calculando posición de objetos celestes...');
-
       const { lat, lng } = coordinates;
       const date = new Date(timestamp);
-      
+
+      // Efemérides de la tesela/hora: se calculan una vez y se reutilizan
+      const sky = await this.tileLookup('celestial', coordinates, timestamp, async ({ center, bucketStart }) => {
+        console.log('🌙 Calculando efemérides de la tesela...');
+        return {
+          sunTimes: SunCalc.getTimes(bucketStart, center.lat, center.lng),
+          moonTimes: SunCalc.getMoonTimes(bucketStart, center.lat, center.lng),
+          moonIllumination: SunCalc.getMoonIllumination(bucketStart)
+        };
+      });
+
       const matches = [];
 
       // Calcular posición del Sol
@@ -359,7 +456,7 @@ class ExternalValidationService {
       const moonPosition = SunCalc.getMoonPosition(date, lat, lng);
       const moonAltitude = moonPosition.altitude * 180 / Math.PI;
       const moonAzimuth = moonPosition.azimuth * 180 / Math.PI;
-      const moonIllumination = SunCalc.getMoonIllumination(date);
+      const { moonIllumination } = sky;
 
       // Luna visible si está sobre el horizonte
       if (moonAltitude > 0) {
@@ -380,9 +477,8 @@ class ExternalValidationService {
         });
       }
 
-      // Calcular horarios de sol/luna
-      const sunTimes = SunCalc.getTimes(date, lat, lng);
-      const moonTimes = SunCalc.getMoonTimes(date, lat, lng);
+      // Horarios de sol/luna (precalculados para la tesela)
+      const { sunTimes, moonTimes } = sky;
 
       const isDaytime = date > sunTimes.sunrise && date < sunTimes.sunset;
       const isNight = date > sunTimes.night && date < sunTimes.nightEnd;
@@ -693,15 +789,18 @@ class ExternalValidationService {
   }
 
   /**
-   * Limpiar cache antiguo
+   * Limpiar cache antiguo (las entradas caducadas también se descartan al
+   * leerlas y en el barrido periódico de CacheService)
    */
   clearOldCache() {
-    const now = Date.now();
-    for (const [key, value] of this.cache.entries()) {
-      if (now - value.timestamp > this.cacheDuration) {
-        this.cache.delete(key);
-      }
-    }
+    return this.cache.prune();
+  }
+
+  /**
+   * Estadísticas de la caché de validación externa
+   */
+  getCacheStats() {
+    return this.cache.getStats();
   }
 }
 
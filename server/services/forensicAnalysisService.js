@@ -13,46 +13,54 @@
 
 const sharp = require('sharp');
 const path = require('path');
+const ImageContext = require('./imageContextService');
+const workerPool = require('./workerPoolService');
+const telemetry = require('./telemetryService');
 
 class ForensicAnalysisService {
   
   /**
    * Análisis forense completo de una imagen
    * @param {string} imagePath - Ruta de la imagen
+   * @param {ImageContext} imageContext - Imagen ya decodificada (opcional)
    * @returns {Object} Resultados del análisis forense
    */
-  async analyzeImage(imagePath) {
+  async analyzeImage(imagePath, imageContext = null) {
     console.log('\n🔬 === ANÁLISIS FORENSE AVANZADO ===');
     
     try {
       const startTime = Date.now();
       
-      // Cargar imagen
-      const image = sharp(imagePath);
-      const metadata = await image.metadata();
+      // Cargar imagen (desde el contexto compartido si ya está decodificada)
+      const metadata = imageContext
+        ? imageContext.metadata
+        : await sharp(imagePath).metadata();
       
       console.log(`📸 Imagen: ${metadata.width}x${metadata.height}, formato: ${metadata.format}`);
       
       // Redimensionar si es muy grande (optimización)
-      const maxDimension = 1200;
-      if (metadata.width > maxDimension || metadata.height > maxDimension) {
-        image.resize(maxDimension, maxDimension, { fit: 'inside', withoutEnlargement: true });
-      }
-      
-      const buffer = await image.raw().toBuffer();
-      const { width, height, channels } = await image.metadata();
-      
-      // Ejecutar análisis en paralelo
+      const maxDimension = ImageContext.SIZES.LARGE;
+      const { data: buffer, info } = imageContext
+        ? await imageContext.getRaw(maxDimension)
+        : await sharp(imagePath)
+          .resize(maxDimension, maxDimension, { fit: 'inside', withoutEnlargement: true })
+          .raw()
+          .toBuffer({ resolveWithObject: true });
+      
+      // Dimensiones del buffer redimensionado (no las del archivo original)
+      const { width, height, channels } = info;
+      
+      // Ejecutar análisis en paralelo (cada comprobación medida como span)
       const [
         lightingAnalysis,
         noiseAnalysis,
         cloneDetection,
         edgeConsistency
       ] = await Promise.all([
-        this.analyzeLightingConsistency(buffer, width, height, channels),
-        this.analyzeNoiseInconsistency(buffer, width, height, channels),
-        this.detectCloning(buffer, width, height, channels),
-        this.analyzeEdgeConsistency(buffer, width, height, channels)
+        telemetry.span('task', 'forensic.lighting', () => this.analyzeLightingConsistency(buffer, width, height, channels)),
+        telemetry.span('task', 'forensic.noise', () => this.analyzeNoiseInconsistency(buffer, width, height, channels)),
+        telemetry.span('task', 'forensic.cloning', () => this.detectCloning(buffer, width, height, channels)),
+        telemetry.span('task', 'forensic.edges', () => this.analyzeEdgeConsistency(buffer, width, height, channels))
       ]);
       
       // Calcular score de manipulación global (0-100, donde 100 es muy manipulado)
@@ -95,13 +103,10 @@ class ForensicAnalysisService {
     console.log('💡 Analizando consistencia de iluminación...');
     
     try {
-      // Dividir imagen en 9 regiones (3x3)
-      const regions = this.divideIntoRegions(buffer, width, height, channels, 3, 3);
-      
-      // Calcular dirección de luz dominante en cada región
-      const lightDirections = regions.map(region => 
-        this.calculateLightDirection(region.data, region.width, region.height, channels)
-      );
+      // Dirección de luz dominante en 9 regiones (3x3), calculada en el pool de workers
+      const lightDirections = await workerPool.run('forensicLighting', {
+        data: buffer, width, height, channels, rows: 3, cols: 3
+      });
       
       // Calcular varianza de direcciones
       const avgDirection = lightDirections.reduce((sum, dir) => sum + dir, 0) / lightDirections.length;
@@ -129,39 +134,6 @@ class ForensicAnalysisService {
     }
   }
   
-  /**
-   * Calcula la dirección de luz dominante usando gradientes
-   */
-  calculateLightDirection(buffer, width, height, channels) {
-    let sumX = 0, sumY = 0, count = 0;
-    
-    // Convertir a escala de grises y calcular gradientes
-    for (let y = 1; y < height - 1; y++) {
-      for (let x = 1; x < width - 1; x++) {
-        const idx = (y * width + x) * channels;
-        
-        // Luminosidad del píxel actual
-        const current = (buffer[idx] + buffer[idx + 1] + buffer[idx + 2]) / 3;
-        
-        // Luminosidad de vecinos
-        const right = (buffer[idx + channels] + buffer[idx + channels + 1] + buffer[idx + channels + 2]) / 3;
-        const down = (buffer[idx + width * channels] + buffer[idx + width * channels + 1] + buffer[idx + width * channels + 2]) / 3;
-        
-        // Gradientes
-        const gx = right - current;
-        const gy = down - current;
-        
-        sumX += gx;
-        sumY += gy;
-        count++;
-      }
-    }
-    
-    // Dirección en grados (0-360)
-    const angle = Math.atan2(sumY / count, sumX / count) * (180 / Math.PI);
-    return angle >= 0 ? angle : angle + 360;
-  }
-  
   /**
    * Analiza inconsistencias en el ruido digital
    * Técnica: Compara la textura de ruido en diferentes regiones
@@ -170,13 +142,10 @@ class ForensicAnalysisService {
     console.log('📊 Analizando inconsistencias de ruido...');
     
     try {
-      // Dividir en regiones más pequeñas para detectar diferencias locales
-      const regions = this.divideIntoRegions(buffer, width, height, channels, 4, 4);
-      
-      // Calcular nivel de ruido en cada región
-      const noiselevels = regions.map(region =>
-        this.calculateNoiseLevel(region.data, region.width, region.height, channels)
-      );
+      // Nivel de ruido en regiones más pequeñas (4x4) para detectar diferencias locales
+      const noiselevels = await workerPool.run('forensicNoise', {
+        data: buffer, width, height, channels, rows: 4, cols: 4
+      });
       
       // Calcular varianza de niveles de ruido
       const avgNoise = noiselevels.reduce((sum, n) => sum + n, 0) / noiselevels.length;
@@ -204,34 +173,12 @@ class ForensicAnalysisService {
     }
   }
   
-  /**
-   * Calcula el nivel de ruido usando diferencias de alta frecuencia
-   */
-  calculateNoiseLevel(buffer, width, height, channels) {
-    let sum = 0, count = 0;
-    
-    // Calcular diferencias entre píxeles adyacentes (ruido de alta frecuencia)
-    for (let y = 0; y < height - 1; y++) {
-      for (let x = 0; x < width - 1; x++) {
-        const idx = (y * width + x) * channels;
-        
-        for (let c = 0; c < 3; c++) {
-          const current = buffer[idx + c];
-          const right = buffer[idx + channels + c];
-          const down = buffer[idx + width * channels + c];
-          
-          sum += Math.abs(right - current) + Math.abs(down - current);
-          count += 2;
-        }
-      }
-    }
-    
-    return sum / count;
-  }
-  
   /**
    * Detecta regiones clonadas/copiadas dentro de la misma imagen
-   * Técnica: Compara hashes de bloques de 32x32 píxeles
+   * Técnica: hashes de bloques de 32x32 píxeles ordenados por descriptor;
+   * cada bloque solo se compara con sus vecinos en ese orden (ver el kernel
+   * forensicCloning), a resolución completa y a mitad de resolución. Los
+   * pares se agrupan por desplazamiento en regiones origen -> destino.
    */
   async detectCloning(buffer, width, height, channels) {
     console.log('🔍 Detectando clonación/copia-pega...');
@@ -240,49 +187,29 @@ class ForensicAnalysisService {
       const blockSize = 32;
       const threshold = 0.95; // 95% de similitud para considerar clonación
       
-      // Dividir imagen en bloques superpuestos
-      const blocks = [];
-      for (let y = 0; y < height - blockSize; y += blockSize / 2) {
-        for (let x = 0; x < width - blockSize; x += blockSize / 2) {
-          const hash = this.calculateBlockHash(buffer, width, height, channels, x, y, blockSize);
-          blocks.push({ x, y, hash });
-        }
-      }
-      
-      // Buscar bloques similares (pero no en la misma posición)
-      let clonedPairs = [];
-      for (let i = 0; i < blocks.length; i++) {
-        for (let j = i + 1; j < blocks.length; j++) {
-          const distance = Math.abs(blocks[i].x - blocks[j].x) + Math.abs(blocks[i].y - blocks[j].y);
-          
-          // Ignorar bloques muy cercanos (son naturalmente similares)
-          if (distance > blockSize * 2) {
-            const similarity = this.compareHashes(blocks[i].hash, blocks[j].hash);
-            
-            if (similarity > threshold) {
-              clonedPairs.push({
-                block1: { x: blocks[i].x, y: blocks[i].y },
-                block2: { x: blocks[j].x, y: blocks[j].y },
-                similarity: similarity
-              });
-            }
-          }
-        }
-      }
+      // Comparación de bloques superpuestos en el pool de workers
+      const { clonedCount, totalBlocks, details, regions } = await workerPool.run('forensicCloning', {
+        data: buffer, width, height, channels, blockSize, threshold, maxDetails: 5,
+        scales: [1, 0.5],
+        maxNeighbors: 64,
+        maxRegions: 5
+      });
       
-      // Score basado en número de regiones clonadas
-      const cloneScore = Math.min((clonedPairs.length / 5) * 100, 100);
+      // Score basado en los pares clonados de la escala con más coincidencias
+      // (una misma clonación vista en varias escalas cuenta una vez)
+      const cloneScore = Math.min((clonedCount / 5) * 100, 100);
       
-      console.log(`  • Bloques analizados: ${blocks.length}`);
-      console.log(`  • Pares clonados detectados: ${clonedPairs.length}`);
+      console.log(`  • Bloques analizados: ${totalBlocks}`);
+      console.log(`  • Pares clonados detectados: ${clonedCount} (${regions.length} región(es))`);
       console.log(`  • Score de clonación: ${cloneScore.toFixed(1)}/100`);
       
       return {
         cloneScore: Math.round(cloneScore),
-        clonedRegions: clonedPairs.length,
-        totalBlocks: blocks.length,
-        isSuspicious: clonedPairs.length > 3,
-        details: clonedPairs.slice(0, 5) // Solo primeros 5 para no saturar
+        clonedRegions: clonedCount,
+        totalBlocks,
+        isSuspicious: clonedCount > 3,
+        regions, // Origen/destino agrupados por desplazamiento
+        details // Solo primeros 5 para no saturar
       };
       
     } catch (error) {
@@ -291,43 +218,6 @@ class ForensicAnalysisService {
     }
   }
   
-  /**
-   * Calcula hash simple de un bloque de imagen
-   */
-  calculateBlockHash(buffer, width, height, channels, startX, startY, blockSize) {
-    const hash = [];
-    const step = Math.max(1, Math.floor(blockSize / 8)); // 8x8 hash
-    
-    for (let y = 0; y < blockSize; y += step) {
-      for (let x = 0; x < blockSize; x += step) {
-        const imgY = Math.min(startY + y, height - 1);
-        const imgX = Math.min(startX + x, width - 1);
-        const idx = (imgY * width + imgX) * channels;
-        
-        // Promedio RGB como valor del hash
-        const avg = (buffer[idx] + buffer[idx + 1] + buffer[idx + 2]) / 3;
-        hash.push(Math.round(avg / 16)); // Cuantizar a 16 niveles
-      }
-    }
-    
-    return hash;
-  }
-  
-  /**
-   * Compara dos hashes (correlación normalizada)
-   */
-  compareHashes(hash1, hash2) {
-    if (hash1.length !== hash2.length) return 0;
-    
-    let sum = 0;
-    for (let i = 0; i < hash1.length; i++) {
-      sum += Math.abs(hash1[i] - hash2[i]);
-    }
-    
-    const maxDiff = hash1.length * 15; // Máxima diferencia posible (16 niveles)
-    return 1 - (sum / maxDiff);
-  }
-  
   /**
    * Analiza consistencia de bordes (detecta bordes artificiales de recortes)
    */
@@ -335,17 +225,13 @@ class ForensicAnalysisService {
     console.log('✂️ Analizando consistencia de bordes...');
     
     try {
-      // Detectar bordes usando operador Sobel
-      const edges = this.detectEdgesSobel(buffer, width, height, channels);
-      
+      // Detectar bordes (operador Sobel) y su densidad por región (4x4) en el pool de workers
       // Buscar patrones sospechosos:
       // 1. Bordes excesivamente nítidos en ciertas áreas
       // 2. "Halos" o artefactos alrededor de objetos
-      
-      const regions = this.divideIntoRegions(edges, width, height, 1, 4, 4);
-      const edgeDensities = regions.map(r => 
-        this.calculateEdgeDensity(r.data, r.width, r.height, 1)
-      );
+      const edgeDensities = await workerPool.run('forensicEdges', {
+        data: buffer, width, height, channels, rows: 4, cols: 4
+      });
       
       // Alta varianza en densidad de bordes = posible composición
       const avgDensity = edgeDensities.reduce((s, d) => s + d, 0) / edgeDensities.length;
@@ -371,100 +257,6 @@ class ForensicAnalysisService {
     }
   }
   
-  /**
-   * Detector de bordes Sobel
-   */
-  detectEdgesSobel(buffer, width, height, channels) {
-    const edges = Buffer.alloc(width * height);
-    
-    const sobelX = [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]];
-    const sobelY = [[-1, -2, -1], [0, 0, 0], [1, 2, 1]];
-    
-    for (let y = 1; y < height - 1; y++) {
-      for (let x = 1; x < width - 1; x++) {
-        let gx = 0, gy = 0;
-        
-        // Aplicar kernels Sobel
-        for (let ky = -1; ky <= 1; ky++) {
-          for (let kx = -1; kx <= 1; kx++) {
-            const idx = ((y + ky) * width + (x + kx)) * channels;
-            const gray = (buffer[idx] + buffer[idx + 1] + buffer[idx + 2]) / 3;
-            
-            gx += gray * sobelX[ky + 1][kx + 1];
-            gy += gray * sobelY[ky + 1][kx + 1];
-          }
-        }
-        
-        const magnitude = Math.sqrt(gx * gx + gy * gy);
-        edges[y * width + x] = Math.min(magnitude, 255);
-      }
-    }
-    
-    return edges;
-  }
-  
-  /**
-   * Calcula densidad de bordes en un buffer
-   */
-  calculateEdgeDensity(buffer, width, height, channels) {
-    let sum = 0;
-    for (let i = 0; i < buffer.length; i++) {
-      sum += buffer[i];
-    }
-    return sum / (width * height);
-  }
-  
-  /**
-   * Divide imagen en regiones
-   */
-  divideIntoRegions(buffer, width, height, channels, rows, cols) {
-    const regions = [];
-    const regionWidth = Math.floor(width / cols);
-    const regionHeight = Math.floor(height / rows);
-    
-    for (let r = 0; r < rows; r++) {
-      for (let c = 0; c < cols; c++) {
-        const startX = c * regionWidth;
-        const startY = r * regionHeight;
-        const endX = Math.min(startX + regionWidth, width);
-        const endY = Math.min(startY + regionHeight, height);
-        
-        const regionData = this.extractRegion(buffer, width, height, channels, startX, startY, endX, endY);
-        
-        regions.push({
-          data: regionData,
-          width: endX - startX,
-          height: endY - startY,
-          x: startX,
-          y: startY
-        });
-      }
-    }
-    
-    return regions;
-  }
-  
-  /**
-   * Extrae una región de la imagen
-   */
-  extractRegion(buffer, width, height, channels, startX, startY, endX, endY) {
-    const regionWidth = endX - startX;
-    const regionHeight = endY - startY;
-    const regionData = Buffer.alloc(regionWidth * regionHeight * channels);
-    
-    let destIdx = 0;
-    for (let y = startY; y < endY; y++) {
-      for (let x = startX; x < endX; x++) {
-        const srcIdx = (y * width + x) * channels;
-        for (let c = 0; c < channels; c++) {
-          regionData[destIdx++] = buffer[srcIdx + c];
-        }
-      }
-    }
-    
-    return regionData;
-  }
-  
   /**
    * Calcula score global de manipulación
    */
@@ -0,0 +1,334 @@
+/**
+ * Contexto de Imagen Decodificada (por análisis)
+ *
+ * Lee el archivo UNA sola vez y lo decodifica UNA sola vez a un buffer RGB
+ * crudo de resolución acotada. A partir de ese buffer se derivan las
+ * resoluciones fijas que usan las capas del pipeline (forense, visual,
+ * características científicas) sin volver a decodificar el JPEG.
+ *
+ * Si la subida pasó por la ingesta (services/ingestService.js), las
+ * resoluciones fijas ya existen en disco como buffers crudos: el contexto las
+ * carga bajo demanda sin leer ni decodificar el original, y puede soltarlas
+ * cuando ninguna capa pendiente las necesita (releaseSize).
+ *
+ * Todas las capas aceptan este contexto como parámetro opcional; si no se
+ * pasa, siguen funcionando con la ruta del archivo como antes.
+ */
+
+const fs = require('fs').promises;
+const crypto = require('crypto');
+const sharp = require('sharp');
+const telemetry = require('./telemetryService');
+
+// Resoluciones fijas (lado mayor en píxeles) que consumen las capas
+const SIZES = {
+  LARGE: 1200,   // Análisis forense, IA local, detección de objetos
+  MEDIUM: 800,   // Análisis visual avanzado
+  SMALL: 400     // Extracción de características científicas
+};
+
+// Bytes iniciales del archivo que contienen las cabeceras (APP1/EXIF cabe en 64KB)
+const HEADER_BYTES = 128 * 1024;
+
+class ImageContext {
+  /**
+   * @param {string} filePath - Ruta de la imagen original
+   * @param {Object} source - { fileBuffer, fileSize, metadata, base, sha256, header, derivatives }
+   */
+  constructor(filePath, source) {
+    const {
+      fileBuffer = null,
+      fileSize = fileBuffer ? fileBuffer.length : 0,
+      metadata,
+      base = null,
+      sha256 = null,
+      header = null,
+      derivatives = []
+    } = source;
+
+    this.filePath = filePath;
+    this.fileBuffer = fileBuffer;
+    this.fileSize = fileSize;
+    this.metadata = metadata;
+
+    // Derivadas crudas en disco (ingesta), por lado mayor
+    this.derivatives = new Map(derivatives.map(d => [d.maxSize, d]));
+
+    // Buffers derivados (promesas), memorizados por resolución
+    this._raw = base ? new Map([[SIZES.LARGE, Promise.resolve(base)]]) : new Map();
+    this._base = base;
+    this._header = header;
+    this._gray = new Map();
+    this._rgba = new Map();
+    this._jimp = new Map();
+    this._stats = null;
+    this._sha256 = sha256;
+    this._perceptualHash = null;
+  }
+
+  /**
+   * Crear contexto a partir de un archivo de imagen
+   * @param {string} filePath - Ruta de la imagen
+   * @returns {Promise<ImageContext>}
+   */
+  static async fromFile(filePath) {
+    const fileBuffer = await fs.readFile(filePath);
+
+    // metadata() solo lee cabeceras, no decodifica píxeles
+    const metadata = await sharp(fileBuffer).metadata();
+
+    // Única decodificación completa: directamente a la resolución máxima usada
+    const base = await sharp(fileBuffer)
+      .resize(SIZES.LARGE, SIZES.LARGE, { fit: 'inside', withoutEnlargement: true })
+      .removeAlpha()
+      .raw()
+      .toBuffer({ resolveWithObject: true });
+    telemetry.addDecodedBytes(base.data.length);
+
+    return new ImageContext(filePath, { fileBuffer, metadata, base });
+  }
+
+  /**
+   * Crear contexto a partir del resultado de la ingesta (sin leer el original)
+   * @param {string} filePath - Ruta de la imagen original
+   * @param {Object} ingest - { sha256, fileSize, metadata, derivatives }
+   * @param {Buffer} header - Cabeceras ya leídas (opcional)
+   * @returns {ImageContext}
+   */
+  static fromIngest(filePath, ingest, header = null) {
+    return new ImageContext(filePath, {
+      fileSize: ingest.fileSize,
+      metadata: ingest.metadata,
+      sha256: ingest.sha256,
+      derivatives: ingest.derivatives,
+      header
+    });
+  }
+
+  /**
+   * Contexto de un análisis: derivadas de la ingesta si siguen en disco,
+   * o decodificación del original (subidas anteriores a la ingesta)
+   * @param {Object} analysis - Documento Analysis
+   * @returns {Promise<ImageContext>}
+   */
+  static async forAnalysis(analysis) {
+    const ingest = analysis.ingest;
+    const derivatives = ingest?.derivatives || [];
+
+    if (ingest?.sha256 && derivatives.length === Object.keys(SIZES).length) {
+      const available = await Promise.all(derivatives.map(d =>
+        fs.access(d.path).then(() => true, () => false)
+      ));
+      if (available.every(Boolean)) {
+        return ImageContext.fromIngest(analysis.filePath, {
+          sha256: ingest.sha256,
+          fileSize: analysis.fileSize,
+          metadata: ingest.metadata,
+          derivatives: derivatives.map(d => ({
+            maxSize: d.maxSize, width: d.width, height: d.height, channels: d.channels, path: d.path
+          }))
+        });
+      }
+    }
+
+    return ImageContext.fromFile(analysis.filePath);
+  }
+
+  /**
+   * Instancia sharp sobre el buffer crudo de la resolución pedida
+   * (permite usar greyscale/convolve/stats sin decodificar el archivo)
+   */
+  async sharpAt(maxSize = SIZES.LARGE) {
+    const { data, info } = await this.getRaw(maxSize);
+    return sharp(data, {
+      raw: { width: info.width, height: info.height, channels: info.channels }
+    });
+  }
+
+  /**
+   * Buffer RGB crudo con lado mayor <= maxSize
+   * @returns {Promise<{data: Buffer, info: {width, height, channels}}>}
+   */
+  getRaw(maxSize = SIZES.LARGE) {
+    // Se memoriza la promesa: las capas concurrentes comparten la misma derivación
+    if (!this._raw.has(maxSize)) {
+      this._raw.set(maxSize, this.derivatives.has(maxSize)
+        ? this._loadDerivative(this.derivatives.get(maxSize))
+        : this._deriveRaw(maxSize));
+    }
+    return this._raw.get(maxSize);
+  }
+
+  async _loadDerivative({ path, width, height, channels }) {
+    const data = await fs.readFile(path);
+    telemetry.addDecodedBytes(data.length);
+    return { data, info: { width, height, channels, size: data.length } };
+  }
+
+  async _deriveRaw(maxSize) {
+    const sourceSize = this._sourceSizeFor(maxSize);
+    if (sourceSize === maxSize) {
+      throw new Error(`Resolución base ${maxSize}px no disponible`);
+    }
+
+    const source = await this.getRaw(sourceSize);
+    const { info } = source;
+    if (info.width <= maxSize && info.height <= maxSize) {
+      return source;
+    }
+
+    const derived = await sharp(source.data, {
+      raw: { width: info.width, height: info.height, channels: info.channels }
+    })
+      .resize(maxSize, maxSize, { fit: 'inside' })
+      .raw()
+      .toBuffer({ resolveWithObject: true });
+    telemetry.addDecodedBytes(derived.data.length);
+    return derived;
+  }
+
+  /**
+   * Resolución de la que derivar maxSize: la menor disponible que la cubre
+   */
+  _sourceSizeFor(maxSize) {
+    const candidates = [...this.derivatives.keys()].filter(size => size > maxSize).sort((a, b) => a - b);
+    return candidates.length > 0 ? candidates[0] : SIZES.LARGE;
+  }
+
+  /**
+   * Buffer en escala de grises (1 canal) con lado mayor <= maxSize
+   */
+  getGray(maxSize = SIZES.LARGE) {
+    if (!this._gray.has(maxSize)) {
+      this._gray.set(maxSize, this.sharpAt(maxSize)
+        .then(image => image.greyscale().raw().toBuffer({ resolveWithObject: true })));
+    }
+    return this._gray.get(maxSize);
+  }
+
+  /**
+   * Buffer RGBA (4 canales), formato que esperan los bitmaps de Jimp
+   */
+  getRgba(maxSize = SIZES.LARGE) {
+    if (!this._rgba.has(maxSize)) {
+      this._rgba.set(maxSize, this.sharpAt(maxSize)
+        .then(image => image.ensureAlpha().raw().toBuffer({ resolveWithObject: true })));
+    }
+    return this._rgba.get(maxSize);
+  }
+
+  /**
+   * Imagen Jimp construida desde el bitmap ya decodificado.
+   * Es compartida: los consumidores deben usar clone() antes de modificarla.
+   */
+  getJimpImage(maxSize = SIZES.LARGE) {
+    if (!this._jimp.has(maxSize)) {
+      this._jimp.set(maxSize, this.getRgba(maxSize).then(({ data, info }) => {
+        const bitmap = { data, width: info.width, height: info.height };
+
+        // jimp 1.x exporta la clase como `Jimp`; 0.x exporta la clase directamente
+        const jimpModule = require('jimp');
+        const JimpClass = jimpModule.Jimp || jimpModule;
+        return typeof JimpClass.fromBitmap === 'function'
+          ? JimpClass.fromBitmap(bitmap)
+          : new JimpClass(bitmap);
+      }));
+    }
+    return this._jimp.get(maxSize);
+  }
+
+  /**
+   * Estadísticas por canal (mean/stdev/min/max), calculadas una sola vez
+   * sobre el buffer base. Mismo formato que sharp().stats().
+   */
+  getStats() {
+    if (!this._stats) {
+      this._stats = this.sharpAt(SIZES.LARGE).then(image => image.stats());
+    }
+    return this._stats;
+  }
+
+  /**
+   * Hash SHA-256 del archivo original (calculado en la ingesta o sin releer el disco)
+   */
+  getSha256() {
+    if (!this._sha256) {
+      this._sha256 = crypto.createHash('sha256').update(this.fileBuffer).digest('hex');
+    }
+    return this._sha256;
+  }
+
+  /**
+   * Bytes iniciales del archivo (cabeceras JPEG con EXIF), sin leer el resto
+   * @returns {Promise<Buffer>}
+   */
+  async getHeader() {
+    if (this.fileBuffer) return this.fileBuffer;
+
+    if (!this._header) {
+      const handle = await fs.open(this.filePath, 'r');
+      try {
+        const buffer = Buffer.alloc(Math.min(HEADER_BYTES, this.fileSize || HEADER_BYTES));
+        const { bytesRead } = await handle.read(buffer, 0, buffer.length, 0);
+        this._header = buffer.subarray(0, bytesRead);
+      } finally {
+        await handle.close();
+      }
+    }
+    return this._header;
+  }
+
+  /**
+   * Hash perceptual (aHash 8x8 sobre la resolución MEDIUM, cadena binaria de
+   * 64 bits): el mismo que guarda el análisis visual
+   */
+  getPerceptualHash() {
+    if (!this._perceptualHash) {
+      this._perceptualHash = this.sharpAt(SIZES.MEDIUM)
+        .then(image => image.resize(8, 8, { fit: 'fill' }).greyscale().raw().toBuffer())
+        .then(data => {
+          const average = data.reduce((sum, val) => sum + val, 0) / data.length;
+          let hash = '';
+          for (let i = 0; i < data.length; i++) {
+            hash += data[i] > average ? '1' : '0';
+          }
+          return hash;
+        });
+    }
+    return this._perceptualHash;
+  }
+
+  /**
+   * Soltar los buffers de una resolución que ninguna capa pendiente necesita.
+   * Solo aplica a las derivadas de la ingesta, que pueden recargarse de disco;
+   * las derivadas en memoria del original se conservan hasta release().
+   * @param {number} maxSize - Resolución (SIZES.*)
+   */
+  releaseSize(maxSize) {
+    if (!this.derivatives.has(maxSize)) return;
+
+    this._raw.delete(maxSize);
+    this._gray.delete(maxSize);
+    this._rgba.delete(maxSize);
+    this._jimp.delete(maxSize);
+  }
+
+  /**
+   * Liberar buffers al terminar el análisis
+   */
+  release() {
+    this._raw.clear();
+    this._gray.clear();
+    this._rgba.clear();
+    this._jimp.clear();
+    this._base = null;
+    this._stats = null;
+    this._header = null;
+    this.fileBuffer = null;
+  }
+}
+
+ImageContext.SIZES = SIZES;
+ImageContext.HEADER_BYTES = HEADER_BYTES;
+
+module.exports = ImageContext;
@@ -0,0 +1,314 @@
+/**
+ * INGESTA DE SUBIDAS (streaming, memoria acotada)
+ *
+ * Motor de almacenamiento de multer que sustituye a diskStorage:
+ * - El archivo se escribe a disco en streaming (nunca entero en memoria),
+ *   calculando el SHA-256 al vuelo y capturando solo las cabeceras
+ *   (primeros ImageContext.HEADER_BYTES), de las que se extrae el EXIF
+ * - Para imágenes, una sola decodificación (lectura secuencial con reducción
+ *   en la carga del JPEG) produce las derivadas crudas de las resoluciones
+ *   fijas del pipeline (ImageContext.SIZES), guardadas junto a la subida
+ *
+ * performAnalysis construye después el ImageContext desde estas derivadas:
+ * cada capa carga solo la resolución que declara, sin leer ni decodificar el
+ * original, lo que evita los picos de memoria de varias subidas de 10 MB
+ * analizándose a la vez.
+ */
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const { Transform } = require('stream');
+const { pipeline } = require('stream/promises');
+const sharp = require('sharp');
+const ImageContext = require('./imageContextService');
+const exifService = require('./exifService');
+const { envInt } = require('../utils/env');
+
+const { SIZES, HEADER_BYTES } = ImageContext;
+
+/**
+ * Metadatos de sharp sin los bloques binarios (EXIF, ICC, XMP...)
+ */
+function plainMetadata(metadata) {
+  const plain = {};
+  for (const [key, value] of Object.entries(metadata)) {
+    if (!Buffer.isBuffer(value)) plain[key] = value;
+  }
+  return plain;
+}
+
+/**
+ * Motor de almacenamiento para multer (interfaz _handleFile/_removeFile)
+ */
+class IngestStorage {
+  constructor(service, { destination, filename }) {
+    this.service = service;
+    this.getDestination = destination;
+    this.getFilename = filename;
+  }
+
+  _handleFile(req, file, cb) {
+    this.getDestination(req, file, (destinationError, destination) => {
+      if (destinationError) return cb(destinationError);
+
+      this.getFilename(req, file, (filenameError, filename) => {
+        if (filenameError) return cb(filenameError);
+
+        const filePath = path.join(destination, filename);
+        this.service.ingest(file.stream, filePath, file.mimetype)
+          .then(ingest => cb(null, {
+            destination,
+            filename,
+            path: filePath,
+            size: ingest.fileSize,
+            ingest
+          }))
+          .catch(cb);
+      });
+    });
+  }
+
+  _removeFile(req, file, cb) {
+    this.service.remove(file.path, file.ingest)
+      .then(() => cb(null), cb);
+  }
+}
+
+class IngestService {
+  constructor(options = {}) {
+    this.derivativesDir = options.derivativesDir
+      ?? path.join(__dirname, '..', 'uploads', 'derivatives');
+    this.concurrency = options.concurrency ?? envInt('INGEST_DERIVATIVE_CONCURRENCY', 2);
+
+    // Decodificaciones en curso / en espera (acota la memoria con subidas simultáneas)
+    this.active = 0;
+    this.waiting = [];
+
+    this.counters = {
+      ingested: 0,
+      bytes: 0,
+      derivativeFailures: 0,
+      totalMs: 0
+    };
+
+    fs.mkdirSync(this.derivativesDir, { recursive: true });
+  }
+
+  /**
+   * Motor de almacenamiento para multer
+   * @param {Object} options - { destination(req, file, cb), filename(req, file, cb) }
+   * @returns {IngestStorage}
+   */
+  storage(options) {
+    return new IngestStorage(this, options);
+  }
+
+  /**
+   * Ingerir una subida: escribir en streaming, hashear y generar derivadas
+   * @param {Readable} stream - Contenido del archivo
+   * @param {string} filePath - Ruta destino del original
+   * @param {string} mimetype - Tipo MIME declarado
+   * @returns {Promise<Object>} { sha256, fileSize, headerBytes, metadata, derivatives, exif, durationMs }
+   */
+  async ingest(stream, filePath, mimetype) {
+    const startedAt = Date.now();
+    const { sha256, fileSize, header } = await this.writeStream(stream, filePath);
+
+    const ingest = {
+      sha256,
+      fileSize,
+      headerBytes: header.length,
+      metadata: null,
+      derivatives: [],
+      exif: null,
+      ingestedAt: new Date()
+    };
+
+    // Subida truncada por el límite de tamaño: multer la rechazará y la borrará
+    if (mimetype.startsWith('image/') && !stream.truncated) {
+      try {
+        const { metadata, derivatives } = await this.withSlot(() =>
+          this.createDerivatives(filePath, path.basename(filePath))
+        );
+        ingest.metadata = metadata;
+        ingest.derivatives = derivatives;
+      } catch (error) {
+        // El análisis decodificará el original como antes
+        this.counters.derivativeFailures++;
+        console.error(`⚠️ No se pudieron generar derivadas de ${path.basename(filePath)}:`, error.message);
+      }
+
+      const context = ImageContext.fromIngest(filePath, ingest, header);
+      const exifResult = await exifService.extractExifData(filePath, context);
+      if (exifResult.success) {
+        ingest.exif = exifResult.data;
+      }
+    }
+
+    ingest.durationMs = Date.now() - startedAt;
+    this.counters.ingested++;
+    this.counters.bytes += fileSize;
+    this.counters.totalMs += ingest.durationMs;
+
+    console.log(`📥 Ingesta de ${path.basename(filePath)}: ${(fileSize / 1024 / 1024).toFixed(1)} MB, ${ingest.derivatives.length} derivada(s) en ${ingest.durationMs}ms`);
+    return ingest;
+  }
+
+  /**
+   * Escribir el stream a disco calculando el hash y capturando las cabeceras
+   * @returns {Promise<{sha256: string, fileSize: number, header: Buffer}>}
+   */
+  async writeStream(stream, filePath) {
+    const hash = crypto.createHash('sha256');
+    const headerChunks = [];
+    let headerLength = 0;
+    let fileSize = 0;
+
+    const tap = new Transform({
+      transform(chunk, encoding, done) {
+        hash.update(chunk);
+        fileSize += chunk.length;
+
+        if (headerLength < HEADER_BYTES) {
+          // Copia: no retener el chunk completo del stream
+          const part = Buffer.from(chunk.subarray(0, HEADER_BYTES - headerLength));
+          headerChunks.push(part);
+          headerLength += part.length;
+        }
+
+        done(null, chunk);
+      }
+    });
+
+    try {
+      await pipeline(stream, tap, fs.createWriteStream(filePath));
+    } catch (error) {
+      await fs.promises.unlink(filePath).catch(() => {});
+      throw error;
+    }
+
+    return {
+      sha256: hash.digest('hex'),
+      fileSize,
+      header: Buffer.concat(headerChunks, headerLength)
+    };
+  }
+
+  /**
+   * Generar las derivadas crudas (RGB) de todas las resoluciones fijas con
+   * una sola decodificación del original. Mismo resultado que
+   * ImageContext.fromFile, de modo que las capas no cambian.
+   * @param {string} filePath - Ruta del original
+   * @param {string} name - Prefijo de los archivos de derivadas
+   * @returns {Promise<{metadata: Object, derivatives: Array}>}
+   */
+  async createDerivatives(filePath, name) {
+    const image = sharp(filePath, { sequentialRead: true });
+    const metadata = plainMetadata(await image.metadata());
+
+    const base = await image
+      .resize(SIZES.LARGE, SIZES.LARGE, { fit: 'inside', withoutEnlargement: true })
+      .removeAlpha()
+      .raw()
+      .toBuffer({ resolveWithObject: true });
+
+    const derivatives = [];
+    try {
+      for (const maxSize of Object.values(SIZES)) {
+        const { data, info } = await this.resizeRaw(base, maxSize);
+        const derivativePath = path.join(this.derivativesDir, `${name}.${maxSize}.rgb`);
+
+        derivatives.push({
+          maxSize,
+          width: info.width,
+          height: info.height,
+          channels: info.channels,
+          path: derivativePath
+        });
+        await fs.promises.writeFile(derivativePath, data);
+      }
+    } catch (error) {
+      await this.removeDerivatives({ derivatives });
+      throw error;
+    }
+
+    return { metadata, derivatives };
+  }
+
+  async resizeRaw(base, maxSize) {
+    const { info } = base;
+    if (info.width <= maxSize && info.height <= maxSize) {
+      return base;
+    }
+
+    return sharp(base.data, {
+      raw: { width: info.width, height: info.height, channels: info.channels }
+    })
+      .resize(maxSize, maxSize, { fit: 'inside' })
+      .raw()
+      .toBuffer({ resolveWithObject: true });
+  }
+
+  /**
+   * Borrar un original y sus derivadas
+   * @param {string} filePath - Ruta del original
+   * @param {Object} ingest - Resultado de la ingesta (opcional)
+   */
+  async remove(filePath, ingest = null) {
+    await fs.promises.unlink(filePath).catch(() => {});
+    await this.removeDerivatives(ingest);
+  }
+
+  /**
+   * Borrar las derivadas de una ingesta (p. ej. al eliminar el análisis)
+   * @param {Object} ingest - { derivatives: [{ path }] }
+   */
+  async removeDerivatives(ingest) {
+    const derivatives = ingest?.derivatives || [];
+    await Promise.all(derivatives.map(d =>
+      fs.promises.unlink(d.path).catch(error => {
+        if (error.code !== 'ENOENT') {
+          console.error('Error al eliminar derivada:', error.message);
+        }
+      })
+    ));
+  }
+
+  /**
+   * Ejecutar fn cuando haya hueco entre las decodificaciones concurrentes
+   */
+  async withSlot(fn) {
+    if (this.active >= this.concurrency) {
+      // El hueco se recibe directamente de quien lo libera
+      await new Promise(resolve => this.waiting.push(resolve));
+    } else {
+      this.active++;
+    }
+
+    try {
+      return await fn();
+    } finally {
+      const next = this.waiting.shift();
+      if (next) {
+        next();
+      } else {
+        this.active--;
+      }
+    }
+  }
+
+  getStats() {
+    return {
+      ...this.counters,
+      active: this.active,
+      waiting: this.waiting.length,
+      avgMs: this.counters.ingested > 0
+        ? Math.round(this.counters.totalMs / this.counters.ingested)
+        : 0
+    };
+  }
+}
+
+module.exports = new IngestService();
+module.exports.IngestService = IngestService;
@@ -0,0 +1,378 @@
+/**
+ * CACHÉ DE RESULTADOS POR CAPA (direccionada por contenido)
+ *
+ * Memoriza la salida de cada capa del pipeline de análisis bajo la clave
+ *   capa : versión : SHA-256 de la imagen : entradas externas
+ * de modo que re-subir la misma imagen (muy habitual con fotos virales)
+ * devuelve los resultados sin volver a ejecutar las capas.
+ *
+ * - Nivel 1: LRU en memoria acotado por tamaño (LAYER_CACHE_MEMORY_MB),
+ *   espacio 'layers' de CacheService
+ * - Nivel 2: colección LayerCacheEntry en MongoDB (JSON comprimido, TTL),
+ *   compartida entre instancias y persistente entre reinicios
+ * - Versionado por capa: subir la versión de una capa solo invalida esa
+ *   capa (las entradas antiguas se purgan la primera vez que se usa la nueva)
+ * - "Entradas externas": huella de los datos de los que depende la capa
+ *   además de la imagen (p. ej. revisión del catálogo o del set de training)
+ * - Clave alternativa por hash perceptual para capas que lo admiten
+ *   (desactivada por defecto: LAYER_CACHE_PERCEPTUAL=true)
+ * - Peticiones concurrentes de la misma clave comparten un solo cálculo
+ *
+ * Los valores se guardan serializados: cada lectura devuelve una copia
+ * independiente que el pipeline puede modificar sin corromper la caché.
+ */
+
+const zlib = require('zlib');
+const { promisify } = require('util');
+const mongoose = require('mongoose');
+const LayerCacheEntry = require('../models/LayerCacheEntry');
+const CacheService = require('./cacheService');
+const { envInt } = require('../utils/env');
+
+const gzip = promisify(zlib.gzip);
+const gunzip = promisify(zlib.gunzip);
+
+/**
+ * Un resultado es cacheable si no representa un fallo de la capa
+ */
+function defaultCacheable(value) {
+  return value !== null && value !== undefined && !value.error && value.success !== false;
+}
+
+class LayerCacheService {
+  constructor(options = {}) {
+    this.maxMemoryBytes = (options.memoryMb ?? envInt('LAYER_CACHE_MEMORY_MB', 64)) * 1024 * 1024;
+    this.maxEntryBytes = (options.maxEntryKb ?? envInt('LAYER_CACHE_MAX_ENTRY_KB', 2048)) * 1024;
+    this.ttlSeconds = (options.ttlDays ?? envInt('LAYER_CACHE_TTL_DAYS', 30)) * 24 * 3600;
+    this.persistent = options.persistent ?? process.env.LAYER_CACHE_PERSISTENT !== 'false';
+    this.perceptual = options.perceptual ?? process.env.LAYER_CACHE_PERCEPTUAL === 'true';
+
+    // key -> { json, perceptualKey }
+    this.memory = CacheService.namespace(options.namespace ?? 'layers', {
+      maxBytes: this.maxMemoryBytes,
+      sizeOf: entry => entry.json.length * 2, // Strings UTF-16 en V8
+      onRemove: (key, entry) => {
+        if (entry.perceptualKey && this.byPerceptual.get(entry.perceptualKey) === key) {
+          this.byPerceptual.delete(entry.perceptualKey);
+        }
+      }
+    });
+    this.byPerceptual = new Map();  // perceptualKey -> key
+    this.inFlight = new Map();      // key -> Promise<{ value, json }>
+    this.purged = new Set();        // capa:versión ya purgadas en este proceso
+
+    this.stats = {
+      hits: { memory: 0, persistent: 0, perceptual: 0 },
+      misses: 0,
+      coalesced: 0,
+      sets: 0,
+      errors: 0,
+      byLayer: {}
+    };
+  }
+
+  /**
+   * Claves de una entrada
+   * @param {Object} descriptor - { layer, version, contentHash, perceptualHash, inputs }
+   */
+  buildKeys(descriptor) {
+    const { layer, version, contentHash, perceptualHash = null, inputs = '' } = descriptor;
+    return {
+      key: `${layer}:${version}:${contentHash}:${inputs}`,
+      perceptualKey: this.perceptual && perceptualHash
+        ? `${layer}:${version}:p${perceptualHash}:${inputs}`
+        : null
+    };
+  }
+
+  /**
+   * Buscar un resultado (memoria -> MongoDB -> hash perceptual)
+   * @returns {Promise<{value: any, source: string}|null>}
+   */
+  async get(descriptor) {
+    const { key, perceptualKey } = this.buildKeys(descriptor);
+
+    let json = this.readMemory(key);
+    if (json !== undefined) {
+      return this.hit(descriptor.layer, 'memory', json);
+    }
+
+    if (perceptualKey && this.byPerceptual.has(perceptualKey)) {
+      json = this.readMemory(this.byPerceptual.get(perceptualKey));
+      if (json !== undefined) {
+        return this.hit(descriptor.layer, 'perceptual', json);
+      }
+    }
+
+    if (this.isPersistentAvailable()) {
+      try {
+        const now = new Date();
+        let source = 'persistent';
+        let doc = await LayerCacheEntry.findOne({ key, expiresAt: { $gt: now } })
+          .select('payload expiresAt').lean();
+
+        if (!doc && perceptualKey) {
+          doc = await LayerCacheEntry.findOne({ perceptualKey, expiresAt: { $gt: now } })
+            .sort({ updatedAt: -1 }).select('key payload expiresAt').lean();
+          source = 'perceptual';
+        }
+
+        if (doc) {
+          json = (await gunzip(toBuffer(doc.payload))).toString('utf8');
+          this.writeMemory(doc.key || key, perceptualKey, json, new Date(doc.expiresAt).getTime());
+
+          LayerCacheEntry.updateOne(
+            { _id: doc._id },
+            { $inc: { hits: 1 }, $set: { lastHitAt: now } }
+          ).catch(() => {});
+
+          return this.hit(descriptor.layer, source, json);
+        }
+      } catch (error) {
+        this.stats.errors++;
+        console.error(`⚠️ Error leyendo caché de capa ${descriptor.layer}:`, error.message);
+      }
+    }
+
+    return null;
+  }
+
+  /**
+   * Guardar un resultado ya serializado
+   * @param {Object} descriptor - Ver buildKeys()
+   * @param {string} json - Resultado serializado
+   * @param {Object} options - { ttlSeconds }
+   */
+  async set(descriptor, json, options = {}) {
+    const size = Buffer.byteLength(json);
+    if (size > this.maxEntryBytes) return false;
+
+    const { key, perceptualKey } = this.buildKeys(descriptor);
+    const ttlSeconds = options.ttlSeconds || this.ttlSeconds;
+    const expiresAt = Date.now() + ttlSeconds * 1000;
+
+    this.writeMemory(key, perceptualKey, json, expiresAt);
+    this.stats.sets++;
+
+    if (this.isPersistentAvailable()) {
+      try {
+        this.purgeOldVersions(descriptor.layer, descriptor.version);
+
+        await LayerCacheEntry.updateOne(
+          { key },
+          {
+            $set: {
+              layer: descriptor.layer,
+              version: descriptor.version,
+              contentHash: descriptor.contentHash,
+              perceptualKey,
+              payload: await gzip(json),
+              sizeBytes: size,
+              expiresAt: new Date(expiresAt)
+            },
+            $setOnInsert: { hits: 0 }
+          },
+          { upsert: true }
+        );
+      } catch (error) {
+        this.stats.errors++;
+        console.error(`⚠️ Error guardando caché de capa ${descriptor.layer}:`, error.message);
+      }
+    }
+
+    return true;
+  }
+
+  /**
+   * Devolver el resultado cacheado o calcularlo (un solo cálculo por clave
+   * aunque lleguen varias peticiones a la vez)
+   * @param {Object} descriptor - Ver buildKeys()
+   * @param {Function} compute - async () => valor
+   * @param {Object} options - { ttlSeconds, cacheable(valor) }
+   */
+  async getOrCompute(descriptor, compute, options = {}) {
+    const cached = await this.get(descriptor);
+    if (cached) return cached.value;
+
+    const { key } = this.buildKeys(descriptor);
+    if (this.inFlight.has(key)) {
+      this.stats.coalesced++;
+      const { value, json } = await this.inFlight.get(key);
+      return json !== null ? JSON.parse(json) : value;
+    }
+
+    this.stats.misses++;
+    this.layerStats(descriptor.layer).misses++;
+
+    const cacheable = options.cacheable || defaultCacheable;
+    const pending = (async () => {
+      const value = await compute();
+
+      // Serializar antes de devolver: el pipeline modifica los resultados
+      let json = null;
+      try {
+        json = JSON.stringify(value);
+      } catch (error) {
+        json = null;
+      }
+
+      if (json !== null && defaultCacheable(value) && cacheable(value)) {
+        this.set(descriptor, json, options).catch(() => {});
+      }
+      return { value, json };
+    })();
+
+    this.inFlight.set(key, pending);
+    try {
+      return (await pending).value;
+    } finally {
+      this.inFlight.delete(key);
+    }
+  }
+
+  /**
+   * Envolver las capas del pipeline con la caché
+   * @param {Object} layers - Capas de LayerSchedulerService
+   * @param {Object} config - capa -> { version, ttlSeconds, perceptual, inputs(results), cacheable(valor, results) }
+   * @param {Object} content - { contentHash, perceptualHash }
+   * @returns {Object} Capas con run() cacheado
+   */
+  wrapLayers(layers, config, content) {
+    const wrapped = { ...layers };
+
+    for (const [name, cache] of Object.entries(config)) {
+      const layer = layers[name];
+      if (!layer) continue;
+
+      wrapped[name] = {
+        ...layer,
+        run: async (results) => {
+          const inputs = cache.inputs ? await cache.inputs(results) : '';
+          return this.getOrCompute(
+            {
+              layer: name,
+              version: cache.version,
+              contentHash: content.contentHash,
+              perceptualHash: cache.perceptual ? content.perceptualHash : null,
+              inputs
+            },
+            () => layer.run(results),
+            {
+              ttlSeconds: cache.ttlSeconds,
+              cacheable: cache.cacheable && ((value) => cache.cacheable(value, results))
+            }
+          );
+        }
+      };
+    }
+
+    return wrapped;
+  }
+
+  // ==================== MEMORIA (LRU) ====================
+
+  readMemory(key) {
+    const entry = this.memory.get(key);
+    return entry ? entry.json : undefined;
+  }
+
+  writeMemory(key, perceptualKey, json, expiresAt) {
+    const stored = this.memory.set(key, { json, perceptualKey }, expiresAt - Date.now());
+    if (stored && perceptualKey) this.byPerceptual.set(perceptualKey, key);
+  }
+
+  // ==================== MANTENIMIENTO ====================
+
+  isPersistentAvailable() {
+    return this.persistent && mongoose.connection.readyState === 1;
+  }
+
+  /**
+   * Borrar de MongoDB las entradas de versiones anteriores de una capa
+   * (una vez por capa y versión en cada proceso)
+   */
+  purgeOldVersions(layer, version) {
+    const id = `${layer}:${version}`;
+    if (this.purged.has(id)) return;
+    this.purged.add(id);
+
+    LayerCacheEntry.deleteMany({ layer, version: { $ne: version } })
+      .then(({ deletedCount }) => {
+        if (deletedCount > 0) {
+          console.log(`🗑️  Caché de capa ${layer}: ${deletedCount} entradas de versiones anteriores eliminadas`);
+        }
+      })
+      .catch(() => this.purged.delete(id));
+  }
+
+  /**
+   * Vaciar la caché (toda o la de una capa)
+   * @param {string} layer - Capa (opcional)
+   * @returns {Promise<number>} Entradas eliminadas de memoria
+   */
+  async clear(layer = null) {
+    const removed = this.memory.deleteWhere(key => !layer || key.startsWith(`${layer}:`));
+
+    if (this.isPersistentAvailable()) {
+      await LayerCacheEntry.deleteMany(layer ? { layer } : {});
+    }
+    return removed;
+  }
+
+  hit(layer, source, json) {
+    this.stats.hits[source]++;
+    this.layerStats(layer).hits++;
+    console.log(`⚡ Capa ${layer} desde caché (${source})`);
+    return { value: JSON.parse(json), source };
+  }
+
+  layerStats(layer) {
+    if (!this.stats.byLayer[layer]) {
+      this.stats.byLayer[layer] = { hits: 0, misses: 0 };
+    }
+    return this.stats.byLayer[layer];
+  }
+
+  /**
+   * Estado de la caché (para monitoreo)
+   */
+  getStats(layer = null) {
+    if (layer) {
+      const prefix = `${layer}:`;
+      let entries = 0;
+      for (const key of this.memory.keys()) {
+        if (key.startsWith(prefix)) entries++;
+      }
+      return { entries, ...this.layerStats(layer) };
+    }
+
+    const memory = this.memory.getStats();
+    return {
+      memory: {
+        entries: memory.entries,
+        bytes: memory.bytes,
+        maxBytes: this.maxMemoryBytes
+      },
+      persistent: this.isPersistentAvailable(),
+      perceptual: this.perceptual,
+      inFlight: this.inFlight.size,
+      ...this.stats,
+      evictions: memory.evictions,
+      hits: { ...this.stats.hits },
+      byLayer: JSON.parse(JSON.stringify(this.stats.byLayer))
+    };
+  }
+}
+
+/**
+ * Buffer / BSON Binary -> Buffer
+ */
+function toBuffer(value) {
+  if (value && value._bsontype === 'Binary') {
+    return Buffer.from(value.buffer);
+  }
+  return value;
+}
+
+module.exports = new LayerCacheService();
+module.exports.LayerCacheService = LayerCacheService;
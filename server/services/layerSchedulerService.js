@@ -0,0 +1,151 @@
+/**
+ * PLANIFICADOR DE CAPAS DE ANÁLISIS (grafo de dependencias)
+ *
+ * Ejecuta las capas del pipeline como un DAG: cada capa arranca en cuanto
+ * terminan las capas de las que depende, de modo que las independientes
+ * (EXIF, visual, forense, IA local...) corren en paralelo.
+ *
+ * Definición de una capa:
+ *   {
+ *     deps: ['a'],        // Dependencias duras: si fallan, la capa se omite
+ *     waitFor: ['b'],     // Dependencias blandas: se esperan, pero su fallo no la omite
+ *     timeoutMs: 30000,   // Tiempo máximo de la capa
+ *     critical: false,    // Si falla, se aborta todo el grafo
+ *     run: async (results) => valor,
+ *     onComplete: (valor) => {},  // Solo se invoca si run terminó a tiempo
+ *     onError: (error) => {}
+ *   }
+ *
+ * Semántica de fallo parcial: una capa fallida o con timeout queda marcada
+ * como tal y su resultado se descarta; el resto del grafo continúa.
+ */
+
+class LayerSchedulerService {
+
+  /**
+   * Ejecutar un grafo de capas
+   * @param {Object} layers - Mapa nombre -> definición de capa
+   * @param {Object} hooks - { onStart(name), onSettled(name, state) }
+   * @returns {Promise<{results: Object, states: Object}>}
+   */
+  static async run(layers, hooks = {}) {
+    LayerSchedulerService.validate(layers);
+
+    const results = {};
+    const states = {};
+    const promises = {};
+
+    const start = (name) => {
+      if (!promises[name]) {
+        promises[name] = LayerSchedulerService.runLayer(name, layers, results, states, start, hooks);
+      }
+      return promises[name];
+    };
+
+    await Promise.all(Object.keys(layers).map(start));
+    return { results, states };
+  }
+
+  /**
+   * Ejecutar una capa tras esperar sus dependencias
+   */
+  static async runLayer(name, layers, results, states, start, hooks) {
+    const layer = layers[name];
+    const deps = layer.deps || [];
+    const waitFor = layer.waitFor || [];
+
+    await Promise.all([...deps, ...waitFor].map(start));
+
+    const missing = deps.find(dep => states[dep].status !== 'completed');
+    if (missing) {
+      states[name] = { status: 'skipped', reason: `Dependencia "${missing}" no disponible` };
+      console.log(`⏭️  Capa ${name} omitida: dependencia "${missing}" no disponible`);
+      if (hooks.onSettled) hooks.onSettled(name, states[name]);
+      if (layer.critical) {
+        throw new Error(`Capa crítica ${name} omitida: dependencia "${missing}" no disponible`);
+      }
+      return states[name];
+    }
+
+    if (hooks.onStart) hooks.onStart(name);
+    const startedAt = Date.now();
+
+    try {
+      const value = await LayerSchedulerService.withTimeout(
+        Promise.resolve().then(() => layer.run(results)),
+        layer.timeoutMs,
+        name
+      );
+
+      results[name] = value;
+      states[name] = { status: 'completed', durationMs: Date.now() - startedAt };
+      if (layer.onComplete) layer.onComplete(value);
+
+    } catch (error) {
+      states[name] = {
+        status: error.code === 'LAYER_TIMEOUT' ? 'timeout' : 'failed',
+        error: error.message,
+        durationMs: Date.now() - startedAt
+      };
+      console.error(`⚠️ Error en capa ${name}:`, error.message);
+      if (layer.onError) layer.onError(error);
+
+      if (layer.critical) {
+        if (hooks.onSettled) hooks.onSettled(name, states[name]);
+        throw error;
+      }
+    }
+
+    if (hooks.onSettled) hooks.onSettled(name, states[name]);
+    return states[name];
+  }
+
+  /**
+   * Rechazar si la promesa no termina a tiempo (la capa sigue en segundo
+   * plano, pero su resultado se descarta)
+   */
+  static withTimeout(promise, timeoutMs, name) {
+    if (!timeoutMs) return promise;
+
+    let timer;
+    const timeout = new Promise((_, reject) => {
+      timer = setTimeout(() => {
+        const error = new Error(`Capa ${name} excedió ${timeoutMs}ms`);
+        error.code = 'LAYER_TIMEOUT';
+        reject(error);
+      }, timeoutMs);
+    });
+
+    return Promise.race([promise, timeout]).finally(() => clearTimeout(timer));
+  }
+
+  /**
+   * Verificar que las dependencias existen y que no hay ciclos
+   */
+  static validate(layers) {
+    const visiting = new Set();
+    const done = new Set();
+
+    const visit = (name, chain) => {
+      if (!layers[name]) {
+        throw new Error(`Capa desconocida en dependencias: ${name} (desde ${chain.join(' -> ')})`);
+      }
+      if (done.has(name)) return;
+      if (visiting.has(name)) {
+        throw new Error(`Ciclo de dependencias entre capas: ${[...chain, name].join(' -> ')}`);
+      }
+
+      visiting.add(name);
+      const layer = layers[name];
+      for (const dep of [...(layer.deps || []), ...(layer.waitFor || [])]) {
+        visit(dep, [...chain, name]);
+      }
+      visiting.delete(name);
+      done.add(name);
+    };
+
+    Object.keys(layers).forEach(name => visit(name, []));
+  }
+}
+
+module.exports = LayerSchedulerService;
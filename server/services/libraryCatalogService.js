@@ -0,0 +1,250 @@
+/**
+ * CATÁLOGO PÚBLICO DE LA BIBLIOTECA
+ *
+ * Listados y fichas de /api/library/phenomena y /api/library/objects, que
+ * consultan constantemente el front-end de WordPress y los visitantes:
+ * - Paginación por cursor (keyset): orden estable con _id como desempate;
+ *   ?cursor=<nextCursor> continúa tras el último elemento sin skip ni
+ *   conteo. ?page=N se mantiene (skip + conteo) para los clientes existentes
+ * - Proyección ligera para las tarjetas: sin rasgos científicos, historial
+ *   de ediciones ni metadatos internos de las imágenes
+ * - Cada respuesta se serializa una vez y se guarda en la caché 'library'
+ *   con su ETag; las peticiones condicionales (If-None-Match) reciben 304.
+ *   Los hooks de UFODatabase y AtmosphericPhenomenon la invalidan al
+ *   cambiar la biblioteca (LIBRARY_CACHE_TTL_SEC acota lo que tarda en
+ *   verse un cambio hecho desde otro proceso)
+ */
+
+const crypto = require('crypto');
+const mongoose = require('mongoose');
+const UFODatabase = require('../models/UFODatabase');
+const AtmosphericPhenomenon = require('../models/AtmosphericPhenomenon');
+const CacheService = require('./cacheService');
+const { envInt } = require('../utils/env');
+
+const CACHE_TTL_MS = envInt('LIBRARY_CACHE_TTL_SEC', 300) * 1000;
+const MAX_LIMIT = 100;
+
+function escapeRegex(text) {
+  return String(text).replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+}
+
+/**
+ * Búsqueda de texto libre (literal, sin expresiones regulares del cliente)
+ */
+function searchFilter(search, arrayField) {
+  const pattern = new RegExp(escapeRegex(search), 'i');
+  return [
+    { name: pattern },
+    { description: pattern },
+    { [arrayField]: pattern }
+  ];
+}
+
+// Orden de cada listado: [campo, dirección]; _id se añade como desempate
+const COLLECTIONS = {
+  phenomena: {
+    model: AtmosphericPhenomenon,
+    select: '-scientificExplanation -photographyTips -referenceImages -images.uploadedBy -images.uploadedAt -__v',
+    sorts: {
+      name: [['name', 1]],
+      rarity: [['occurrenceConditions.frequency', -1]],
+      category: [['category', 1], ['name', 1]]
+    },
+    filter(query) {
+      const filter = { isActive: true };
+      if (query.category) filter.category = query.category;
+      if (query.rarity) filter.rarity = query.rarity;
+      if (query.search) filter.$or = searchFilter(query.search, 'keywords');
+      return filter;
+    }
+  },
+  objects: {
+    model: UFODatabase,
+    select: '-scientificFeatures -editHistory -manualImages.filename -manualImages.uploadedAt -addedBy -uploadedBy -linkedTrainingId -__v',
+    sorts: {
+      name: [['name', 1]],
+      frequency: [['frequency', -1]],
+      category: [['category', 1], ['name', 1]],
+      recent: [['createdAt', -1]]
+    },
+    filter(query) {
+      const filter = { isActive: true };
+      if (query.category) filter.category = query.category;
+      if (query.verified === 'true') filter.isVerified = true;
+      if (query.isManualEntry !== undefined && query.isManualEntry !== '') {
+        filter.isManualEntry = query.isManualEntry === 'true';
+      }
+      if (query.search) filter.$or = searchFilter(query.search, 'visualPatterns');
+      return filter;
+    }
+  }
+};
+
+function getPath(doc, field) {
+  return field.split('.').reduce((value, key) => (value == null ? undefined : value[key]), doc);
+}
+
+/**
+ * Cursor opaco: orden + valores de las claves del último elemento
+ */
+function encodeCursor(sortBy, keys, doc) {
+  const values = keys.map(([field]) => {
+    const value = getPath(doc, field);
+    if (value instanceof Date) return { $date: value.toISOString() };
+    if (value instanceof mongoose.Types.ObjectId) return value.toString();
+    return value ?? null;
+  });
+  return Buffer.from(JSON.stringify({ s: sortBy, v: values })).toString('base64url');
+}
+
+function decodeCursor(cursor, sortBy, keys) {
+  try {
+    const { s, v } = JSON.parse(Buffer.from(String(cursor), 'base64url').toString());
+    if (s !== sortBy || !Array.isArray(v) || v.length !== keys.length) throw new Error();
+
+    return v.map((value, index) => {
+      if (keys[index][0] === '_id') return new mongoose.Types.ObjectId(value);
+      if (value && typeof value === 'object' && value.$date) return new Date(value.$date);
+      return value;
+    });
+  } catch (error) {
+    const invalid = new Error('Cursor inválido para este listado');
+    invalid.code = 'INVALID_CURSOR';
+    throw invalid;
+  }
+}
+
+/**
+ * Condición "después de" para un campo. Los documentos sin valor (null)
+ * van primero en orden ascendente y al final en descendente.
+ */
+function afterConditions(direction, value) {
+  if (direction === 1) {
+    return [value === null ? { $ne: null } : { $gt: value }];
+  }
+  return value === null ? [] : [{ $lt: value }, null];
+}
+
+/**
+ * Filtro keyset: elementos estrictamente posteriores al cursor
+ */
+function keysetFilter(keys, values) {
+  const clauses = [];
+
+  keys.forEach(([field, direction], index) => {
+    const equal = {};
+    for (let j = 0; j < index; j++) {
+      equal[keys[j][0]] = values[j];
+    }
+    for (const condition of afterConditions(direction, values[index])) {
+      clauses.push({ ...equal, [field]: condition });
+    }
+  });
+
+  return { $or: clauses };
+}
+
+class LibraryCatalogService {
+  constructor() {
+    this.cache = CacheService.namespace('library', {
+      ttlMs: CACHE_TTL_MS,
+      maxBytes: envInt('LIBRARY_CACHE_MB', 16) * 1024 * 1024,
+      sizeOf: (entry) => entry.body.length * 2 + 128
+    });
+    // Se incrementa al invalidar: las cargas en curso guardan bajo la
+    // generación anterior y nadie vuelve a leerlas
+    this.generation = 0;
+  }
+
+  /**
+   * Respuesta serializada + ETag (débil, sobre el cuerpo)
+   */
+  serialize(payload) {
+    const body = JSON.stringify(payload);
+    const etag = `W/"${crypto.createHash('sha1').update(body).digest('base64url')}"`;
+    return { body, etag };
+  }
+
+  cacheKey(kind, params) {
+    const query = Object.keys(params).sort()
+      .filter(key => params[key] !== undefined && params[key] !== '')
+      .map(key => `${key}=${params[key]}`)
+      .join('&');
+    return `g${this.generation}:${kind}:${query}`;
+  }
+
+  /**
+   * Listado paginado
+   * @param {string} kind - 'phenomena' | 'objects'
+   * @param {Object} query - Parámetros de la petición (page | cursor, limit, filtros, sortBy)
+   * @returns {Promise<{body: string, etag: string}>}
+   */
+  list(kind, query) {
+    const spec = COLLECTIONS[kind];
+    const limit = Math.min(Math.max(parseInt(query.limit) || 12, 1), MAX_LIMIT);
+    const sortBy = spec.sorts[query.sortBy] ? query.sortBy : 'name';
+    const keys = [...spec.sorts[sortBy], ['_id', 1]];
+
+    // Validar el cursor antes de tocar la caché
+    const after = query.cursor ? decodeCursor(query.cursor, sortBy, keys) : null;
+    const page = !after && query.page ? Math.max(parseInt(query.page) || 1, 1) : null;
+
+    const params = { ...query, limit, sortBy, page: page || undefined };
+    return this.cache.getOrSet(this.cacheKey(`${kind}:list`, params), async () => {
+      const filter = spec.filter(query);
+      const conditions = after ? { $and: [filter, keysetFilter(keys, after)] } : filter;
+
+      const itemsQuery = spec.model
+        .find(conditions)
+        .sort(Object.fromEntries(keys))
+        .limit(limit + 1)
+        .select(spec.select)
+        .lean();
+      if (page) itemsQuery.skip((page - 1) * limit);
+
+      // El conteo solo se hace en el modo por página (clientes existentes)
+      const [items, total] = await Promise.all([
+        itemsQuery,
+        page ? spec.model.countDocuments(filter) : null
+      ]);
+
+      const hasMore = items.length > limit;
+      const data = hasMore ? items.slice(0, limit) : items;
+      const pagination = {
+        limit,
+        hasMore,
+        nextCursor: hasMore ? encodeCursor(sortBy, keys, data[data.length - 1]) : null
+      };
+      if (page) {
+        const pages = Math.ceil(total / limit);
+        Object.assign(pagination, { page, total, pages, totalPages: pages });
+      }
+
+      return this.serialize({ success: true, data, pagination });
+    });
+  }
+
+  /**
+   * Ficha completa de un elemento (null si no existe)
+   * @returns {Promise<{body: string, etag: string}|null>}
+   */
+  detail(kind, id) {
+    const { model } = COLLECTIONS[kind];
+    return this.cache.getOrSet(this.cacheKey(`${kind}:detail`, { id }), async () => {
+      const item = await model.findById(id).lean();
+      return item ? this.serialize({ success: true, data: item }) : null;
+    }, { cacheable: (value) => value !== null });
+  }
+
+  /**
+   * Vaciar la caché (desde los hooks de los modelos de la biblioteca)
+   */
+  invalidate() {
+    this.generation++;
+    this.cache.clear();
+  }
+}
+
+module.exports = new LibraryCatalogService();
+module.exports.LibraryCatalogService = LibraryCatalogService;
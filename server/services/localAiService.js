@@ -16,39 +16,46 @@ const fs = require('fs');
 const path = require('path');
 const sharp = require('sharp');
 const Jimp = require('jimp');
+const ImageContext = require('./imageContextService');
+const workerPool = require('./workerPoolService');
+const layerCache = require('./layerCacheService');
 
 class LocalAIService {
   constructor() {
-    this.analysisCache = new Map(); // Caché en memoria
+    this.regionScans = new WeakMap(); // Escaneo de regiones por imagen Jimp
   }
 
   /**
    * Analizar imagen localmente sin APIs externas
+   * @param {string} imagePath - Ruta de la imagen
+   * @param {object} options - { imageContext } imagen ya decodificada (opcional)
    */
   async analyzeImage(imagePath, options = {}) {
+    const { imageContext = null } = options;
+
     try {
       console.log('🔍 Analizando imagen LOCALMENTE (sin APIs externas)...');
 
-      // 1. Generar hash para caché
-      const imageHash = await this.generateImageHash(imagePath);
-      
-      // Verificar caché
-      if (this.analysisCache.has(imageHash)) {
-        console.log('✅ Resultado desde caché (0 costo)');
-        return this.analysisCache.get(imageHash);
-      }
+      // 1. Hash de la imagen (el resultado se cachea por contenido en
+      // layerCacheService al ejecutarse dentro del pipeline)
+      const imageHash = imageContext
+        ? imageContext.getSha256()
+        : await this.generateImageHash(imagePath);
 
       // 2. Análisis de metadatos
-      const metadata = await this.analyzeMetadata(imagePath);
+      const metadata = await this.analyzeMetadata(imagePath, imageContext);
+
+      // Decodificar una sola vez para las tres pasadas de píxeles
+      const image = await this.loadImage(imagePath, imageContext);
 
       // 3. Análisis de contenido visual
-      const visualAnalysis = await this.analyzeVisualContent(imagePath);
+      const visualAnalysis = await this.analyzeVisualContent(image);
 
       // 4. Detección de características sospechosas
-      const anomalyDetection = await this.detectAnomalies(imagePath);
+      const anomalyDetection = await this.detectAnomalies(image);
 
       // 5. Análisis de color y luz
-      const colorAnalysis = await this.analyzeColors(imagePath);
+      const colorAnalysis = await this.analyzeColors(image);
 
       // 6. Clasificación básica por heurísticas
       const classification = this.classifyByHeuristics({
@@ -105,9 +112,6 @@ class LocalAIService {
         }
       };
 
-      // Guardar en caché
-      this.analysisCache.set(imageHash, result);
-
       return result;
 
     } catch (error) {
@@ -129,12 +133,26 @@ class LocalAIService {
     return crypto.createHash('sha256').update(buffer).digest('hex');
   }
 
+  /**
+   * Cargar imagen Jimp (desde el contexto compartido si existe)
+   */
+  async loadImage(imagePath, imageContext = null) {
+    if (imageContext) {
+      return imageContext.getJimpImage(ImageContext.SIZES.LARGE);
+    }
+    return Jimp.read(imagePath);
+  }
+
   /**
    * Analizar metadatos de la imagen
    */
-  async analyzeMetadata(imagePath) {
-    const metadata = await sharp(imagePath).metadata();
-    const stats = fs.statSync(imagePath);
+  async analyzeMetadata(imagePath, imageContext = null) {
+    const metadata = imageContext
+      ? imageContext.metadata
+      : await sharp(imagePath).metadata();
+    const stats = imageContext
+      ? { size: imageContext.fileSize }
+      : fs.statSync(imagePath);
 
     return {
       width: metadata.width,
@@ -153,9 +171,7 @@ class LocalAIService {
   /**
    * Análisis visual del contenido
    */
-  async analyzeVisualContent(imagePath) {
-    const image = await Jimp.read(imagePath);
-    
+  async analyzeVisualContent(image) {
     return {
       aspectRatio: image.bitmap.width / image.bitmap.height,
       pixelCount: image.bitmap.width * image.bitmap.height,
@@ -172,27 +188,21 @@ class LocalAIService {
   async detectShapes(image) {
     // Análisis simplificado de regiones de interés
     const shapes = [];
-    const width = image.bitmap.width;
-    const height = image.bitmap.height;
     
-    // Dividir imagen en cuadrantes y analizar
-    const regions = [
-      { x: 0, y: 0, w: width/2, h: height/2, name: 'superior-izquierda' },
-      { x: width/2, y: 0, w: width/2, h: height/2, name: 'superior-derecha' },
-      { x: 0, y: height/2, w: width/2, h: height/2, name: 'inferior-izquierda' },
-      { x: width/2, y: height/2, w: width/2, h: height/2, name: 'inferior-derecha' }
-    ];
-
-    for (const region of regions) {
-      const brightness = this.getRegionBrightness(image, region);
-      const contrast = this.getRegionContrast(image, region);
+    // Dividir imagen en cuadrantes y analizar (mismo orden que scanRegions)
+    const regionNames = ['superior-izquierda', 'superior-derecha', 'inferior-izquierda', 'inferior-derecha'];
+    const { quadrantStats } = await this.scanRegions(image);
+
+    for (let i = 0; i < regionNames.length; i++) {
+      const name = regionNames[i];
+      const { brightness, contrast } = quadrantStats[i];
       
       if (contrast > 50 && brightness > 100) {
         shapes.push({
-          region: region.name,
+          region: name,
           type: 'bright_object',
           confidence: Math.min(contrast / 255 * 100, 100),
-          description: `Objeto brillante detectado en región ${region.name}`
+          description: `Objeto brillante detectado en región ${name}`
         });
       }
     }
@@ -286,12 +296,11 @@ class LocalAIService {
   /**
    * Detectar anomalías
    */
-  async detectAnomalies(imagePath) {
-    const image = await Jimp.read(imagePath);
+  async detectAnomalies(image) {
     const anomalies = [];
 
     // 1. Detectar objetos muy brillantes
-    const brightRegions = this.detectBrightRegions(image);
+    const brightRegions = await this.detectBrightRegions(image);
     if (brightRegions.length > 0) {
       anomalies.push({
         type: 'high_brightness',
@@ -333,8 +342,7 @@ class LocalAIService {
   /**
    * Analizar colores
    */
-  async analyzeColors(imagePath) {
-    const image = await Jimp.read(imagePath);
+  async analyzeColors(image) {
     const width = image.bitmap.width;
     const height = image.bitmap.height;
     
@@ -386,55 +394,35 @@ class LocalAIService {
   }
 
   // Métodos auxiliares
-  detectBrightRegions(image) {
-    const regions = [];
-    const width = image.bitmap.width;
-    const height = image.bitmap.height;
-    const gridSize = 20;
-    
-    for (let y = 0; y < height; y += gridSize) {
-      for (let x = 0; x < width; x += gridSize) {
-        const brightness = this.getRegionBrightness(image, { 
-          x, y, w: gridSize, h: gridSize 
-        });
-        
-        if (brightness > 200) {
-          regions.push({ x, y, brightness });
-        }
-      }
-    }
-    
-    return regions;
-  }
-
-  getRegionBrightness(image, region) {
-    let sum = 0;
-    let count = 0;
-    
-    for (let y = region.y; y < Math.min(region.y + region.h, image.bitmap.height); y++) {
-      for (let x = region.x; x < Math.min(region.x + region.w, image.bitmap.width); x++) {
-        const color = Jimp.intToRGBA(image.getPixelColor(x, y));
-        sum += (color.r + color.g + color.b) / 3;
-        count++;
-      }
-    }
-    
-    return count > 0 ? sum / count : 0;
+  async detectBrightRegions(image) {
+    const { brightRegions } = await this.scanRegions(image);
+    return brightRegions;
   }
 
-  getRegionContrast(image, region) {
-    let min = 255, max = 0;
-    
-    for (let y = region.y; y < Math.min(region.y + region.h, image.bitmap.height); y++) {
-      for (let x = region.x; x < Math.min(region.x + region.w, image.bitmap.width); x++) {
-        const color = Jimp.intToRGBA(image.getPixelColor(x, y));
-        const brightness = (color.r + color.g + color.b) / 3;
-        min = Math.min(min, brightness);
-        max = Math.max(max, brightness);
-      }
+  /**
+   * Brillo/contraste de los cuadrantes y rejilla de regiones brillantes (20px),
+   * calculados una sola vez por imagen en el pool de workers
+   */
+  scanRegions(image) {
+    if (!this.regionScans.has(image)) {
+      const width = image.bitmap.width;
+      const height = image.bitmap.height;
+
+      this.regionScans.set(image, workerPool.run('localAiRegionScan', {
+        data: image.bitmap.data,
+        width,
+        height,
+        quadrants: [
+          { x: 0, y: 0, w: width/2, h: height/2 },
+          { x: width/2, y: 0, w: width/2, h: height/2 },
+          { x: 0, y: height/2, w: width/2, h: height/2 },
+          { x: width/2, y: height/2, w: width/2, h: height/2 }
+        ],
+        gridSize: 20,
+        brightThreshold: 200
+      }));
     }
-    
-    return max - min;
+    return this.regionScans.get(image);
   }
 
   detectGeometricPatterns(image) {
@@ -597,11 +585,10 @@ class LocalAIService {
   }
 
   /**
-   * Limpiar caché (llamar periódicamente)
+   * Limpiar la caché de resultados de esta capa
    */
-  clearCache() {
-    const size = this.analysisCache.size;
-    this.analysisCache.clear();
+  async clearCache() {
+    const size = await layerCache.clear('localAi');
     console.log(`🗑️  Caché limpiado: ${size} entradas eliminadas`);
   }
 
@@ -610,7 +597,7 @@ class LocalAIService {
    */
   getStats() {
     return {
-      cachedAnalyses: this.analysisCache.size,
+      cachedAnalyses: layerCache.getStats('localAi').entries,
       memoryCost: 0,
       apiCost: 0,
       method: 'local_computer_vision'
@@ -29,6 +29,30 @@ class NotificationService {
     }
   }
   
+  /**
+   * Notificar cuando termina un lote de análisis (una sola notificación por lote)
+   */
+  static async notifyBatchCompleted(userId, batchId, batchData) {
+    try {
+      await Notification.createNotification({
+        userId,
+        type: 'analysis_completed',
+        title: '📦 Lote de Análisis Completado',
+        message: `Tu lote${batchData.name ? ` "${batchData.name}"` : ''} ha terminado: ${batchData.completed} imagen(es) analizada(s), ${batchData.errors} con error.`,
+        relatedId: batchId,
+        relatedModel: 'AnalysisBatch',
+        priority: 'medium',
+        metadata: {
+          name: batchData.name,
+          completed: batchData.completed,
+          errors: batchData.errors
+        }
+      });
+    } catch (error) {
+      console.error('Error enviando notificación de lote:', error);
+    }
+  }
+  
   /**
    * Notificar cuando un reporte se genera
    */
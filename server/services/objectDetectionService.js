@@ -1,5 +1,6 @@
 const sharp = require('sharp');
 const jimp = require('jimp');
+const ImageContext = require('./imageContextService');
 
 /**
  * Servicio de Detección de Objetos usando análisis de imagen nativo
@@ -10,16 +11,17 @@ const jimp = require('jimp');
 /**
  * Analiza una imagen para detectar objetos, formas y características
  * @param {string} filePath - Ruta de la imagen
+ * @param {ImageContext} imageContext - Imagen ya decodificada (opcional)
  * @returns {Object} Análisis detallado
  */
-async function analyzeImage(filePath) {
+async function analyzeImage(filePath, imageContext = null) {
   try {
     console.log('🔍 Iniciando análisis de detección de objetos...');
     
     // Análisis paralelo con Sharp (metadata y stats) y Jimp (píxeles)
     const [sharpAnalysis, jimpAnalysis] = await Promise.all([
-      analyzeWithSharp(filePath),
-      analyzeWithJimp(filePath)
+      analyzeWithSharp(filePath, imageContext),
+      analyzeWithJimp(filePath, imageContext)
     ]);
 
     // Combinar resultados
@@ -93,12 +95,18 @@ async function analyzeImage(filePath) {
 /**
  * Análisis con Sharp (rápido, metadata y stats)
  */
-async function analyzeWithSharp(filePath) {
+async function analyzeWithSharp(filePath, imageContext = null) {
   const startTime = Date.now();
   
-  const image = sharp(filePath);
-  const metadata = await image.metadata();
-  const stats = await image.stats();
+  let metadata, stats;
+  if (imageContext) {
+    metadata = imageContext.metadata;
+    stats = await imageContext.getStats();
+  } else {
+    const image = sharp(filePath);
+    metadata = await image.metadata();
+    stats = await image.stats();
+  }
 
   // Calcular brillo promedio
   const brightness = stats.channels.reduce((sum, ch) => sum + ch.mean, 0) / stats.channels.length;
@@ -124,8 +132,10 @@ async function analyzeWithSharp(filePath) {
 /**
  * Análisis con Jimp (análisis de píxeles)
  */
-async function analyzeWithJimp(filePath) {
-  const image = await jimp.read(filePath);
+async function analyzeWithJimp(filePath, imageContext = null) {
+  const image = imageContext
+    ? await imageContext.getJimpImage(ImageContext.SIZES.LARGE)
+    : await jimp.read(filePath);
   
   // Análisis de colores dominantes
   const dominantColors = extractDominantColors(image);
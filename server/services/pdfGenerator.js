@@ -17,77 +17,63 @@ class PDFGenerator {
   }
 
   /**
-   * Genera un PDF completo del informe
+   * Crea el documento vacío del informe. Quien lo use se suscribe a su
+   * stream antes de llamar a writeDocument, así recibe cada página en cuanto
+   * pdfkit la termina y no el documento entero al final.
    * @param {Object} reportData - Datos del reporte
-   * @param {Object} analysis - Análisis asociado
    * @param {Object} user - Usuario que genera el reporte
-   * @returns {Promise<string>} - Ruta del archivo PDF generado
+   * @returns {PDFDocument}
    */
-  async generateReport(reportData, analysis, user) {
-    return new Promise((resolve, reject) => {
-      try {
-        // Nombre del archivo PDF
-        const fileName = `UAP-Report-${Date.now()}.pdf`;
-        const filePath = path.join(this.reportsDir, fileName);
-
-        // Crear documento PDF
-        const doc = new PDFDocument({
-          size: 'A4',
-          margins: {
-            top: 50,
-            bottom: 50,
-            left: 50,
-            right: 50
-          },
-          info: {
-            Title: `Informe UAP ${reportData.reportNumber || ''}`,
-            Author: user.username || 'UAP Analysis System',
-            Subject: 'Análisis de Fenómeno Aéreo No Identificado',
-            Keywords: 'UAP, OVNI, UFO, Análisis',
-            CreationDate: new Date()
-          }
-        });
-
-        // Stream al archivo
-        const stream = fs.createWriteStream(filePath);
-        doc.pipe(stream);
-
-        // CONTENIDO DEL PDF
-        this._addHeader(doc, reportData);
-        this._addSeparator(doc);
-        this._addReportInfo(doc, reportData);
-        this._addSeparator(doc);
-        this._addSightingDetails(doc, reportData);
-        this._addSeparator(doc);
-        this._addAnalysisResults(doc, analysis);
-        this._addSeparator(doc);
-        this._addExifData(doc, analysis);
-        this._addSeparator(doc);
-        this._addAIAnalysis(doc, analysis);
-        this._addSeparator(doc);
-        this._addExternalValidation(doc, analysis);
-        this._addSeparator(doc);
-        this._addConclusions(doc, analysis, reportData);
-        this._addFooter(doc);
-
-        // Finalizar documento
-        doc.end();
-
-        // Esperar a que termine de escribirse
-        stream.on('finish', () => {
-          resolve(filePath);
-        });
-
-        stream.on('error', (error) => {
-          reject(error);
-        });
-
-      } catch (error) {
-        reject(error);
+  openDocument(reportData, user) {
+    return new PDFDocument({
+      size: 'A4',
+      margins: {
+        top: 50,
+        bottom: 50,
+        left: 50,
+        right: 50
+      },
+      info: {
+        Title: `Informe UAP ${reportData.reportNumber || ''}`,
+        Author: user?.username || 'UAP Analysis System',
+        Subject: 'Análisis de Fenómeno Aéreo No Identificado',
+        Keywords: 'UAP, OVNI, UFO, Análisis',
+        CreationDate: new Date()
       }
     });
   }
 
+  /**
+   * Escribe el contenido del informe y finaliza el documento (doc.end())
+   * @param {PDFDocument} doc - Documento de openDocument
+   * @param {Object} reportData - Datos del reporte
+   * @param {Object} analysis - Análisis asociado
+   * @param {Object} options - { imagePath: JPEG reducido de la imagen analizada }
+   */
+  writeDocument(doc, reportData, analysis, { imagePath = null } = {}) {
+    // CONTENIDO DEL PDF
+    this._addHeader(doc, reportData);
+    this._addSeparator(doc);
+    this._addReportInfo(doc, reportData);
+    this._addSeparator(doc);
+    this._addSightingDetails(doc, reportData);
+    this._addSeparator(doc);
+    this._addAnalysisResults(doc, analysis);
+    this._addImage(doc, imagePath);
+    this._addSeparator(doc);
+    this._addExifData(doc, analysis);
+    this._addSeparator(doc);
+    this._addAIAnalysis(doc, analysis);
+    this._addSeparator(doc);
+    this._addExternalValidation(doc, analysis);
+    this._addSeparator(doc);
+    this._addConclusions(doc, analysis, reportData);
+    this._addFooter(doc);
+
+    // Finalizar documento
+    doc.end();
+  }
+
   /**
    * Añade el encabezado del documento
    */
@@ -248,6 +234,24 @@ class PDFGenerator {
     doc.moveDown(0.5);
   }
 
+  /**
+   * Añade la imagen analizada (copia reducida, ver reportRenderService)
+   */
+  _addImage(doc, imagePath) {
+    if (!imagePath || !fs.existsSync(imagePath)) return;
+
+    const maxHeight = 280;
+    if (doc.y + maxHeight > doc.page.height - doc.page.margins.bottom) {
+      doc.addPage();
+    }
+
+    doc.image(imagePath, {
+      fit: [doc.page.width - 100, maxHeight],
+      align: 'center'
+    });
+    doc.moveDown(1);
+  }
+
   /**
    * Añade datos EXIF
    */
@@ -722,3 +726,5 @@ class PDFGenerator {
 }
 
 module.exports = new PDFGenerator();
+// Subir al cambiar el contenido o el diseño del informe (invalida los PDF en caché)
+module.exports.TEMPLATE_VERSION = 3;
@@ -0,0 +1,338 @@
+/**
+ * ÍNDICE DE HASHES PERCEPTUALES (detección de re-subidas y montajes conocidos)
+ *
+ * Cada análisis de imagen guarda un aHash de 64 bits
+ * (visualAnalysis.perceptualHash, cadena binaria). Este índice mantiene en
+ * memoria los hashes de todo el histórico de Analysis en un BK-tree sobre la
+ * distancia de Hamming, de modo que "análisis a distancia <= d" solo recorre
+ * las ramas que la desigualdad triangular no descarta, en lugar de comparar
+ * contra todo el archivo.
+ *
+ * - Los hashes se guardan como dos enteros de 32 bits (popcount sobre XOR)
+ * - Hashes idénticos comparten nodo; los borrados dejan el nodo vacío y el
+ *   árbol se reconstruye cuando los nodos vacíos dominan
+ * - Hashes con muy poca información (casi todo 0 o todo 1: cielos nocturnos
+ *   casi negros) no se indexan ni se consultan: colisionan entre sí
+ * - Se carga al arrancar y se mantiene con los hooks del modelo Analysis;
+ *   las escrituras por consulta (updateMany/deleteMany) programan una recarga
+ */
+
+const Analysis = require('../models/Analysis');
+const { envInt } = require('../utils/env');
+
+const HASH_BITS = 64;
+const MIN_BITS = envInt('PHASH_MIN_BITS', 4);
+const RELOAD_DELAY_MS = envInt('PHASH_RELOAD_DELAY_SEC', 30) * 1000;
+
+// Categorías de análisis que cuentan como fraude conocido
+const HOAX_CATEGORIES = new Set(['hoax', 'fake']);
+
+const INDEX_FIELDS = 'visualAnalysis.perceptualHash aiAnalysis.category status userId isPublic fileName createdAt';
+
+function popcount32(value) {
+  value -= (value >>> 1) & 0x55555555;
+  value = (value & 0x33333333) + ((value >>> 2) & 0x33333333);
+  value = (value + (value >>> 4)) & 0x0f0f0f0f;
+  return Math.imul(value, 0x01010101) >>> 24;
+}
+
+/**
+ * Cadena binaria de 64 bits -> { hi, lo } (null si no es un hash válido)
+ */
+function parseHash(hash) {
+  if (typeof hash !== 'string' || hash.length !== HASH_BITS || /[^01]/.test(hash)) {
+    return null;
+  }
+  return {
+    hi: parseInt(hash.slice(0, 32), 2) >>> 0,
+    lo: parseInt(hash.slice(32), 2) >>> 0
+  };
+}
+
+function distance(a, b) {
+  return popcount32(a.hi ^ b.hi) + popcount32(a.lo ^ b.lo);
+}
+
+function isInformative(parsed) {
+  const bits = popcount32(parsed.hi) + popcount32(parsed.lo);
+  return bits >= MIN_BITS && bits <= HASH_BITS - MIN_BITS;
+}
+
+class PerceptualHashIndexService {
+  constructor() {
+    this.root = null;
+    this.entries = new Map();   // analysisId -> { node, meta }
+    this.nodes = 0;
+    this.emptyNodes = 0;
+
+    this.loaded = false;
+    this.loading = null;
+    this.pendingOps = null;     // Cambios recibidos durante una carga
+    this.reloadTimer = null;
+
+    this.stats = { queries: 0, visited: 0, matches: 0, reloads: 0 };
+  }
+
+  /**
+   * Cargar (o recargar) los hashes de todos los análisis
+   */
+  async load() {
+    this.pendingOps = [];
+    const startTime = Date.now();
+
+    try {
+      const cursor = Analysis.find({ 'visualAnalysis.perceptualHash': { $type: 'string' } })
+        .select(INDEX_FIELDS)
+        .lean()
+        .cursor({ batchSize: 1000 });
+
+      this.clear();
+      for await (const doc of cursor) {
+        this.add(doc);
+      }
+
+      // Reaplicar cambios que llegaron mientras se leía la colección
+      const pending = this.pendingOps;
+      this.pendingOps = null;
+      pending.forEach(op => op());
+
+      this.loaded = true;
+      this.stats.reloads++;
+      console.log(`🧬 Índice de hashes perceptuales cargado: ${this.entries.size} análisis (${this.nodes} nodos) en ${Date.now() - startTime}ms`);
+    } finally {
+      this.pendingOps = null;
+      this.loading = null;
+    }
+  }
+
+  /**
+   * Esperar a que el índice esté cargado (carga perezosa en el primer uso)
+   */
+  async ensureLoaded() {
+    if (this.loaded) return;
+    if (!this.loading) {
+      this.loading = this.load();
+    }
+    await this.loading;
+  }
+
+  /**
+   * Recargar en breve (escrituras por consulta sin los documentos afectados)
+   */
+  scheduleReload() {
+    if (this.reloadTimer || !this.loaded) return;
+
+    this.reloadTimer = setTimeout(() => {
+      this.reloadTimer = null;
+      this.load().catch(error => console.error('⚠️ Error recargando el índice de hashes perceptuales:', error.message));
+    }, RELOAD_DELAY_MS);
+    this.reloadTimer.unref();
+  }
+
+  clear() {
+    this.root = null;
+    this.entries.clear();
+    this.nodes = 0;
+    this.emptyNodes = 0;
+  }
+
+  // ==================== MANTENIMIENTO ====================
+
+  /**
+   * Insertar o actualizar un análisis (documento Mongoose u objeto plano)
+   */
+  upsert(doc) {
+    if (!doc) return;
+    if (this.pendingOps) {
+      this.pendingOps.push(() => this.upsert(doc));
+    }
+
+    const id = String(doc._id);
+    const hash = doc.visualAnalysis?.perceptualHash;
+
+    // Documento cargado sin visualAnalysis: solo se refrescan los metadatos
+    if (hash === undefined && typeof doc.isSelected === 'function' && !doc.isSelected('visualAnalysis')) {
+      const entry = this.entries.get(id);
+      if (entry) entry.meta = { ...entry.meta, ...this.buildMeta(doc, entry.meta.hash) };
+      return;
+    }
+
+    this.removeEntry(id);
+    this.add(doc);
+  }
+
+  /**
+   * Quitar un análisis del índice
+   */
+  remove(analysisId) {
+    const id = String(analysisId);
+    if (this.pendingOps) {
+      this.pendingOps.push(() => this.remove(id));
+    }
+    this.removeEntry(id);
+  }
+
+  removeEntry(id) {
+    const entry = this.entries.get(id);
+    if (!entry) return;
+
+    this.entries.delete(id);
+    entry.node.ids.delete(id);
+    if (entry.node.ids.size === 0) {
+      entry.node.empty = true;
+      this.emptyNodes++;
+    }
+
+    // Demasiados nodos vacíos: las consultas recorrerían ramas inútiles
+    if (this.emptyNodes > 1000 && this.emptyNodes > this.nodes / 2) {
+      this.rebuild();
+    }
+  }
+
+  add(doc) {
+    const hash = doc.visualAnalysis?.perceptualHash;
+    const parsed = parseHash(hash);
+    if (!parsed || !isInformative(parsed)) return;
+
+    const id = String(doc._id);
+    const node = this.insertNode(parsed);
+    if (node.empty) {
+      node.empty = false;
+      this.emptyNodes--;
+    }
+    node.ids.add(id);
+    this.entries.set(id, { node, meta: this.buildMeta(doc, hash) });
+  }
+
+  buildMeta(doc, hash) {
+    const category = doc.aiAnalysis?.category || null;
+    return {
+      hash,
+      category,
+      isHoax: HOAX_CATEGORIES.has(category),
+      status: doc.status,
+      userId: doc.userId ? String(doc.userId) : null,
+      isPublic: !!doc.isPublic,
+      fileName: doc.fileName,
+      createdAt: doc.createdAt
+    };
+  }
+
+  /**
+   * Bajar por el árbol hasta el nodo del hash (creándolo si no existe)
+   */
+  insertNode(parsed) {
+    const create = () => {
+      this.nodes++;
+      return { hi: parsed.hi, lo: parsed.lo, ids: new Set(), children: new Map(), empty: false };
+    };
+
+    if (!this.root) {
+      this.root = create();
+      return this.root;
+    }
+
+    let node = this.root;
+    for (;;) {
+      const d = distance(node, parsed);
+      if (d === 0) return node;
+
+      const child = node.children.get(d);
+      if (!child) {
+        const created = create();
+        node.children.set(d, created);
+        return created;
+      }
+      node = child;
+    }
+  }
+
+  /**
+   * Reconstruir el árbol con las entradas vivas (sin tocar MongoDB)
+   */
+  rebuild() {
+    const entries = [...this.entries.entries()];
+    this.clear();
+    for (const [id, { meta }] of entries) {
+      const node = this.insertNode(parseHash(meta.hash));
+      node.ids.add(id);
+      this.entries.set(id, { node, meta });
+    }
+  }
+
+  // ==================== CONSULTAS ====================
+
+  /**
+   * Análisis cuyo hash está a distancia de Hamming <= maxDistance
+   * @param {string} hash - Hash perceptual (cadena binaria de 64 bits)
+   * @param {Object} options - { maxDistance, limit, excludeId }
+   * @returns {Promise<Array>} Coincidencias ordenadas por distancia
+   */
+  async search(hash, options = {}) {
+    const { maxDistance = 5, limit = 10, excludeId = null } = options;
+    await this.ensureLoaded();
+
+    const parsed = parseHash(hash);
+    if (!parsed || !isInformative(parsed) || !this.root) return [];
+
+    const exclude = excludeId ? String(excludeId) : null;
+    const found = [];
+    const stack = [this.root];
+    let visited = 0;
+
+    while (stack.length > 0) {
+      const node = stack.pop();
+      visited++;
+
+      const d = distance(node, parsed);
+      if (d <= maxDistance) {
+        for (const id of node.ids) {
+          if (id !== exclude) found.push({ id, distance: d });
+        }
+      }
+
+      // Desigualdad triangular: solo los hijos con |k - d| <= maxDistance
+      for (const [k, child] of node.children) {
+        if (k >= d - maxDistance && k <= d + maxDistance) stack.push(child);
+      }
+    }
+
+    this.stats.queries++;
+    this.stats.visited += visited;
+    this.stats.matches += found.length;
+
+    return found
+      .sort((a, b) => a.distance - b.distance)
+      .slice(0, limit)
+      .map(({ id, distance: d }) => {
+        const { hash: _hash, ...meta } = this.entries.get(id).meta;
+        return {
+          analysisId: id,
+          distance: d,
+          similarity: Math.round((1 - d / HASH_BITS) * 100),
+          ...meta
+        };
+      });
+  }
+
+  /**
+   * Estadísticas del índice
+   */
+  getStats() {
+    return {
+      loaded: this.loaded,
+      entries: this.entries.size,
+      nodes: this.nodes,
+      emptyNodes: this.emptyNodes,
+      queries: this.stats.queries,
+      matches: this.stats.matches,
+      reloads: this.stats.reloads,
+      avgVisitedNodes: this.stats.queries > 0
+        ? Math.round(this.stats.visited / this.stats.queries)
+        : 0
+    };
+  }
+}
+
+module.exports = new PerceptualHashIndexService();
+module.exports.PerceptualHashIndexService = PerceptualHashIndexService;
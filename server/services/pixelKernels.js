@@ -0,0 +1,1233 @@
+/**
+ * KERNELS DE PÍXELES
+ *
+ * Bucles por píxel de las capas de análisis, escritos como funciones puras
+ * sobre buffers crudos (sin sharp, sin Jimp, sin Mongo). Así pueden
+ * ejecutarse tanto en el hilo principal como dentro de un worker_thread
+ * (ver workerPoolService y workers/pixelKernelWorker.js).
+ *
+ * Cada kernel recibe un único objeto de argumentos serializable y devuelve
+ * un resultado pequeño (números/objetos planos), nunca buffers grandes.
+ */
+
+// ==================== UTILIDADES DE REGIONES ====================
+
+/**
+ * Rectángulos de una rejilla rows x cols (misma partición que
+ * ForensicAnalysisService.divideIntoRegions)
+ */
+function regionGrid(width, height, rows, cols) {
+  const regions = [];
+  const regionWidth = Math.floor(width / cols);
+  const regionHeight = Math.floor(height / rows);
+
+  for (let r = 0; r < rows; r++) {
+    for (let c = 0; c < cols; c++) {
+      const startX = c * regionWidth;
+      const startY = r * regionHeight;
+      regions.push({
+        x: startX,
+        y: startY,
+        endX: Math.min(startX + regionWidth, width),
+        endY: Math.min(startY + regionHeight, height)
+      });
+    }
+  }
+
+  return regions;
+}
+
+// ==================== FORENSE ====================
+
+/**
+ * Dirección de luz dominante (grados 0-360) de cada región de la rejilla
+ */
+function forensicLighting({ data, width, channels, height, rows, cols }) {
+  const stride = width * channels;
+
+  return regionGrid(width, height, rows, cols).map(region => {
+    let sumX = 0, sumY = 0, count = 0;
+
+    for (let y = region.y + 1; y < region.endY - 1; y++) {
+      for (let x = region.x + 1; x < region.endX - 1; x++) {
+        const idx = y * stride + x * channels;
+
+        const current = (data[idx] + data[idx + 1] + data[idx + 2]) / 3;
+        const right = (data[idx + channels] + data[idx + channels + 1] + data[idx + channels + 2]) / 3;
+        const down = (data[idx + stride] + data[idx + stride + 1] + data[idx + stride + 2]) / 3;
+
+        sumX += right - current;
+        sumY += down - current;
+        count++;
+      }
+    }
+
+    const angle = Math.atan2(sumY / count, sumX / count) * (180 / Math.PI);
+    return angle >= 0 ? angle : angle + 360;
+  });
+}
+
+/**
+ * Nivel de ruido de alta frecuencia de cada región de la rejilla
+ */
+function forensicNoise({ data, width, height, channels, rows, cols }) {
+  const stride = width * channels;
+
+  return regionGrid(width, height, rows, cols).map(region => {
+    let sum = 0, count = 0;
+
+    for (let y = region.y; y < region.endY - 1; y++) {
+      for (let x = region.x; x < region.endX - 1; x++) {
+        const idx = y * stride + x * channels;
+
+        for (let c = 0; c < 3; c++) {
+          const current = data[idx + c];
+          const right = data[idx + channels + c];
+          const down = data[idx + stride + c];
+
+          sum += Math.abs(right - current) + Math.abs(down - current);
+          count += 2;
+        }
+      }
+    }
+
+    return sum / count;
+  });
+}
+
+/**
+ * Magnitud Sobel (0-255) sobre la luminosidad media RGB
+ */
+function sobelMagnitude(data, width, height, channels) {
+  const edges = new Uint8Array(width * height);
+
+  const sobelX = [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]];
+  const sobelY = [[-1, -2, -1], [0, 0, 0], [1, 2, 1]];
+
+  for (let y = 1; y < height - 1; y++) {
+    for (let x = 1; x < width - 1; x++) {
+      let gx = 0, gy = 0;
+
+      for (let ky = -1; ky <= 1; ky++) {
+        for (let kx = -1; kx <= 1; kx++) {
+          const idx = ((y + ky) * width + (x + kx)) * channels;
+          const gray = (data[idx] + data[idx + 1] + data[idx + 2]) / 3;
+
+          gx += gray * sobelX[ky + 1][kx + 1];
+          gy += gray * sobelY[ky + 1][kx + 1];
+        }
+      }
+
+      const magnitude = Math.sqrt(gx * gx + gy * gy);
+      edges[y * width + x] = Math.min(magnitude, 255);
+    }
+  }
+
+  return edges;
+}
+
+/**
+ * Densidad media de bordes Sobel de cada región de la rejilla
+ */
+function forensicEdges({ data, width, height, channels, rows, cols }) {
+  const edges = sobelMagnitude(data, width, height, channels);
+
+  return regionGrid(width, height, rows, cols).map(region => {
+    let sum = 0;
+    for (let y = region.y; y < region.endY; y++) {
+      for (let x = region.x; x < region.endX; x++) {
+        sum += edges[y * width + x];
+      }
+    }
+    return sum / ((region.endX - region.x) * (region.endY - region.y));
+  });
+}
+
+/**
+ * Hash 8x8 de un bloque (promedio RGB cuantizado a 16 niveles), escrito en
+ * `out` a partir de `offset`
+ */
+function blockHash(data, width, height, channels, startX, startY, blockSize, out, offset) {
+  const step = Math.max(1, Math.floor(blockSize / 8));
+  let i = offset;
+
+  for (let y = 0; y < blockSize; y += step) {
+    for (let x = 0; x < blockSize; x += step) {
+      const imgY = Math.min(startY + y, height - 1);
+      const imgX = Math.min(startX + x, width - 1);
+      const idx = (imgY * width + imgX) * channels;
+
+      const avg = (data[idx] + data[idx + 1] + data[idx + 2]) / 3;
+      out[i++] = Math.round(avg / 16);
+    }
+  }
+
+  return i - offset;
+}
+
+/**
+ * Reducir una imagen por un factor entero (promedio de cada celda factor x factor)
+ */
+function downscale(data, width, height, channels, factor) {
+  const w = Math.floor(width / factor);
+  const h = Math.floor(height / factor);
+  const out = new Uint8Array(w * h * channels);
+  const area = factor * factor;
+
+  for (let y = 0; y < h; y++) {
+    for (let x = 0; x < w; x++) {
+      for (let c = 0; c < channels; c++) {
+        let sum = 0;
+        for (let dy = 0; dy < factor; dy++) {
+          const row = ((y * factor + dy) * width + x * factor) * channels + c;
+          for (let dx = 0; dx < factor; dx++) {
+            sum += data[row + dx * channels];
+          }
+        }
+        out[(y * w + x) * channels + c] = Math.round(sum / area);
+      }
+    }
+  }
+
+  return { data: out, width: w, height: h };
+}
+
+/**
+ * Pares de bloques clonados en una escala
+ *
+ * Los bloques se ordenan por la suma de su hash y cada bloque solo se compara
+ * con los siguientes de ese orden cuya suma difiere menos que la distancia
+ * L1 máxima admitida (cota exacta: |Σa - Σb| <= Σ|a - b|), con un máximo de
+ * `maxNeighbors` comparaciones por bloque. Antes de la comparación completa
+ * se descarta con la distancia entre sumas por cuadrante (también cota
+ * inferior de la L1). Coste: O(n log n + n · maxNeighbors · 64).
+ */
+function cloningPairsAtScale(data, width, height, channels, options) {
+  const { blockSize, threshold, maxNeighbors, maxBlocks, minContrast } = options;
+
+  // Paso de la rejilla: medio bloque, ampliado si se superaría maxBlocks
+  let stride = blockSize / 2;
+  const gridBlocks = (s) => Math.max(0, Math.ceil((width - blockSize) / s)) * Math.max(0, Math.ceil((height - blockSize) / s));
+  while (gridBlocks(stride) > maxBlocks) stride += blockSize / 2;
+
+  const total = gridBlocks(stride);
+  const hashLength = Math.pow(Math.ceil(blockSize / Math.max(1, Math.floor(blockSize / 8))), 2);
+  const side = Math.sqrt(hashLength);
+  const hashes = new Uint8Array(total * hashLength);
+  const xs = new Int32Array(total);
+  const ys = new Int32Array(total);
+  const sums = new Int32Array(total);
+  const energies = new Float32Array(total);
+  const histogram = new Int32Array(17);
+  const quads = new Int32Array(total * 4);
+
+  let n = 0;
+  let flat = 0;
+  for (let y = 0; y < height - blockSize; y += stride) {
+    for (let x = 0; x < width - blockSize; x += stride) {
+      const offset = n * hashLength;
+      blockHash(data, width, height, channels, x, y, blockSize, hashes, offset);
+
+      let min = 255;
+      let max = 0;
+      let sum = 0;
+      for (let i = 0; i < hashLength; i++) {
+        const v = hashes[offset + i];
+        if (v < min) min = v;
+        if (v > max) max = v;
+        sum += v;
+        quads[n * 4 + (Math.floor(i / side) < side / 2 ? 0 : 2) + (i % side < side / 2 ? 0 : 1)] += v;
+      }
+
+      // Bloques planos (cielo, fondo uniforme): son "iguales" entre sí sin
+      // que haya clonación; se excluyen
+      if (max - min < minContrast) {
+        quads.fill(0, n * 4, n * 4 + 4);
+        flat++;
+        continue;
+      }
+
+      // Textura: desviación absoluta respecto a la mediana (no la media, para
+      // que un bloque casi plano con un borde tenga textura baja)
+      histogram.fill(0);
+      for (let i = 0; i < hashLength; i++) histogram[hashes[offset + i]]++;
+      let median = 0;
+      for (let seen = 0; seen + histogram[median] <= hashLength / 2; median++) seen += histogram[median];
+      let energy = 0;
+      for (let v = 0; v < histogram.length; v++) energy += histogram[v] * Math.abs(v - median);
+
+      xs[n] = x;
+      ys[n] = y;
+      sums[n] = sum;
+      energies[n] = energy;
+      n++;
+    }
+  }
+
+  const order = Array.from({ length: n }, (_, i) => i).sort((a, b) => sums[a] - sums[b]);
+
+  // similitud > threshold  <=>  distancia L1 < maxL1
+  const maxL1 = (1 - threshold) * hashLength * 15;
+  const minDistance = blockSize * 2;
+  const pairs = [];
+  let comparisons = 0;
+
+  for (let p = 0; p < n; p++) {
+    const a = order[p];
+    const limit = Math.min(n, p + 1 + maxNeighbors);
+
+    for (let q = p + 1; q < limit; q++) {
+      const b = order[q];
+      if (sums[b] - sums[a] >= maxL1) break;
+
+      // Ignorar bloques muy cercanos (son naturalmente similares)
+      if (Math.abs(xs[a] - xs[b]) + Math.abs(ys[a] - ys[b]) <= minDistance) continue;
+
+      let bound = 0;
+      for (let k = 0; k < 4; k++) bound += Math.abs(quads[a * 4 + k] - quads[b * 4 + k]);
+      if (bound >= maxL1) continue;
+
+      comparisons++;
+      let l1 = 0;
+      const oa = a * hashLength;
+      const ob = b * hashLength;
+      for (let i = 0; i < hashLength && l1 < maxL1; i++) {
+        l1 += Math.abs(hashes[oa + i] - hashes[ob + i]);
+      }
+      // La diferencia debe ser pequeña también respecto a la textura propia
+      // de los bloques: casi planos con un borde (horizonte) no cuentan
+      if (l1 >= maxL1 || l1 * 4 > Math.min(energies[a], energies[b])) continue;
+
+      pairs.push({
+        a: { x: xs[a], y: ys[a] },
+        b: { x: xs[b], y: ys[b] },
+        similarity: 1 - l1 / (hashLength * 15)
+      });
+    }
+  }
+
+  return { pairs, totalBlocks: total, flatBlocks: flat, comparisons, stride };
+}
+
+/**
+ * Detección de clonación (copia-pega) por bloques solapados, multi-escala
+ *
+ * En cada escala (1 = resolución recibida, 0.5 = mitad...) se buscan pares de
+ * bloques casi idénticos comparando solo vecinos en el orden por descriptor
+ * (ver cloningPairsAtScale). Los pares se agrupan por vector de
+ * desplazamiento: una región copiada produce muchos pares con el mismo
+ * desplazamiento, que se reportan como una región (origen y destino).
+ *
+ * Una misma clonación suele aparecer en varias escalas: `clonedCount` es el
+ * máximo de pares de una sola escala (no la suma) y las regiones de una escala
+ * más gruesa que repiten una ya encontrada a más resolución (desplazamiento
+ * equivalente y destino solapado) se descartan.
+ *
+ * Tiempo acotado: como mucho `maxBlocks` bloques y `maxNeighbors`
+ * comparaciones por bloque en cada escala. Con una imagen de 1200x900 son
+ * ~4.000 bloques y ~250.000 comparaciones de 64 valores en el peor caso.
+ */
+function forensicCloning({
+  data, width, height, channels, blockSize, threshold, maxDetails,
+  scales = [1], maxNeighbors = 64, maxBlocks = 20000, minContrast = 2, maxRegions = 5
+}) {
+  const options = { blockSize, threshold, maxNeighbors, maxBlocks, minContrast };
+  const regions = new Map();
+  const details = [];
+  const scaleStats = [];
+  let clonedCount = 0;
+  let totalBlocks = 0;
+
+  for (const scale of scales) {
+    const factor = Math.max(1, Math.round(1 / scale));
+    const image = factor === 1
+      ? { data, width, height }
+      : downscale(data, width, height, channels, factor);
+
+    const { pairs, totalBlocks: blocks, flatBlocks, comparisons, stride } = cloningPairsAtScale(
+      image.data, image.width, image.height, channels, options
+    );
+
+    totalBlocks += blocks;
+    clonedCount = Math.max(clonedCount, pairs.length);
+    scaleStats.push({ scale: 1 / factor, blocks, flatBlocks, comparisons, stride: stride * factor, pairs: pairs.length });
+
+    const size = blockSize * factor;
+    for (const pair of pairs) {
+      // Coordenadas en la resolución recibida; origen = bloque más arriba/izquierda
+      let src = { x: pair.a.x * factor, y: pair.a.y * factor };
+      let dst = { x: pair.b.x * factor, y: pair.b.y * factor };
+      if (dst.y < src.y || (dst.y === src.y && dst.x < src.x)) [src, dst] = [dst, src];
+
+      if (details.length < maxDetails) {
+        details.push({ block1: src, block2: dst, similarity: pair.similarity });
+      }
+
+      const key = `${factor}:${dst.x - src.x},${dst.y - src.y}`;
+      let region = regions.get(key);
+      if (!region) {
+        region = {
+          scale: 1 / factor,
+          shift: { dx: dst.x - src.x, dy: dst.y - src.y },
+          pairs: 0,
+          similaritySum: 0,
+          source: { x1: Infinity, y1: Infinity, x2: 0, y2: 0 },
+          target: { x1: Infinity, y1: Infinity, x2: 0, y2: 0 }
+        };
+        regions.set(key, region);
+      }
+      region.pairs++;
+      region.similaritySum += pair.similarity;
+      extendBox(region.source, src, size);
+      extendBox(region.target, dst, size);
+    }
+  }
+
+  const matchedRegions = dedupeRegionsAcrossScales(Array.from(regions.values()), blockSize)
+    .sort((a, b) => b.pairs - a.pairs)
+    .slice(0, maxRegions)
+    .map(({ similaritySum, ...region }) => ({
+      ...region,
+      similarity: Math.round((similaritySum / region.pairs) * 1000) / 1000
+    }));
+
+  return { clonedCount, totalBlocks, details, regions: matchedRegions, scales: scaleStats };
+}
+
+/**
+ * Quitar las regiones de escalas gruesas que repiten una región de una escala
+ * más fina: desplazamiento a menos de un bloque (de la escala gruesa) y
+ * destinos solapados
+ */
+function dedupeRegionsAcrossScales(regions, blockSize) {
+  const kept = [];
+  const byScale = [...regions].sort((a, b) => b.scale - a.scale);
+
+  for (const region of byScale) {
+    const tolerance = blockSize / region.scale;
+    const duplicate = kept.some(other => other.scale > region.scale &&
+      Math.abs(other.shift.dx - region.shift.dx) <= tolerance &&
+      Math.abs(other.shift.dy - region.shift.dy) <= tolerance &&
+      boxesOverlap(other.target, region.target));
+    if (!duplicate) kept.push(region);
+  }
+
+  return kept;
+}
+
+function boxesOverlap(a, b) {
+  return a.x1 < b.x2 && b.x1 < a.x2 && a.y1 < b.y2 && b.y1 < a.y2;
+}
+
+function extendBox(box, block, size) {
+  box.x1 = Math.min(box.x1, block.x);
+  box.y1 = Math.min(box.y1, block.y);
+  box.x2 = Math.max(box.x2, block.x + size);
+  box.y2 = Math.max(box.y2, block.y + size);
+}
+
+// ==================== ANÁLISIS VISUAL ====================
+
+/**
+ * Puntos brillantes muestreados cada `step` píxeles
+ */
+function lightPatternScan({ data, width, height, channels, step, threshold }) {
+  const brightSpots = [];
+
+  for (let y = 0; y < height; y += step) {
+    for (let x = 0; x < width; x += step) {
+      const idx = (y * width + x) * channels;
+      const r = data[idx];
+      const g = data[idx + 1];
+      const b = data[idx + 2];
+      const brightness = (r + g + b) / 3;
+
+      if (brightness > threshold) {
+        brightSpots.push({ x, y, brightness, r, g, b });
+      }
+    }
+  }
+
+  return brightSpots;
+}
+
+/**
+ * Área de objeto y compacidad sobre una imagen binarizada (1 canal)
+ */
+function shapeScan({ data, width, height }) {
+  let objectPixels = 0;
+  for (let i = 0; i < data.length; i++) {
+    if (data[i] > 128) objectPixels++;
+  }
+
+  // Compacidad: ratio área/perímetro (círculo perfecto = 1)
+  let perimeter = 0;
+  let area = 0;
+
+  for (let y = 1; y < height - 1; y++) {
+    for (let x = 1; x < width - 1; x++) {
+      const idx = y * width + x;
+      if (data[idx] > 128) {
+        area++;
+        if (data[idx - 1] <= 128 || data[idx + 1] <= 128 ||
+            data[idx - width] <= 128 || data[idx + width] <= 128) {
+          perimeter++;
+        }
+      }
+    }
+  }
+
+  const compactness = perimeter === 0
+    ? 0
+    : Math.min((4 * Math.PI * area) / (perimeter * perimeter), 1);
+
+  return { objectPixels, compactness };
+}
+
+// ==================== IA LOCAL ====================
+
+/**
+ * Brillo medio y contraste (max-min) de una región de un bitmap RGBA.
+ * Las coordenadas se redondean y limitan como en Jimp.getPixelColor.
+ */
+function regionBrightnessContrast(data, width, height, region) {
+  let sum = 0, count = 0;
+  let min = 255, max = 0;
+
+  for (let y = region.y; y < Math.min(region.y + region.h, height); y++) {
+    const yi = Math.min(Math.round(y), height - 1);
+    for (let x = region.x; x < Math.min(region.x + region.w, width); x++) {
+      const xi = Math.min(Math.round(x), width - 1);
+      const idx = (yi * width + xi) * 4;
+      const brightness = (data[idx] + data[idx + 1] + data[idx + 2]) / 3;
+
+      sum += brightness;
+      count++;
+      if (brightness < min) min = brightness;
+      if (brightness > max) max = brightness;
+    }
+  }
+
+  return {
+    brightness: count > 0 ? sum / count : 0,
+    contrast: max - min
+  };
+}
+
+/**
+ * Escaneo de regiones de LocalAIService: cuadrantes (brillo/contraste)
+ * y rejilla de regiones brillantes
+ */
+function localAiRegionScan({ data, width, height, quadrants, gridSize, brightThreshold }) {
+  const quadrantStats = quadrants.map(region => regionBrightnessContrast(data, width, height, region));
+
+  const brightRegions = [];
+  for (let y = 0; y < height; y += gridSize) {
+    for (let x = 0; x < width; x += gridSize) {
+      const { brightness } = regionBrightnessContrast(data, width, height, { x, y, w: gridSize, h: gridSize });
+      if (brightness > brightThreshold) {
+        brightRegions.push({ x, y, brightness });
+      }
+    }
+  }
+
+  return { quadrantStats, brightRegions };
+}
+
+// ==================== CARACTERÍSTICAS CIENTÍFICAS ====================
+
+/**
+ * 1. MORFOLOGÍA - Análisis cuantitativo de forma
+ */
+function extractMorphology(buffer, info) {
+  const { width, height, channels } = info;
+
+  // Binarización: separar objeto de fondo
+  const threshold = 128;
+  let objectPixels = 0;
+  let backgroundPixels = 0;
+  let perimeterPixels = 0;
+
+  const binaryImage = new Uint8Array(width * height);
+
+  for (let y = 0; y < height; y++) {
+    for (let x = 0; x < width; x++) {
+      const idx = (y * width + x) * channels;
+      const intensity = (buffer[idx] + buffer[idx + 1] + buffer[idx + 2]) / 3;
+
+      const binaryIdx = y * width + x;
+      binaryImage[binaryIdx] = intensity > threshold ? 1 : 0;
+
+      if (binaryImage[binaryIdx] === 1) {
+        objectPixels++;
+      } else {
+        backgroundPixels++;
+      }
+    }
+  }
+
+  // Calcular perímetro (píxeles en el borde del objeto)
+  for (let y = 1; y < height - 1; y++) {
+    for (let x = 1; x < width - 1; x++) {
+      const idx = y * width + x;
+      if (binaryImage[idx] === 1) {
+        // Es objeto, verificar si está en borde
+        const neighbors = [
+          binaryImage[idx - 1],         // izquierda
+          binaryImage[idx + 1],         // derecha
+          binaryImage[idx - width],     // arriba
+          binaryImage[idx + width]      // abajo
+        ];
+        if (neighbors.includes(0)) {
+          perimeterPixels++;
+        }
+      }
+    }
+  }
+
+  const totalPixels = width * height;
+  const area = objectPixels / totalPixels; // Área relativa
+  const perimeter = perimeterPixels / Math.sqrt(totalPixels); // Perímetro normalizado
+
+  // Compacidad (circularidad): 4π*Area / Perimeter²
+  // Valor cercano a 1 = circular, menor = irregular
+  const compactness = perimeterPixels > 0
+    ? (4 * Math.PI * objectPixels) / (perimeterPixels * perimeterPixels)
+    : 0;
+
+  // Relación de aspecto (aproximada)
+  const aspectRatio = width / height;
+
+  return {
+    area,                    // 0-1 (fracción de imagen ocupada)
+    perimeter,              // Normalizado
+    compactness,            // 0-1 (1 = círculo perfecto)
+    aspectRatio,            // width/height
+    objectPixelCount: objectPixels,
+    perimeterPixelCount: perimeterPixels,
+    fillRatio: objectPixels / totalPixels
+  };
+}
+
+/**
+ * 2. HISTOGRAMA DE COLOR - Distribución estadística RGB
+ */
+function extractColorHistogram(buffer, info) {
+  const { width, height, channels } = info;
+  const totalPixels = width * height;
+
+  // Histogramas con 16 bins por canal (reducido para eficiencia)
+  const bins = 16;
+  const histR = new Array(bins).fill(0);
+  const histG = new Array(bins).fill(0);
+  const histB = new Array(bins).fill(0);
+
+  let sumR = 0, sumG = 0, sumB = 0;
+  let sumR2 = 0, sumG2 = 0, sumB2 = 0;
+
+  for (let i = 0; i < buffer.length; i += channels) {
+    const r = buffer[i];
+    const g = buffer[i + 1];
+    const b = buffer[i + 2];
+
+    // Acumular para estadísticas
+    sumR += r; sumG += g; sumB += b;
+    sumR2 += r * r; sumG2 += g * g; sumB2 += b * b;
+
+    // Asignar a bins
+    const binR = Math.min(Math.floor(r / 256 * bins), bins - 1);
+    const binG = Math.min(Math.floor(g / 256 * bins), bins - 1);
+    const binB = Math.min(Math.floor(b / 256 * bins), bins - 1);
+
+    histR[binR]++;
+    histG[binG]++;
+    histB[binB]++;
+  }
+
+  // Normalizar histogramas (convertir a probabilidad)
+  const normHistR = histR.map(v => v / totalPixels);
+  const normHistG = histG.map(v => v / totalPixels);
+  const normHistB = histB.map(v => v / totalPixels);
+
+  // Estadísticas de color
+  const meanR = sumR / totalPixels;
+  const meanG = sumG / totalPixels;
+  const meanB = sumB / totalPixels;
+
+  const stdR = Math.sqrt(sumR2 / totalPixels - meanR * meanR);
+  const stdG = Math.sqrt(sumG2 / totalPixels - meanG * meanG);
+  const stdB = Math.sqrt(sumB2 / totalPixels - meanB * meanB);
+
+  return {
+    histogramR: normHistR,
+    histogramG: normHistG,
+    histogramB: normHistB,
+    meanR, meanG, meanB,
+    stdR, stdG, stdB,
+    // Dominancia de color (cual canal es más fuerte)
+    dominantChannel: meanR > meanG && meanR > meanB ? 'R' : meanG > meanB ? 'G' : 'B'
+  };
+}
+
+/**
+ * 3. TEXTURA - Análisis de patrones y rugosidad
+ */
+function extractTexture(buffer, info) {
+  const { width, height, channels } = info;
+  const totalPixels = width * height;
+
+  // Convertir a escala de grises
+  const gray = new Float32Array(totalPixels);
+  for (let i = 0; i < totalPixels; i++) {
+    const idx = i * channels;
+    gray[i] = (buffer[idx] + buffer[idx + 1] + buffer[idx + 2]) / 3;
+  }
+
+  // Calcular entropía (medida de aleatoriedad/complejidad)
+  const histogram = new Array(256).fill(0);
+  for (let i = 0; i < totalPixels; i++) {
+    histogram[Math.floor(gray[i])]++;
+  }
+
+  let entropy = 0;
+  for (let i = 0; i < 256; i++) {
+    if (histogram[i] > 0) {
+      const p = histogram[i] / totalPixels;
+      entropy -= p * Math.log2(p);
+    }
+  }
+
+  // Calcular energía (uniformidad)
+  let energy = 0;
+  for (let i = 0; i < 256; i++) {
+    const p = histogram[i] / totalPixels;
+    energy += p * p;
+  }
+
+  // Calcular contraste (varianza local)
+  let contrast = 0;
+  for (let y = 1; y < height - 1; y++) {
+    for (let x = 1; x < width - 1; x++) {
+      const idx = y * width + x;
+      const center = gray[idx];
+      const neighbors = [
+        gray[idx - 1], gray[idx + 1],
+        gray[idx - width], gray[idx + width]
+      ];
+      const localVariance = neighbors.reduce((sum, val) => sum + Math.pow(val - center, 2), 0) / 4;
+      contrast += localVariance;
+    }
+  }
+  contrast /= totalPixels;
+
+  return {
+    entropy,        // Alta = imagen compleja, baja = uniforme
+    energy,         // Alta = uniforme, baja = variada
+    contrast,       // Varianza local promedio
+    smoothness: 1 - (1 / (1 + contrast)) // 0 = rugoso, 1 = suave
+  };
+}
+
+/**
+ * 4. BORDES - Detección de contornos con Sobel
+ */
+function extractEdges(buffer, info) {
+  const { width, height, channels } = info;
+  const totalPixels = width * height;
+
+  // Convertir a escala de grises
+  const gray = new Float32Array(totalPixels);
+  for (let i = 0; i < totalPixels; i++) {
+    const idx = i * channels;
+    gray[i] = (buffer[idx] + buffer[idx + 1] + buffer[idx + 2]) / 3;
+  }
+
+  // Operadores Sobel
+  const sobelX = [-1, 0, 1, -2, 0, 2, -1, 0, 1];
+  const sobelY = [-1, -2, -1, 0, 0, 0, 1, 2, 1];
+
+  let edgeStrength = 0;
+  let edgeCount = 0;
+  const edgeThreshold = 30;
+
+  for (let y = 1; y < height - 1; y++) {
+    for (let x = 1; x < width - 1; x++) {
+      let gx = 0, gy = 0;
+
+      // Convolución 3x3
+      for (let ky = -1; ky <= 1; ky++) {
+        for (let kx = -1; kx <= 1; kx++) {
+          const idx = (y + ky) * width + (x + kx);
+          const kernelIdx = (ky + 1) * 3 + (kx + 1);
+          gx += gray[idx] * sobelX[kernelIdx];
+          gy += gray[idx] * sobelY[kernelIdx];
+        }
+      }
+
+      const magnitude = Math.sqrt(gx * gx + gy * gy);
+      edgeStrength += magnitude;
+
+      if (magnitude > edgeThreshold) {
+        edgeCount++;
+      }
+    }
+  }
+
+  const avgEdgeStrength = edgeStrength / totalPixels;
+  const edgeDensity = edgeCount / totalPixels;
+
+  return {
+    averageEdgeStrength: avgEdgeStrength,
+    edgeDensity,                    // Fracción de píxeles que son bordes
+    totalEdgeStrength: edgeStrength,
+    hasStrongEdges: edgeDensity > 0.1  // >10% de píxeles son bordes
+  };
+}
+
+/**
+ * 5. MOMENTOS ESTADÍSTICOS - Distribución espacial
+ */
+function extractMoments(buffer, info) {
+  const { width, height, channels } = info;
+
+  // Calcular centro de masa (centroid)
+  let sumX = 0, sumY = 0, sumIntensity = 0;
+
+  for (let y = 0; y < height; y++) {
+    for (let x = 0; x < width; x++) {
+      const idx = (y * width + x) * channels;
+      const intensity = (buffer[idx] + buffer[idx + 1] + buffer[idx + 2]) / 3;
+
+      sumX += x * intensity;
+      sumY += y * intensity;
+      sumIntensity += intensity;
+    }
+  }
+
+  const centroidX = sumIntensity > 0 ? sumX / sumIntensity : width / 2;
+  const centroidY = sumIntensity > 0 ? sumY / sumIntensity : height / 2;
+
+  // Normalizar a 0-1
+  const normalizedCentroidX = centroidX / width;
+  const normalizedCentroidY = centroidY / height;
+
+  // Calcular momentos de segundo orden (dispersión)
+  let m20 = 0, m02 = 0, m11 = 0;
+
+  for (let y = 0; y < height; y++) {
+    for (let x = 0; x < width; x++) {
+      const idx = (y * width + x) * channels;
+      const intensity = (buffer[idx] + buffer[idx + 1] + buffer[idx + 2]) / 3;
+
+      const dx = x - centroidX;
+      const dy = y - centroidY;
+
+      m20 += dx * dx * intensity;
+      m02 += dy * dy * intensity;
+      m11 += dx * dy * intensity;
+    }
+  }
+
+  if (sumIntensity > 0) {
+    m20 /= sumIntensity;
+    m02 /= sumIntensity;
+    m11 /= sumIntensity;
+  }
+
+  // Excentricidad (qué tan "estirado" está el objeto)
+  const eccentricity = m20 !== m02
+    ? Math.sqrt(1 - Math.min(m20, m02) / Math.max(m20, m02))
+    : 0;
+
+  return {
+    centroidX: normalizedCentroidX,
+    centroidY: normalizedCentroidY,
+    moment20: m20,
+    moment02: m02,
+    moment11: m11,
+    eccentricity,  // 0 = circular, cercano a 1 = muy alargado
+    isCentered: Math.abs(normalizedCentroidX - 0.5) < 0.2 && Math.abs(normalizedCentroidY - 0.5) < 0.2
+  };
+}
+
+/**
+ * 6. CARACTERÍSTICAS GLOBALES - Propiedades generales
+ */
+function extractGlobalFeatures(buffer, info) {
+  const { width, height, channels } = info;
+  const totalPixels = width * height;
+
+  // Brillo promedio
+  let avgBrightness = 0;
+  let avgSaturation = 0;
+
+  for (let i = 0; i < buffer.length; i += channels) {
+    const r = buffer[i];
+    const g = buffer[i + 1];
+    const b = buffer[i + 2];
+
+    const brightness = (r + g + b) / 3;
+    avgBrightness += brightness;
+
+    const max = Math.max(r, g, b);
+    const min = Math.min(r, g, b);
+    const saturation = max > 0 ? (max - min) / max : 0;
+    avgSaturation += saturation;
+  }
+
+  avgBrightness /= totalPixels;
+  avgSaturation /= totalPixels;
+
+  return {
+    averageBrightness: avgBrightness / 255,  // Normalizado 0-1
+    averageSaturation: avgSaturation,         // 0-1
+    isDark: avgBrightness < 85,
+    isBright: avgBrightness > 170,
+    isColorful: avgSaturation > 0.3
+  };
+}
+
+/**
+ * Las seis familias por separado (implementación de referencia del motor
+ * fusionado; ver scripts/benchFeatureExtraction.js)
+ */
+function scientificFeaturesReference(buffer, info) {
+  return {
+    morphology: extractMorphology(buffer, info),
+    colorHistogram: extractColorHistogram(buffer, info),
+    texture: extractTexture(buffer, info),
+    edges: extractEdges(buffer, info),
+    moments: extractMoments(buffer, info),
+    global: extractGlobalFeatures(buffer, info)
+  };
+}
+
+// Tablas por suma de canales s = r + g + b (0-765). La intensidad (s / 3)
+// se usa en doble precisión en morfología, momentos y globales, y redondeada
+// a Float32 en textura y bordes (que trabajaban sobre un Float32Array de
+// grises): las tablas reproducen exactamente ambos valores.
+const SUM_LEVELS = 766;
+const INTENSITY = new Float64Array(SUM_LEVELS);
+const GRAY32 = new Float64Array(SUM_LEVELS);
+const GRAY_LEVEL = new Uint8Array(SUM_LEVELS);
+for (let s = 0; s < SUM_LEVELS; s++) {
+  INTENSITY[s] = s / 3;
+  GRAY32[s] = Math.fround(s / 3);
+  GRAY_LEVEL[s] = Math.floor(GRAY32[s]);
+}
+
+// Umbral de binarización de la morfología: intensidad > 128  <=>  s > 384
+const OBJECT_SUM = 3 * 128;
+const EDGE_THRESHOLD = 30;
+const HIST_BINS = 16;
+
+/**
+ * Motor fusionado de características científicas: las seis familias en dos
+ * recorridos sobre una vista gris (Uint16Array con r + g + b por píxel) en
+ * lugar de nueve recorridos del buffer con una copia gris por familia.
+ *
+ * 1. Sobre el buffer RGB: vista gris, histogramas RGB y de grises, sumas de
+ *    color, píxeles de objeto, centroide, brillo y saturación
+ * 2. Sobre la vista gris (ya con el centroide): momentos de segundo orden y,
+ *    en los píxeles interiores, perímetro, contraste local y Sobel con el
+ *    núcleo 3x3 desenrollado
+ *
+ * Cada acumulador recibe los mismos términos en el mismo orden que en las
+ * funciones extract*: el resultado es idéntico bit a bit.
+ */
+function fusedScientificFeatures(buffer, info) {
+  const { width, height, channels } = info;
+
+  // Imágenes de un canal: las funciones de referencia leen fuera del píxel
+  // y hay que reproducir su resultado tal cual
+  if (channels < 3) {
+    return scientificFeaturesReference(buffer, info);
+  }
+
+  const totalPixels = width * height;
+  const sums = new Uint16Array(totalPixels);
+
+  const histR = new Uint32Array(HIST_BINS);
+  const histG = new Uint32Array(HIST_BINS);
+  const histB = new Uint32Array(HIST_BINS);
+  const grayHistogram = new Uint32Array(256);
+
+  let sumR = 0, sumG = 0, sumB = 0;
+  let sumR2 = 0, sumG2 = 0, sumB2 = 0;
+  let objectPixels = 0;
+  let sumX = 0, sumY = 0, sumIntensity = 0;
+  let sumSaturation = 0;
+
+  // ---------- Recorrido 1: buffer RGB ----------
+  let i = 0;
+  for (let y = 0; y < height; y++) {
+    for (let x = 0; x < width; x++, i++) {
+      const idx = i * channels;
+      const r = buffer[idx];
+      const g = buffer[idx + 1];
+      const b = buffer[idx + 2];
+      const s = r + g + b;
+      sums[i] = s;
+
+      sumR += r; sumG += g; sumB += b;
+      sumR2 += r * r; sumG2 += g * g; sumB2 += b * b;
+      histR[r >> 4]++;
+      histG[g >> 4]++;
+      histB[b >> 4]++;
+
+      grayHistogram[GRAY_LEVEL[s]]++;
+      if (s > OBJECT_SUM) objectPixels++;
+
+      const intensity = INTENSITY[s];
+      sumX += x * intensity;
+      sumY += y * intensity;
+      sumIntensity += intensity;
+
+      const max = r > g ? (r > b ? r : b) : (g > b ? g : b);
+      const min = r < g ? (r < b ? r : b) : (g < b ? g : b);
+      sumSaturation += max > 0 ? (max - min) / max : 0;
+    }
+  }
+
+  const centroidX = sumIntensity > 0 ? sumX / sumIntensity : width / 2;
+  const centroidY = sumIntensity > 0 ? sumY / sumIntensity : height / 2;
+
+  // ---------- Recorrido 2: vista gris ----------
+  let m20 = 0, m02 = 0, m11 = 0;
+  let perimeterPixels = 0;
+  let contrast = 0;
+  let edgeStrength = 0;
+  let edgeCount = 0;
+
+  for (let y = 0; y < height; y++) {
+    const dy = y - centroidY;
+    const innerRow = y > 0 && y < height - 1;
+    let p = y * width;
+
+    for (let x = 0; x < width; x++, p++) {
+      const s = sums[p];
+      const intensity = INTENSITY[s];
+      const dx = x - centroidX;
+      m20 += dx * dx * intensity;
+      m02 += dy * dy * intensity;
+      m11 += dx * dy * intensity;
+
+      if (!innerRow || x === 0 || x === width - 1) continue;
+
+      const up = p - width;
+      const down = p + width;
+      const sLeft = sums[p - 1];
+      const sRight = sums[p + 1];
+      const sUp = sums[up];
+      const sDown = sums[down];
+
+      // Perímetro: píxel de objeto con algún vecino (4-conexión) de fondo
+      if (s > OBJECT_SUM &&
+          (sLeft <= OBJECT_SUM || sRight <= OBJECT_SUM || sUp <= OBJECT_SUM || sDown <= OBJECT_SUM)) {
+        perimeterPixels++;
+      }
+
+      // Contraste: varianza local con los 4 vecinos
+      const center = GRAY32[s];
+      const left = GRAY32[sLeft];
+      const right = GRAY32[sRight];
+      const top = GRAY32[sUp];
+      const bottom = GRAY32[sDown];
+      const dLeft = left - center;
+      const dRight = right - center;
+      const dTop = top - center;
+      const dBottom = bottom - center;
+      contrast += (dLeft * dLeft + dRight * dRight + dTop * dTop + dBottom * dBottom) / 4;
+
+      // Sobel 3x3 desenrollado (los términos de peso 0 no cambian la suma)
+      const topLeft = GRAY32[sums[up - 1]];
+      const topRight = GRAY32[sums[up + 1]];
+      const bottomLeft = GRAY32[sums[down - 1]];
+      const bottomRight = GRAY32[sums[down + 1]];
+      const gx = -topLeft + topRight - 2 * left + 2 * right - bottomLeft + bottomRight;
+      const gy = -topLeft - 2 * top - topRight + bottomLeft + 2 * bottom + bottomRight;
+
+      const magnitude = Math.sqrt(gx * gx + gy * gy);
+      edgeStrength += magnitude;
+      if (magnitude > EDGE_THRESHOLD) edgeCount++;
+    }
+  }
+
+  // ---------- Resultados (mismas fórmulas y claves que extract*) ----------
+  const area = objectPixels / totalPixels;
+  const compactness = perimeterPixels > 0
+    ? (4 * Math.PI * objectPixels) / (perimeterPixels * perimeterPixels)
+    : 0;
+
+  const meanR = sumR / totalPixels;
+  const meanG = sumG / totalPixels;
+  const meanB = sumB / totalPixels;
+
+  let entropy = 0;
+  let energy = 0;
+  for (let level = 0; level < 256; level++) {
+    if (grayHistogram[level] > 0) {
+      const probability = grayHistogram[level] / totalPixels;
+      entropy -= probability * Math.log2(probability);
+    }
+  }
+  for (let level = 0; level < 256; level++) {
+    const probability = grayHistogram[level] / totalPixels;
+    energy += probability * probability;
+  }
+  contrast /= totalPixels;
+
+  if (sumIntensity > 0) {
+    m20 /= sumIntensity;
+    m02 /= sumIntensity;
+    m11 /= sumIntensity;
+  }
+  const normalizedCentroidX = centroidX / width;
+  const normalizedCentroidY = centroidY / height;
+  const edgeDensity = edgeCount / totalPixels;
+  const avgBrightness = sumIntensity / totalPixels;
+  const avgSaturation = sumSaturation / totalPixels;
+
+  return {
+    morphology: {
+      area,
+      perimeter: perimeterPixels / Math.sqrt(totalPixels),
+      compactness,
+      aspectRatio: width / height,
+      objectPixelCount: objectPixels,
+      perimeterPixelCount: perimeterPixels,
+      fillRatio: objectPixels / totalPixels
+    },
+    colorHistogram: {
+      histogramR: Array.from(histR, v => v / totalPixels),
+      histogramG: Array.from(histG, v => v / totalPixels),
+      histogramB: Array.from(histB, v => v / totalPixels),
+      meanR, meanG, meanB,
+      stdR: Math.sqrt(sumR2 / totalPixels - meanR * meanR),
+      stdG: Math.sqrt(sumG2 / totalPixels - meanG * meanG),
+      stdB: Math.sqrt(sumB2 / totalPixels - meanB * meanB),
+      dominantChannel: meanR > meanG && meanR > meanB ? 'R' : meanG > meanB ? 'G' : 'B'
+    },
+    texture: {
+      entropy,
+      energy,
+      contrast,
+      smoothness: 1 - (1 / (1 + contrast))
+    },
+    edges: {
+      averageEdgeStrength: edgeStrength / totalPixels,
+      edgeDensity,
+      totalEdgeStrength: edgeStrength,
+      hasStrongEdges: edgeDensity > 0.1
+    },
+    moments: {
+      centroidX: normalizedCentroidX,
+      centroidY: normalizedCentroidY,
+      moment20: m20,
+      moment02: m02,
+      moment11: m11,
+      eccentricity: m20 !== m02
+        ? Math.sqrt(1 - Math.min(m20, m02) / Math.max(m20, m02))
+        : 0,
+      isCentered: Math.abs(normalizedCentroidX - 0.5) < 0.2 && Math.abs(normalizedCentroidY - 0.5) < 0.2
+    },
+    global: {
+      averageBrightness: avgBrightness / 255,
+      averageSaturation: avgSaturation,
+      isDark: avgBrightness < 85,
+      isBright: avgBrightness > 170,
+      isColorful: avgSaturation > 0.3
+    }
+  };
+}
+
+/**
+ * Las seis familias de características científicas de una sola vez
+ */
+function scientificFeatures({ data, info }) {
+  return fusedScientificFeatures(data, info);
+}
+
+// ==================== VÍDEO ====================
+
+/**
+ * Estadísticas de un fotograma muestreado de vídeo (RGB crudo):
+ * luminancia media y máxima, centroide del punto más brillante (si destaca
+ * sobre el fondo y es pequeño) y miniatura gris grid x grid para detectar cambios de escena
+ */
+function videoFrameStats({ data, width, height, channels, grid, step, minContrast, maxSpotArea }) {
+  const luma = (idx) => (data[idx] * 299 + data[idx + 1] * 587 + data[idx + 2] * 114) / 1000;
+
+  const cells = new Float64Array(grid * grid);
+  const counts = new Uint32Array(grid * grid);
+  let sum = 0;
+  let samples = 0;
+  let peak = 0;
+
+  for (let y = 0; y < height; y += step) {
+    const row = Math.min(grid - 1, Math.floor((y * grid) / height)) * grid;
+    for (let x = 0; x < width; x += step) {
+      const value = luma((y * width + x) * channels);
+      const cell = row + Math.min(grid - 1, Math.floor((x * grid) / width));
+      cells[cell] += value;
+      counts[cell]++;
+      sum += value;
+      samples++;
+      if (value > peak) peak = value;
+    }
+  }
+
+  const mean = samples > 0 ? sum / samples : 0;
+  const thumb = Array.from(cells, (total, i) => (counts[i] > 0 ? Math.round(total / counts[i]) : 0));
+
+  // Punto brillante: píxeles cerca del máximo, solo si destaca sobre la media
+  let spot = null;
+  if (peak - mean >= minContrast) {
+    const threshold = Math.max(peak - 25, mean + minContrast);
+    let sx = 0;
+    let sy = 0;
+    let count = 0;
+    for (let y = 0; y < height; y += step) {
+      for (let x = 0; x < width; x += step) {
+        if (luma((y * width + x) * channels) >= threshold) {
+          sx += x;
+          sy += y;
+          count++;
+        }
+      }
+    }
+    // Una zona brillante extensa (cielo, farola cercana) no es un punto
+    if (count > 0 && count / samples <= maxSpotArea) {
+      spot = { x: sx / count / width, y: sy / count / height, area: count / samples };
+    }
+  }
+
+  return { mean, peak, spot, thumb };
+}
+
+// Registro de kernels ejecutables por nombre (hilo principal o worker)
+const kernels = {
+  forensicLighting,
+  forensicNoise,
+  forensicEdges,
+  forensicCloning,
+  lightPatternScan,
+  shapeScan,
+  localAiRegionScan,
+  scientificFeatures,
+  videoFrameStats
+};
+
+module.exports = {
+  kernels,
+  regionGrid,
+  sobelMagnitude,
+  extractMorphology,
+  extractColorHistogram,
+  extractTexture,
+  extractEdges,
+  extractMoments,
+  extractGlobalFeatures,
+  scientificFeaturesReference,
+  fusedScientificFeatures
+};
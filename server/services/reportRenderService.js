@@ -0,0 +1,515 @@
+/**
+ * RENDERIZADO DE INFORMES PDF EN SEGUNDO PLANO
+ *
+ * Genera los PDF de services/pdfGenerator.js fuera del event loop para que
+ * un informe grande no bloquee la API:
+ * - pdfkit corre en worker_threads (REPORT_WORKERS, por defecto 1;
+ *   0 = inline) con cola acotada (REPORT_QUEUE) y timeout por informe
+ *   (REPORT_RENDER_TIMEOUT_MS)
+ * - Caché por contenido: la clave combina los datos y el estado del informe,
+ *   la versión del análisis (updatedAt) y TEMPLATE_VERSION. Si el PDF de esa
+ *   clave ya está en reports/, no se vuelve a generar
+ * - Streaming: el worker envía cada página en cuanto la termina y las
+ *   descargas la reciben sin esperar al documento completo (los bloques ya
+ *   generados se reenvían a quien llega tarde); al terminar se guarda en
+ *   disco para las siguientes descargas
+ * - La imagen analizada se reduce una sola vez (REPORT_IMAGE_SIZE) a
+ *   reports/images/<analysisId>.jpg y se reutiliza en cada informe
+ */
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const { PassThrough } = require('stream');
+const { Worker } = require('worker_threads');
+const sharp = require('sharp');
+const Report = require('../models/Report');
+const Analysis = require('../models/Analysis');
+const User = require('../models/User');
+const pdfGenerator = require('./pdfGenerator');
+const analysisPayloads = require('./analysisPayloadService');
+const { envInt } = require('../utils/env');
+
+const WORKER_SCRIPT = path.join(__dirname, '..', 'workers', 'pdfReportWorker.js');
+
+// Campos que usa la plantilla (lo que viaja al worker y entra en la clave)
+const ANALYSIS_FIELDS = [
+  'fileName', 'fileType', 'fileSize', 'uploadDate', 'status',
+  'exifData', 'aiAnalysis', 'externalValidation'
+];
+// Cargas de esos campos guardadas aparte (analysisPayloadService)
+const ANALYSIS_PAYLOADS = analysisPayloads.PAYLOAD_PATHS
+  .filter(payloadPath => ANALYSIS_FIELDS.some(field => payloadPath.startsWith(`${field}.`)));
+
+/**
+ * Copia plana (JSON) de un documento de Mongoose o de un objeto
+ */
+function plain(value) {
+  return JSON.parse(JSON.stringify(value ?? null));
+}
+
+/**
+ * Renderizado en curso: acumula los bloques del PDF, los reenvía a las
+ * descargas suscritas y los escribe en un archivo temporal
+ */
+class RenderJob {
+  constructor(key, filePath) {
+    this.key = key;
+    this.filePath = filePath;
+    this.tmpPath = `${filePath}.${process.pid}.tmp`;
+    this.chunks = [];
+    this.bytes = 0;
+    this.done = false;
+    this.error = null;
+    this.streams = new Set();
+    this.file = fs.createWriteStream(this.tmpPath);
+    this.file.on('error', (error) => this.fail(error));
+
+    this.promise = new Promise((resolve, reject) => {
+      this.resolve = resolve;
+      this.reject = reject;
+    });
+    // Evitar avisos de rechazo no gestionado si nadie espera al renderizado
+    this.promise.catch(() => {});
+  }
+
+  push(chunk) {
+    if (this.done || this.error) return;
+    this.chunks.push(chunk);
+    this.bytes += chunk.length;
+    this.file.write(chunk);
+    for (const stream of this.streams) {
+      stream.write(chunk);
+    }
+  }
+
+  finish() {
+    if (this.done || this.error) return;
+    this.done = true;
+    for (const stream of this.streams) {
+      stream.end();
+    }
+    this.streams.clear();
+
+    this.file.end(async () => {
+      try {
+        await fs.promises.rename(this.tmpPath, this.filePath);
+        this.resolve(this.filePath);
+      } catch (error) {
+        this.reject(error);
+      }
+    });
+  }
+
+  fail(error) {
+    if (this.done || this.error) return;
+    this.error = error;
+    this.chunks = [];
+    for (const stream of this.streams) {
+      stream.destroy(error);
+    }
+    this.streams.clear();
+
+    this.file.destroy();
+    fs.promises.unlink(this.tmpPath).catch(() => {});
+    this.reject(error);
+  }
+
+  /**
+   * Stream de lectura desde el primer byte del PDF
+   */
+  createStream() {
+    const stream = new PassThrough();
+    for (const chunk of this.chunks) {
+      stream.write(chunk);
+    }
+
+    if (this.error) {
+      stream.destroy(this.error);
+    } else if (this.done) {
+      stream.end();
+    } else {
+      this.streams.add(stream);
+      stream.on('close', () => this.streams.delete(stream));
+    }
+    return stream;
+  }
+}
+
+class ReportRenderService {
+  constructor(options = {}) {
+    this.size = options.size ?? envInt('REPORT_WORKERS', 1);
+    this.maxQueue = options.maxQueue ?? envInt('REPORT_QUEUE', 20);
+    this.timeoutMs = options.timeoutMs ?? envInt('REPORT_RENDER_TIMEOUT_MS', 120000);
+    this.imageSize = options.imageSize ?? envInt('REPORT_IMAGE_SIZE', 800);
+
+    this.reportsDir = options.reportsDir ?? pdfGenerator.reportsDir;
+    this.imagesDir = path.join(this.reportsDir, 'images');
+    fs.mkdirSync(this.imagesDir, { recursive: true });
+
+    this.workers = [];
+    this.queue = [];
+    this.nextId = 1;
+
+    // Renderizados en curso por clave de caché
+    this.jobs = new Map();
+    // Reducciones de imagen en curso por análisis
+    this.images = new Map();
+
+    this.stats = {
+      rendered: 0,
+      cacheHits: 0,
+      joined: 0,
+      failed: 0,
+      timedOut: 0,
+      rejected: 0,
+      imagesResized: 0
+    };
+  }
+
+  /**
+   * Estado que tendrá el informe con su PDF generado (el que se imprime)
+   * @returns {string}
+   */
+  renderedStatus(report) {
+    return report.status === 'sent' ? 'sent' : 'generated';
+  }
+
+  /**
+   * Clave de caché: contenido y estado del informe + versión del análisis +
+   * plantilla
+   * @returns {string}
+   */
+  cacheKey(report, analysis) {
+    return crypto.createHash('sha1')
+      .update(JSON.stringify({
+        template: pdfGenerator.TEMPLATE_VERSION,
+        report: report._id,
+        reportNumber: report.reportNumber,
+        status: this.renderedStatus(report),
+        version: report.version,
+        reportData: report.reportData,
+        analysis: analysis._id,
+        analysisVersion: analysis.updatedAt
+      }))
+      .digest('hex')
+      .slice(0, 16);
+  }
+
+  /**
+   * Generar (o reutilizar) el PDF de un informe sin esperar al renderizado.
+   * Actualiza el informe: 'generated' si ya estaba en caché, 'generating'
+   * mientras se renderiza (y 'generated'/'error' al terminar).
+   * @param {Object} report - Documento Report
+   * @param {Object} analysis - Análisis asociado (se carga si es null)
+   * @param {Object} user - Usuario autor (se carga si es null)
+   * @returns {Promise<{key: string, filePath: string, fileName: string, cached: boolean, job: RenderJob|null, done: Promise}>}
+   */
+  async generate(report, analysis = null, user = null) {
+    analysis = analysis || await Analysis.findById(report.analysisId);
+    if (!analysis) {
+      const error = new Error('Análisis asociado no encontrado');
+      error.code = 'ANALYSIS_NOT_FOUND';
+      throw error;
+    }
+    await analysisPayloads.attach(analysis, ANALYSIS_PAYLOADS);
+    user = user || await User.findById(report.userId).select('username');
+
+    const key = this.cacheKey(report, analysis);
+    const fileName = `UAP-Report-${report.reportNumber}.pdf`;
+    const filePath = path.join(this.reportsDir, `UAP-Report-${report.reportNumber}-${key}.pdf`);
+    const previousPath = report.pdfPath;
+    const status = this.renderedStatus(report);
+    const cached = fs.existsSync(filePath);
+
+    if (!cached && !this.jobs.has(key) && this.queue.length >= this.maxQueue) {
+      this.stats.rejected++;
+      const error = new Error(`Cola de informes llena (${this.maxQueue} pendientes)`);
+      error.code = 'REPORT_QUEUE_FULL';
+      throw error;
+    }
+
+    report.pdfCacheKey = key;
+    report.pdfFileName = fileName;
+    report.pdfUrl = `/api/reports/${report._id}/download`;
+
+    if (cached) {
+      this.stats.cacheHits++;
+      report.pdfPath = filePath;
+      report.pdfGeneratedDate = report.pdfGeneratedDate || new Date();
+      report.status = status;
+      report.errorMessage = undefined;
+      await report.save();
+      return { key, filePath, fileName, cached: true, job: null, done: Promise.resolve(filePath) };
+    }
+
+    report.status = 'generating';
+    await report.save();
+
+    let job = this.jobs.get(key);
+    if (job) {
+      this.stats.joined++;
+    } else {
+      job = this.start(key, filePath, { ...report.toObject(), status }, analysis, user);
+    }
+
+    const done = job.promise.then(async () => {
+      await Report.updateOne({ _id: report._id, pdfCacheKey: key }, {
+        pdfPath: filePath,
+        pdfGeneratedDate: new Date(),
+        status,
+        $unset: { errorMessage: 1 }
+      });
+      if (previousPath && previousPath !== filePath) {
+        await fs.promises.unlink(previousPath).catch(() => {});
+      }
+      return filePath;
+    }, async (error) => {
+      await Report.updateOne({ _id: report._id, pdfCacheKey: key }, {
+        status: 'error',
+        errorMessage: error.message
+      }).catch(() => {});
+      throw error;
+    });
+    done.catch(() => {});
+
+    return { key, filePath, fileName, cached: false, job, done };
+  }
+
+  /**
+   * Stream del PDF de un informe para descargarlo: el renderizado en curso,
+   * el archivo en caché o, si falta, un renderizado nuevo
+   * @param {Object} report - Documento Report
+   * @returns {Promise<{stream: Readable, fileName: string}>}
+   */
+  async open(report) {
+    const fileName = report.pdfFileName || `UAP-Report-${report.reportNumber}.pdf`;
+
+    const running = report.pdfCacheKey && this.jobs.get(report.pdfCacheKey);
+    if (running) {
+      return { stream: running.createStream(), fileName };
+    }
+
+    if (report.pdfPath && fs.existsSync(report.pdfPath)) {
+      return { stream: fs.createReadStream(report.pdfPath), fileName };
+    }
+
+    const result = await this.generate(report);
+    return {
+      stream: result.job ? result.job.createStream() : fs.createReadStream(result.filePath),
+      fileName: result.fileName
+    };
+  }
+
+  /**
+   * Lanzar el renderizado: reducir la imagen (una vez) y encolar en los workers
+   */
+  start(key, filePath, report, analysis, user) {
+    const job = new RenderJob(key, filePath);
+    this.jobs.set(key, job);
+    job.promise.then(
+      () => this.jobs.delete(key),
+      () => this.jobs.delete(key)
+    );
+
+    const payload = {
+      report: plain({
+        reportNumber: report.reportNumber,
+        status: report.status,
+        version: report.version,
+        reportData: report.reportData
+      }),
+      analysis: plain(Object.fromEntries(ANALYSIS_FIELDS.map(field => [field, analysis[field]]))),
+      user: { username: user?.username || null }
+    };
+
+    this.prepareImage(analysis)
+      .then((imagePath) => this.enqueue(job, { ...payload, imagePath }))
+      .catch((error) => job.fail(error));
+
+    return job;
+  }
+
+  /**
+   * Copia JPEG reducida de la imagen analizada, generada una sola vez.
+   * Parte de la derivada cruda de la ingesta si existe (sin decodificar el
+   * original). Si falla, el informe se genera sin imagen.
+   * @returns {Promise<string|null>}
+   */
+  prepareImage(analysis) {
+    if (analysis.fileType !== 'image') return Promise.resolve(null);
+
+    const id = analysis._id.toString();
+    const imagePath = path.join(this.imagesDir, `${id}.${this.imageSize}.jpg`);
+    if (fs.existsSync(imagePath)) return Promise.resolve(imagePath);
+
+    if (!this.images.has(id)) {
+      const task = this.resizeImage(analysis, imagePath)
+        .catch((error) => {
+          console.warn(`⚠️ No se pudo preparar la imagen del informe (${id}):`, error.message);
+          return null;
+        })
+        .finally(() => this.images.delete(id));
+      this.images.set(id, task);
+    }
+    return this.images.get(id);
+  }
+
+  async resizeImage(analysis, imagePath) {
+    const derivative = (analysis.ingest?.derivatives || [])
+      .filter(d => d.maxSize >= this.imageSize && fs.existsSync(d.path))
+      .sort((a, b) => a.maxSize - b.maxSize)[0];
+
+    const source = derivative
+      ? sharp(derivative.path, {
+        raw: { width: derivative.width, height: derivative.height, channels: derivative.channels }
+      })
+      : sharp(analysis.filePath).rotate();
+
+    const tmpPath = `${imagePath}.${process.pid}.tmp`;
+    await source
+      .resize(this.imageSize, this.imageSize, { fit: 'inside', withoutEnlargement: true })
+      .jpeg({ quality: 80 })
+      .toFile(tmpPath);
+    await fs.promises.rename(tmpPath, imagePath);
+
+    this.stats.imagesResized++;
+    return imagePath;
+  }
+
+  // ==================== POOL DE WORKERS ====================
+
+  enqueue(job, payload) {
+    // Modo inline: sin workers (tests, entornos con 1 CPU)
+    if (this.size <= 0) {
+      this.renderInline(job, payload);
+      return;
+    }
+
+    this.queue.push({ id: this.nextId++, job, payload });
+    this.dispatch();
+  }
+
+  renderInline(job, { report, analysis, user, imagePath }) {
+    try {
+      const doc = pdfGenerator.openDocument(report, user);
+      doc.on('data', (chunk) => job.push(chunk));
+      doc.on('end', () => {
+        this.stats.rendered++;
+        job.finish();
+      });
+      doc.on('error', (error) => {
+        this.stats.failed++;
+        job.fail(error);
+      });
+      pdfGenerator.writeDocument(doc, report, analysis, { imagePath });
+    } catch (error) {
+      this.stats.failed++;
+      job.fail(error);
+    }
+  }
+
+  /**
+   * Asignar informes en cola a workers libres (creándolos bajo demanda)
+   */
+  dispatch() {
+    while (this.queue.length > 0) {
+      let slot = this.workers.find(w => !w.task);
+      if (!slot) {
+        if (this.workers.length >= this.size) return;
+        slot = this.spawn();
+      }
+
+      const task = this.queue.shift();
+      slot.task = task;
+      slot.worker.ref();
+      slot.timer = setTimeout(() => this.handleTimeout(slot), this.timeoutMs);
+      slot.worker.postMessage({ id: task.id, ...task.payload });
+    }
+  }
+
+  spawn() {
+    const slot = { worker: new Worker(WORKER_SCRIPT), task: null, timer: null };
+
+    slot.worker.on('message', (message) => {
+      const task = slot.task;
+      if (!task || message.id !== task.id) return;
+
+      if (message.chunk) {
+        task.job.push(Buffer.from(message.chunk.buffer, message.chunk.byteOffset, message.chunk.byteLength));
+        return;
+      }
+
+      this.release(slot);
+      if (message.error) {
+        this.stats.failed++;
+        task.job.fail(new Error(message.error.message));
+      } else {
+        this.stats.rendered++;
+        task.job.finish();
+      }
+      this.dispatch();
+    });
+
+    slot.worker.on('error', (error) => {
+      console.error('❌ Error en worker de informes:', error.message);
+      this.discard(slot, error);
+    });
+
+    slot.worker.on('exit', (code) => {
+      if (this.workers.includes(slot)) {
+        this.discard(slot, new Error(`Worker de informes terminó inesperadamente (código ${code})`));
+      }
+    });
+
+    slot.worker.unref();
+    this.workers.push(slot);
+    return slot;
+  }
+
+  release(slot) {
+    clearTimeout(slot.timer);
+    slot.timer = null;
+    slot.task = null;
+    slot.worker.unref();
+  }
+
+  discard(slot, error) {
+    const task = slot.task;
+    this.release(slot);
+    this.workers = this.workers.filter(w => w !== slot);
+
+    if (task) {
+      this.stats.failed++;
+      task.job.fail(error);
+    }
+    this.dispatch();
+  }
+
+  handleTimeout(slot) {
+    if (!slot.task) return;
+
+    console.warn(`⚠️ Informe excedió ${this.timeoutMs}ms, reiniciando worker`);
+    this.stats.timedOut++;
+    this.discard(slot, new Error(`Timeout al generar el informe (${this.timeoutMs}ms)`));
+    slot.worker.terminate().catch(() => {});
+  }
+
+  /**
+   * Estado del renderizado (para monitoreo)
+   */
+  getStats() {
+    return {
+      size: this.size,
+      workers: this.workers.length,
+      busy: this.workers.filter(w => w.task).length,
+      queued: this.queue.length,
+      rendering: this.jobs.size,
+      maxQueue: this.maxQueue,
+      ...this.stats
+    };
+  }
+}
+
+module.exports = new ReportRenderService();
+module.exports.ReportRenderService = ReportRenderService;
@@ -0,0 +1,332 @@
+/**
+ * RE-PUNTUACIÓN INCREMENTAL DEL HISTÓRICO
+ *
+ * Cuando cambia el catálogo (UFODatabase), el set de training
+ * (TrainingImage), los fenómenos atmosféricos (AtmosphericPhenomenon) o los
+ * pesos de confidenceCalculatorService, los veredictos guardados quedan
+ * desfasados. En lugar de repetir performAnalysis sobre cada imagen, el
+ * pipeline guarda con cada análisis las entradas de las capas de puntuación
+ * (scoringInputs: características científicas, consulta de training,
+ * embeddings y el análisis previo a la fusión) y las revisiones con las que
+ * se puntuó (scoring.*). Este servicio recalcula solo las capas afectadas:
+ *
+ *   catálogo o training -> scientific + training -> confidence
+ *   fenómenos           -> atmospheric (por lotes, scoreBatch) -> confidence
+ *   pesos de la fusión  -> confidence
+ *
+ * - Recorrido por lotes con paginación por _id (reanudable desde el último)
+ * - Ritmo acotado (RESCORE_RATE_PER_SEC) y pausa entre lotes para no competir
+ *   con los análisis en curso
+ * - Modo de prueba (dryRun): calcula el diff de veredictos sin guardar
+ * - Se guarda con save(): estadísticas, índice perceptual y cargas aparte se
+ *   mantienen por los hooks del modelo
+ *
+ * Los vídeos y los análisis sin entradas guardadas (anteriores a este
+ * servicio) necesitan un re-análisis completo. scripts/rescoreAnalyses.js es
+ * la interfaz de línea de comandos.
+ */
+
+const Analysis = require('../models/Analysis');
+const analysisPayloads = require('./analysisPayloadService');
+const ufoFeatureIndex = require('./ufoFeatureIndexService');
+const trainingVectorIndex = require('./trainingVectorIndexService');
+const atmosphericComparisonService = require('./atmosphericComparisonService');
+const confidenceCalculatorService = require('./confidenceCalculatorService');
+const trainingLearningService = require('./trainingLearningService');
+const scientificComparisonService = require('./scientificComparisonService');
+const { envInt } = require('../utils/env');
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+// Cargas aparte que necesita la re-puntuación (la fusión lee las
+// coincidencias de la validación externa)
+const RESCORE_PAYLOADS = ['scoringInputs', 'externalValidation.results'];
+
+/**
+ * Lo que se compara entre el veredicto guardado y el nuevo
+ */
+function verdict(analysis) {
+  return {
+    category: analysis.aiAnalysis?.category || null,
+    confidence: analysis.aiAnalysis?.confidence ?? null,
+    bestMatchCategory: analysis.bestMatch?.category || null,
+    atmospheric: analysis.atmosphericComparison?.bestMatch?.phenomenon?.name || null
+  };
+}
+
+class RescoringService {
+  constructor(options = {}) {
+    this.batchSize = options.batchSize ?? envInt('RESCORE_BATCH_SIZE', 100);
+    this.ratePerSec = options.ratePerSec ?? envInt('RESCORE_RATE_PER_SEC', 20);
+    this.batchPauseMs = options.batchPauseMs ?? envInt('RESCORE_BATCH_PAUSE_MS', 250);
+  }
+
+  // ==================== PIPELINE ====================
+
+  /**
+   * Revisiones actuales de todo aquello de lo que depende un veredicto
+   * @returns {Promise<Object>} { catalogRevision, trainingRevision,
+   *   phenomenaRevision, confidenceVersion }
+   */
+  async currentRevisions() {
+    const [, , model] = await Promise.all([
+      ufoFeatureIndex.ensureLoaded(),
+      trainingVectorIndex.ensureLoaded(),
+      atmosphericComparisonService.getCompiled().catch(() => null)
+    ]);
+    return {
+      catalogRevision: ufoFeatureIndex.revision,
+      trainingRevision: trainingVectorIndex.revision,
+      phenomenaRevision: model?.revision || null,
+      confidenceVersion: confidenceCalculatorService.VERSION
+    };
+  }
+
+  /**
+   * Guardar las entradas de una capa de puntuación en el análisis
+   * @param {Object} analysis - Documento Analysis u objeto de fotograma
+   * @param {string} layer - 'scientific' | 'training' | 'fusion'
+   * @param {Object} value - Objeto plano (se guarda tal cual)
+   */
+  recordInputs(analysis, layer, value) {
+    if (!value) return;
+    // Reasignar el objeto completo: Mongoose no detecta cambios dentro de Mixed
+    analysis.scoringInputs = { ...(analysis.scoringInputs || {}), [layer]: value };
+  }
+
+  /**
+   * Entradas de la fusión: el análisis tal como llega a la capa confidence,
+   * antes de las recomendaciones de contexto
+   */
+  fusionInputs(aiAnalysis) {
+    return {
+      confidence: aiAnalysis.confidence,
+      category: aiAnalysis.category,
+      description: aiAnalysis.description,
+      recommendations: [...(aiAnalysis.recommendations || [])]
+    };
+  }
+
+  /**
+   * Anotar las revisiones con las que se puntuó el análisis
+   */
+  stampRevisions(analysis, revisions, rescored = false) {
+    analysis.scoring = {
+      ...revisions,
+      scoredAt: rescored ? analysis.scoring?.scoredAt : new Date(),
+      rescoredAt: rescored ? new Date() : undefined
+    };
+  }
+
+  // ==================== PLAN ====================
+
+  /**
+   * Consulta de análisis desfasados respecto a las revisiones dadas. Solo
+   * los que guardan revisiones (puntuados por el pipeline actual)
+   */
+  staleFilter(revisions) {
+    return {
+      status: 'completed',
+      fileType: 'image',
+      'scoring.scoredAt': { $exists: true },
+      $or: [
+        { 'scoring.catalogRevision': { $ne: revisions.catalogRevision } },
+        { 'scoring.trainingRevision': { $ne: revisions.trainingRevision } },
+        { 'scoring.phenomenaRevision': { $ne: revisions.phenomenaRevision } },
+        { 'scoring.confidenceVersion': { $ne: revisions.confidenceVersion } }
+      ]
+    };
+  }
+
+  /**
+   * Capas a recalcular para un análisis
+   * @returns {{stages: string[], missing: string[]}} missing: entradas que
+   *   faltan (el análisis necesita un re-análisis completo)
+   */
+  plan(analysis, revisions) {
+    const scoring = analysis.scoring || {};
+    const inputs = analysis.scoringInputs || {};
+    const stages = [];
+
+    if (scoring.catalogRevision !== revisions.catalogRevision ||
+        scoring.trainingRevision !== revisions.trainingRevision) {
+      // La capa scientific también consulta el training
+      stages.push('scientific', 'training');
+    }
+    // La capa atmosférica solo corre con datos meteorológicos
+    if (scoring.phenomenaRevision !== revisions.phenomenaRevision &&
+        analysis.weatherData?.temperature?.current !== undefined) {
+      stages.push('atmospheric');
+    }
+    if (stages.length > 0 || scoring.confidenceVersion !== revisions.confidenceVersion) {
+      stages.push('confidence');
+    }
+
+    const missing = [];
+    if (stages.includes('scientific')) {
+      if (!inputs.scientific) missing.push('scientific');
+      if (!inputs.training) missing.push('training');
+    } else if (stages.includes('confidence') && !inputs.fusion) {
+      missing.push('fusion');
+    }
+
+    return { stages, missing };
+  }
+
+  // ==================== RE-PUNTUACIÓN ====================
+
+  /**
+   * Recalcular las capas planificadas sobre el documento (sin guardar)
+   * @param {Document} analysis - Con scoringInputs y externalValidation.results
+   * @param {string[]} stages - De plan()
+   * @param {Object|null} atmosphericComparison - Resultado de scoreBatch
+   */
+  async rescore(analysis, stages, atmosphericComparison = null) {
+    const inputs = analysis.scoringInputs;
+
+    if (stages.includes('scientific')) {
+      const analysisResult = await scientificComparisonService.scoreScientificInputs(
+        inputs.scientific,
+        analysis.exifData
+      ).catch(error => ({ success: false, error: error.message }));
+
+      const preliminaryAnalysis = analysisResult.success
+        ? analysisResult.data
+        : scientificComparisonService.basicPreliminaryAnalysis();
+
+      // Igual que la capa scientific del pipeline
+      if (analysisResult.success && analysisResult.data.rawResponse?.bestMatch) {
+        const bestMatch = analysisResult.data.rawResponse.bestMatch;
+        analysis.bestMatch = {
+          objectId: bestMatch.objectId,
+          category: bestMatch.category,
+          matchPercentage: bestMatch.matchPercentage
+        };
+        analysis.matchResults = analysisResult.data.rawResponse.allMatches || [];
+      }
+
+      // Sin contar el uso de las imágenes de training: no es un análisis nuevo
+      const trainingEnhancement = await trainingLearningService.enhanceWithInputs(
+        inputs.training,
+        preliminaryAnalysis,
+        analysis.exifData,
+        { recordUsage: false }
+      );
+      trainingLearningService.applyEnhancement(analysis, trainingEnhancement);
+      this.recordInputs(analysis, 'fusion', this.fusionInputs(analysis.aiAnalysis));
+    } else if (stages.includes('confidence')) {
+      // Volver al análisis previo a la fusión anterior
+      const fusion = inputs.fusion;
+      analysis.aiAnalysis.confidence = fusion.confidence;
+      analysis.aiAnalysis.category = fusion.category;
+      analysis.aiAnalysis.description = fusion.description;
+      analysis.aiAnalysis.recommendations = [...fusion.recommendations];
+    }
+
+    if (stages.includes('atmospheric') && atmosphericComparison && !atmosphericComparison.error) {
+      analysis.atmosphericComparison = atmosphericComparison;
+    }
+
+    if (stages.includes('confidence')) {
+      confidenceCalculatorService.applyContextRecommendations(analysis);
+      const weightedResult = confidenceCalculatorService.calculateWeightedConfidence(
+        analysis.aiAnalysis,
+        analysis.externalValidation || {},
+        analysis.trainingEnhancement || {},
+        analysis.exifData || {},
+        analysis.visualAnalysis || null
+      );
+      confidenceCalculatorService.applyWeightedResult(analysis, weightedResult);
+    }
+  }
+
+  /**
+   * Re-puntuar un lote de análisis desfasados
+   * @param {Object} revisions - De currentRevisions()
+   * @param {Object} options - { afterId, limit, dryRun }
+   * @returns {Promise<{lastId, results: Object[]}>} lastId null si no quedan;
+   *   results: { analysisId, stages, missing, before, after, changed, error }
+   */
+  async rescoreBatch(revisions, options = {}) {
+    const { afterId = null, limit = this.batchSize, dryRun = false } = options;
+
+    const filter = this.staleFilter(revisions);
+    if (afterId) filter._id = { $gt: afterId };
+
+    const batch = await Analysis.find(filter)
+      .sort({ _id: 1 })
+      .limit(limit)
+      .select(analysisPayloads.summaryProjection());
+    if (batch.length === 0) return { lastId: null, results: [] };
+
+    await analysisPayloads.attach(batch, RESCORE_PAYLOADS);
+
+    const plans = batch.map(analysis => this.plan(analysis, revisions));
+
+    // Comparación atmosférica de todo el lote en una sola pasada
+    const sightings = [];
+    const sightingIndex = new Map();
+    batch.forEach((analysis, index) => {
+      if (plans[index].missing.length === 0 && plans[index].stages.includes('atmospheric')) {
+        sightingIndex.set(index, sightings.length);
+        sightings.push({
+          visualAnalysis: analysis.visualAnalysis,
+          weatherData: analysis.weatherData,
+          exifData: analysis.exifData
+        });
+      }
+    });
+    const atmospheric = sightings.length > 0
+      ? await atmosphericComparisonService.scoreBatch(sightings)
+      : [];
+
+    const results = [];
+    const minIntervalMs = this.ratePerSec > 0 ? 1000 / this.ratePerSec : 0;
+
+    for (const [index, analysis] of batch.entries()) {
+      const { stages, missing } = plans[index];
+      const result = { analysisId: analysis._id, stages, missing, before: verdict(analysis) };
+      results.push(result);
+      if (missing.length > 0) continue;
+
+      const startedAt = Date.now();
+      try {
+        // Sin capas que recalcular (p. ej. fenómenos nuevos y sin datos
+        // meteorológicos) solo se actualizan las revisiones
+        if (stages.length > 0) {
+          await this.rescore(analysis, stages, sightingIndex.has(index) ? atmospheric[sightingIndex.get(index)] : null);
+        }
+        result.after = verdict(analysis);
+        result.changed = Object.keys(result.before).some(key => result.before[key] !== result.after[key]);
+
+        if (!dryRun) {
+          this.stampRevisions(analysis, revisions, true);
+          await analysis.save();
+        }
+      } catch (error) {
+        result.error = error.message;
+      }
+
+      // Ritmo acotado para no competir con los análisis en curso
+      const elapsed = Date.now() - startedAt;
+      if (elapsed < minIntervalMs) await sleep(minIntervalMs - elapsed);
+    }
+
+    if (this.batchPauseMs > 0) await sleep(this.batchPauseMs);
+    return { lastId: batch[batch.length - 1]._id, results };
+  }
+
+  /**
+   * Análisis completados que no se pueden re-puntuar por no tener revisiones
+   * guardadas (anteriores a este servicio, o vídeos)
+   */
+  countUnscored() {
+    return Analysis.countDocuments({
+      status: 'completed',
+      $or: [{ fileType: { $ne: 'image' } }, { 'scoring.scoredAt': { $exists: false } }]
+    });
+  }
+}
+
+module.exports = new RescoringService();
+module.exports.RescoringService = RescoringService;
@@ -0,0 +1,450 @@
+/**
+ * ESTADÍSTICAS PRECALCULADAS (ROLLUPS)
+ *
+ * Los paneles (GET /api/admin/stats, /api/library/stats y las rutas
+ * /stats/categories) leen unos pocos documentos de StatsRollup en lugar de
+ * agregar Analysis, UFODatabase y AtmosphericPhenomenon en cada petición:
+ * - Análisis: contadores globales (total, por estado, por categoría de los
+ *   completados), cubetas diarias y total por usuario. Se actualizan con
+ *   $inc desde los hooks del modelo Analysis (alta, cambio de estado,
+ *   borrado)
+ * - Biblioteca: colecciones pequeñas; se recalcula poco después de cada
+ *   cambio, agrupando los cambios seguidos (STATS_LIBRARY_DEBOUNCE_MS)
+ * - Reconciliación periódica (STATS_RECONCILE_INTERVAL_MIN) con las
+ *   agregaciones completas, que corrige la deriva de las escrituras que no
+ *   pasan por los hooks (updateMany, scripts, borrados masivos). Esas
+ *   escrituras además adelantan la siguiente (STATS_DIRTY_DELAY_SEC). Un
+ *   lease en MongoDB evita que varios procesos reconcilien a la vez
+ */
+
+const StatsRollup = require('../models/StatsRollup');
+const Analysis = require('../models/Analysis');
+const User = require('../models/User');
+const UFODatabase = require('../models/UFODatabase');
+const AtmosphericPhenomenon = require('../models/AtmosphericPhenomenon');
+const { envInt } = require('../utils/env');
+
+const ANALYSES_ID = 'analyses';
+const LIBRARY_ID = 'library';
+const LEASE_ID = 'lease:reconcile';
+const NO_CATEGORY = '_none';
+
+const DAY_MS = 24 * 60 * 60 * 1000;
+
+/**
+ * Día UTC (YYYY-MM-DD), igual que $dateToString
+ */
+function dayKey(date) {
+  return new Date(date).toISOString().slice(0, 10);
+}
+
+/**
+ * Categoría como clave de contador (sin '.' ni '$')
+ */
+function categoryKey(category) {
+  return category ? String(category).replace(/[.$]/g, '_') : NO_CATEGORY;
+}
+
+/**
+ * Lista { _id, count } ordenada a partir de un mapa de contadores
+ */
+function toCountList(map = {}) {
+  return Object.entries(map)
+    .map(([key, count]) => ({ _id: key === NO_CATEGORY ? null : key, count: Math.max(0, count) }))
+    .filter(entry => entry.count > 0)
+    .sort((a, b) => b.count - a.count);
+}
+
+class StatsService {
+  constructor() {
+    this.reconcileIntervalMs = envInt('STATS_RECONCILE_INTERVAL_MIN', 60) * 60 * 1000;
+    this.dirtyDelayMs = envInt('STATS_DIRTY_DELAY_SEC', 300) * 1000;
+    this.libraryDebounceMs = envInt('STATS_LIBRARY_DEBOUNCE_MS', 2000);
+    this.retentionDays = envInt('STATS_DAILY_RETENTION_DAYS', 90);
+
+    this.timer = null;
+    this.dirtyTimer = null;
+    this.libraryTimer = null;
+    this.reconciling = null;
+    this.libraryRefresh = null;
+
+    this.counters = {
+      increments: 0,
+      incrementFailures: 0,
+      reconciliations: 0,
+      libraryRefreshes: 0,
+      lastReconcileMs: 0
+    };
+  }
+
+  /**
+   * Arrancar la reconciliación periódica (y una inicial si no hay rollups)
+   */
+  start() {
+    if (this.timer) return;
+
+    // Un rollup sin reconciliar solo tiene los incrementos desde su creación
+    StatsRollup.exists({ _id: ANALYSES_ID, reconciledAt: { $ne: null } })
+      .then(exists => (exists ? null : this.reconcile()))
+      .catch(error => console.error('⚠️ Error inicializando estadísticas:', error.message));
+
+    this.timer = setInterval(() => {
+      this.reconcile().catch(error => console.error('⚠️ Error reconciliando estadísticas:', error.message));
+    }, this.reconcileIntervalMs);
+    this.timer.unref();
+  }
+
+  // ==================== ANÁLISIS (INCREMENTAL) ====================
+
+  /**
+   * Aportación de un análisis a los contadores globales
+   * @param {Object|null} state - { status, category } o null (no existe)
+   */
+  contribution(state) {
+    if (!state) return {};
+
+    const counts = { total: 1, [`status.${state.status}`]: 1 };
+    if (state.status === 'completed') {
+      counts[`category.${categoryKey(state.category)}`] = 1;
+    }
+    return counts;
+  }
+
+  /**
+   * Aplicar el cambio de un análisis (desde los hooks del modelo)
+   * @param {Object|null} before - { status, category } antes (null si es nuevo)
+   * @param {Object|null} after - { status, category } después (null si se borró)
+   * @param {Object} doc - { userId, createdAt }
+   */
+  async recordAnalysisChange(before, after, doc) {
+    const inc = {};
+    const previous = this.contribution(before);
+    const next = this.contribution(after);
+    for (const key of new Set([...Object.keys(previous), ...Object.keys(next)])) {
+      const delta = (next[key] || 0) - (previous[key] || 0);
+      if (delta !== 0) inc[`counts.${key}`] = delta;
+    }
+    if (Object.keys(inc).length === 0) return;
+
+    const ops = [{
+      updateOne: {
+        filter: { _id: ANALYSES_ID },
+        update: { $inc: inc, $setOnInsert: { kind: 'analyses' } },
+        upsert: true
+      }
+    }];
+
+    const today = dayKey(Date.now());
+    const createdDay = dayKey(doc.createdAt || Date.now());
+    const userId = doc.userId ? doc.userId.toString() : null;
+
+    // Alta o baja: cubeta del día de creación y contador del usuario
+    // (las bajas no crean documentos)
+    const created = (after ? 1 : 0) - (before ? 1 : 0);
+    if (created !== 0) {
+      ops.push({
+        updateOne: {
+          filter: { _id: `analyses:day:${createdDay}` },
+          update: { $inc: { 'counts.created': created }, $setOnInsert: { kind: 'analysesDaily', day: createdDay } },
+          upsert: created > 0
+        }
+      });
+      if (userId) {
+        ops.push({
+          updateOne: {
+            filter: { _id: `analyses:user:${userId}` },
+            update: { $inc: { 'counts.total': created }, $setOnInsert: { kind: 'analysesByUser', userId } },
+            upsert: created > 0
+          }
+        });
+      }
+    }
+
+    // Finalizaciones del día (completados / errores)
+    if (after && after.status !== before?.status && ['completed', 'error'].includes(after.status)) {
+      ops.push({
+        updateOne: {
+          filter: { _id: `analyses:day:${today}` },
+          update: { $inc: { [`counts.${after.status}`]: 1 }, $setOnInsert: { kind: 'analysesDaily', day: today } },
+          upsert: true
+        }
+      });
+    }
+
+    try {
+      await StatsRollup.bulkWrite(ops, { ordered: false });
+      this.counters.increments++;
+    } catch (error) {
+      this.counters.incrementFailures++;
+      console.error('⚠️ Error actualizando estadísticas:', error.message);
+      this.markDirty();
+    }
+  }
+
+  /**
+   * Escritura que no pasa por los hooks de documento (updateMany, borrados
+   * masivos...): adelantar la reconciliación
+   */
+  markDirty() {
+    if (this.dirtyTimer) return;
+
+    this.dirtyTimer = setTimeout(() => {
+      this.dirtyTimer = null;
+      // Sin lease: solo el proceso que hizo la escritura adelanta la suya
+      this.reconcile({ force: true }).catch(error => console.error('⚠️ Error reconciliando estadísticas:', error.message));
+    }, this.dirtyDelayMs);
+    this.dirtyTimer.unref();
+  }
+
+  // ==================== BIBLIOTECA ====================
+
+  /**
+   * Un objeto o fenómeno de la biblioteca cambió: recalcular en breve
+   */
+  libraryChanged() {
+    clearTimeout(this.libraryTimer);
+    this.libraryTimer = setTimeout(() => {
+      this.libraryTimer = null;
+      this.refreshLibrary().catch(error => console.error('⚠️ Error recalculando estadísticas de biblioteca:', error.message));
+    }, this.libraryDebounceMs);
+    this.libraryTimer.unref();
+  }
+
+  /**
+   * Recalcular el rollup de la biblioteca (solo elementos activos)
+   */
+  refreshLibrary() {
+    if (this.libraryRefresh) return this.libraryRefresh;
+
+    this.libraryRefresh = (async () => {
+      const byCategory = (Model) => Model.aggregate([
+        { $match: { isActive: true } },
+        { $group: { _id: '$category', count: { $sum: 1 } } }
+      ]);
+      const [phenomena, objects] = await Promise.all([
+        byCategory(AtmosphericPhenomenon),
+        byCategory(UFODatabase)
+      ]);
+
+      const summarize = (groups) => ({
+        total: groups.reduce((sum, group) => sum + group.count, 0),
+        category: Object.fromEntries(groups.map(group => [categoryKey(group._id), group.count]))
+      });
+
+      const counts = { phenomena: summarize(phenomena), objects: summarize(objects) };
+      await StatsRollup.updateOne(
+        { _id: LIBRARY_ID },
+        { $set: { kind: 'library', counts, reconciledAt: new Date() } },
+        { upsert: true }
+      );
+
+      this.counters.libraryRefreshes++;
+      return counts;
+    })().finally(() => {
+      this.libraryRefresh = null;
+    });
+
+    return this.libraryRefresh;
+  }
+
+  // ==================== RECONCILIACIÓN ====================
+
+  /**
+   * Tomar el lease de reconciliación (un proceso a la vez)
+   * @returns {Promise<boolean>}
+   */
+  async acquireLease() {
+    const now = new Date();
+    try {
+      await StatsRollup.updateOne(
+        { _id: LEASE_ID, $or: [{ leaseUntil: { $lt: now } }, { leaseUntil: null }] },
+        { $set: { kind: 'lease', leaseUntil: new Date(now.getTime() + this.reconcileIntervalMs * 0.9) } },
+        { upsert: true }
+      );
+      return true;
+    } catch (error) {
+      // Clave duplicada: otro proceso tiene el lease vigente
+      if (error.code === 11000) return false;
+      throw error;
+    }
+  }
+
+  /**
+   * Recalcular todos los rollups desde las colecciones
+   * @param {Object} options - { force: ignorar el lease }
+   */
+  reconcile({ force = false } = {}) {
+    if (this.reconciling) return this.reconciling;
+
+    this.reconciling = (async () => {
+      if (!force && !(await this.acquireLease())) return false;
+
+      const startedAt = Date.now();
+      await Promise.all([this.reconcileAnalyses(), this.refreshLibrary()]);
+
+      this.counters.reconciliations++;
+      this.counters.lastReconcileMs = Date.now() - startedAt;
+      console.log(`📊 Estadísticas reconciliadas en ${this.counters.lastReconcileMs}ms`);
+      return true;
+    })().finally(() => {
+      this.reconciling = null;
+    });
+
+    return this.reconciling;
+  }
+
+  async reconcileAnalyses() {
+    const now = new Date();
+    const since = new Date(Date.now() - this.retentionDays * DAY_MS);
+    const day = (field) => ({ $dateToString: { format: '%Y-%m-%d', date: field } });
+
+    const [byStatus, byCategory, created, finished, byUser] = await Promise.all([
+      Analysis.aggregate([{ $group: { _id: '$status', count: { $sum: 1 } } }]),
+      Analysis.aggregate([
+        { $match: { status: 'completed' } },
+        { $group: { _id: '$aiAnalysis.category', count: { $sum: 1 } } }
+      ]),
+      Analysis.aggregate([
+        { $match: { createdAt: { $gte: since } } },
+        { $group: { _id: day('$createdAt'), count: { $sum: 1 } } }
+      ]),
+      // Sin fecha de finalización: updatedAt es la mejor aproximación
+      Analysis.aggregate([
+        { $match: { status: { $in: ['completed', 'error'] }, updatedAt: { $gte: since } } },
+        { $group: { _id: { day: day('$updatedAt'), status: '$status' }, count: { $sum: 1 } } }
+      ]),
+      Analysis.aggregate([{ $group: { _id: '$userId', count: { $sum: 1 } } }])
+    ]);
+
+    const status = Object.fromEntries(byStatus.map(group => [group._id, group.count]));
+    const counts = {
+      total: byStatus.reduce((sum, group) => sum + group.count, 0),
+      status,
+      category: Object.fromEntries(byCategory.map(group => [categoryKey(group._id), group.count]))
+    };
+
+    const days = new Map();
+    const bucket = (key) => {
+      if (!days.has(key)) days.set(key, { created: 0, completed: 0, error: 0 });
+      return days.get(key);
+    };
+    for (const group of created) bucket(group._id).created = group.count;
+    for (const group of finished) bucket(group._id.day)[group._id.status] = group.count;
+
+    const ops = [
+      {
+        updateOne: {
+          filter: { _id: ANALYSES_ID },
+          update: { $set: { kind: 'analyses', counts, reconciledAt: now } },
+          upsert: true
+        }
+      },
+      ...[...days].map(([key, dayCounts]) => ({
+        updateOne: {
+          filter: { _id: `analyses:day:${key}` },
+          update: { $set: { kind: 'analysesDaily', day: key, counts: dayCounts, reconciledAt: now } },
+          upsert: true
+        }
+      })),
+      ...byUser.filter(group => group._id).map(group => ({
+        updateOne: {
+          filter: { _id: `analyses:user:${group._id}` },
+          update: { $set: { kind: 'analysesByUser', userId: group._id, counts: { total: group.count }, reconciledAt: now } },
+          upsert: true
+        }
+      }))
+    ];
+
+    await StatsRollup.bulkWrite(ops, { ordered: false });
+
+    // Días sin análisis, fuera de retención y usuarios sin análisis
+    // (updatedAt anterior al inicio: no los tocó ni la reconciliación ni un $inc posterior)
+    await StatsRollup.deleteMany({
+      $or: [
+        { kind: 'analysesDaily', $or: [{ day: { $lt: dayKey(since) } }, { updatedAt: { $lt: now } }] },
+        { kind: 'analysesByUser', updatedAt: { $lt: now } }
+      ]
+    });
+  }
+
+  // ==================== LECTURA ====================
+
+  /**
+   * Estadísticas de análisis para el dashboard de administración
+   * @param {Object} options - { days: cubetas diarias, topUsers }
+   */
+  async getAnalysisStats({ days = 7, topUsers = 5 } = {}) {
+    let rollup = await StatsRollup.findById(ANALYSES_ID).lean();
+    if (!rollup?.reconciledAt) {
+      await this.reconcile({ force: true });
+      rollup = await StatsRollup.findById(ANALYSES_ID).lean();
+    }
+
+    const since = dayKey(Date.now() - days * DAY_MS);
+    const [daily, users] = await Promise.all([
+      StatsRollup.find({ kind: 'analysesDaily', day: { $gte: since } }).sort({ day: 1 }).lean(),
+      StatsRollup.find({ kind: 'analysesByUser' }).sort({ 'counts.total': -1 }).limit(topUsers).lean()
+    ]);
+
+    const profiles = await User.find({ _id: { $in: users.map(u => u.userId) } })
+      .select('username email')
+      .lean();
+    const profileById = new Map(profiles.map(p => [p._id.toString(), p]));
+
+    const counts = rollup?.counts || {};
+    const status = counts.status || {};
+    const positive = (value) => Math.max(0, value || 0);
+
+    return {
+      total: positive(counts.total),
+      completed: positive(status.completed),
+      pending: positive(status.pending) + positive(status.analyzing),
+      errors: positive(status.error),
+      byCategory: toCountList(counts.category),
+      last7Days: daily
+        .filter(bucket => bucket.counts?.created > 0)
+        .map(bucket => ({ _id: bucket.day, count: bucket.counts.created })),
+      topUsers: users
+        .filter(u => profileById.has(u.userId?.toString()))
+        .map(u => {
+          const profile = profileById.get(u.userId.toString());
+          return {
+            _id: u.userId,
+            username: profile.username,
+            email: profile.email,
+            analysisCount: positive(u.counts?.total)
+          };
+        }),
+      reconciledAt: rollup?.reconciledAt || null
+    };
+  }
+
+  /**
+   * Estadísticas de la biblioteca: { phenomena, objects } con total y
+   * byCategory [{ _id, count }] ordenado
+   */
+  async getLibraryStats() {
+    const rollup = await StatsRollup.findById(LIBRARY_ID).lean();
+    const counts = rollup?.counts || await this.refreshLibrary();
+
+    const section = (data = {}) => ({
+      total: Math.max(0, data.total || 0),
+      byCategory: toCountList(data.category)
+    });
+
+    return {
+      phenomena: section(counts.phenomena),
+      objects: section(counts.objects)
+    };
+  }
+
+  /**
+   * Contadores del servicio (para monitoreo)
+   */
+  getStats() {
+    return { ...this.counters, reconciling: Boolean(this.reconciling) };
+  }
+}
+
+module.exports = new StatsService();
+module.exports.StatsService = StatsService;
@@ -0,0 +1,479 @@
+/**
+ * TELEMETRÍA DEL PIPELINE (spans, histogramas y /metrics)
+ *
+ * Cada capa del análisis, cada sub-análisis (visual, forense), cada consulta
+ * a MongoDB y cada llamada HTTP externa se mide como un span:
+ * - Tiempo real (wall) y CPU del proceso durante el span (todas las hebras,
+ *   incluidos los workers; con capas en paralelo las CPU se solapan)
+ * - Bytes decodificados (ImageContext informa con addDecodedBytes) y delta
+ *   de memoria (heap + external) en capas y sub-análisis
+ *
+ * Los spans se agrupan en una traza por análisis (AsyncLocalStorage: los
+ * servicios no necesitan recibir la traza) que se resume de forma compacta
+ * en Analysis.timings. Además alimentan, por tipo y nombre:
+ * - Histogramas acumulados para Prometheus (GET /metrics)
+ * - Muestras recientes para p50/p95 en el panel (GET /api/admin/performance)
+ *
+ * Consultas y HTTP solo miden tiempo real: son esperas de E/S concurrentes.
+ */
+
+const { AsyncLocalStorage } = require('async_hooks');
+const { envInt } = require('../utils/env');
+
+// Muestras recientes por serie para los percentiles del panel
+const SAMPLE_SIZE = envInt('TELEMETRY_SAMPLE_SIZE', 500);
+
+// Límites de los histogramas (segundos)
+const DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120];
+const CPU_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60];
+
+// Tipos con CPU y memoria (el resto solo tiempo real)
+const PROFILED_KINDS = new Set(['analysis', 'layer', 'task']);
+const KIND_ORDER = ['analysis', 'layer', 'task', 'db', 'http'];
+
+const storage = new AsyncLocalStorage();
+
+function percentiles(samples) {
+  if (samples.length === 0) {
+    return { count: 0, avg: 0, p50: 0, p95: 0, max: 0 };
+  }
+
+  const sorted = [...samples].sort((a, b) => a - b);
+  const pick = (q) => sorted[Math.min(sorted.length - 1, Math.floor(q * sorted.length))];
+  const round = (v) => Math.round(v * 10) / 10;
+
+  return {
+    count: sorted.length,
+    avg: round(sorted.reduce((s, v) => s + v, 0) / sorted.length),
+    p50: round(pick(0.5)),
+    p95: round(pick(0.95)),
+    max: round(sorted[sorted.length - 1])
+  };
+}
+
+function memoryInUse() {
+  const { heapUsed, external } = process.memoryUsage();
+  return heapUsed + external;
+}
+
+function escapeLabel(value) {
+  return String(value).replace(/\\/g, '\\\\').replace(/"/g, '\\"').replace(/\n/g, '\\n');
+}
+
+class Histogram {
+  constructor(buckets) {
+    this.buckets = buckets;
+    this.counts = new Array(buckets.length).fill(0);
+    this.sum = 0;
+    this.count = 0;
+  }
+
+  observe(value) {
+    this.sum += value;
+    this.count++;
+    for (let i = 0; i < this.buckets.length; i++) {
+      if (value <= this.buckets[i]) {
+        this.counts[i]++;
+        break;
+      }
+    }
+  }
+
+  render(metric, labels, lines) {
+    let cumulative = 0;
+    for (let i = 0; i < this.buckets.length; i++) {
+      cumulative += this.counts[i];
+      lines.push(`${metric}_bucket{${labels},le="${this.buckets[i]}"} ${cumulative}`);
+    }
+    lines.push(`${metric}_bucket{${labels},le="+Inf"} ${this.count}`);
+    lines.push(`${metric}_sum{${labels}} ${this.sum}`);
+    lines.push(`${metric}_count{${labels}} ${this.count}`);
+  }
+}
+
+/**
+ * Spans de un análisis, agregados por tipo y nombre
+ */
+class Trace {
+  constructor() {
+    this.startedAt = process.hrtime.bigint();
+    this.cpuStart = process.cpuUsage();
+    this.spans = new Map();
+    this.decodedBytes = 0;
+  }
+
+  add(kind, name, { ms, cpuMs = null, bytes = 0, memoryDelta = null, error = false }) {
+    const key = `${kind}:${name}`;
+    let span = this.spans.get(key);
+    if (!span) {
+      span = { kind, name, count: 0, ms: 0, cpuMs: 0, bytes: 0, memKb: 0, errors: 0 };
+      this.spans.set(key, span);
+    }
+
+    span.count++;
+    span.ms += ms;
+    if (cpuMs !== null) span.cpuMs += cpuMs;
+    if (memoryDelta !== null) span.memKb += memoryDelta / 1024;
+    span.bytes += bytes;
+    if (error) span.errors++;
+  }
+
+  /**
+   * Resumen compacto para Analysis.timings
+   * @param {Object} layerStates - Estados del planificador (status por capa)
+   */
+  summary(layerStates = {}) {
+    const totalMs = Number(process.hrtime.bigint() - this.startedAt) / 1e6;
+    const cpu = process.cpuUsage(this.cpuStart);
+
+    const spans = Array.from(this.spans.values())
+      .map(span => ({
+        kind: span.kind,
+        name: span.name,
+        count: span.count,
+        ms: Math.round(span.ms),
+        cpuMs: PROFILED_KINDS.has(span.kind) ? Math.round(span.cpuMs) : undefined,
+        bytes: span.bytes || undefined,
+        memKb: PROFILED_KINDS.has(span.kind) ? Math.round(span.memKb) : undefined,
+        errors: span.errors || undefined,
+        status: span.kind === 'layer' ? layerStates[span.name]?.status : undefined
+      }))
+      .sort((a, b) => KIND_ORDER.indexOf(a.kind) - KIND_ORDER.indexOf(b.kind) || b.ms - a.ms);
+
+    // Capas sin span (omitidas por dependencias)
+    for (const [name, state] of Object.entries(layerStates)) {
+      if (!this.spans.has(`layer:${name}`)) {
+        spans.push({ kind: 'layer', name, count: 0, ms: 0, status: state.status });
+      }
+    }
+
+    return {
+      totalMs: Math.round(totalMs),
+      cpuMs: Math.round((cpu.user + cpu.system) / 1000),
+      decodedBytes: this.decodedBytes,
+      spans,
+      recordedAt: new Date()
+    };
+  }
+}
+
+class TelemetryService {
+  constructor() {
+    // `${kind}:${name}` -> { kind, name, count, errors, bytes, memorySum, duration, cpu, samples }
+    this.series = new Map();
+    this.instrumented = false;
+  }
+
+  /**
+   * Iniciar una traza (un análisis)
+   */
+  startTrace() {
+    return new Trace();
+  }
+
+  /**
+   * Ejecutar fn con la traza activa (los spans anidados se asocian a ella)
+   */
+  runInTrace(trace, fn) {
+    return storage.run({ trace, span: null }, fn);
+  }
+
+  currentTrace() {
+    return storage.getStore()?.trace || null;
+  }
+
+  /**
+   * Medir una función como span con CPU, memoria y bytes decodificados
+   * @param {string} kind - 'layer' | 'task' | 'analysis'
+   * @param {string} name - Nombre del span (p. ej. 'visual.shape')
+   * @param {Function} fn - Función (síncrona o async)
+   * @returns {Promise<*>} Resultado de fn
+   */
+  async span(kind, name, fn) {
+    const parent = storage.getStore();
+    const span = { bytes: 0, parent: parent?.span || null };
+    const start = process.hrtime.bigint();
+    const cpuStart = process.cpuUsage();
+    const memoryStart = memoryInUse();
+    let error = false;
+
+    try {
+      return await storage.run({ trace: parent?.trace || null, span }, fn);
+    } catch (err) {
+      error = true;
+      throw err;
+    } finally {
+      const cpu = process.cpuUsage(cpuStart);
+      this.record(kind, name, {
+        ms: Number(process.hrtime.bigint() - start) / 1e6,
+        cpuMs: (cpu.user + cpu.system) / 1000,
+        bytes: span.bytes,
+        memoryDelta: memoryInUse() - memoryStart,
+        error
+      }, parent?.trace || null);
+
+      // Los bytes de un sub-análisis cuentan también para su capa
+      if (span.parent) span.parent.bytes += span.bytes;
+    }
+  }
+
+  /**
+   * Iniciar un span de E/S (consulta, HTTP) que termina en otro callback
+   * @returns {Object} Token para end()
+   */
+  begin(kind, name) {
+    return { kind, name, start: process.hrtime.bigint(), trace: this.currentTrace() };
+  }
+
+  end(token, error = false) {
+    if (!token || token.ended) return;
+    token.ended = true;
+    this.record(token.kind, token.name, {
+      ms: Number(process.hrtime.bigint() - token.start) / 1e6,
+      error
+    }, token.trace);
+  }
+
+  /**
+   * Contabilizar bytes decodificados en el span activo
+   */
+  addDecodedBytes(bytes) {
+    const store = storage.getStore();
+    if (!store) return;
+    if (store.span) store.span.bytes += bytes;
+    if (store.trace) store.trace.decodedBytes += bytes;
+  }
+
+  record(kind, name, sample, trace = null) {
+    const key = `${kind}:${name}`;
+    let series = this.series.get(key);
+    if (!series) {
+      series = {
+        kind,
+        name,
+        count: 0,
+        errors: 0,
+        bytes: 0,
+        memorySum: 0,
+        duration: new Histogram(DURATION_BUCKETS),
+        cpu: PROFILED_KINDS.has(kind) ? new Histogram(CPU_BUCKETS) : null,
+        samples: []
+      };
+      this.series.set(key, series);
+    }
+
+    series.count++;
+    if (sample.error) series.errors++;
+    series.bytes += sample.bytes || 0;
+    series.memorySum += sample.memoryDelta || 0;
+    series.duration.observe(sample.ms / 1000);
+    if (series.cpu && sample.cpuMs !== undefined) series.cpu.observe(sample.cpuMs / 1000);
+
+    series.samples.push(sample.ms);
+    if (series.samples.length > SAMPLE_SIZE) series.samples.shift();
+
+    if (trace) trace.add(kind, name, sample);
+  }
+
+  /**
+   * Envolver las capas del pipeline para medir cada run() como span
+   * @param {Object} layers - Capas de LayerSchedulerService
+   * @returns {Object} Capas con run() medido
+   */
+  wrapLayers(layers) {
+    const wrapped = {};
+    for (const [name, layer] of Object.entries(layers)) {
+      wrapped[name] = {
+        ...layer,
+        run: (results) => this.span('layer', name, () => layer.run(results))
+      };
+    }
+    return wrapped;
+  }
+
+  // ==================== INSTRUMENTACIÓN ====================
+
+  /**
+   * Registrar los hooks de MongoDB (plugin global: debe llamarse antes de
+   * compilar los modelos) y de axios
+   */
+  instrument({ mongoose = null, axios = null } = {}) {
+    if (this.instrumented) return;
+    this.instrumented = true;
+
+    if (mongoose) this.instrumentMongoose(mongoose);
+    if (axios) this.instrumentAxios(axios);
+  }
+
+  instrumentMongoose(mongoose) {
+    const telemetry = this;
+    const queryOps = [
+      'find', 'findOne', 'countDocuments', 'estimatedDocumentCount', 'distinct',
+      'updateOne', 'updateMany', 'deleteOne', 'deleteMany',
+      'findOneAndUpdate', 'findOneAndDelete', 'replaceOne'
+    ];
+
+    mongoose.plugin((schema) => {
+      schema.pre(queryOps, function () {
+        this._telemetry = telemetry.begin('db', `${this.model.modelName}.${this.op}`);
+      });
+      schema.post(queryOps, function () {
+        telemetry.end(this._telemetry);
+      });
+      schema.post(queryOps, function (error, res, next) {
+        telemetry.end(this._telemetry, true);
+        next(error);
+      });
+
+      schema.pre('aggregate', function () {
+        this._telemetry = telemetry.begin('db', `${this._model.modelName}.aggregate`);
+      });
+      schema.post('aggregate', function () {
+        telemetry.end(this._telemetry);
+      });
+      schema.post('aggregate', function (error, res, next) {
+        telemetry.end(this._telemetry, true);
+        next(error);
+      });
+
+      schema.pre('save', function () {
+        // Los subdocumentos también pasan por aquí: solo documentos de modelo
+        const modelName = this.constructor.modelName;
+        if (modelName && !this.$isSubdocument) {
+          this.$locals.telemetry = telemetry.begin('db', `${modelName}.save`);
+        }
+      });
+      schema.post('save', function () {
+        telemetry.end(this.$locals.telemetry);
+      });
+      schema.post('save', function (error, doc, next) {
+        telemetry.end(this.$locals.telemetry, true);
+        next(error);
+      });
+    });
+  }
+
+  instrumentAxios(axios) {
+    axios.interceptors.request.use((config) => {
+      let host = 'unknown';
+      try {
+        host = new URL(config.url, config.baseURL).host;
+      } catch (error) {
+        // URL relativa sin baseURL
+      }
+      config.telemetry = this.begin('http', host);
+      return config;
+    });
+
+    axios.interceptors.response.use(
+      (response) => {
+        this.end(response.config?.telemetry);
+        return response;
+      },
+      (error) => {
+        this.end(error.config?.telemetry, true);
+        return Promise.reject(error);
+      }
+    );
+  }
+
+  // ==================== CONSULTA ====================
+
+  /**
+   * Percentiles recientes por serie (para el panel de administración)
+   * @param {string} kind - Filtrar por tipo (opcional)
+   * @returns {Array<{kind, name, count, errors, ms: {avg, p50, p95, max}, avgCpuMs, decodedBytes}>}
+   */
+  getSummary(kind = null) {
+    return Array.from(this.series.values())
+      .filter(series => !kind || series.kind === kind)
+      .map(series => ({
+        kind: series.kind,
+        name: series.name,
+        count: series.count,
+        errors: series.errors,
+        ms: percentiles(series.samples),
+        avgCpuMs: series.cpu && series.cpu.count > 0
+          ? Math.round((series.cpu.sum / series.cpu.count) * 10000) / 10
+          : null,
+        avgMemoryDeltaKb: PROFILED_KINDS.has(series.kind) && series.count > 0
+          ? Math.round(series.memorySum / series.count / 1024)
+          : null,
+        decodedBytes: series.bytes
+      }))
+      .sort((a, b) => KIND_ORDER.indexOf(a.kind) - KIND_ORDER.indexOf(b.kind) || b.ms.p95 - a.ms.p95);
+  }
+
+  /**
+   * Métricas en formato de texto de Prometheus
+   * @param {Array<{name, type, help, samples: Array<{labels, value}>}>} extra - Métricas adicionales
+   * @returns {string}
+   */
+  renderPrometheus(extra = []) {
+    const lines = [];
+    const all = Array.from(this.series.values());
+    const labelsOf = (series) => `kind="${escapeLabel(series.kind)}",name="${escapeLabel(series.name)}"`;
+
+    lines.push('# HELP uap_span_duration_seconds Duración de capas, sub-análisis, consultas y llamadas HTTP');
+    lines.push('# TYPE uap_span_duration_seconds histogram');
+    all.forEach(series => series.duration.render('uap_span_duration_seconds', labelsOf(series), lines));
+
+    lines.push('# HELP uap_span_cpu_seconds CPU del proceso durante capas y sub-análisis');
+    lines.push('# TYPE uap_span_cpu_seconds histogram');
+    all.filter(series => series.cpu)
+      .forEach(series => series.cpu.render('uap_span_cpu_seconds', labelsOf(series), lines));
+
+    lines.push('# HELP uap_span_errors_total Spans terminados con error');
+    lines.push('# TYPE uap_span_errors_total counter');
+    all.forEach(series => lines.push(`uap_span_errors_total{${labelsOf(series)}} ${series.errors}`));
+
+    lines.push('# HELP uap_span_decoded_bytes_total Bytes de imagen decodificados');
+    lines.push('# TYPE uap_span_decoded_bytes_total counter');
+    all.filter(series => series.bytes > 0)
+      .forEach(series => lines.push(`uap_span_decoded_bytes_total{${labelsOf(series)}} ${series.bytes}`));
+
+    lines.push('# HELP uap_span_memory_delta_bytes_avg Delta medio de memoria (heap + external) por span');
+    lines.push('# TYPE uap_span_memory_delta_bytes_avg gauge');
+    all.filter(series => series.cpu && series.count > 0)
+      .forEach(series => lines.push(`uap_span_memory_delta_bytes_avg{${labelsOf(series)}} ${Math.round(series.memorySum / series.count)}`));
+
+    const memory = process.memoryUsage();
+    extra = [
+      {
+        name: 'process_resident_memory_bytes',
+        type: 'gauge',
+        help: 'Memoria residente del proceso',
+        samples: [{ value: memory.rss }]
+      },
+      {
+        name: 'nodejs_heap_used_bytes',
+        type: 'gauge',
+        help: 'Heap de V8 en uso',
+        samples: [{ value: memory.heapUsed }]
+      },
+      {
+        name: 'nodejs_external_memory_bytes',
+        type: 'gauge',
+        help: 'Memoria externa (Buffers de imagen)',
+        samples: [{ value: memory.external }]
+      },
+      ...extra
+    ];
+
+    for (const metric of extra) {
+      lines.push(`# HELP ${metric.name} ${metric.help}`);
+      lines.push(`# TYPE ${metric.name} ${metric.type}`);
+      for (const { labels = {}, value } of metric.samples) {
+        const rendered = Object.entries(labels)
+          .map(([key, label]) => `${key}="${escapeLabel(label)}"`)
+          .join(',');
+        lines.push(`${metric.name}${rendered ? `{${rendered}}` : ''} ${Number(value) || 0}`);
+      }
+    }
+
+    return `${lines.join('\n')}\n`;
+  }
+}
+
+module.exports = new TelemetryService();
+module.exports.TelemetryService = TelemetryService;
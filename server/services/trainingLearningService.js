@@ -1,4 +1,5 @@
 const TrainingImage = require('../models/TrainingImage');
+const trainingVectorIndex = require('./trainingVectorIndexService');
 const sharp = require('sharp');
 const fs = require('fs').promises;
 
@@ -16,9 +17,39 @@ class TrainingLearningService {
    * @param {string} imagePath - Ruta de la imagen a analizar
    * @param {object} preliminaryAnalysis - Análisis preliminar del sistema
    * @param {object} exifData - Datos EXIF de la imagen
+   * @param {ImageContext} imageContext - Imagen ya decodificada (opcional)
    * @returns {object} Análisis mejorado con datos de entrenamiento
    */
-  async enhanceAnalysisWithTraining(imagePath, preliminaryAnalysis, exifData = null) {
+  async enhanceAnalysisWithTraining(imagePath, preliminaryAnalysis, exifData = null, imageContext = null) {
+    const inputs = await this.extractTrainingInputs(imagePath, imageContext);
+    const result = await this.enhanceWithInputs(inputs, preliminaryAnalysis, exifData);
+    return { ...result, inputs };
+  }
+
+  /**
+   * Parte de la mejora que depende solo de la imagen: características
+   * básicas y embedding, como objeto plano para guardarlo con el análisis
+   * (services/rescoringService.js re-puntúa con él sin volver a decodificar)
+   * @returns {Promise<{basicFeatures: object, embedding: number[]|null}>}
+   */
+  async extractTrainingInputs(imagePath, imageContext = null) {
+    const basicFeatures = await this.extractBasicFeatures(imagePath, imageContext);
+    const embedding = await trainingVectorIndex.embedImage(imagePath, imageContext).catch(() => null);
+    return { basicFeatures, embedding: embedding ? Array.from(embedding) : null };
+  }
+
+  /**
+   * Mejora el análisis con entradas ya extraídas de la imagen
+   *
+   * @param {object} inputs - Resultado de extractTrainingInputs
+   * @param {object} preliminaryAnalysis - Análisis preliminar del sistema
+   * @param {object} exifData - Datos EXIF de la imagen
+   * @param {object} options - { recordUsage }: false para no contar el uso
+   *   de la imagen de entrenamiento (re-puntuación del histórico)
+   * @returns {object} Análisis mejorado con datos de entrenamiento
+   */
+  async enhanceWithInputs(inputs, preliminaryAnalysis, exifData = null, options = {}) {
+    const { recordUsage = true } = options;
     try {
       console.log('🎓 Iniciando mejora con datos de entrenamiento...');
       
@@ -49,8 +80,8 @@ class TrainingLearningService {
       console.log(`   Encontradas ${trainingMatches.length} imágenes de entrenamiento similares`);
 
       // 3. Comparar características visuales
-      const visualComparison = await this.compareVisualFeatures(
-        imagePath,
+      const visualComparison = this.compareVisualFeatures(
+        inputs,
         trainingMatches,
         preliminaryCategory  // Pasar categoría para penalización
       );
@@ -66,7 +97,7 @@ class TrainingLearningService {
       const bestTrainingMatch = visualComparison.bestMatch;
 
       // 6. Actualizar estadísticas de uso
-      if (bestTrainingMatch) {
+      if (bestTrainingMatch && recordUsage) {
         await this.updateTrainingImageUsage(bestTrainingMatch._id, enhancedConfidence > 70);
       }
 
@@ -134,6 +165,32 @@ class TrainingLearningService {
     }
   }
 
+  /**
+   * Vuelca el resultado de la mejora sobre el análisis (capa training del
+   * pipeline y re-puntuación del histórico)
+   * @param {Object} analysis - Documento Analysis u objeto de fotograma
+   * @param {object} trainingEnhancement - Resultado de enhanceWithInputs
+   */
+  applyEnhancement(analysis, trainingEnhancement) {
+    if (trainingEnhancement.enhanced) {
+      analysis.aiAnalysis = trainingEnhancement.enhancedAnalysis;
+
+      // Guardar datos de mejora para auditoría
+      analysis.trainingEnhancement = {
+        enhanced: true,
+        improvementDelta: trainingEnhancement.improvementDelta,
+        trainingMatchCount: trainingEnhancement.enhancedAnalysis.trainingData?.matchCount || 0,
+        enhancedAt: new Date()
+      };
+    } else {
+      analysis.aiAnalysis = trainingEnhancement.originalAnalysis;
+      analysis.trainingEnhancement = {
+        enhanced: false,
+        reason: trainingEnhancement.error || 'No hay datos de entrenamiento disponibles'
+      };
+    }
+  }
+
   /**
    * Busca imágenes de entrenamiento que coincidan con la categoría
    */
@@ -180,25 +237,22 @@ class TrainingLearningService {
 
       const mappedCategories = categoryMapping[category] || [category];
 
-      // Buscar imágenes activas y verificadas
-      let trainingImages = await TrainingImage.find({
-        category: { $in: mappedCategories },
-        isActive: true,
-        verified: true
-      })
-      .sort({ 'usageStats.accuracy': -1, 'usageStats.matchCount': -1 })
-      .limit(20);
+      // Buscar imágenes activas y verificadas (índice residente, sin consultar MongoDB)
+      await trainingVectorIndex.ensureLoaded();
+      let trainingImages = trainingVectorIndex.query({
+        categories: mappedCategories,
+        verified: true,
+        limit: 20
+      });
 
       // FALLBACK: Si no hay resultados, buscar en TODAS las categorías
       // y dejar que el algoritmo de similitud decida
       if (trainingImages.length === 0) {
         console.log(`   ⚠️ No hay imágenes para categoría "${category}", buscando en todas...`);
-        trainingImages = await TrainingImage.find({
-          isActive: true,
-          verified: true
-        })
-        .sort({ 'usageStats.accuracy': -1, 'usageStats.matchCount': -1 })
-        .limit(30); // Buscar más para compensar
+        trainingImages = trainingVectorIndex.query({
+          verified: true,
+          limit: 30 // Buscar más para compensar
+        });
 
         console.log(`   📊 Encontradas ${trainingImages.length} imágenes totales para comparar`);
       }
@@ -216,20 +270,26 @@ class TrainingLearningService {
    * 
    * NUEVO: Fusiona análisis visual + análisis textual de descripciones
    */
-  async compareVisualFeatures(imagePath, trainingImages, preliminaryCategory = null) {
+  compareVisualFeatures(inputs, trainingImages, preliminaryCategory = null) {
     try {
-      // Extraer características básicas de la imagen analizada
-      const imageFeatures = await this.extractBasicFeatures(imagePath);
-      
+      // Características básicas y embedding de la imagen analizada
+      const { basicFeatures: imageFeatures, embedding: queryEmbedding } = inputs;
+
+      // Similitud de embeddings de todos los candidatos en un solo barrido
+      const embeddingScores = trainingVectorIndex.scoreIds(queryEmbedding, trainingImages.map(t => t._id));
+
       const comparisons = [];
 
       for (const trainingImg of trainingImages) {
-        // 1. SIMILITUD VISUAL (características de imagen)
-        const visualSimilarity = this.calculateFeatureSimilarity(
-          imageFeatures,
-          trainingImg.visualFeatures,
-          trainingImg
-        );
+        // 1. SIMILITUD VISUAL (embedding; si la imagen no lo tiene, características de imagen)
+        const embeddingScore = embeddingScores.get(String(trainingImg._id));
+        const visualSimilarity = embeddingScore !== undefined
+          ? this.applyUsageBonus(embeddingScore, trainingImg)
+          : this.calculateFeatureSimilarity(
+            imageFeatures,
+            trainingImg.visualFeatures,
+            trainingImg
+          );
 
         // 2. SIMILITUD TEXTUAL (análisis de descripción)
         const textualSimilarity = this.calculateTextualSimilarity(
@@ -395,10 +455,14 @@ class TrainingLearningService {
   /**
    * Extrae características básicas de una imagen
    */
-  async extractBasicFeatures(imagePath) {
+  async extractBasicFeatures(imagePath, imageContext = null) {
     try {
-      const metadata = await sharp(imagePath).metadata();
-      const stats = await sharp(imagePath).stats();
+      const metadata = imageContext
+        ? imageContext.metadata
+        : await sharp(imagePath).metadata();
+      const stats = imageContext
+        ? await imageContext.getStats()
+        : await sharp(imagePath).stats();
 
       // Características básicas
       return {
@@ -574,8 +638,15 @@ class TrainingLearningService {
       ? (matchedWeight / totalWeight) * 100
       : 40;
 
+    return this.applyUsageBonus(calculatedSimilarity, trainingImage);
+  }
+
+  /**
+   * Aplica los bonus por historial de uso a una similitud visual (0-100)
+   */
+  applyUsageBonus(similarity, trainingImage) {
     // Bonus por estadísticas de uso positivas
-    let finalSimilarity = calculatedSimilarity;
+    let finalSimilarity = similarity;
     if (trainingImage.usageStats && trainingImage.usageStats.accuracy > 70) {
       finalSimilarity += (trainingImage.usageStats.accuracy - 70) * 0.2;
     }
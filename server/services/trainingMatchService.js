@@ -1,12 +1,18 @@
 const sharp = require('sharp');
 const path = require('path');
-const TrainingImage = require('../models/TrainingImage');
+const trainingVectorIndex = require('./trainingVectorIndexService');
+
+// Candidatos visuales por consulta en modo aproximado (además de los que
+// comparten keywords/tags con el contexto AI)
+const ANN_CANDIDATES = 200;
 
 /**
  * Servicio de Matching con Imágenes de Training
  * 
  * Compara una imagen subida con el dataset de training usando:
- * 1. Análisis visual: colores dominantes, histogramas, dimensiones
+ * 1. Análisis visual: similitud de embeddings (trainingVectorIndexService)
+ *    o, si la imagen de training aún no tiene embedding, colores dominantes,
+ *    brillo y dimensiones
  * 2. Similitud textual: keywords, descripción, tipo
  * 3. Score combinado ponderado
  */
@@ -17,27 +23,52 @@ class TrainingMatchService {
    * @param {string} imagePath - Ruta de la imagen subida
    * @param {object} exifData - Datos EXIF extraídos
    * @param {object} aiContext - Contexto del análisis AI (tags, descripción)
+   * @param {ImageContext} imageContext - Imagen ya decodificada (opcional)
    * @returns {object} - { bestMatch, allMatches, matchFound }
    */
-  static async findMatches(imagePath, exifData = {}, aiContext = {}) {
-    try {
-      console.log('🔍 TrainingMatchService: Iniciando búsqueda de matches...');
+  static async findMatches(imagePath, exifData = {}, aiContext = {}, imageContext = null) {
+    const query = await this.extractQuery(imagePath, imageContext);
+    return this.matchQuery(query, aiContext);
+  }
+
+  /**
+   * Parte de la búsqueda que depende solo de la imagen: características
+   * visuales y embedding. Es un objeto plano (el embedding como array) para
+   * poder guardarlo con el análisis y re-puntuarlo sin la imagen
+   * (services/rescoringService.js).
+   * @returns {Promise<{visualFeatures: object, embedding: number[]|null}>}
+   */
+  static async extractQuery(imagePath, imageContext = null) {
+    const visualFeatures = await this.extractVisualFeatures(imagePath, imageContext);
+    console.log('📊 Características visuales extraídas:', {
+      dominantColors: visualFeatures.dominantColors.slice(0, 3),
+      dimensions: visualFeatures.dimensions
+    });
 
-      // 1. Extraer características visuales de la imagen subida
-      const visualFeatures = await this.extractVisualFeatures(imagePath);
-      console.log('📊 Características visuales extraídas:', {
-        dominantColors: visualFeatures.dominantColors.slice(0, 3),
-        dimensions: visualFeatures.dimensions
+    const embedding = await trainingVectorIndex.embedImage(imagePath, imageContext)
+      .catch(err => {
+        console.error('⚠️ Error calculando embedding de la imagen:', err.message);
+        return null;
       });
 
-      // 2. Obtener todas las imágenes activas de training
-      const trainingImages = await TrainingImage.find({ isActive: true })
-        .select('category type model description keywords tags visualFeatures imageUrl')
-        .lean();
+    return { visualFeatures, embedding: embedding ? Array.from(embedding) : null };
+  }
+
+  /**
+   * Busca matches en el set de training actual para una consulta ya extraída
+   * @param {object} query - Resultado de extractQuery
+   * @param {object} aiContext - Contexto del análisis AI (tags, descripción)
+   * @returns {object} - { bestMatch, allMatches, matchFound }
+   */
+  static async matchQuery(query, aiContext = {}) {
+    try {
+      console.log('🔍 TrainingMatchService: Iniciando búsqueda de matches...');
+      const { visualFeatures, embedding: queryEmbedding } = query;
 
-      console.log(`📚 Comparando con ${trainingImages.length} imágenes de training...`);
+      // Candidatos desde el índice vectorial residente (sin leer la colección)
+      await trainingVectorIndex.ensureLoaded();
 
-      if (trainingImages.length === 0) {
+      if (trainingVectorIndex.size === 0) {
         return {
           matchFound: false,
           bestMatch: null,
@@ -46,13 +77,21 @@ class TrainingMatchService {
         };
       }
 
-      // 3. Calcular scores para cada imagen de training
+      const { candidates, total, approximate } = trainingVectorIndex.candidates(queryEmbedding, {
+        tokens: this.buildTextualKeywords(aiContext),
+        limit: ANN_CANDIDATES
+      });
+
+      console.log(`📚 Comparando con ${candidates.length} de ${total} imágenes de training${approximate ? ' (búsqueda aproximada)' : ''}...`);
+
+      // 3. Calcular scores (similitud visual ya calculada en un solo barrido)
       const matches = [];
-      for (const trainingImg of trainingImages) {
-        const score = await this.calculateMatchScore(
+      for (const { image: trainingImg, visualScore } of candidates) {
+        const score = this.calculateMatchScore(
           visualFeatures,
           aiContext,
-          trainingImg
+          trainingImg,
+          visualScore
         );
 
         if (score.total >= 40) { // Solo guardar matches con score >= 40%
@@ -84,7 +123,7 @@ class TrainingMatchService {
         matchFound,
         bestMatch,
         allMatches: matches.slice(0, 5), // Top 5 matches
-        totalCandidates: trainingImages.length
+        totalCandidates: total
       };
 
     } catch (error) {
@@ -101,11 +140,17 @@ class TrainingMatchService {
   /**
    * Extrae características visuales de una imagen
    */
-  static async extractVisualFeatures(imagePath) {
+  static async extractVisualFeatures(imagePath, imageContext = null) {
     try {
-      const image = sharp(imagePath);
-      const metadata = await image.metadata();
-      const stats = await image.stats();
+      let metadata, stats;
+      if (imageContext) {
+        metadata = imageContext.metadata;
+        stats = await imageContext.getStats();
+      } else {
+        const image = sharp(imagePath);
+        metadata = await image.metadata();
+        stats = await image.stats();
+      }
 
       // Colores dominantes (promedio de canales RGB)
       const dominantColors = stats.channels.map(channel => ({
@@ -144,11 +189,23 @@ class TrainingMatchService {
     }
   }
 
+  /**
+   * Keywords de la imagen subida a partir del contexto AI (tags + descripción)
+   */
+  static buildTextualKeywords(aiContext) {
+    return [
+      ...(aiContext.tags || []),
+      ...(aiContext.description ? aiContext.description.toLowerCase().split(' ') : [])
+    ];
+  }
+
   /**
    * Calcula score de similitud entre imagen subida y training
+   * @param {number} visualScore - Similitud de embeddings (0-100) del índice
+   *   vectorial; si es null se usa la comparación de visualFeatures
    * @returns {object} - { total, breakdown: { visual, textual, context } }
    */
-  static async calculateMatchScore(visualFeatures, aiContext, trainingImg) {
+  static calculateMatchScore(visualFeatures, aiContext, trainingImg, visualScore = null) {
     const scores = {
       visual: 0,
       textual: 0,
@@ -156,7 +213,9 @@ class TrainingMatchService {
     };
 
     // 1. SCORE VISUAL (50% del total)
-    if (trainingImg.visualFeatures && visualFeatures.dominantColors.length > 0) {
+    if (visualScore !== null) {
+      scores.visual = visualScore;
+    } else if (trainingImg.visualFeatures && visualFeatures.dominantColors.length > 0) {
       // Comparar colores dominantes (similaridad de RGB)
       if (trainingImg.visualFeatures.colors && trainingImg.visualFeatures.colors.length > 0) {
         const colorSimilarity = this.compareColors(
@@ -183,10 +242,7 @@ class TrainingMatchService {
 
     // 2. SCORE TEXTUAL (40% del total)
     const textualContext = {
-      keywords: [
-        ...(aiContext.tags || []),
-        ...(aiContext.description ? aiContext.description.toLowerCase().split(' ') : [])
-      ],
+      keywords: this.buildTextualKeywords(aiContext),
       description: aiContext.description || ''
     };
 
@@ -0,0 +1,887 @@
+/**
+ * ÍNDICE VECTORIAL DE IMÁGENES DE ENTRENAMIENTO
+ *
+ * Cada TrainingImage guarda un embedding de longitud fija (Float32) que se
+ * calcula UNA vez al guardar la imagen (hook pre('save') del modelo):
+ * medias y desviaciones RGB, brillo, contraste, aspect ratio, resolución e
+ * histograma de luminancia.
+ *
+ * El índice mantiene residentes las imágenes activas con sus embeddings ya
+ * ponderados en una matriz contigua (Float32Array n × D), de modo que la
+ * similitud visual contra todo el set de training es un único barrido
+ * vectorizado (L2 o coseno) en lugar de recalcular la similitud objeto a
+ * objeto desde visualFeatures.
+ *
+ * Con sets grandes (TRAINING_INDEX_ANN_MIN_SIZE) se usa un modo aproximado
+ * tipo IVF: k-means sobre los embeddings y búsqueda solo en las
+ * TRAINING_INDEX_ANN_PROBES listas más cercanas a la consulta.
+ *
+ * Se sincroniza con los hooks del modelo TrainingImage (save /
+ * findOneAndUpdate / findOneAndDelete / deleteOne) y, si MongoDB es un
+ * replica set, con un change stream.
+ */
+
+const path = require('path');
+const crypto = require('crypto');
+const sharp = require('sharp');
+const TrainingImage = require('../models/TrainingImage');
+const { SIZES } = require('./imageContextService');
+const { envInt } = require('../utils/env');
+
+// Subir al cambiar el cálculo del embedding: fuerza su recálculo (backfill)
+const EMBEDDING_VERSION = 1;
+
+const HIST_BINS = 16;
+const THUMB_SIZE = 64;
+const SERVER_ROOT = path.join(__dirname, '..');
+
+// Disposición del embedding (valores sin ponderar, todos en [0, 1])
+const E = {
+  MEAN_R: 0,
+  MEAN_G: 1,
+  MEAN_B: 2,
+  STD_R: 3,
+  STD_G: 4,
+  STD_B: 5,
+  BRIGHTNESS: 6,
+  CONTRAST: 7,
+  ASPECT_RATIO: 8,
+  AREA: 9,
+  HIST: 10,
+  LENGTH: 10 + HIST_BINS
+};
+
+// Peso de cada bloque (misma jerarquía que
+// trainingLearningService.calculateFeatureSimilarity).
+// maxSq: distancia cuadrática máxima del bloque sin ponderar; el histograma
+// guarda raíces de probabilidades (distancia de Hellinger, máximo 2).
+const BLOCKS = [
+  { start: E.MEAN_R, size: 3, weight: 25, maxSq: 3 },
+  { start: E.STD_R, size: 3, weight: 5, maxSq: 3 },
+  { start: E.BRIGHTNESS, size: 1, weight: 15, maxSq: 1 },
+  { start: E.CONTRAST, size: 1, weight: 15, maxSq: 1 },
+  { start: E.ASPECT_RATIO, size: 1, weight: 20, maxSq: 1 },
+  { start: E.AREA, size: 1, weight: 10, maxSq: 1 },
+  { start: E.HIST, size: HIST_BINS, weight: 10, maxSq: 2 }
+];
+
+// Escala por dimensión: con ella la distancia L2 ponderada queda en [0, 1]
+const DIM_SCALE = (() => {
+  const totalWeight = BLOCKS.reduce((sum, b) => sum + b.weight, 0);
+  const scale = new Float32Array(E.LENGTH);
+  for (const block of BLOCKS) {
+    const s = Math.sqrt(block.weight / (totalWeight * block.maxSq));
+    scale.fill(s, block.start, block.start + block.size);
+  }
+  return scale;
+})();
+
+// Campos que no hace falta mantener en memoria
+const EXCLUDED_FIELDS = '+embedding -notes -externalRefs';
+
+const KMEANS_ITERATIONS = 6;
+const KMEANS_SAMPLE_PER_LIST = 32;
+
+class TrainingVectorIndexService {
+  constructor(options = {}) {
+    this.mode = options.mode ?? (process.env.TRAINING_INDEX_MODE || 'auto'); // auto | exact | ann
+    this.metric = options.metric ?? (process.env.TRAINING_INDEX_METRIC || 'l2'); // l2 | cosine
+    this.annMinSize = options.annMinSize ?? envInt('TRAINING_INDEX_ANN_MIN_SIZE', 5000);
+    this.annLists = options.annLists ?? envInt('TRAINING_INDEX_ANN_LISTS', 0);
+    this.annProbes = options.annProbes ?? envInt('TRAINING_INDEX_ANN_PROBES', 8);
+
+    this.entries = new Map();     // id -> { image, slot }  (slot -1 = sin embedding)
+    this.byCategory = new Map();  // categoría -> Set(id)
+    this.byToken = new Map();     // keyword/tag normalizado -> Set(id)
+    this.digest = 0;              // XOR de los hashes de cada imagen (ver revision)
+
+    // Matriz de embeddings ponderados: fila `slot` = imagen ids[slot]
+    this.ids = [];
+    this.matrix = new Float32Array(64 * E.LENGTH);
+    this.norms = new Float32Array(64);
+
+    this.ann = null;              // { centroids, lists: Set(id)[], builtSize, changes }
+    this.annRebuild = null;
+
+    this.loaded = false;
+    this.loading = null;
+    this.pendingOps = null;
+    this.changeStream = null;
+    this.backfilling = false;
+  }
+
+  /**
+   * Cargar (o recargar) todas las imágenes activas con sus embeddings
+   */
+  async load() {
+    this.pendingOps = [];
+    const startTime = Date.now();
+
+    try {
+      const docs = await TrainingImage.find({ isActive: true }).select(EXCLUDED_FIELDS).lean();
+
+      this.entries.clear();
+      this.byCategory.clear();
+      this.byToken.clear();
+      this.digest = 0;
+      this.ids = [];
+      this.ann = null;
+
+      const stale = [];
+      for (const doc of docs) {
+        this.add(doc, decodeEmbedding(doc.embedding));
+        if (doc.embeddingVersion !== EMBEDDING_VERSION) stale.push(String(doc._id));
+      }
+
+      const pending = this.pendingOps;
+      this.pendingOps = null;
+      pending.forEach(op => op());
+
+      if (this.shouldUseAnn()) this.buildAnn();
+
+      this.loaded = true;
+      console.log(`🧮 Índice vectorial de training cargado: ${this.entries.size} imágenes (${this.ids.length} con embedding) en ${Date.now() - startTime}ms${this.ann ? `, IVF con ${this.ann.lists.length} listas` : ''}`);
+
+      if (stale.length > 0) {
+        this.backfill(stale).catch(err => console.error('⚠️ Error recalculando embeddings de training:', err.message));
+      }
+    } finally {
+      this.pendingOps = null;
+      this.loading = null;
+    }
+  }
+
+  /**
+   * Esperar a que el índice esté cargado (carga perezosa en el primer uso)
+   */
+  async ensureLoaded() {
+    if (this.loaded) return;
+    if (!this.loading) {
+      this.loading = this.load();
+    }
+    await this.loading;
+  }
+
+  /**
+   * Suscribirse a cambios de la colección (requiere replica set)
+   */
+  watch() {
+    if (this.changeStream) return;
+
+    try {
+      this.changeStream = TrainingImage.watch([], { fullDocument: 'updateLookup' });
+
+      this.changeStream.on('change', (change) => {
+        if (change.operationType === 'delete') {
+          this.remove(change.documentKey._id);
+        } else if (change.fullDocument) {
+          this.upsert(change.fullDocument);
+        }
+      });
+
+      this.changeStream.on('error', (error) => {
+        console.log(`ℹ️ Change stream de TrainingImage no disponible (${error.message}); se usan los hooks del modelo`);
+        this.changeStream.close().catch(() => {});
+        this.changeStream = null;
+      });
+    } catch (error) {
+      this.changeStream = null;
+    }
+  }
+
+  /**
+   * Calcular embeddings pendientes (imágenes anteriores al índice o con una
+   * versión de embedding antigua), una a una y en segundo plano
+   */
+  async backfill(ids) {
+    if (this.backfilling) return;
+    this.backfilling = true;
+    let computed = 0;
+
+    try {
+      for (const id of ids) {
+        const entry = this.entries.get(id);
+        if (!entry) continue;
+
+        const embedding = await embedImage(resolveImagePath(entry.image.imageUrl)).catch(() => null);
+        await TrainingImage.updateOne(
+          { _id: id },
+          { $set: { embedding: encodeEmbedding(embedding), embeddingVersion: EMBEDDING_VERSION } }
+        );
+
+        if (this.entries.has(id)) {
+          this.setVector(id, embedding);
+          if (embedding) computed++;
+        }
+      }
+      console.log(`🧮 Embeddings de training recalculados: ${computed}/${ids.length}`);
+    } finally {
+      this.backfilling = false;
+    }
+  }
+
+  /**
+   * Insertar o actualizar una imagen (documento Mongoose u objeto plano).
+   * Si el documento no trae el embedding (select: false), se conserva el
+   * vector que ya tenía el índice.
+   */
+  upsert(doc) {
+    if (!doc) return;
+    if (this.pendingOps) {
+      this.pendingOps.push(() => this.upsert(doc));
+    }
+
+    const image = typeof doc.toObject === 'function' ? doc.toObject({ virtuals: false }) : { ...doc };
+    const id = String(image._id);
+    const rawEmbedding = image.embedding;
+    delete image.embedding;
+    delete image.notes;
+    delete image.externalRefs;
+
+    const previous = this.entries.get(id);
+    const embedding = rawEmbedding === undefined && previous && previous.slot >= 0
+      ? this.unweightedRow(previous.slot)
+      : decodeEmbedding(rawEmbedding);
+
+    this.removeEntry(id);
+    if (image.isActive !== false) {
+      this.add(image, embedding);
+    }
+  }
+
+  /**
+   * Releer una imagen desde la base de datos y actualizar el índice
+   */
+  async refresh(id) {
+    const doc = await TrainingImage.findById(id).select(EXCLUDED_FIELDS).lean();
+    if (doc) {
+      this.upsert(doc);
+    } else {
+      this.remove(id);
+    }
+  }
+
+  /**
+   * Eliminar una imagen del índice
+   */
+  remove(id) {
+    if (!id) return;
+    if (this.pendingOps) {
+      this.pendingOps.push(() => this.remove(id));
+    }
+    this.removeEntry(String(id));
+  }
+
+  add(image, embedding) {
+    const id = String(image._id);
+    const entry = { image, slot: -1, list: -1, digest: 0 };
+    this.entries.set(id, entry);
+
+    if (!this.byCategory.has(image.category)) {
+      this.byCategory.set(image.category, new Set());
+    }
+    this.byCategory.get(image.category).add(id);
+
+    for (const token of imageTokens(image)) {
+      if (!this.byToken.has(token)) {
+        this.byToken.set(token, new Set());
+      }
+      this.byToken.get(token).add(id);
+    }
+
+    this.setVector(id, embedding);
+  }
+
+  removeEntry(id) {
+    const entry = this.entries.get(id);
+    if (!entry) return;
+
+    this.setVector(id, null);
+    this.entries.delete(id);
+    this.digest ^= entry.digest;
+    this.byCategory.get(entry.image.category)?.delete(id);
+    for (const token of imageTokens(entry.image)) {
+      this.byToken.get(token)?.delete(id);
+    }
+  }
+
+  /**
+   * Colocar (o quitar, con embedding null) la fila de una imagen en la matriz
+   */
+  setVector(id, embedding) {
+    const entry = this.entries.get(id);
+    if (!entry) return;
+
+    this.digest ^= entry.digest;
+    entry.digest = hashImage(entry.image, embedding);
+    this.digest ^= entry.digest;
+
+    if (!embedding) {
+      if (entry.slot < 0) return;
+      this.detachFromAnn(id, entry);
+
+      // Mover la última fila al hueco para mantener la matriz contigua
+      const last = this.ids.length - 1;
+      if (entry.slot !== last) {
+        const movedId = this.ids[last];
+        this.matrix.copyWithin(entry.slot * E.LENGTH, last * E.LENGTH, (last + 1) * E.LENGTH);
+        this.norms[entry.slot] = this.norms[last];
+        this.ids[entry.slot] = movedId;
+        this.entries.get(movedId).slot = entry.slot;
+      }
+      this.ids.pop();
+      entry.slot = -1;
+      return;
+    }
+
+    if (entry.slot < 0) {
+      entry.slot = this.ids.length;
+      this.ids.push(id);
+      this.ensureCapacity(this.ids.length);
+    }
+
+    const offset = entry.slot * E.LENGTH;
+    let norm = 0;
+    for (let i = 0; i < E.LENGTH; i++) {
+      const v = embedding[i] * DIM_SCALE[i];
+      this.matrix[offset + i] = v;
+      norm += v * v;
+    }
+    this.norms[entry.slot] = Math.sqrt(norm);
+
+    this.detachFromAnn(id, entry);
+    this.attachToAnn(id, entry);
+  }
+
+  ensureCapacity(rows) {
+    if (rows <= this.norms.length) return;
+
+    const capacity = Math.max(rows, this.norms.length * 2);
+    const matrix = new Float32Array(capacity * E.LENGTH);
+    matrix.set(this.matrix);
+    const norms = new Float32Array(capacity);
+    norms.set(this.norms);
+    this.matrix = matrix;
+    this.norms = norms;
+  }
+
+  unweightedRow(slot) {
+    const embedding = new Float32Array(E.LENGTH);
+    const offset = slot * E.LENGTH;
+    for (let i = 0; i < E.LENGTH; i++) {
+      embedding[i] = this.matrix[offset + i] / DIM_SCALE[i];
+    }
+    return embedding;
+  }
+
+  get size() {
+    return this.entries.size;
+  }
+
+  /**
+   * Huella del contenido del set de training: cambia al añadir, editar o
+   * eliminar imágenes y al recalcular embeddings, pero no con las
+   * estadísticas de uso. La usa la caché de capas.
+   */
+  get revision() {
+    return `${(this.digest >>> 0).toString(16)}.${this.entries.size}`;
+  }
+
+  // ==================== CONSULTAS ====================
+
+  /**
+   * Preparar un embedding de consulta (ponderado, con su norma)
+   * @param {Float32Array} embedding - Resultado de embedImage()
+   */
+  prepareQuery(embedding) {
+    const vector = new Float32Array(E.LENGTH);
+    let norm = 0;
+    for (let i = 0; i < E.LENGTH; i++) {
+      vector[i] = embedding[i] * DIM_SCALE[i];
+      norm += vector[i] * vector[i];
+    }
+    return { vector, norm: Math.sqrt(norm) };
+  }
+
+  /**
+   * Similitud visual (0-100) entre la consulta y la fila `slot`
+   */
+  scoreSlot(query, slot) {
+    const m = this.matrix;
+    const q = query.vector;
+    const offset = slot * E.LENGTH;
+
+    if (this.metric === 'cosine') {
+      let dot = 0;
+      for (let i = 0; i < E.LENGTH; i++) dot += m[offset + i] * q[i];
+      const denom = this.norms[slot] * query.norm;
+      return denom > 0 ? Math.max(0, dot / denom) * 100 : 0;
+    }
+
+    let sq = 0;
+    for (let i = 0; i < E.LENGTH; i++) {
+      const d = m[offset + i] - q[i];
+      sq += d * d;
+    }
+    return (1 - Math.min(1, Math.sqrt(sq))) * 100;
+  }
+
+  /**
+   * Similitud visual de toda la matriz en un solo barrido
+   * @returns {Float32Array} Puntuación por slot
+   */
+  scoreAll(query) {
+    const count = this.ids.length;
+    const scores = new Float32Array(count);
+    for (let slot = 0; slot < count; slot++) {
+      scores[slot] = this.scoreSlot(query, slot);
+    }
+    return scores;
+  }
+
+  /**
+   * Candidatos para el matching de TrainingMatchService, con su similitud
+   * visual precalculada (null si la imagen aún no tiene embedding).
+   *
+   * - Modo exacto: todas las imágenes activas
+   * - Modo aproximado (IVF): las `limit` más cercanas de las listas
+   *   sondeadas, más las que comparten algún keyword/tag con `tokens`
+   *
+   * @param {Float32Array} embedding - Embedding de la imagen analizada
+   * @param {Object} options - { tokens: string[], limit }
+   * @returns {{candidates: Array<{image, visualScore}>, total, approximate}}
+   */
+  candidates(embedding, options = {}) {
+    const { tokens = [], limit = 200 } = options;
+    const query = embedding ? this.prepareQuery(embedding) : null;
+
+    if (!query || !this.ann) {
+      const scores = query ? this.scoreAll(query) : null;
+      const candidates = [];
+      for (const entry of this.entries.values()) {
+        candidates.push({
+          image: entry.image,
+          visualScore: scores && entry.slot >= 0 ? scores[entry.slot] : null
+        });
+      }
+      return { candidates, total: this.entries.size, approximate: false };
+    }
+
+    const selected = new Map();
+    for (const { id, score } of this.searchAnn(query, limit)) {
+      selected.set(id, score);
+    }
+    for (const id of this.idsForTokens(tokens)) {
+      if (selected.has(id)) continue;
+      const entry = this.entries.get(id);
+      selected.set(id, entry.slot >= 0 ? this.scoreSlot(query, entry.slot) : null);
+    }
+
+    const candidates = [];
+    for (const [id, visualScore] of selected) {
+      candidates.push({ image: this.entries.get(id).image, visualScore });
+    }
+    return { candidates, total: this.entries.size, approximate: true };
+  }
+
+  /**
+   * Similitud visual contra un conjunto concreto de imágenes
+   * @param {Float32Array} embedding - Embedding de la imagen analizada
+   * @param {Array} ids - IDs de TrainingImage
+   * @returns {Map<string, number>} Solo incluye las imágenes con embedding
+   */
+  scoreIds(embedding, ids) {
+    const scores = new Map();
+    if (!embedding) return scores;
+
+    const query = this.prepareQuery(embedding);
+    for (const rawId of ids) {
+      const id = String(rawId);
+      const entry = this.entries.get(id);
+      if (entry && entry.slot >= 0) {
+        scores.set(id, this.scoreSlot(query, entry.slot));
+      }
+    }
+    return scores;
+  }
+
+  /**
+   * Top-k por similitud visual (exacto o aproximado según el modo)
+   * @returns {Array<{image, visualScore}>}
+   */
+  search(embedding, k = 10) {
+    const query = this.prepareQuery(embedding);
+    const hits = this.ann ? this.searchAnn(query, k) : this.searchExact(query, k);
+    return hits.map(({ id, score }) => ({ image: this.entries.get(id).image, visualScore: score }));
+  }
+
+  searchExact(query, k) {
+    const scores = this.scoreAll(query);
+    const top = [];
+    for (let slot = 0; slot < scores.length; slot++) {
+      insertHit(top, { id: this.ids[slot], score: scores[slot] }, k);
+    }
+    return top;
+  }
+
+  searchAnn(query, k) {
+    const { centroids, lists } = this.ann;
+    const probes = nearestCentroids(centroids, lists.length, query.vector, this.annProbes);
+
+    const top = [];
+    for (const list of probes) {
+      for (const id of lists[list]) {
+        insertHit(top, { id, score: this.scoreSlot(query, this.entries.get(id).slot) }, k);
+      }
+    }
+    return top;
+  }
+
+  /**
+   * Imágenes activas de unas categorías, ordenadas por precisión y uso
+   * (sustituye a la consulta por categoría de trainingLearningService)
+   * @param {Object} filter - { categories, verified, limit }
+   */
+  query(filter = {}) {
+    const { categories = null, verified = null, limit = 20 } = filter;
+
+    const ids = [];
+    if (categories) {
+      for (const category of categories) {
+        for (const id of this.byCategory.get(category) || []) ids.push(id);
+      }
+    } else {
+      ids.push(...this.entries.keys());
+    }
+
+    return ids
+      .map(id => this.entries.get(id).image)
+      .filter(image => verified === null || Boolean(image.verified) === verified)
+      .sort((a, b) =>
+        (b.usageStats?.accuracy || 0) - (a.usageStats?.accuracy || 0) ||
+        (b.usageStats?.matchCount || 0) - (a.usageStats?.matchCount || 0))
+      .slice(0, limit);
+  }
+
+  /**
+   * IDs de imágenes con algún keyword/tag igual a los tokens dados
+   */
+  idsForTokens(tokens) {
+    const ids = new Set();
+    for (const token of normalizeTokens(tokens)) {
+      for (const id of this.byToken.get(token) || []) ids.add(id);
+    }
+    return ids;
+  }
+
+  // ==================== MODO APROXIMADO (IVF) ====================
+
+  shouldUseAnn() {
+    if (this.mode === 'exact') return false;
+    const minSize = this.mode === 'ann' ? 64 : this.annMinSize;
+    return this.ids.length >= minSize;
+  }
+
+  /**
+   * k-means sobre una muestra de la matriz y asignación de todas las filas
+   * a su centroide más cercano
+   */
+  buildAnn() {
+    const count = this.ids.length;
+    const listCount = Math.max(2, this.annLists || Math.round(Math.sqrt(count)));
+    const D = E.LENGTH;
+    const startTime = Date.now();
+
+    // Muestra equiespaciada (determinista) para entrenar los centroides
+    const sampleSize = Math.min(count, listCount * KMEANS_SAMPLE_PER_LIST);
+    const sample = new Array(sampleSize);
+    for (let i = 0; i < sampleSize; i++) sample[i] = Math.floor(i * count / sampleSize);
+
+    const centroids = new Float32Array(listCount * D);
+    for (let c = 0; c < listCount; c++) {
+      const slot = sample[Math.floor(c * sampleSize / listCount)];
+      centroids.set(this.matrix.subarray(slot * D, slot * D + D), c * D);
+    }
+
+    const sums = new Float64Array(listCount * D);
+    const counts = new Uint32Array(listCount);
+    for (let iter = 0; iter < KMEANS_ITERATIONS; iter++) {
+      sums.fill(0);
+      counts.fill(0);
+      for (const slot of sample) {
+        const row = this.matrix.subarray(slot * D, slot * D + D);
+        const c = nearestCentroids(centroids, listCount, row, 1)[0];
+        counts[c]++;
+        for (let i = 0; i < D; i++) sums[c * D + i] += row[i];
+      }
+      for (let c = 0; c < listCount; c++) {
+        if (counts[c] === 0) continue; // Centroide vacío: se conserva
+        for (let i = 0; i < D; i++) centroids[c * D + i] = sums[c * D + i] / counts[c];
+      }
+    }
+
+    const lists = Array.from({ length: listCount }, () => new Set());
+    for (let slot = 0; slot < count; slot++) {
+      const entry = this.entries.get(this.ids[slot]);
+      entry.list = nearestCentroids(centroids, listCount, this.matrix.subarray(slot * D, slot * D + D), 1)[0];
+      lists[entry.list].add(this.ids[slot]);
+    }
+    this.ann = { centroids, lists, builtSize: count, changes: 0 };
+
+    console.log(`🧮 IVF de training construido: ${listCount} listas sobre ${count} embeddings en ${Date.now() - startTime}ms`);
+  }
+
+  attachToAnn(id, entry) {
+    if (!this.ann || entry.slot < 0) return;
+
+    const row = this.matrix.subarray(entry.slot * E.LENGTH, (entry.slot + 1) * E.LENGTH);
+    entry.list = nearestCentroids(this.ann.centroids, this.ann.lists.length, row, 1)[0];
+    this.ann.lists[entry.list].add(id);
+    this.noteAnnChange();
+  }
+
+  detachFromAnn(id, entry) {
+    if (!this.ann || entry.list < 0) return;
+
+    this.ann.lists[entry.list].delete(id);
+    entry.list = -1;
+    this.noteAnnChange();
+  }
+
+  /**
+   * Los centroides envejecen con altas/bajas: se reconstruyen fuera del
+   * camino de la petición cuando el set ha cambiado lo suficiente
+   */
+  noteAnnChange() {
+    this.ann.changes++;
+    if (this.annRebuild || this.ann.changes < Math.max(100, this.ann.builtSize * 0.2)) return;
+
+    this.annRebuild = setImmediate(() => {
+      this.annRebuild = null;
+      if (this.shouldUseAnn()) {
+        this.buildAnn();
+      } else {
+        this.ann = null;
+        for (const entry of this.entries.values()) entry.list = -1;
+      }
+    });
+    this.annRebuild.unref();
+  }
+
+  getStats() {
+    return {
+      images: this.entries.size,
+      embedded: this.ids.length,
+      dimensions: E.LENGTH,
+      metric: this.metric,
+      mode: this.ann ? 'ann' : 'exact',
+      annLists: this.ann ? this.ann.lists.length : 0,
+      annProbes: this.ann ? Math.min(this.annProbes, this.ann.lists.length) : 0
+    };
+  }
+}
+
+// ==================== EMBEDDINGS ====================
+
+/**
+ * Ruta en disco de una imagen de training según el formato de imageUrl
+ * (nombre de archivo en uploads/training o URL /uploads/... de la biblioteca)
+ */
+function resolveImagePath(imageUrl) {
+  if (!imageUrl || /^https?:\/\//i.test(imageUrl)) return null;
+  if (imageUrl.startsWith('/uploads/')) return path.join(SERVER_ROOT, imageUrl);
+  return path.join(SERVER_ROOT, 'uploads', 'training', imageUrl);
+}
+
+/**
+ * Calcular el embedding de una imagen
+ * @param {string} imagePath - Ruta de la imagen
+ * @param {ImageContext} imageContext - Imagen ya decodificada (opcional)
+ * @returns {Promise<Float32Array|null>}
+ */
+async function embedImage(imagePath, imageContext = null) {
+  if (!imagePath && !imageContext) return null;
+
+  let metadata, stats, thumb;
+  if (imageContext) {
+    metadata = imageContext.metadata;
+    stats = await imageContext.getStats();
+    thumb = await imageContext.sharpAt(SIZES.SMALL);
+  } else {
+    const image = sharp(imagePath);
+    metadata = await image.metadata();
+    stats = await image.stats();
+    thumb = sharp(imagePath);
+  }
+
+  const { data } = await thumb
+    .resize(THUMB_SIZE, THUMB_SIZE, { fit: 'inside' })
+    .greyscale()
+    .raw()
+    .toBuffer({ resolveWithObject: true });
+
+  return computeEmbedding(metadata, stats, data);
+}
+
+/**
+ * Embedding a partir de metadatos, estadísticas por canal (formato de
+ * sharp().stats()) y una miniatura en escala de grises
+ */
+function computeEmbedding(metadata, stats, grayData) {
+  const embedding = new Float32Array(E.LENGTH);
+  const channels = stats.channels || [];
+  const channel = (i) => channels[Math.min(i, channels.length - 1)] || { mean: 0, stdev: 0 };
+  const clamp = (v) => Math.max(0, Math.min(1, v));
+
+  let meanSum = 0;
+  let stdSum = 0;
+  for (let i = 0; i < 3; i++) {
+    const { mean } = channel(i);
+    const std = channel(i).stdev ?? channel(i).std ?? 0;
+    embedding[E.MEAN_R + i] = clamp(mean / 255);
+    embedding[E.STD_R + i] = clamp(std / 128);
+    meanSum += mean;
+    stdSum += std;
+  }
+
+  const r = channel(0).mean;
+  const g = channel(1).mean;
+  const b = channel(2).mean;
+  embedding[E.BRIGHTNESS] = clamp((0.299 * r + 0.587 * g + 0.114 * b) / 255);
+  embedding[E.CONTRAST] = clamp(stdSum / 3 / 255);
+
+  const width = metadata.width || 1;
+  const height = metadata.height || 1;
+  embedding[E.ASPECT_RATIO] = clamp((Math.log2(width / height) + 3) / 6); // 1:8 .. 8:1
+  embedding[E.AREA] = clamp(Math.log2(width * height) / 26);              // hasta ~67 MP
+
+  const histogram = new Float64Array(HIST_BINS);
+  for (let i = 0; i < grayData.length; i++) {
+    histogram[(grayData[i] * HIST_BINS) >> 8]++;
+  }
+  const total = grayData.length || 1;
+  for (let i = 0; i < HIST_BINS; i++) {
+    embedding[E.HIST + i] = Math.sqrt(histogram[i] / total);
+  }
+
+  return embedding;
+}
+
+/**
+ * Float32Array -> Buffer (little-endian) para guardar en MongoDB
+ */
+function encodeEmbedding(embedding) {
+  if (!embedding) return null;
+  const buffer = Buffer.alloc(E.LENGTH * 4);
+  for (let i = 0; i < E.LENGTH; i++) buffer.writeFloatLE(embedding[i], i * 4);
+  return buffer;
+}
+
+/**
+ * Buffer / BSON Binary -> Float32Array (null si falta o tiene otra longitud)
+ */
+function decodeEmbedding(value) {
+  if (!value) return null;
+
+  let bytes = value;
+  if (value._bsontype === 'Binary') {
+    bytes = value.buffer;
+  }
+  if (!(bytes instanceof Uint8Array) || bytes.length !== E.LENGTH * 4) return null;
+
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  const embedding = new Float32Array(E.LENGTH);
+  for (let i = 0; i < E.LENGTH; i++) embedding[i] = view.getFloat32(i * 4, true);
+  return embedding;
+}
+
+/**
+ * Calcular y asignar el embedding de un documento TrainingImage (hook
+ * pre('save')). Si la imagen no se puede leer queda sin embedding.
+ */
+async function embedTrainingImage(doc) {
+  const embedding = await embedImage(resolveImagePath(doc.imageUrl)).catch(() => null);
+  doc.embedding = encodeEmbedding(embedding);
+  doc.embeddingVersion = EMBEDDING_VERSION;
+}
+
+// ==================== AUXILIARES ====================
+
+/**
+ * Hash de 32 bits del contenido de una imagen y su embedding (sin
+ * estadísticas de uso ni marcas de tiempo)
+ */
+function hashImage(image, embedding) {
+  const { usageStats, updatedAt, createdAt, __v, ...content } = image;
+  const hash = crypto.createHash('sha1').update(JSON.stringify(content));
+  if (embedding) hash.update(Buffer.from(embedding.buffer, embedding.byteOffset, embedding.byteLength));
+  return hash.digest().readUInt32BE(0);
+}
+
+function normalizeTokens(tokens) {
+  return tokens
+    .map(t => String(t).toLowerCase().trim())
+    .filter(t => t.length > 2);
+}
+
+function imageTokens(image) {
+  return new Set(normalizeTokens([...(image.keywords || []), ...(image.tags || [])]));
+}
+
+/**
+ * Índices de los `count` centroides más cercanos (L2) a un vector
+ */
+function nearestCentroids(centroids, listCount, vector, count) {
+  const D = E.LENGTH;
+
+  if (count === 1) {
+    let nearest = 0;
+    let nearestSq = Infinity;
+    for (let c = 0; c < listCount; c++) {
+      let sq = 0;
+      for (let i = 0; i < D; i++) {
+        const d = centroids[c * D + i] - vector[i];
+        sq += d * d;
+      }
+      if (sq < nearestSq) {
+        nearestSq = sq;
+        nearest = c;
+      }
+    }
+    return [nearest];
+  }
+
+  const best = [];
+  for (let c = 0; c < listCount; c++) {
+    let sq = 0;
+    for (let i = 0; i < D; i++) {
+      const d = centroids[c * D + i] - vector[i];
+      sq += d * d;
+    }
+    insertHit(best, { id: c, score: -sq }, count);
+  }
+
+  return best.map(hit => hit.id);
+}
+
+/**
+ * Insertar en una lista top-k ordenada por puntuación descendente
+ */
+function insertHit(top, hit, k) {
+  if (top.length >= k && hit.score <= top[top.length - 1].score) return;
+
+  let i = top.length;
+  while (i > 0 && top[i - 1].score < hit.score) i--;
+  top.splice(i, 0, hit);
+  if (top.length > k) top.pop();
+}
+
+module.exports = new TrainingVectorIndexService();
+module.exports.TrainingVectorIndexService = TrainingVectorIndexService;
+module.exports.EMBEDDING_VERSION = EMBEDDING_VERSION;
+module.exports.embedImage = embedImage;
+module.exports.embedTrainingImage = embedTrainingImage;
+module.exports.computeEmbedding = computeEmbedding;
+module.exports.encodeEmbedding = encodeEmbedding;
+module.exports.decodeEmbedding = decodeEmbedding;
+module.exports.resolveImagePath = resolveImagePath;
@@ -0,0 +1,661 @@
+/**
+ * ÍNDICE EN MEMORIA DEL CATÁLOGO DE REFERENCIA (UFODatabase)
+ *
+ * Mantiene residentes los objetos activos del catálogo con:
+ * - Vector numérico precalculado de características científicas
+ *   (mismo cálculo que featureExtractionService.calculateFeatureSimilarity)
+ * - Listas invertidas por categoría y por visualPatterns
+ *
+ * Se carga al arrancar y se mantiene al día con los hooks del modelo
+ * UFODatabase (save / findOneAndUpdate / findOneAndDelete / deleteOne, que
+ * cubren las rutas de administración de library.js y admin.js) y, si MongoDB
+ * es un replica set, con un change stream para cambios de otros procesos
+ * (scripts de seed, otras instancias).
+ *
+ * Las consultas top-k podan candidatos con una cota superior exacta: el
+ * término de histograma (el más caro) solo se calcula si el objeto aún puede
+ * entrar en el top-k.
+ */
+
+const crypto = require('crypto');
+const UFODatabase = require('../models/UFODatabase');
+
+// Campos pesados que no hace falta mantener en memoria
+const EXCLUDED_FIELDS = '-editHistory -images';
+
+const HIST_BINS = 16;
+
+// Disposición del vector de características
+const V = {
+  AREA: 0,
+  COMPACTNESS: 1,
+  ASPECT_RATIO: 2,
+  ENTROPY: 3,
+  ENERGY: 4,
+  CONTRAST: 5,
+  EDGE_DENSITY: 6,
+  EDGE_STRENGTH: 7,
+  CENTROID_X: 8,
+  CENTROID_Y: 9,
+  ECCENTRICITY: 10,
+  HIST_R: 11,
+  HIST_G: 11 + HIST_BINS,
+  HIST_B: 11 + 2 * HIST_BINS,
+  NORM_R: 11 + 3 * HIST_BINS,
+  NORM_G: 12 + 3 * HIST_BINS,
+  NORM_B: 13 + 3 * HIST_BINS,
+  LENGTH: 14 + 3 * HIST_BINS
+};
+
+class UFOFeatureIndexService {
+  constructor() {
+    this.entries = new Map();      // id -> { object, vector }
+    this.byCategory = new Map();   // categoría -> Set(id)
+    this.byPattern = new Map();    // patrón (minúsculas) -> Set(id)
+    this.digest = 0;               // XOR de los hashes de cada objeto (ver revision)
+
+    this.loaded = false;
+    this.loading = null;
+    this.pendingOps = null;        // Cambios recibidos durante una carga
+    this.changeStream = null;
+  }
+
+  /**
+   * Cargar (o recargar) el catálogo activo completo
+   */
+  async load() {
+    this.pendingOps = [];
+    const startTime = Date.now();
+
+    try {
+      const docs = await UFODatabase.find({ isActive: true }).select(EXCLUDED_FIELDS).lean();
+
+      this.entries.clear();
+      this.byCategory.clear();
+      this.byPattern.clear();
+      this.digest = 0;
+      docs.forEach(doc => this.add(doc));
+
+      // Reaplicar cambios que llegaron mientras se leía la colección
+      const pending = this.pendingOps;
+      this.pendingOps = null;
+      pending.forEach(op => op());
+
+      this.loaded = true;
+      console.log(`📚 Índice de catálogo cargado: ${this.entries.size} objetos en ${Date.now() - startTime}ms`);
+    } finally {
+      this.pendingOps = null;
+      this.loading = null;
+    }
+  }
+
+  /**
+   * Esperar a que el índice esté cargado (carga perezosa en el primer uso)
+   */
+  async ensureLoaded() {
+    if (this.loaded) return;
+    if (!this.loading) {
+      this.loading = this.load();
+    }
+    await this.loading;
+  }
+
+  /**
+   * Suscribirse a cambios de la colección (requiere replica set; en un
+   * servidor standalone basta con los hooks del modelo)
+   */
+  watch() {
+    if (this.changeStream) return;
+
+    try {
+      this.changeStream = UFODatabase.watch([], { fullDocument: 'updateLookup' });
+
+      this.changeStream.on('change', (change) => {
+        if (change.operationType === 'delete') {
+          this.remove(change.documentKey._id);
+        } else if (change.fullDocument) {
+          this.upsert(change.fullDocument);
+        }
+      });
+
+      this.changeStream.on('error', (error) => {
+        console.log(`ℹ️ Change stream de UFODatabase no disponible (${error.message}); se usan los hooks del modelo`);
+        this.changeStream.close().catch(() => {});
+        this.changeStream = null;
+      });
+    } catch (error) {
+      this.changeStream = null;
+    }
+  }
+
+  /**
+   * Insertar o actualizar un objeto (documento Mongoose u objeto plano)
+   */
+  upsert(doc) {
+    if (!doc) return;
+    if (this.pendingOps) {
+      this.pendingOps.push(() => this.upsert(doc));
+    }
+
+    const object = typeof doc.toObject === 'function' ? doc.toObject() : { ...doc };
+    delete object.editHistory;
+    delete object.images;
+
+    this.removeEntry(String(object._id));
+    if (object.isActive !== false) {
+      this.add(object);
+    }
+  }
+
+  /**
+   * Releer un objeto desde la base de datos y actualizar el índice
+   */
+  async refresh(id) {
+    const doc = await UFODatabase.findById(id).select(EXCLUDED_FIELDS).lean();
+    if (doc) {
+      this.upsert(doc);
+    } else {
+      this.remove(id);
+    }
+  }
+
+  /**
+   * Eliminar un objeto del índice
+   */
+  remove(id) {
+    if (!id) return;
+    if (this.pendingOps) {
+      this.pendingOps.push(() => this.remove(id));
+    }
+    this.removeEntry(String(id));
+  }
+
+  add(object) {
+    const id = String(object._id);
+    const features = resolveFeatures(object);
+
+    const digest = hashObject(object);
+    this.entries.set(id, { object, features, vector: toVector(features), digest });
+    this.digest ^= digest;
+
+    if (!this.byCategory.has(object.category)) {
+      this.byCategory.set(object.category, new Set());
+    }
+    this.byCategory.get(object.category).add(id);
+
+    for (const pattern of object.visualPatterns || []) {
+      const key = pattern.toLowerCase();
+      if (!this.byPattern.has(key)) {
+        this.byPattern.set(key, new Set());
+      }
+      this.byPattern.get(key).add(id);
+    }
+  }
+
+  removeEntry(id) {
+    const entry = this.entries.get(id);
+    if (!entry) return;
+
+    this.entries.delete(id);
+    this.digest ^= entry.digest;
+    this.byCategory.get(entry.object.category)?.delete(id);
+    for (const pattern of entry.object.visualPatterns || []) {
+      this.byPattern.get(pattern.toLowerCase())?.delete(id);
+    }
+  }
+
+  get size() {
+    return this.entries.size;
+  }
+
+  /**
+   * Huella del contenido del catálogo: cambia al añadir, editar o eliminar
+   * objetos (no con los contadores de matching). La usa la caché de capas.
+   */
+  get revision() {
+    return `${(this.digest >>> 0).toString(16)}.${this.entries.size}`;
+  }
+
+  /**
+   * Objetos activos del catálogo (planos, sin hidratar)
+   */
+  getObjects() {
+    return Array.from(this.entries.values(), entry => entry.object);
+  }
+
+  /**
+   * Objetos activos de una categoría (lista invertida)
+   */
+  getByCategory(category) {
+    const ids = this.byCategory.get(category);
+    return ids ? Array.from(ids, id => this.entries.get(id).object) : [];
+  }
+
+  /**
+   * Patrones del vocabulario del catálogo que coinciden (por subcadena, en
+   * cualquier sentido) con alguno de los patrones de la imagen. Se evalúa una
+   * vez por patrón distinto en lugar de una vez por objeto.
+   * @param {string[]} imagePatterns
+   * @returns {Set<string>} Patrones coincidentes (en minúsculas)
+   */
+  matchPatternVocabulary(imagePatterns) {
+    const lowered = imagePatterns.map(ip => ip.toLowerCase());
+    const matched = new Set();
+
+    for (const pattern of this.byPattern.keys()) {
+      if (lowered.some(ip => ip.includes(pattern) || pattern.includes(ip))) {
+        matched.add(pattern);
+      }
+    }
+
+    return matched;
+  }
+
+  /**
+   * Top-k de objetos más similares a unas características científicas
+   * @param {Object} inputFeatures - Resultado de extractScientificFeatures
+   * @param {number} k - Número de resultados
+   * @param {Object} options - { categories } restringir a ciertas categorías
+   * @returns {{matches: Array, total: number, scored: number, pruned: number}}
+   */
+  topK(inputFeatures, k = 10, options = {}) {
+    const query = toVector(inputFeatures);
+    const candidates = this.candidateIds(options.categories);
+
+    const results = [];
+    const topScores = []; // Puntuaciones del top-k actual, orden descendente
+    let scored = 0;
+    let pruned = 0;
+    let order = 0;
+
+    for (const id of candidates) {
+      const entry = this.entries.get(id);
+      const v = entry.vector;
+      order++;
+
+      const partial = scalarTerms(query, v);
+
+      // Cota superior: similitud de histograma <= 100
+      if (topScores.length >= k) {
+        const upperBound = (partial.morph * 20 + 100 * 30 + partial.texture * 20 +
+          partial.edge * 15 + partial.moment * 15) / 100;
+        if (Math.round(upperBound + 1e-9) < topScores[k - 1]) {
+          pruned++;
+          continue;
+        }
+      }
+
+      const similarityScore = combineTerms(partial, histogramTerm(query, v));
+      scored++;
+
+      results.push({ entry, similarityScore, order });
+      insertScore(topScores, similarityScore, k);
+    }
+
+    // Orden estable por puntuación (empates en orden de carga, como antes)
+    results.sort((a, b) => b.similarityScore - a.similarityScore || a.order - b.order);
+
+    return {
+      matches: results.slice(0, k).map(({ entry, similarityScore }) => ({
+        object: entry.object,
+        features: entry.features,
+        similarityScore
+      })),
+      total: candidates.length,
+      scored,
+      pruned
+    };
+  }
+
+  candidateIds(categories) {
+    if (!categories || categories.length === 0) {
+      return Array.from(this.entries.keys());
+    }
+
+    const ids = [];
+    for (const category of categories) {
+      for (const id of this.byCategory.get(category) || []) ids.push(id);
+    }
+    return ids;
+  }
+}
+
+/**
+ * Hash de 32 bits del contenido de un objeto (sin contadores ni marcas de tiempo)
+ */
+function hashObject(object) {
+  const { matchCount, updatedAt, createdAt, __v, ...content } = object;
+  return crypto.createHash('sha1').update(JSON.stringify(content)).digest().readUInt32BE(0);
+}
+
+// ==================== VECTORES Y SIMILITUD ====================
+
+/**
+ * Características a usar para un objeto del catálogo: las precalculadas si
+ * existen (completando las partes que falten) o las sintéticas por categoría
+ */
+function resolveFeatures(object) {
+  const stored = object.scientificFeatures;
+
+  // Validar que scientificFeatures existe y tiene la estructura correcta
+  if (!stored || !stored.morphology || !stored.colorHistogram) {
+    return generateDefaultFeatures(object);
+  }
+
+  if (stored.texture && stored.edges && stored.moments) {
+    return stored;
+  }
+
+  const defaults = generateDefaultFeatures(object);
+  return {
+    ...stored,
+    texture: stored.texture || defaults.texture,
+    edges: stored.edges || defaults.edges,
+    moments: stored.moments || defaults.moments
+  };
+}
+
+/**
+ * Empaquetar características en un Float64Array (con las normas de los
+ * histogramas precalculadas)
+ */
+function toVector(features) {
+  const v = new Float64Array(V.LENGTH);
+  const { morphology, colorHistogram, texture, edges, moments } = features;
+
+  v[V.AREA] = morphology.area;
+  v[V.COMPACTNESS] = morphology.compactness;
+  v[V.ASPECT_RATIO] = morphology.aspectRatio;
+  v[V.ENTROPY] = texture.entropy;
+  v[V.ENERGY] = texture.energy;
+  v[V.CONTRAST] = texture.contrast;
+  v[V.EDGE_DENSITY] = edges.edgeDensity;
+  v[V.EDGE_STRENGTH] = edges.averageEdgeStrength;
+  v[V.CENTROID_X] = moments.centroidX;
+  v[V.CENTROID_Y] = moments.centroidY;
+  v[V.ECCENTRICITY] = moments.eccentricity;
+
+  const channels = [
+    ['histogramR', V.HIST_R, V.NORM_R],
+    ['histogramG', V.HIST_G, V.NORM_G],
+    ['histogramB', V.HIST_B, V.NORM_B]
+  ];
+  for (const [key, offset, normIdx] of channels) {
+    const hist = colorHistogram[key] || [];
+    let mag = 0;
+    for (let i = 0; i < HIST_BINS; i++) {
+      const value = hist[i] || 0;
+      v[offset + i] = value;
+      mag += value * value;
+    }
+    v[normIdx] = Math.sqrt(mag);
+  }
+
+  return v;
+}
+
+/**
+ * Términos escalares (baratos) de la similitud: morfología, textura, bordes, momentos
+ */
+function scalarTerms(q, v) {
+  const areaD = 1 - Math.abs(q[V.AREA] - v[V.AREA]);
+  const compactD = 1 - Math.abs(q[V.COMPACTNESS] - v[V.COMPACTNESS]);
+  const aspectD = 1 - Math.min(Math.abs(q[V.ASPECT_RATIO] - v[V.ASPECT_RATIO]) / 2, 1);
+
+  const entropyD = 1 - Math.abs(q[V.ENTROPY] - v[V.ENTROPY]) / 8;
+  const energyD = 1 - Math.abs(q[V.ENERGY] - v[V.ENERGY]);
+  const contrastD = 1 - Math.min(Math.abs(q[V.CONTRAST] - v[V.CONTRAST]) / 1000, 1);
+
+  const densityD = 1 - Math.abs(q[V.EDGE_DENSITY] - v[V.EDGE_DENSITY]);
+  const strengthD = 1 - Math.min(Math.abs(q[V.EDGE_STRENGTH] - v[V.EDGE_STRENGTH]) / 100, 1);
+
+  const centroidD = 1 - Math.sqrt(
+    Math.pow(q[V.CENTROID_X] - v[V.CENTROID_X], 2) +
+    Math.pow(q[V.CENTROID_Y] - v[V.CENTROID_Y], 2)
+  );
+  const eccentD = 1 - Math.abs(q[V.ECCENTRICITY] - v[V.ECCENTRICITY]);
+
+  return {
+    morph: (areaD + compactD + aspectD) / 3 * 100,
+    texture: (entropyD + energyD + contrastD) / 3 * 100,
+    edge: (densityD + strengthD) / 2 * 100,
+    moment: (centroidD + eccentD) / 2 * 100
+  };
+}
+
+/**
+ * Similitud de coseno media de los tres histogramas (0-100)
+ */
+function histogramTerm(q, v) {
+  let totalSim = 0;
+
+  for (const [offset, normIdx] of [[V.HIST_R, V.NORM_R], [V.HIST_G, V.NORM_G], [V.HIST_B, V.NORM_B]]) {
+    let dotProduct = 0;
+    for (let i = 0; i < HIST_BINS; i++) {
+      dotProduct += q[offset + i] * v[offset + i];
+    }
+
+    const norm1 = q[normIdx];
+    const norm2 = v[normIdx];
+    totalSim += (norm1 > 0 && norm2 > 0) ? dotProduct / (norm1 * norm2) : 0;
+  }
+
+  return (totalSim / 3) * 100;
+}
+
+/**
+ * Ponderación final (mismos pesos que calculateFeatureSimilarity)
+ */
+function combineTerms(partial, hist) {
+  let totalScore = 0;
+  totalScore += partial.morph * 20;
+  totalScore += hist * 30;
+  totalScore += partial.texture * 20;
+  totalScore += partial.edge * 15;
+  totalScore += partial.moment * 15;
+  return Math.round(totalScore / 100);
+}
+
+function insertScore(topScores, score, k) {
+  let i = topScores.length;
+  while (i > 0 && topScores[i - 1] < score) i--;
+  topScores.splice(i, 0, score);
+  if (topScores.length > k) topScores.pop();
+}
+
+// ==================== CARACTERÍSTICAS POR DEFECTO ====================
+
+/**
+ * Genera características por defecto basadas en metadatos del objeto
+ * (Para objetos sin características precalculadas)
+ * MEJORADO: Mayor diferenciación por categoría
+ */
+function generateDefaultFeatures(obj) {
+  // Generar features sintéticas MUY DIFERENCIADAS por categoría y características
+  const shape = obj.characteristics?.shape || 'irregular';
+  const colors = obj.characteristics?.color || ['gray'];
+  const luminosity = obj.characteristics?.luminosity || 'tenue';
+  const category = obj.category;
+  
+  // MORFOLOGÍA - VALORES MUY ESPECÍFICOS POR CATEGORÍA
+  const morphologyMap = {
+    'celestial': { area: 0.05, compactness: 0.95, aspectRatio: 1.0, perimeter: 0.8 },      // Puntos muy compactos
+    'satellite': { area: 0.08, compactness: 0.85, aspectRatio: 1.2, perimeter: 1.1 },      // Pequeños, algo alargados
+    'aircraft': { area: 0.25, compactness: 0.35, aspectRatio: 3.5, perimeter: 5.0 },       // Grandes, MUY alargados
+    'drone': { area: 0.15, compactness: 0.50, aspectRatio: 1.8, perimeter: 2.5 },          // Medianos, moderadamente alargados
+    'balloon': { area: 0.30, compactness: 0.80, aspectRatio: 1.1, perimeter: 2.2 },        // Grandes, redondos
+    'bird': { area: 0.12, compactness: 0.40, aspectRatio: 2.0, perimeter: 2.8 },           // Pequeños, con alas
+    'natural': { area: 0.40, compactness: 0.20, aspectRatio: 1.5, perimeter: 8.0 },        // Irregulares, difusos
+    'uap': { area: 0.20, compactness: 0.75, aspectRatio: 1.3, perimeter: 2.0 },            // Variables
+    'hoax': { area: 0.22, compactness: 0.60, aspectRatio: 1.4, perimeter: 2.3 },           // Similar a UAP
+    'unknown': { area: 0.18, compactness: 0.55, aspectRatio: 1.5, perimeter: 2.6 }         // Intermedios
+  };
+  
+  // Ajustar según forma específica
+  let morph = morphologyMap[category] || morphologyMap['unknown'];
+  
+  if (shape === 'circular' || shape === 'point') {
+    morph = { ...morph, compactness: Math.max(morph.compactness, 0.85), aspectRatio: 1.0 };
+  } else if (shape === 'cylindrical' || shape === 'rectangular') {
+    morph = { ...morph, aspectRatio: Math.max(morph.aspectRatio, 2.5) };
+  }
+  
+  // COLOR - MUY ESPECÍFICO POR CATEGORÍA Y COLOR
+  const colorBaseMap = {
+    'celestial': { meanR: 220, meanG: 230, meanB: 245, stdR: 15, stdG: 15, stdB: 15 },     // Azul claro/blanco
+    'satellite': { meanR: 180, meanG: 190, meanB: 200, stdR: 20, stdG: 20, stdB: 20 },     // Gris claro
+    'aircraft': { meanR: 140, meanG: 145, meanB: 150, stdR: 35, stdG: 35, stdB: 35 },      // Gris metálico
+    'drone': { meanR: 100, meanG: 105, meanB: 110, stdR: 40, stdG: 40, stdB: 40 },         // Gris oscuro
+    'balloon': { meanR: 200, meanG: 80, meanB: 80, stdR: 50, stdG: 30, stdB: 30 },         // Colores vivos (rojo default)
+    'bird': { meanR: 80, meanG: 70, meanB: 65, stdR: 45, stdG: 40, stdB: 40 },             // Marrón/negro
+    'natural': { meanR: 160, meanG: 180, meanB: 200, stdR: 60, stdG: 60, stdB: 60 },       // Azul cielo
+    'uap': { meanR: 150, meanG: 150, meanB: 150, stdR: 50, stdG: 50, stdB: 50 },           // Gris neutro
+    'hoax': { meanR: 130, meanG: 130, meanB: 130, stdR: 45, stdG: 45, stdB: 45 },          // Gris oscuro
+    'unknown': { meanR: 120, meanG: 110, meanB: 115, stdR: 55, stdG: 50, stdB: 50 }        // Oscuro indefinido
+  };
+  
+  let colorVals = colorBaseMap[category] || colorBaseMap['unknown'];
+  
+  // Ajustar si tiene color específico
+  const primaryColor = colors[0]?.toLowerCase() || '';
+  if (primaryColor.includes('blanco')) colorVals = { meanR: 240, meanG: 240, meanB: 240, stdR: 10, stdG: 10, stdB: 10 };
+  else if (primaryColor.includes('negro')) colorVals = { meanR: 30, meanG: 30, meanB: 30, stdR: 20, stdG: 20, stdB: 20 };
+  else if (primaryColor.includes('rojo')) colorVals = { meanR: 220, meanG: 50, meanB: 50, stdR: 30, stdG: 25, stdB: 25 };
+  else if (primaryColor.includes('azul')) colorVals = { meanR: 50, meanG: 120, meanB: 220, stdR: 25, stdG: 30, stdB: 30 };
+  else if (primaryColor.includes('verde')) colorVals = { meanR: 50, meanG: 200, meanB: 50, stdR: 25, stdG: 30, stdB: 25 };
+  
+  // TEXTURA - MUY DIFERENTE POR CATEGORÍA
+  const textureMap = {
+    'celestial': { entropy: 2.5, energy: 0.30, contrast: 20 },         // MUY uniforme, suave
+    'satellite': { entropy: 3.2, energy: 0.22, contrast: 60 },         // Uniforme con algo de detalle
+    'aircraft': { entropy: 5.8, energy: 0.09, contrast: 450 },         // Complejo, muchos detalles
+    'drone': { entropy: 5.2, energy: 0.11, contrast: 320 },            // Detalles moderados
+    'balloon': { entropy: 3.8, energy: 0.18, contrast: 100 },          // Relativamente suave
+    'bird': { entropy: 4.5, energy: 0.14, contrast: 220 },             // Textura orgánica
+    'natural': { entropy: 7.5, energy: 0.04, contrast: 800 },          // MUY complejo, irregular
+    'uap': { entropy: 4.2, energy: 0.15, contrast: 180 },              // Variable
+    'hoax': { entropy: 6.0, energy: 0.08, contrast: 400 },             // Similar a editado
+    'unknown': { entropy: 5.0, energy: 0.10, contrast: 280 }           // Intermedio
+  };
+  
+  const texture = textureMap[category] || textureMap['unknown'];
+  
+  // BORDES - ESPECÍFICO POR CATEGORÍA
+  const edgeMap = {
+    'celestial': { edgeDensity: 0.03, averageEdgeStrength: 15 },       // Casi sin bordes
+    'satellite': { edgeDensity: 0.05, averageEdgeStrength: 25 },       // Pocos bordes
+    'aircraft': { edgeDensity: 0.22, averageEdgeStrength: 70 },        // MUCHOS bordes definidos
+    'drone': { edgeDensity: 0.16, averageEdgeStrength: 55 },           // Bordes moderados
+    'balloon': { edgeDensity: 0.08, averageEdgeStrength: 30 },         // Pocos bordes (suave)
+    'bird': { edgeDensity: 0.14, averageEdgeStrength: 50 },            // Bordes de silueta
+    'natural': { edgeDensity: 0.25, averageEdgeStrength: 40 },         // Muchos bordes pero difusos
+    'uap': { edgeDensity: 0.12, averageEdgeStrength: 45 },             // Variable
+    'hoax': { edgeDensity: 0.18, averageEdgeStrength: 60 },            // Artificialmente alto
+    'unknown': { edgeDensity: 0.15, averageEdgeStrength: 42 }          // Intermedio
+  };
+  
+  const edges = edgeMap[category] || edgeMap['unknown'];
+  
+  // Ajustar bordes según luminosidad
+  if (luminosity === 'brillante') {
+    edges.edgeDensity *= 1.3;
+    edges.averageEdgeStrength *= 1.2;
+  }
+  
+  // MOMENTOS - ESPECÍFICO POR CATEGORÍA
+  const momentMap = {
+    'celestial': { eccentricity: 0.05, centroidX: 0.5, centroidY: 0.5 },    // Muy centrado, circular
+    'satellite': { eccentricity: 0.20, centroidX: 0.48, centroidY: 0.50 },  // Ligeramente alargado
+    'aircraft': { eccentricity: 0.75, centroidX: 0.50, centroidY: 0.48 },   // MUY alargado
+    'drone': { eccentricity: 0.40, centroidX: 0.50, centroidY: 0.52 },      // Moderadamente alargado
+    'balloon': { eccentricity: 0.15, centroidX: 0.50, centroidY: 0.45 },    // Casi circular
+    'bird': { eccentricity: 0.60, centroidX: 0.48, centroidY: 0.50 },       // Alargado (alas)
+    'natural': { eccentricity: 0.35, centroidX: 0.52, centroidY: 0.52 },    // Irregular
+    'uap': { eccentricity: 0.45, centroidX: 0.50, centroidY: 0.50 },        // Variable
+    'hoax': { eccentricity: 0.50, centroidX: 0.50, centroidY: 0.50 },       // Intermedio
+    'unknown': { eccentricity: 0.55, centroidX: 0.48, centroidY: 0.48 }     // Variable
+  };
+  
+  const moments = momentMap[category] || momentMap['unknown'];
+  
+  // GLOBAL - ESPECÍFICO POR CATEGORÍA
+  const globalMap = {
+    'celestial': { brightness: 0.85, saturation: 0.10 },        // Muy brillante, poco saturado
+    'satellite': { brightness: 0.70, saturation: 0.15 },        // Brillante, poco saturado
+    'aircraft': { brightness: 0.55, saturation: 0.25 },         // Medio, algo saturado
+    'drone': { brightness: 0.45, saturation: 0.30 },            // Medio-oscuro
+    'balloon': { brightness: 0.75, saturation: 0.70 },          // Brillante, MUY saturado
+    'bird': { brightness: 0.35, saturation: 0.20 },             // Oscuro, poco saturado
+    'natural': { brightness: 0.65, saturation: 0.35 },          // Variable
+    'uap': { brightness: 0.50, saturation: 0.40 },              // Medio
+    'hoax': { brightness: 0.48, saturation: 0.35 },             // Similar a editado
+    'unknown': { brightness: 0.42, saturation: 0.32 }           // Oscuro indefinido
+  };
+  
+  const global = globalMap[category] || globalMap['unknown'];
+  
+  // Generar histogramas sintéticos más realistas
+  const histR = new Array(16).fill(0);
+  const histG = new Array(16).fill(0);
+  const histB = new Array(16).fill(0);
+  
+  const rBin = Math.min(Math.floor(colorVals.meanR / 16), 15);
+  const gBin = Math.min(Math.floor(colorVals.meanG / 16), 15);
+  const bBin = Math.min(Math.floor(colorVals.meanB / 16), 15);
+  
+  // Distribución gaussiana alrededor del color medio
+  for (let i = -2; i <= 2; i++) {
+    const weight = Math.exp(-(i*i) / 2) / Math.sqrt(2 * Math.PI);
+    if (rBin + i >= 0 && rBin + i < 16) histR[rBin + i] = weight * 0.2;
+    if (gBin + i >= 0 && gBin + i < 16) histG[gBin + i] = weight * 0.2;
+    if (bBin + i >= 0 && bBin + i < 16) histB[bBin + i] = weight * 0.2;
+  }
+  
+  return {
+    morphology: {
+      area: morph.area,
+      perimeter: morph.perimeter,
+      compactness: morph.compactness,
+      aspectRatio: morph.aspectRatio
+    },
+    colorHistogram: {
+      histogramR: histR,
+      histogramG: histG,
+      histogramB: histB,
+      meanR: colorVals.meanR,
+      meanG: colorVals.meanG,
+      meanB: colorVals.meanB,
+      stdR: colorVals.stdR,
+      stdG: colorVals.stdG,
+      stdB: colorVals.stdB
+    },
+    texture: {
+      entropy: texture.entropy,
+      energy: texture.energy,
+      contrast: texture.contrast,
+      smoothness: 1 - (1 / (1 + texture.contrast / 1000))
+    },
+    edges: {
+      averageEdgeStrength: edges.averageEdgeStrength,
+      edgeDensity: edges.edgeDensity,
+      hasStrongEdges: edges.edgeDensity > 0.1
+    },
+    moments: {
+      centroidX: moments.centroidX,
+      centroidY: moments.centroidY,
+      eccentricity: moments.eccentricity,
+      isCentered: Math.abs(moments.centroidX - 0.5) < 0.15 && Math.abs(moments.centroidY - 0.5) < 0.15
+    },
+    global: {
+      averageBrightness: global.brightness,
+      averageSaturation: global.saturation,
+      isDark: global.brightness < 0.4,
+      isBright: global.brightness > 0.7,
+      isColorful: global.saturation > 0.5
+    }
+  };
+}
+
+
+module.exports = new UFOFeatureIndexService();
+module.exports.generateDefaultFeatures = generateDefaultFeatures;
@@ -0,0 +1,547 @@
+/**
+ * ANÁLISIS DE VÍDEO (muestreo de fotogramas en streaming)
+ *
+ * Los vídeos (uploads/videos) se decodifican con ffmpeg como un flujo de
+ * fotogramas RGB crudos a baja frecuencia (VIDEO_SAMPLE_FPS) y resolución
+ * acotada (VIDEO_FRAME_SIZE): el archivo nunca se carga entero en memoria y
+ * en cada momento solo se retienen los fotogramas clave elegidos.
+ *
+ * - Cada fotograma muestreado pasa por el kernel videoFrameStats del pool de
+ *   workers: luminancia media y máxima, punto más brillante y miniatura
+ * - Fotogramas clave adaptativos: cambio de escena/movimiento respecto al
+ *   último clave (VIDEO_SCENE_THRESHOLD) o, en vídeos estáticos, uno cada
+ *   VIDEO_KEYFRAME_MAX_GAP_SEC. Como máximo VIDEO_MAX_KEYFRAMES (se descartan
+ *   los de menor cambio)
+ * - Límites por vídeo: VIDEO_MAX_SECONDS decodificados y
+ *   VIDEO_DECODE_TIMEOUT_MS de decodificación
+ * - Agregación temporal: trayectoria del punto brillante, curva de brillo
+ *   (parpadeo) y estabilidad de la clasificación entre fotogramas clave
+ *
+ * Las capas por fotograma (visual, IA local, comparación científica,
+ * training) las ejecuta routes/analyze.js sobre cada fotograma clave.
+ * Requiere los binarios ffmpeg y ffprobe (FFMPEG_PATH / FFPROBE_PATH).
+ */
+
+const path = require('path');
+const fs = require('fs').promises;
+const { spawn } = require('child_process');
+const sharp = require('sharp');
+const workerPool = require('./workerPoolService');
+const ImageContext = require('./imageContextService');
+const telemetry = require('./telemetryService');
+const { envInt } = require('../utils/env');
+
+const FFMPEG_PATH = process.env.FFMPEG_PATH || 'ffmpeg';
+const FFPROBE_PATH = process.env.FFPROBE_PATH || 'ffprobe';
+
+const THUMB_GRID = 16;
+const STATS_STEP = 2;            // Muestrear 1 de cada 2 píxeles por eje
+const SPOT_MIN_CONTRAST = 40;    // Diferencia mínima punto brillante - media
+const SPOT_MAX_AREA = 0.02;      // Fracción máxima de la imagen para ser un "punto"
+const KEYFRAME_MIN_GAP_SEC = 1;
+const MAX_CURVE_POINTS = 300;
+const MAX_TRAJECTORY_POINTS = 120;
+
+/**
+ * Ejecutar un proceso y recoger su salida (solo para salidas pequeñas)
+ */
+function run(command, args, timeoutMs) {
+  return new Promise((resolve, reject) => {
+    const child = spawn(command, args, { stdio: ['ignore', 'pipe', 'pipe'] });
+    const stdout = [];
+    let stderr = '';
+    const timer = setTimeout(() => child.kill('SIGKILL'), timeoutMs);
+
+    child.stdout.on('data', chunk => stdout.push(chunk));
+    child.stderr.on('data', chunk => { stderr = (stderr + chunk).slice(-2048); });
+    child.on('error', (error) => {
+      clearTimeout(timer);
+      reject(error);
+    });
+    child.on('close', (code) => {
+      clearTimeout(timer);
+      if (code === 0) {
+        resolve(Buffer.concat(stdout).toString('utf8'));
+      } else {
+        reject(new Error(`${path.basename(command)} terminó con código ${code}: ${stderr.trim()}`));
+      }
+    });
+  });
+}
+
+/**
+ * Coordenadas ISO 6709 de los metadatos de móviles ("+40.4168-003.7038+650.0/")
+ */
+function parseIso6709(value) {
+  const match = /^([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)([+-]\d+(?:\.\d+)?)?/.exec(value || '');
+  if (!match) return null;
+  return {
+    latitude: parseFloat(match[1]),
+    longitude: parseFloat(match[2]),
+    altitude: match[3] ? parseFloat(match[3]) : undefined
+  };
+}
+
+function parseRate(rate) {
+  const [num, den] = String(rate || '0/1').split('/').map(Number);
+  return den ? num / den : num || 0;
+}
+
+function round(value, decimals = 3) {
+  const factor = 10 ** decimals;
+  return Math.round(value * factor) / factor;
+}
+
+/**
+ * Reducir una serie a como mucho maxPoints elementos equiespaciados
+ */
+function downsample(points, maxPoints) {
+  if (points.length <= maxPoints) return points;
+  const step = points.length / maxPoints;
+  return Array.from({ length: maxPoints }, (_, i) => points[Math.floor(i * step)]);
+}
+
+/**
+ * Cambio entre dos miniaturas (diferencia absoluta media, 0-1)
+ */
+function thumbDistance(a, b) {
+  let sum = 0;
+  for (let i = 0; i < a.length; i++) {
+    sum += Math.abs(a[i] - b[i]);
+  }
+  return sum / (a.length * 255);
+}
+
+class VideoAnalysisService {
+  constructor() {
+    this.maxSeconds = envInt('VIDEO_MAX_SECONDS', 60);
+    this.sampleFps = envInt('VIDEO_SAMPLE_FPS', 5);
+    this.frameSize = envInt('VIDEO_FRAME_SIZE', 640);
+    this.maxKeyframes = envInt('VIDEO_MAX_KEYFRAMES', 8);
+    this.maxGapSec = envInt('VIDEO_KEYFRAME_MAX_GAP_SEC', 10);
+    this.sceneThreshold = envInt('VIDEO_SCENE_THRESHOLD', 8) / 100;
+    this.decodeTimeoutMs = envInt('VIDEO_DECODE_TIMEOUT_MS', 120000);
+
+    this.available = null;
+    this.stats = { videos: 0, sampledFrames: 0, keyframes: 0, truncated: 0 };
+  }
+
+  /**
+   * ¿Están ffmpeg y ffprobe instalados? (se comprueba una vez)
+   * @returns {Promise<boolean>}
+   */
+  isAvailable() {
+    if (!this.available) {
+      this.available = Promise.all([
+        run(FFMPEG_PATH, ['-version'], 10000),
+        run(FFPROBE_PATH, ['-version'], 10000)
+      ]).then(() => true, (error) => {
+        console.error('⚠️ ffmpeg/ffprobe no disponibles, análisis de vídeo desactivado:', error.message);
+        return false;
+      });
+    }
+    return this.available;
+  }
+
+  /**
+   * Metadatos del contenedor y del flujo de vídeo (ffprobe, sin decodificar)
+   * @param {string} filePath - Ruta del vídeo
+   */
+  async probe(filePath) {
+    const output = await run(FFPROBE_PATH, [
+      '-v', 'error',
+      '-print_format', 'json',
+      '-show_format',
+      '-show_streams',
+      filePath
+    ], 30000);
+
+    const { format = {}, streams = [] } = JSON.parse(output);
+    const stream = streams.find(s => s.codec_type === 'video');
+    if (!stream) {
+      throw new Error('El archivo no contiene ninguna pista de vídeo');
+    }
+
+    // ffmpeg rota los fotogramas al decodificar: las dimensiones de salida
+    // son las del vídeo ya rotado
+    const rotation = Math.abs(parseInt(
+      stream.tags?.rotate ?? stream.side_data_list?.find(d => d.rotation !== undefined)?.rotation ?? 0,
+      10
+    )) % 180;
+    const width = rotation === 90 ? stream.height : stream.width;
+    const height = rotation === 90 ? stream.width : stream.height;
+
+    return {
+      width,
+      height,
+      codec: stream.codec_name,
+      fps: round(parseRate(stream.avg_frame_rate || stream.r_frame_rate), 2),
+      durationSec: round(parseFloat(stream.duration || format.duration) || 0, 2),
+      tags: { ...(format.tags || {}), ...(stream.tags || {}) }
+    };
+  }
+
+  /**
+   * Metadatos del vídeo con la forma de analysis.exifData (cámara,
+   * ubicación y fecha de grabación de los móviles)
+   */
+  metadataToExif(probe) {
+    const tags = probe.tags;
+    const exif = {
+      camera: tags['com.apple.quicktime.make'] || tags.make || undefined,
+      cameraModel: tags['com.apple.quicktime.model'] || tags.model || undefined,
+      software: tags['com.apple.quicktime.software'] || tags.encoder || undefined,
+      imageWidth: probe.width,
+      imageHeight: probe.height
+    };
+
+    const location = parseIso6709(tags['com.apple.quicktime.location.ISO6709'] || tags.location);
+    if (location) exif.location = location;
+
+    const created = tags['com.apple.quicktime.creationdate'] || tags.creation_time;
+    if (created && !Number.isNaN(Date.parse(created))) {
+      exif.captureDate = new Date(created);
+    }
+
+    return exif;
+  }
+
+  /**
+   * Decodificar el vídeo como flujo de fotogramas RGB crudos
+   * @param {Function} onFrame - async (data, index) por fotograma muestreado;
+   *   mientras no resuelve, ffmpeg queda en pausa (backpressure del pipe)
+   * @returns {Promise<number>} Fotogramas leídos
+   */
+  async decodeFrames(filePath, { width, height }, onFrame) {
+    const frameBytes = width * height * 3;
+    const child = spawn(FFMPEG_PATH, [
+      '-v', 'error',
+      '-nostdin',
+      '-t', String(this.maxSeconds),
+      '-i', filePath,
+      '-an', '-sn',
+      '-vf', `fps=${this.sampleFps},scale=${width}:${height}`,
+      '-pix_fmt', 'rgb24',
+      '-f', 'rawvideo',
+      'pipe:1'
+    ], { stdio: ['ignore', 'pipe', 'pipe'] });
+
+    let stderr = '';
+    child.stderr.on('data', chunk => { stderr = (stderr + chunk).slice(-2048); });
+    const exited = new Promise((resolve, reject) => {
+      child.on('error', reject);
+      child.on('close', resolve);
+    });
+    exited.catch(() => {});
+
+    let timedOut = false;
+    const timer = setTimeout(() => {
+      timedOut = true;
+      child.kill('SIGKILL');
+    }, this.decodeTimeoutMs);
+
+    let frame = Buffer.allocUnsafe(frameBytes);
+    let filled = 0;
+    let index = 0;
+
+    try {
+      for await (const chunk of child.stdout) {
+        let offset = 0;
+        while (offset < chunk.length) {
+          const copied = chunk.copy(frame, filled, offset, offset + frameBytes - filled);
+          filled += copied;
+          offset += copied;
+
+          if (filled === frameBytes) {
+            // Buffer nuevo por fotograma: el anterior puede quedar retenido
+            // como fotograma clave
+            await onFrame(frame, index++);
+            frame = Buffer.allocUnsafe(frameBytes);
+            filled = 0;
+          }
+        }
+      }
+
+      const code = await exited;
+      if (timedOut) {
+        if (index === 0) throw new Error(`Decodificación de vídeo excedió ${this.decodeTimeoutMs}ms`);
+        console.log(`⚠️ Decodificación de vídeo cortada a los ${this.decodeTimeoutMs}ms (${index} fotogramas)`);
+      } else if (code !== 0 && index === 0) {
+        throw new Error(`ffmpeg terminó con código ${code}: ${stderr.trim()}`);
+      }
+      return index;
+    } finally {
+      clearTimeout(timer);
+      if (child.exitCode === null) child.kill('SIGKILL');
+    }
+  }
+
+  /**
+   * Muestrear el vídeo y elegir fotogramas clave
+   * @param {string} filePath - Ruta del vídeo
+   * @param {Object} options - { probe (si ya se tiene), framesDir, onProgress(fracción) }
+   * @returns {Promise<Object>} { probe, width, height, timeline, keyframes, sampledFrames, analyzedSec, truncated }
+   */
+  async extract(filePath, { probe = null, framesDir, onProgress } = {}) {
+    probe = probe || await this.probe(filePath);
+    const scale = Math.min(1, this.frameSize / Math.max(probe.width, probe.height));
+    // Dimensiones pares (requisito de la mayoría de filtros de escalado)
+    const width = Math.max(2, Math.round((probe.width * scale) / 2) * 2);
+    const height = Math.max(2, Math.round((probe.height * scale) / 2) * 2);
+
+    const expectedSec = Math.min(probe.durationSec || this.maxSeconds, this.maxSeconds);
+    const timeline = [];
+    let keyframes = [];
+    let lastKey = null;
+
+    const sampledFrames = await this.decodeFrames(filePath, { width, height }, async (data, index) => {
+      const time = index / this.sampleFps;
+      const stats = await workerPool.run('videoFrameStats', {
+        data,
+        width,
+        height,
+        channels: 3,
+        grid: THUMB_GRID,
+        step: STATS_STEP,
+        minContrast: SPOT_MIN_CONTRAST,
+        maxSpotArea: SPOT_MAX_AREA
+      });
+
+      timeline.push({ time, mean: stats.mean, peak: stats.peak, spot: stats.spot });
+
+      const change = lastKey ? thumbDistance(stats.thumb, lastKey.thumb) : Infinity;
+      const gap = lastKey ? time - lastKey.time : Infinity;
+      if (gap >= KEYFRAME_MIN_GAP_SEC && (change >= this.sceneThreshold || gap >= this.maxGapSec)) {
+        lastKey = { index, time, score: change, data, thumb: stats.thumb };
+        keyframes.push(lastKey);
+
+        // Tope de fotogramas clave: fuera el de menor cambio (nunca el primero)
+        if (keyframes.length > this.maxKeyframes) {
+          let weakest = 1;
+          for (let i = 2; i < keyframes.length; i++) {
+            if (keyframes[i].score < keyframes[weakest].score) weakest = i;
+          }
+          keyframes.splice(weakest, 1);
+        }
+      }
+
+      if (onProgress && expectedSec > 0) onProgress(Math.min(1, time / expectedSec));
+    });
+    telemetry.addDecodedBytes(sampledFrames * width * height * 3);
+
+    if (sampledFrames === 0) {
+      throw new Error('No se pudo decodificar ningún fotograma del vídeo');
+    }
+
+    keyframes = await this.saveKeyframes(keyframes, { width, height, framesDir });
+
+    const analyzedSec = round(sampledFrames / this.sampleFps, 2);
+    const truncated = probe.durationSec > this.maxSeconds;
+
+    this.stats.videos++;
+    this.stats.sampledFrames += sampledFrames;
+    this.stats.keyframes += keyframes.length;
+    if (truncated) this.stats.truncated++;
+
+    return { probe, width, height, timeline, keyframes, sampledFrames, analyzedSec, truncated };
+  }
+
+  /**
+   * Directorio de los fotogramas clave de un análisis de vídeo
+   * @param {Object} analysis - Documento Analysis (filePath, _id)
+   * @returns {string}
+   */
+  framesDir(analysis) {
+    return path.join(path.dirname(analysis.filePath), 'frames', analysis._id.toString());
+  }
+
+  /**
+   * Borrar los fotogramas clave guardados de un análisis
+   * @param {Object} analysis - Documento Analysis (filePath, _id)
+   */
+  async removeFrames(analysis) {
+    await fs.rm(this.framesDir(analysis), { recursive: true, force: true });
+  }
+
+  /**
+   * Guardar los fotogramas clave como JPEG y preparar su ImageContext
+   * (el buffer crudo ya decodificado hace de resolución base)
+   */
+  async saveKeyframes(keyframes, { width, height, framesDir }) {
+    await fs.rm(framesDir, { recursive: true, force: true });
+    await fs.mkdir(framesDir, { recursive: true });
+
+    return Promise.all(keyframes.map(async (keyframe) => {
+      const raw = { width, height, channels: 3 };
+      const fileBuffer = await sharp(keyframe.data, { raw }).jpeg({ quality: 90 }).toBuffer();
+      const framePath = path.join(framesDir, `keyframe-${String(keyframe.index).padStart(5, '0')}.jpg`);
+      await fs.writeFile(framePath, fileBuffer);
+
+      const context = new ImageContext(framePath, {
+        fileBuffer,
+        metadata: await sharp(fileBuffer).metadata(),
+        base: { data: keyframe.data, info: { ...raw, size: keyframe.data.length } }
+      });
+
+      return {
+        index: keyframe.index,
+        time: round(keyframe.time, 2),
+        sceneScore: Number.isFinite(keyframe.score) ? round(keyframe.score) : null,
+        path: framePath,
+        context
+      };
+    }));
+  }
+
+  // ==================== AGREGACIÓN TEMPORAL ====================
+
+  /**
+   * Trayectoria del punto más brillante (coordenadas normalizadas 0-1)
+   */
+  summarizeTrajectory(timeline) {
+    const points = timeline.filter(sample => sample.spot).map(sample => ({
+      t: round(sample.time, 2),
+      x: round(sample.spot.x),
+      y: round(sample.spot.y)
+    }));
+
+    const summary = {
+      detectedRatio: timeline.length > 0 ? round(points.length / timeline.length, 2) : 0,
+      pathLength: 0,
+      displacement: 0,
+      straightness: null,
+      meanSpeed: 0,
+      maxSpeed: 0,
+      directionChanges: 0,
+      points: downsample(points, MAX_TRAJECTORY_POINTS)
+    };
+    if (points.length < 2) return summary;
+
+    let previousAngle = null;
+    for (let i = 1; i < points.length; i++) {
+      const dx = points[i].x - points[i - 1].x;
+      const dy = points[i].y - points[i - 1].y;
+      const step = Math.hypot(dx, dy);
+      const dt = points[i].t - points[i - 1].t;
+
+      summary.pathLength += step;
+      if (dt > 0) summary.maxSpeed = Math.max(summary.maxSpeed, step / dt);
+
+      // Giros de más de 60° entre tramos con desplazamiento apreciable
+      if (step > 0.01) {
+        const angle = Math.atan2(dy, dx);
+        if (previousAngle !== null) {
+          let turn = Math.abs(angle - previousAngle);
+          if (turn > Math.PI) turn = 2 * Math.PI - turn;
+          if (turn > Math.PI / 3) summary.directionChanges++;
+        }
+        previousAngle = angle;
+      }
+    }
+
+    const first = points[0];
+    const last = points[points.length - 1];
+    summary.displacement = Math.hypot(last.x - first.x, last.y - first.y);
+    summary.straightness = summary.pathLength > 0 ? round(summary.displacement / summary.pathLength, 2) : null;
+    summary.meanSpeed = last.t > first.t ? round(summary.pathLength / (last.t - first.t)) : 0;
+    summary.pathLength = round(summary.pathLength);
+    summary.displacement = round(summary.displacement);
+    summary.maxSpeed = round(summary.maxSpeed);
+
+    return summary;
+  }
+
+  /**
+   * Curva de brillo: nivel medio y pico por fotograma, parpadeo
+   */
+  summarizeBrightness(timeline) {
+    const peaks = timeline.map(sample => sample.peak);
+    const mean = peaks.reduce((sum, value) => sum + value, 0) / (peaks.length || 1);
+    const variance = peaks.reduce((sum, value) => sum + (value - mean) ** 2, 0) / (peaks.length || 1);
+    const min = peaks.length > 0 ? Math.min(...peaks) : 0;
+    const max = peaks.length > 0 ? Math.max(...peaks) : 0;
+
+    // Parpadeos: subidas del pico por encima de la mitad del rango (con histéresis)
+    let blinkCount = 0;
+    const range = max - min;
+    if (range > 30) {
+      const high = min + range * 0.6;
+      const low = min + range * 0.4;
+      let lit = peaks[0] >= high;
+      for (const value of peaks) {
+        if (!lit && value >= high) {
+          blinkCount++;
+          lit = true;
+        } else if (lit && value <= low) {
+          lit = false;
+        }
+      }
+    }
+
+    return {
+      min: Math.round(min),
+      max: Math.round(max),
+      mean: Math.round(mean),
+      flickerIndex: mean > 0 ? round(Math.sqrt(variance) / mean, 2) : 0,
+      blinkCount,
+      curve: downsample(timeline, MAX_CURVE_POINTS).map(sample => ({
+        t: round(sample.time, 2),
+        mean: Math.round(sample.mean),
+        peak: Math.round(sample.peak)
+      }))
+    };
+  }
+
+  /**
+   * Estabilidad de la clasificación entre fotogramas clave
+   * @param {Array} frames - [{ category, confidence, objectId }]
+   */
+  summarizeStability(frames) {
+    const mode = (values) => {
+      const counts = new Map();
+      values.filter(Boolean).forEach(value => counts.set(value, (counts.get(value) || 0) + 1));
+      let best = null;
+      for (const [value, count] of counts) {
+        if (!best || count > best.count) best = { value, count };
+      }
+      return best;
+    };
+
+    const category = mode(frames.map(frame => frame.category));
+    const object = mode(frames.map(frame => frame.objectId && String(frame.objectId)));
+
+    return {
+      framesAnalyzed: frames.length,
+      category: category?.value || null,
+      categoryAgreement: category ? round(category.count / frames.length, 2) : 0,
+      objectId: object?.value || null,
+      objectAgreement: object ? round(object.count / frames.length, 2) : 0
+    };
+  }
+
+  /**
+   * Recomendaciones derivadas del comportamiento temporal
+   */
+  temporalRecommendations({ trajectory, brightness, stability }) {
+    const recommendations = [];
+
+    if (brightness.blinkCount >= 2) {
+      recommendations.push(`🎞️ VÍDEO: ${brightness.blinkCount} destellos periódicos del punto brillante, compatibles con luces anticolisión de aeronave`);
+    }
+    if (trajectory.detectedRatio >= 0.5 && trajectory.straightness !== null && trajectory.straightness > 0.9 && trajectory.directionChanges === 0) {
+      recommendations.push('🎞️ VÍDEO: trayectoria rectilínea y sin cambios de dirección, compatible con aeronave o satélite');
+    }
+    if (stability.framesAnalyzed > 1 && stability.categoryAgreement < 0.5) {
+      recommendations.push(`🎞️ VÍDEO: clasificación inestable entre fotogramas (${Math.round(stability.categoryAgreement * 100)}% de acuerdo); revisar manualmente`);
+    }
+
+    return recommendations;
+  }
+
+  getStats() {
+    return { ...this.stats };
+  }
+}
+
+module.exports = new VideoAnalysisService();
+module.exports.VideoAnalysisService = VideoAnalysisService;
@@ -14,6 +14,9 @@
 const sharp = require('sharp');
 const path = require('path');
 const fs = require('fs').promises;
+const ImageContext = require('./imageContextService');
+const workerPool = require('./workerPoolService');
+const telemetry = require('./telemetryService');
 
 class VisualAnalysisService {
   
@@ -22,33 +25,33 @@ class VisualAnalysisService {
    * Independiente de EXIF - solo análisis de píxeles
    * 
    * @param {string} imagePath - Ruta de la imagen
+   * @param {ImageContext} imageContext - Imagen ya decodificada (opcional)
    * @returns {object} Características visuales detectadas
    */
-  async analyzeVisualFeatures(imagePath) {
+  async analyzeVisualFeatures(imagePath, imageContext = null) {
     console.log('\n🔬 ANÁLISIS VISUAL AVANZADO');
     console.log('═'.repeat(60));
     
     try {
-      const image = sharp(imagePath);
-      const metadata = await image.metadata();
+      const metadata = imageContext
+        ? imageContext.metadata
+        : await sharp(imagePath).metadata();
       
       console.log(`📊 Imagen: ${metadata.width}x${metadata.height}px`);
       
-      // Redimensionar imagen grande para análisis más rápido
-      const maxSize = 800;
-      let processImage = image;
-      if (metadata.width > maxSize || metadata.height > maxSize) {
-        console.log(`⚡ Redimensionando imagen para análisis rápido (max ${maxSize}px)`);
-        processImage = image.resize(maxSize, maxSize, { fit: 'inside' });
+      // Con contexto, todas las sub-análisis trabajan sobre el buffer ya
+      // decodificado (max 800px) en lugar de abrir el archivo cinco veces
+      if (imageContext) {
+        console.log(`⚡ Usando imagen decodificada compartida (max ${ImageContext.SIZES.MEDIUM}px)`);
       }
       
-      // Ejecutar análisis en paralelo con timeout
+      // Ejecutar análisis en paralelo con timeout (cada uno medido como span)
       const analysisPromises = [
-        this.detectLightPatterns(imagePath),
-        this.analyzeShape(imagePath),
-        this.analyzeColorProfile(imagePath),
-        this.detectEdges(imagePath),
-        this.generatePerceptualHash(imagePath)
+        telemetry.span('task', 'visual.lightPatterns', () => this.detectLightPatterns(imagePath, imageContext)),
+        telemetry.span('task', 'visual.shape', () => this.analyzeShape(imagePath, imageContext)),
+        telemetry.span('task', 'visual.colorProfile', () => this.analyzeColorProfile(imagePath, imageContext)),
+        telemetry.span('task', 'visual.edges', () => this.detectEdges(imagePath, imageContext)),
+        telemetry.span('task', 'visual.perceptualHash', () => this.generatePerceptualHash(imagePath, imageContext))
       ];
       
       // Agregar timeout de 10 segundos
@@ -107,40 +110,38 @@ class VisualAnalysisService {
     }
   }
   
+  /**
+   * Instancia sharp de trabajo: desde el contexto decodificado si existe,
+   * o desde el archivo en caso contrario
+   */
+  async getImage(imagePath, imageContext) {
+    return imageContext
+      ? imageContext.sharpAt(ImageContext.SIZES.MEDIUM)
+      : sharp(imagePath);
+  }
+  
   /**
    * Detectar patrones de luces (característico de drones y aviones)
    * - Drones: luces intermitentes, patrón múltiple
    * - Aviones: luces de navegación (verde/rojo/blanco)
    * - Celestial: luz única, brillante, sin parpadeo
    */
-  async detectLightPatterns(imagePath) {
+  async detectLightPatterns(imagePath, imageContext = null) {
     try {
-      const image = sharp(imagePath);
-      const { data, info } = await image
-        .raw()
-        .toBuffer({ resolveWithObject: true });
+      const { data, info } = imageContext
+        ? await imageContext.getRaw(ImageContext.SIZES.MEDIUM)
+        : await sharp(imagePath).raw().toBuffer({ resolveWithObject: true });
       
       const width = info.width;
       const height = info.height;
       const channels = info.channels;
       
-      // Detectar puntos brillantes
-      const brightSpots = [];
-      const threshold = 200; // Umbral de brillo
-      
-      for (let y = 0; y < height; y += 5) { // Muestreo cada 5 píxeles
-        for (let x = 0; x < width; x += 5) {
-          const idx = (y * width + x) * channels;
-          const r = data[idx];
-          const g = data[idx + 1];
-          const b = data[idx + 2];
-          const brightness = (r + g + b) / 3;
-          
-          if (brightness > threshold) {
-            brightSpots.push({ x, y, brightness, r, g, b });
-          }
-        }
-      }
+      // Detectar puntos brillantes (muestreo cada 5 píxeles) en el pool de workers
+      const brightSpots = await workerPool.run('lightPatternScan', {
+        data, width, height, channels,
+        step: 5,
+        threshold: 200 // Umbral de brillo
+      });
       
       // Analizar distribución de puntos brillantes
       const spotCount = brightSpots.length;
@@ -240,9 +241,9 @@ class VisualAnalysisService {
   /**
    * Analizar forma del objeto
    */
-  async analyzeShape(imagePath) {
+  async analyzeShape(imagePath, imageContext = null) {
     try {
-      const image = sharp(imagePath);
+      const image = await this.getImage(imagePath, imageContext);
       
       // Convertir a escala de grises y detectar contornos
       const { data, info } = await image
@@ -255,18 +256,15 @@ class VisualAnalysisService {
       const width = info.width;
       const height = info.height;
       
-      // Contar píxeles de objeto (blancos después de threshold)
-      let objectPixels = 0;
-      for (let i = 0; i < data.length; i++) {
-        if (data[i] > 128) objectPixels++;
-      }
+      // Contar píxeles de objeto (blancos después de threshold) y calcular
+      // compacidad (círculo = 1, línea = 0) en el pool de workers
+      const { objectPixels, compactness } = await workerPool.run('shapeScan', {
+        data, width, height
+      });
       
       const totalPixels = width * height;
       const objectArea = objectPixels / totalPixels;
       
-      // Calcular compacidad (círculo = 1, línea = 0)
-      const compactness = this.calculateCompactness(data, width, height);
-      
       // Detectar aspectos específicos
       const isCircular = compactness > 0.7;
       const isElongated = compactness < 0.3;
@@ -287,38 +285,6 @@ class VisualAnalysisService {
     }
   }
   
-  /**
-   * Calcular compacidad de la forma
-   */
-  calculateCompactness(data, width, height) {
-    // Simplificación: ratio área/perímetro
-    let perimeter = 0;
-    let area = 0;
-    
-    for (let y = 1; y < height - 1; y++) {
-      for (let x = 1; x < width - 1; x++) {
-        const idx = y * width + x;
-        if (data[idx] > 128) {
-          area++;
-          // Es borde si algún vecino es negro
-          const neighbors = [
-            data[idx - 1], data[idx + 1],
-            data[idx - width], data[idx + width]
-          ];
-          if (neighbors.some(n => n <= 128)) {
-            perimeter++;
-          }
-        }
-      }
-    }
-    
-    if (perimeter === 0) return 0;
-    
-    // Normalizar: círculo perfecto = 1
-    const circularity = (4 * Math.PI * area) / (perimeter * perimeter);
-    return Math.min(circularity, 1);
-  }
-  
   /**
    * Clasificar forma
    */
@@ -335,9 +301,10 @@ class VisualAnalysisService {
   /**
    * Analizar perfil de color
    */
-  async analyzeColorProfile(imagePath) {
+  async analyzeColorProfile(imagePath, imageContext = null) {
     try {
-      const { dominant } = await sharp(imagePath)
+      const image = await this.getImage(imagePath, imageContext);
+      const { dominant } = await image
         .resize(100, 100, { fit: 'inside' })
         .stats();
       
@@ -378,9 +345,10 @@ class VisualAnalysisService {
   /**
    * Detectar bordes (simplificado)
    */
-  async detectEdges(imagePath) {
+  async detectEdges(imagePath, imageContext = null) {
     try {
-      const edgeBuffer = await sharp(imagePath)
+      const image = await this.getImage(imagePath, imageContext);
+      const edgeBuffer = await image
         .greyscale()
         .convolve({
           width: 3,
@@ -413,10 +381,16 @@ class VisualAnalysisService {
   /**
    * Generar hash perceptual para comparación
    */
-  async generatePerceptualHash(imagePath) {
+  async generatePerceptualHash(imagePath, imageContext = null) {
     try {
+      // Con contexto se comparte el hash (también lo usa la caché de capas)
+      if (imageContext) {
+        return await imageContext.getPerceptualHash();
+      }
+
       // Reducir a 8x8 y convertir a escala de grises
-      const { data } = await sharp(imagePath)
+      const image = await this.getImage(imagePath, imageContext);
+      const { data } = await image
         .resize(8, 8, { fit: 'fill' })
         .greyscale()
         .raw()
@@ -2,6 +2,7 @@ const fs = require('fs');
 const path = require('path');
 const UFODatabase = require('../models/UFODatabase');
 const imageAnalysisService = require('./imageAnalysisService');
+const ufoFeatureIndex = require('./ufoFeatureIndexService');
 
 /**
  * Servicio de análisis visual basado en comparación con base de datos
@@ -238,12 +239,18 @@ function isWideLens(exifData) {
  */
 async function findMatches(imageFeatures) {
   try {
-    // Obtener todos los objetos activos
-    const allObjects = await UFODatabase.find({ isActive: true });
+    // Objetos activos desde el índice residente (sin consultar ni hidratar documentos)
+    await ufoFeatureIndex.ensureLoaded();
+    const allObjects = ufoFeatureIndex.getObjects();
+    
+    // Patrones del catálogo que coinciden con la imagen (una vez por patrón, no por objeto)
+    const matchedPatterns = imageFeatures.hasVisualData
+      ? ufoFeatureIndex.matchPatternVocabulary(buildImagePatterns(imageFeatures))
+      : null;
     
     // Calcular score de similitud para cada objeto
     const scoredObjects = allObjects.map(obj => {
-      const score = calculateSimilarityScore(imageFeatures, obj);
+      const score = calculateSimilarityScore(imageFeatures, obj, matchedPatterns);
       return {
         objectId: obj._id,
         objectName: obj.name,
@@ -266,12 +273,47 @@ async function findMatches(imageFeatures) {
   }
 }
 
+/**
+ * Construir patrones de la imagen para comparar con visualPatterns
+ */
+function buildImagePatterns(features) {
+  const imagePatterns = [];
+  
+  if (features.dominantColor && features.dominantColor !== 'unknown') {
+    imagePatterns.push(features.dominantColor);
+  }
+  
+  // Extraer shape del análisis visual si existe
+  if (features.visualAnalysis?.composition?.hasCentralObject) {
+    imagePatterns.push('central_object');
+  }
+  
+  if (features.hasBrightSpots) {
+    imagePatterns.push('bright_spots', 'luminous');
+  }
+  
+  if (features.isDarkImage) {
+    imagePatterns.push('dark', 'night');
+  }
+  
+  if (features.hasHighContrast) {
+    imagePatterns.push('high_contrast');
+  }
+  
+  if (features.skyType && features.skyType !== 'unknown') {
+    imagePatterns.push(features.skyType);
+  }
+  
+  return imagePatterns;
+}
+
 /**
  * Calcula score de similitud entre características y objeto
  * VERSIÓN 4.0: Visual + VisualPatterns matching + EXIF + Context
  * Pesos: 40% Visual (incluyendo patterns), 25% EXIF, 20% Context, 15% Penalties
+ * @param {Set<string>} matchedPatterns - Patrones del catálogo ya comparados con la imagen (opcional)
  */
-function calculateSimilarityScore(features, object) {
+function calculateSimilarityScore(features, object, matchedPatterns = null) {
   let score = 0;
   let maxScore = 0;
 
@@ -389,37 +431,12 @@ function calculateSimilarityScore(features, object) {
   // 5b. NUEVO: Visual Patterns Matching (peso: 20) - APROVECHA BD MASIVA
   maxScore += 20;
   if (features.hasVisualData && object.visualPatterns && object.visualPatterns.length > 0) {
-    const imagePatterns = [];
-    
-    // Construir patrones de la imagen
-    if (features.dominantColor && features.dominantColor !== 'unknown') {
-      imagePatterns.push(features.dominantColor);
-    }
-    
-    // Extraer shape del análisis visual si existe
-    if (features.visualAnalysis?.composition?.hasCentralObject) {
-      imagePatterns.push('central_object');
-    }
-    
-    if (features.hasBrightSpots) {
-      imagePatterns.push('bright_spots', 'luminous');
-    }
-    
-    if (features.isDarkImage) {
-      imagePatterns.push('dark', 'night');
-    }
-    
-    if (features.hasHighContrast) {
-      imagePatterns.push('high_contrast');
-    }
-    
-    if (features.skyType && features.skyType !== 'unknown') {
-      imagePatterns.push(features.skyType);
-    }
+    const imagePatterns = matchedPatterns ? null : buildImagePatterns(features);
     
     // Comparar patrones: contar coincidencias
-    const matchingPatterns = object.visualPatterns.filter(pattern => 
-      imagePatterns.some(ip => 
+    const matchingPatterns = object.visualPatterns.filter(pattern => matchedPatterns
+      ? matchedPatterns.has(pattern.toLowerCase())
+      : imagePatterns.some(ip => 
         ip.toLowerCase().includes(pattern.toLowerCase()) || 
         pattern.toLowerCase().includes(ip.toLowerCase())
       )
@@ -1,4 +1,5 @@
 const axios = require('axios');
+const CacheService = require('./cacheService');
 
 /**
  * Servicio de Datos Meteorológicos
@@ -13,9 +14,15 @@ class WeatherService {
     this.apiKey = process.env.OPENWEATHER_API_KEY;
     this.baseUrl = 'https://api.openweathermap.org/data/2.5';
     
-    // Cache de consultas (5 minutos)
-    this.cache = new Map();
-    this.cacheDuration = 5 * 60 * 1000;
+    // Cache de consultas (5 minutos; hasta 10 más se sirve el valor anterior
+    // mientras se renueva de fondo)
+    this.cache = CacheService.namespace('weather', {
+      ttlMs: 5 * 60 * 1000,
+      staleMs: 10 * 60 * 1000,
+      maxEntries: 2000,
+      negativeTtlMs: 60 * 1000,
+      shared: true
+    });
   }
 
   /**
@@ -39,85 +46,7 @@ class WeatherService {
 
     try {
       const cacheKey = `current_${latitude}_${longitude}`;
-      
-      // Verificar cache
-      if (this.cache.has(cacheKey)) {
-        const cached = this.cache.get(cacheKey);
-        if (Date.now() - cached.timestamp < this.cacheDuration) {
-          return cached.data;
-        }
-      }
-
-      const url = `${this.baseUrl}/weather`;
-      const response = await axios.get(url, {
-        params: {
-          lat: latitude,
-          lon: longitude,
-          appid: this.apiKey,
-          units: 'metric',
-          lang: 'es'
-        },
-        timeout: 10000
-      });
-
-      const data = response.data;
-      
-      const weather = {
-        source: 'OpenWeatherMap',
-        queriedAt: new Date(),
-        location: {
-          latitude,
-          longitude,
-          name: data.name,
-          country: data.sys.country
-        },
-        temperature: {
-          current: data.main.temp,
-          feels_like: data.main.feels_like,
-          min: data.main.temp_min,
-          max: data.main.temp_max,
-          unit: '°C'
-        },
-        conditions: {
-          main: data.weather[0].main.toLowerCase(),  // 'clouds', 'clear', 'rain', etc.
-          description: data.weather[0].description,
-          icon: data.weather[0].icon
-        },
-        clouds: {
-          coverage: data.clouds.all,  // %
-          type: this.getCloudType(data.clouds.all)
-        },
-        visibility: data.visibility,  // metros
-        humidity: data.main.humidity,  // %
-        pressure: data.main.pressure,  // hPa
-        wind: {
-          speed: data.wind.speed,  // m/s
-          direction: data.wind.deg,  // grados
-          gust: data.wind.gust || null  // m/s
-        },
-        precipitation: {
-          rain_1h: data.rain?.['1h'] || 0,
-          rain_3h: data.rain?.['3h'] || 0,
-          snow_1h: data.snow?.['1h'] || 0,
-          snow_3h: data.snow?.['3h'] || 0
-        },
-        sun: {
-          sunrise: new Date(data.sys.sunrise * 1000),
-          sunset: new Date(data.sys.sunset * 1000)
-        },
-        timestamp: new Date(data.dt * 1000)
-      };
-
-      // Análisis atmosférico
-      weather.analysis = this.analyzeAtmosphericConditions(weather);
-
-      // Guardar en cache
-      this.cache.set(cacheKey, {
-        timestamp: Date.now(),
-        data: weather
-      });
-
-      return weather;
+      return await this.cache.getOrSet(cacheKey, () => this.fetchCurrentWeather(latitude, longitude));
 
     } catch (error) {
       console.error('Error obteniendo datos meteorológicos:', error.message);
@@ -128,6 +57,76 @@ class WeatherService {
     }
   }
 
+  /**
+   * Consultar OpenWeatherMap (sin caché)
+   */
+  async fetchCurrentWeather(latitude, longitude) {
+    const url = `${this.baseUrl}/weather`;
+    const response = await axios.get(url, {
+      params: {
+        lat: latitude,
+        lon: longitude,
+        appid: this.apiKey,
+        units: 'metric',
+        lang: 'es'
+      },
+      timeout: 10000
+    });
+
+    const data = response.data;
+    
+    const weather = {
+      source: 'OpenWeatherMap',
+      queriedAt: new Date(),
+      location: {
+        latitude,
+        longitude,
+        name: data.name,
+        country: data.sys.country
+      },
+      temperature: {
+        current: data.main.temp,
+        feels_like: data.main.feels_like,
+        min: data.main.temp_min,
+        max: data.main.temp_max,
+        unit: '°C'
+      },
+      conditions: {
+        main: data.weather[0].main.toLowerCase(),  // 'clouds', 'clear', 'rain', etc.
+        description: data.weather[0].description,
+        icon: data.weather[0].icon
+      },
+      clouds: {
+        coverage: data.clouds.all,  // %
+        type: this.getCloudType(data.clouds.all)
+      },
+      visibility: data.visibility,  // metros
+      humidity: data.main.humidity,  // %
+      pressure: data.main.pressure,  // hPa
+      wind: {
+        speed: data.wind.speed,  // m/s
+        direction: data.wind.deg,  // grados
+        gust: data.wind.gust || null  // m/s
+      },
+      precipitation: {
+        rain_1h: data.rain?.['1h'] || 0,
+        rain_3h: data.rain?.['3h'] || 0,
+        snow_1h: data.snow?.['1h'] || 0,
+        snow_3h: data.snow?.['3h'] || 0
+      },
+      sun: {
+        sunrise: new Date(data.sys.sunrise * 1000),
+        sunset: new Date(data.sys.sunset * 1000)
+      },
+      timestamp: new Date(data.dt * 1000)
+    };
+
+    // Análisis atmosférico
+    weather.analysis = this.analyzeAtmosphericConditions(weather);
+
+    return weather;
+  }
+
   /**
    * Obtener condiciones climáticas históricas (5 días atrás máximo)
    */
@@ -270,12 +269,7 @@ class WeatherService {
    * Limpiar cache antiguo
    */
   clearOldCache() {
-    const now = Date.now();
-    for (const [key, value] of this.cache.entries()) {
-      if (now - value.timestamp > this.cacheDuration) {
-        this.cache.delete(key);
-      }
-    }
+    return this.cache.prune();
   }
 }
 
@@ -1,17 +1,172 @@
 /**
  * Servicio de Notificaciones WebSocket
  * Maneja emisión de eventos en tiempo real durante el análisis
+ *
+ * Entrega por salas: cada evento va solo a los sockets suscritos.
+ * - Al conectar, el cliente se autentica con su JWT (handshake auth.token)
+ *   y entra en la sala de su usuario (user:<id>); los administradores
+ *   además en la sala 'admins'
+ * - Para recibir un análisis o un lote, el cliente emite
+ *   'subscribe' { analysisId } / { batchId }; se comprueba que le pertenece
+ *   (o que es admin) antes de unirlo a la sala analysis:<id> / batch:<id>
+ * - Los nombres de evento no cambian (analysis:<id>, batch:<id>, user:<id>)
+ * - El progreso se agrupa: como mucho un evento cada
+ *   WS_PROGRESS_INTERVAL_MS por análisis, con el último valor; el resto de
+ *   eventos del análisis envían antes el progreso pendiente (orden intacto)
+ * - SOCKET_IO_ADAPTER: módulo que configura un adaptador de Socket.IO
+ *   (p. ej. Redis) para repartir la entrega entre varios procesos
  */
 
+const path = require('path');
+const jwt = require('jsonwebtoken');
+const User = require('../models/User');
+const Analysis = require('../models/Analysis');
+const AnalysisBatch = require('../models/AnalysisBatch');
+const { envInt } = require('../utils/env');
+
+const PROGRESS_INTERVAL_MS = envInt('WS_PROGRESS_INTERVAL_MS', 250);
+
+// Progreso pendiente por análisis: { payload, timer, lastSentAt }
+const progressState = new Map();
+
+const counters = {
+  emitted: 0,
+  progressCoalesced: 0,
+  subscriptions: 0,
+  subscriptionsDenied: 0,
+  authFailures: 0
+};
+
 class WebSocketService {
-  
+
+  /**
+   * Configurar el servidor Socket.IO: adaptador, autenticación y suscripciones
+   * @param {Server} io - Servidor Socket.IO
+   */
+  static async attach(io) {
+    global.io = io;
+
+    await WebSocketService.configureAdapter(io);
+
+    io.use((socket, next) => WebSocketService.authenticate(socket, next));
+
+    io.on('connection', (socket) => {
+      const { userId, role } = socket.data;
+      console.log(`Cliente conectado: ${socket.id}${userId ? ` (usuario ${userId})` : ''}`);
+
+      if (userId) {
+        socket.join(`user:${userId}`);
+        if (role === 'admin') socket.join('admins');
+      }
+
+      socket.on('subscribe', (request, ack) => {
+        WebSocketService.subscribe(socket, request || {})
+          .then(result => typeof ack === 'function' && ack(result))
+          .catch(error => typeof ack === 'function' && ack({ ok: false, error: error.message }));
+      });
+
+      socket.on('unsubscribe', (request = {}) => {
+        if (request.analysisId) socket.leave(`analysis:${request.analysisId}`);
+        if (request.batchId) socket.leave(`batch:${request.batchId}`);
+      });
+
+      socket.on('disconnect', () => {
+        console.log('Cliente desconectado:', socket.id);
+      });
+    });
+  }
+
+  /**
+   * Cargar el adaptador indicado en SOCKET_IO_ADAPTER: un módulo que
+   * exporta async (io) => { io.adapter(...) }
+   */
+  static async configureAdapter(io) {
+    const adapterModule = process.env.SOCKET_IO_ADAPTER;
+    if (!adapterModule) return;
+
+    try {
+      const configure = require(adapterModule.startsWith('.')
+        ? path.resolve(__dirname, '..', adapterModule)
+        : adapterModule);
+      await configure(io);
+      console.log(`🔌 Adaptador de Socket.IO configurado: ${adapterModule}`);
+    } catch (error) {
+      // Sin adaptador la entrega sigue funcionando dentro de este proceso
+      console.error(`⚠️ No se pudo configurar el adaptador de Socket.IO (${adapterModule}):`, error.message);
+    }
+  }
+
+  /**
+   * Middleware de conexión: JWT en handshake.auth.token (o cabecera
+   * Authorization). Sin token, o con uno inválido o caducado, se conecta
+   * como anónimo: no entra en salas de usuario ni puede suscribirse.
+   */
+  static async authenticate(socket, next) {
+    const { auth = {}, headers = {} } = socket.handshake;
+    const token = auth.token || headers.authorization?.replace('Bearer ', '');
+    if (!token) return next();
+
+    try {
+      const decoded = jwt.verify(token, process.env.JWT_SECRET || 'uap-secret-key-2025');
+      const user = await User.findById(decoded.userId).select('role');
+      if (!user) throw new Error('Usuario no encontrado');
+
+      socket.data.userId = user._id.toString();
+      socket.data.role = user.role;
+      next();
+    } catch (error) {
+      counters.authFailures++;
+      socket.data.authError = 'Token inválido o caducado';
+      next();
+    }
+  }
+
+  /**
+   * Unir el socket a la sala de un análisis o lote si le pertenece
+   * @returns {Promise<{ok: boolean, room?: string, error?: string}>}
+   */
+  static async subscribe(socket, { analysisId = null, batchId = null }) {
+    const { userId, role } = socket.data;
+    if (!userId) {
+      counters.subscriptionsDenied++;
+      return { ok: false, error: socket.data.authError || 'Autenticación requerida' };
+    }
+
+    const [Model, id, prefix] = analysisId
+      ? [Analysis, analysisId, 'analysis']
+      : [AnalysisBatch, batchId, 'batch'];
+    if (!id) {
+      return { ok: false, error: 'Falta analysisId o batchId' };
+    }
+
+    const owner = await Model.findById(id).select('userId').lean().catch(() => null);
+    if (!owner || (role !== 'admin' && owner.userId.toString() !== userId)) {
+      counters.subscriptionsDenied++;
+      return { ok: false, error: 'No tienes permiso para suscribirte' };
+    }
+
+    const room = `${prefix}:${id}`;
+    socket.join(room);
+    counters.subscriptions++;
+    return { ok: true, room };
+  }
+
+  /**
+   * Enviar un evento a una sala
+   */
+  static emitTo(room, event, payload) {
+    if (!global.io) return;
+    counters.emitted++;
+    global.io.to(room).emit(event, payload);
+  }
+
   /**
    * Emitir evento de inicio de análisis
    */
   static emitAnalysisStarted(analysisId, userId) {
-    if (!global.io) return;
-    
-    global.io.emit(`analysis:${analysisId}`, {
+    WebSocketService.flushProgress(analysisId);
+
+    WebSocketService.emitTo(`analysis:${analysisId}`, `analysis:${analysisId}`, {
       type: 'started',
       analysisId,
       userId,
@@ -26,9 +181,9 @@ class WebSocketService {
    * Emitir evento de capa completada
    */
   static emitLayerComplete(analysisId, layerNumber, layerName, data = {}) {
-    if (!global.io) return;
-    
-    global.io.emit(`analysis:${analysisId}`, {
+    WebSocketService.flushProgress(analysisId);
+
+    WebSocketService.emitTo(`analysis:${analysisId}`, `analysis:${analysisId}`, {
       type: 'layer_complete',
       analysisId,
       layer: {
@@ -44,27 +199,69 @@ class WebSocketService {
   }
 
   /**
-   * Emitir progreso de análisis
+   * Emitir progreso de análisis (agrupado: como mucho uno cada
+   * PROGRESS_INTERVAL_MS por análisis, siempre con el último valor)
    */
   static emitProgress(analysisId, progress, currentLayer) {
     if (!global.io) return;
-    
-    global.io.emit(`analysis:${analysisId}`, {
+
+    const id = analysisId.toString();
+    const payload = {
       type: 'progress',
       analysisId,
       progress, // 0-100
       currentLayer,
       timestamp: new Date()
-    });
+    };
+
+    const state = progressState.get(id) || { payload: null, timer: null, lastSentAt: 0 };
+    progressState.set(id, state);
+
+    if (state.payload) counters.progressCoalesced++;
+    state.payload = payload;
+
+    const wait = state.lastSentAt + PROGRESS_INTERVAL_MS - Date.now();
+    if (wait <= 0) {
+      WebSocketService.flushProgress(id);
+    } else if (!state.timer) {
+      state.timer = setTimeout(() => WebSocketService.flushProgress(id), wait);
+      state.timer.unref();
+    }
+  }
+
+  /**
+   * Enviar el progreso pendiente de un análisis (si lo hay)
+   */
+  static flushProgress(analysisId) {
+    const id = analysisId.toString();
+    const state = progressState.get(id);
+    if (!state) return;
+
+    clearTimeout(state.timer);
+    state.timer = null;
+
+    if (state.payload) {
+      WebSocketService.emitTo(`analysis:${id}`, `analysis:${id}`, state.payload);
+      state.payload = null;
+      state.lastSentAt = Date.now();
+    }
+  }
+
+  /**
+   * Olvidar el estado de progreso de un análisis terminado
+   */
+  static endProgress(analysisId) {
+    WebSocketService.flushProgress(analysisId);
+    progressState.delete(analysisId.toString());
   }
 
   /**
    * Emitir evento de análisis completado
    */
   static emitAnalysisComplete(analysisId, result) {
-    if (!global.io) return;
-    
-    global.io.emit(`analysis:${analysisId}`, {
+    WebSocketService.endProgress(analysisId);
+
+    WebSocketService.emitTo(`analysis:${analysisId}`, `analysis:${analysisId}`, {
       type: 'complete',
       analysisId,
       result: {
@@ -83,9 +280,9 @@ class WebSocketService {
    * Emitir evento de error
    */
   static emitAnalysisError(analysisId, error) {
-    if (!global.io) return;
-    
-    global.io.emit(`analysis:${analysisId}`, {
+    WebSocketService.endProgress(analysisId);
+
+    WebSocketService.emitTo(`analysis:${analysisId}`, `analysis:${analysisId}`, {
       type: 'error',
       analysisId,
       error: {
@@ -99,13 +296,41 @@ class WebSocketService {
     console.error(`[WebSocket] Error en análisis ${analysisId}:`, error.message);
   }
 
+  /**
+   * Emitir resultado de una imagen de un lote (con el progreso del lote)
+   */
+  static emitBatchItem(batchId, item, progress) {
+    WebSocketService.emitTo(`batch:${batchId}`, `batch:${batchId}`, {
+      type: 'item',
+      batchId,
+      item,
+      progress, // { total, completed, error, pending, analyzing }
+      timestamp: new Date()
+    });
+  }
+
+  /**
+   * Emitir evento de lote terminado
+   */
+  static emitBatchComplete(batchId, batch) {
+    WebSocketService.emitTo(`batch:${batchId}`, `batch:${batchId}`, {
+      type: 'complete',
+      batchId,
+      status: batch.status,
+      counts: batch.counts,
+      summary: batch.summary,
+      timestamp: new Date(),
+      message: 'Lote completado'
+    });
+
+    console.log(`[WebSocket] Lote completado: ${batchId}`);
+  }
+
   /**
    * Emitir notificación general a un usuario
    */
   static emitUserNotification(userId, notification) {
-    if (!global.io) return;
-    
-    global.io.emit(`user:${userId}`, {
+    WebSocketService.emitTo(`user:${userId}`, `user:${userId}`, {
       type: 'notification',
       notification,
       timestamp: new Date()
@@ -113,12 +338,10 @@ class WebSocketService {
   }
 
   /**
-   * Emitir estadísticas del sistema
+   * Emitir estadísticas del sistema (solo administradores)
    */
   static emitSystemStats(stats) {
-    if (!global.io) return;
-    
-    global.io.emit('system:stats', {
+    WebSocketService.emitTo('admins', 'system:stats', {
       type: 'stats',
       stats,
       timestamp: new Date()
@@ -132,6 +355,18 @@ class WebSocketService {
     if (!global.io) return 0;
     return global.io.engine.clientsCount;
   }
+
+  /**
+   * Contadores de entrega (eventos enviados, progreso agrupado, suscripciones)
+   */
+  static getStats() {
+    return {
+      ...counters,
+      connectedClients: WebSocketService.getConnectedClients(),
+      pendingProgress: progressState.size,
+      progressIntervalMs: PROGRESS_INTERVAL_MS
+    };
+  }
 }
 
 module.exports = WebSocketService;
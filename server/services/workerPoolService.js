@@ -0,0 +1,244 @@
+/**
+ * POOL DE WORKERS PARA KERNELS DE PÍXELES
+ *
+ * Ejecuta los bucles por píxel de las capas de análisis (forense, visual,
+ * IA local, características científicas) en worker_threads para no bloquear
+ * el event loop de Express/Socket.IO mientras se analiza una imagen.
+ *
+ * - Tamaño acotado (ANALYSIS_WORKERS, por defecto nº de CPUs - 1; 0 = inline)
+ * - Cola acotada con backpressure (ANALYSIS_WORKER_QUEUE): si está llena,
+ *   run() rechaza con error.code = 'POOL_QUEUE_FULL'
+ * - Timeout por tarea (ANALYSIS_WORKER_TIMEOUT_MS): el worker colgado se
+ *   termina y se reemplaza
+ * - Los buffers se copian una sola vez a memoria compartida
+ *   (SharedArrayBuffer) y se reutilizan entre tareas sobre la misma imagen
+ */
+
+const os = require('os');
+const path = require('path');
+const { Worker } = require('worker_threads');
+const { kernels } = require('./pixelKernels');
+const { envInt } = require('../utils/env');
+
+const WORKER_SCRIPT = path.join(__dirname, '..', 'workers', 'pixelKernelWorker.js');
+
+class WorkerPoolService {
+  constructor(options = {}) {
+    this.size = options.size ?? envInt('ANALYSIS_WORKERS', Math.max(1, os.cpus().length - 1));
+    this.maxQueue = options.maxQueue ?? envInt('ANALYSIS_WORKER_QUEUE', 100);
+    this.timeoutMs = options.timeoutMs ?? envInt('ANALYSIS_WORKER_TIMEOUT_MS', 30000);
+
+    this.workers = [];
+    this.queue = [];
+    this.nextId = 1;
+
+    // Copias compartidas memorizadas por buffer de origen
+    this.sharedCopies = new WeakMap();
+
+    this.stats = {
+      completed: 0,
+      failed: 0,
+      timedOut: 0,
+      rejected: 0,
+      inline: 0
+    };
+  }
+
+  /**
+   * Ejecutar un kernel registrado en services/pixelKernels.js
+   * @param {string} kernel - Nombre del kernel
+   * @param {Object} args - Argumentos (los TypedArray/Buffer se comparten)
+   * @returns {Promise<any>} Resultado del kernel
+   */
+  run(kernel, args) {
+    if (!kernels[kernel]) {
+      return Promise.reject(new Error(`Kernel desconocido: ${kernel}`));
+    }
+
+    // Modo inline: sin workers (tests, entornos con 1 CPU)
+    if (this.size <= 0) {
+      this.stats.inline++;
+      try {
+        return Promise.resolve(kernels[kernel](args));
+      } catch (error) {
+        return Promise.reject(error);
+      }
+    }
+
+    if (this.queue.length >= this.maxQueue) {
+      this.stats.rejected++;
+      const error = new Error(`Cola de análisis llena (${this.maxQueue} tareas pendientes)`);
+      error.code = 'POOL_QUEUE_FULL';
+      return Promise.reject(error);
+    }
+
+    return new Promise((resolve, reject) => {
+      this.queue.push({
+        id: this.nextId++,
+        kernel,
+        args: this.shareArgs(args),
+        resolve,
+        reject
+      });
+      this.dispatch();
+    });
+  }
+
+  /**
+   * Sustituir los buffers de primer nivel por vistas sobre SharedArrayBuffer
+   */
+  shareArgs(args) {
+    const shared = { ...args };
+
+    for (const [key, value] of Object.entries(args)) {
+      if (ArrayBuffer.isView(value) && !(value.buffer instanceof SharedArrayBuffer)) {
+        let copy = this.sharedCopies.get(value);
+        if (!copy) {
+          copy = new Uint8Array(new SharedArrayBuffer(value.byteLength));
+          copy.set(new Uint8Array(value.buffer, value.byteOffset, value.byteLength));
+          this.sharedCopies.set(value, copy);
+        }
+        shared[key] = copy;
+      }
+    }
+
+    return shared;
+  }
+
+  /**
+   * Asignar tareas en cola a workers libres (creándolos bajo demanda)
+   */
+  dispatch() {
+    while (this.queue.length > 0) {
+      let slot = this.workers.find(w => !w.job);
+      if (!slot) {
+        if (this.workers.length >= this.size) return;
+        slot = this.spawn();
+      }
+
+      const job = this.queue.shift();
+      slot.job = job;
+      slot.worker.ref();
+      slot.timer = setTimeout(() => this.handleTimeout(slot), this.timeoutMs);
+      slot.worker.postMessage({ id: job.id, kernel: job.kernel, args: job.args });
+    }
+  }
+
+  /**
+   * Crear un worker nuevo y registrar sus manejadores
+   */
+  spawn() {
+    const slot = { worker: new Worker(WORKER_SCRIPT), job: null, timer: null };
+
+    slot.worker.on('message', (message) => {
+      const job = slot.job;
+      if (!job || message.id !== job.id) return;
+
+      this.release(slot);
+
+      if (message.error) {
+        this.stats.failed++;
+        job.reject(new Error(message.error.message));
+      } else {
+        this.stats.completed++;
+        job.resolve(message.result);
+      }
+
+      this.dispatch();
+    });
+
+    slot.worker.on('error', (error) => {
+      console.error('❌ Error en worker de análisis:', error.message);
+      this.discard(slot, error);
+    });
+
+    slot.worker.on('exit', (code) => {
+      if (this.workers.includes(slot)) {
+        this.discard(slot, new Error(`Worker de análisis terminó inesperadamente (código ${code})`));
+      }
+    });
+
+    slot.worker.unref();
+    this.workers.push(slot);
+    return slot;
+  }
+
+  /**
+   * Marcar el worker como libre
+   */
+  release(slot) {
+    clearTimeout(slot.timer);
+    slot.timer = null;
+    slot.job = null;
+    slot.worker.unref();
+  }
+
+  /**
+   * Sacar un worker del pool y fallar su tarea en curso
+   */
+  discard(slot, error) {
+    const job = slot.job;
+    this.release(slot);
+    this.workers = this.workers.filter(w => w !== slot);
+
+    if (job) {
+      this.stats.failed++;
+      job.reject(error);
+    }
+
+    this.dispatch();
+  }
+
+  /**
+   * Tarea que excede el timeout: terminar el worker y reemplazarlo
+   */
+  handleTimeout(slot) {
+    const job = slot.job;
+    if (!job) return;
+
+    console.warn(`⚠️ Kernel "${job.kernel}" excedió ${this.timeoutMs}ms, reiniciando worker`);
+    this.stats.timedOut++;
+
+    const error = new Error(`Timeout del kernel ${job.kernel} (${this.timeoutMs}ms)`);
+    error.code = 'POOL_TIMEOUT';
+
+    this.discard(slot, error);
+    slot.worker.terminate().catch(() => {});
+  }
+
+  /**
+   * Estado del pool (para monitoreo)
+   */
+  getStats() {
+    return {
+      size: this.size,
+      workers: this.workers.length,
+      busy: this.workers.filter(w => w.job).length,
+      queued: this.queue.length,
+      maxQueue: this.maxQueue,
+      timeoutMs: this.timeoutMs,
+      ...this.stats
+    };
+  }
+
+  /**
+   * Terminar todos los workers (apagado del servidor)
+   */
+  async shutdown() {
+    const slots = this.workers;
+    this.workers = [];
+
+    for (const job of this.queue.splice(0)) {
+      job.reject(new Error('Pool de análisis detenido'));
+    }
+
+    await Promise.all(slots.map(slot => {
+      if (slot.job) slot.job.reject(new Error('Pool de análisis detenido'));
+      clearTimeout(slot.timer);
+      return slot.worker.terminate();
+    }));
+  }
+}
+
+module.exports = new WorkerPoolService();
+module.exports.WorkerPoolService = WorkerPoolService;
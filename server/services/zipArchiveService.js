@@ -0,0 +1,152 @@
+/**
+ * LECTOR DE ARCHIVOS ZIP (sin dependencias)
+ *
+ * Lee el directorio central de un ZIP en disco y abre cada entrada como
+ * stream (almacenada o deflate), sin descomprimir el archivo completo en
+ * memoria. Suficiente para los archivos de casos que suben los usuarios;
+ * no soporta ZIP64 ni entradas cifradas.
+ */
+
+const fs = require('fs');
+const zlib = require('zlib');
+const { Transform, Readable, pipeline } = require('stream');
+
+const EOCD_SIGNATURE = 0x06054b50;
+const CENTRAL_SIGNATURE = 0x02014b50;
+const LOCAL_SIGNATURE = 0x04034b50;
+const EOCD_MIN_SIZE = 22;
+const MAX_COMMENT_SIZE = 0xffff;
+
+const METHOD_STORED = 0;
+const METHOD_DEFLATE = 8;
+
+async function readAt(handle, position, length) {
+  const buffer = Buffer.alloc(length);
+  const { bytesRead } = await handle.read(buffer, 0, length, position);
+  return buffer.subarray(0, bytesRead);
+}
+
+class ZipArchiveService {
+
+  /**
+   * Listar las entradas de un ZIP
+   * @param {string} zipPath - Ruta del archivo
+   * @returns {Promise<Array<{name, method, compressedSize, size, offset, encrypted, isDirectory}>>}
+   */
+  static async listEntries(zipPath) {
+    const handle = await fs.promises.open(zipPath, 'r');
+
+    try {
+      const { size } = await handle.stat();
+      const tailLength = Math.min(size, EOCD_MIN_SIZE + MAX_COMMENT_SIZE);
+      const tail = await readAt(handle, size - tailLength, tailLength);
+
+      let eocd = -1;
+      for (let i = tail.length - EOCD_MIN_SIZE; i >= 0; i--) {
+        if (tail.readUInt32LE(i) === EOCD_SIGNATURE) {
+          eocd = i;
+          break;
+        }
+      }
+      if (eocd === -1) {
+        throw new Error('Archivo ZIP no válido (sin directorio central)');
+      }
+
+      const entryCount = tail.readUInt16LE(eocd + 10);
+      const directorySize = tail.readUInt32LE(eocd + 12);
+      const directoryOffset = tail.readUInt32LE(eocd + 16);
+      if (entryCount === 0xffff || directoryOffset === 0xffffffff) {
+        throw new Error('Archivos ZIP64 no soportados');
+      }
+
+      const directory = await readAt(handle, directoryOffset, directorySize);
+      const entries = [];
+      let pos = 0;
+
+      for (let i = 0; i < entryCount; i++) {
+        if (pos + 46 > directory.length || directory.readUInt32LE(pos) !== CENTRAL_SIGNATURE) {
+          throw new Error('Directorio central del ZIP corrupto');
+        }
+
+        const flags = directory.readUInt16LE(pos + 8);
+        const nameLength = directory.readUInt16LE(pos + 28);
+        const extraLength = directory.readUInt16LE(pos + 30);
+        const commentLength = directory.readUInt16LE(pos + 32);
+        // Bit 11: nombre en UTF-8; si no, CP437 (se aproxima con latin1)
+        const name = directory.toString(flags & 0x800 ? 'utf8' : 'latin1', pos + 46, pos + 46 + nameLength);
+
+        entries.push({
+          name,
+          method: directory.readUInt16LE(pos + 10),
+          compressedSize: directory.readUInt32LE(pos + 20),
+          size: directory.readUInt32LE(pos + 24),
+          offset: directory.readUInt32LE(pos + 42),
+          encrypted: (flags & 0x1) === 1,
+          isDirectory: name.endsWith('/')
+        });
+
+        pos += 46 + nameLength + extraLength + commentLength;
+      }
+
+      return entries;
+    } finally {
+      await handle.close();
+    }
+  }
+
+  /**
+   * Abrir una entrada como stream descomprimido
+   * @param {string} zipPath - Ruta del archivo
+   * @param {Object} entry - Entrada de listEntries()
+   * @param {number} maxBytes - Tamaño descomprimido máximo (protección ante bombas ZIP)
+   * @returns {Promise<Readable>}
+   */
+  static async openEntry(zipPath, entry, maxBytes = null) {
+    if (entry.encrypted) {
+      throw new Error(`Entrada cifrada no soportada: ${entry.name}`);
+    }
+    if (entry.method !== METHOD_STORED && entry.method !== METHOD_DEFLATE) {
+      throw new Error(`Método de compresión no soportado (${entry.method}): ${entry.name}`);
+    }
+
+    // La cabecera local puede tener un campo extra distinto al del directorio central
+    const handle = await fs.promises.open(zipPath, 'r');
+    let header;
+    try {
+      header = await readAt(handle, entry.offset, 30);
+    } finally {
+      await handle.close();
+    }
+    if (header.length < 30 || header.readUInt32LE(0) !== LOCAL_SIGNATURE) {
+      throw new Error(`Cabecera local corrupta: ${entry.name}`);
+    }
+
+    const start = entry.offset + 30 + header.readUInt16LE(26) + header.readUInt16LE(28);
+    const raw = entry.compressedSize > 0
+      ? fs.createReadStream(zipPath, { start, end: start + entry.compressedSize - 1 })
+      : Readable.from([]);
+
+    const limit = maxBytes ?? entry.size;
+    let seen = 0;
+    const guard = new Transform({
+      transform(chunk, encoding, done) {
+        seen += chunk.length;
+        if (seen > limit) {
+          return done(new Error(`Entrada ${entry.name} excede ${limit} bytes descomprimida`));
+        }
+        done(null, chunk);
+      }
+    });
+
+    // pipeline destruye toda la cadena si una parte falla o el consumidor
+    // cierra guard: sin descriptores abiertos ni inflado hacia la nada. El
+    // error ya llega a quien lee guard, el callback solo evita duplicarlo
+    const streams = entry.method === METHOD_DEFLATE
+      ? [raw, zlib.createInflateRaw(), guard]
+      : [raw, guard];
+    pipeline(...streams, () => {});
+    return guard;
+  }
+}
+
+module.exports = ZipArchiveService;
@@ -150,7 +150,8 @@ function connectWebSocket() {
         log('\n🔌 Conectando a WebSocket...', 'blue');
         
         socket = io(API_URL, {
-            transports: ['websocket', 'polling']
+            transports: ['websocket', 'polling'],
+            auth: { token }
         });
         
         socket.on('connect', () => {
@@ -171,6 +172,11 @@ function connectWebSocket() {
 
 function subscribeToAnalysis(id) {
     const channel = `analysis:${id}`;
+    socket.emit('subscribe', { analysisId: id }, (result) => {
+        if (!result || !result.ok) {
+            log(`❌ Suscripción rechazada: ${result && result.error}`, 'red');
+        }
+    });
     log(`\n📡 Suscrito a canal: ${channel}`, 'cyan');
     log('\n⏳ Esperando eventos WebSocket...\n', 'yellow');
     
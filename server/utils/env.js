@@ -0,0 +1,16 @@
+/**
+ * Lectura de variables de entorno numéricas
+ */
+
+/**
+ * Entero de una variable de entorno
+ * @param {string} name - Nombre de la variable
+ * @param {number} fallback - Valor si no está definida o no es un entero
+ * @returns {number}
+ */
+function envInt(name, fallback) {
+  const value = parseInt(process.env[name], 10);
+  return Number.isNaN(value) ? fallback : value;
+}
+
+module.exports = { envInt };
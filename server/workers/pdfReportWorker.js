@@ -0,0 +1,54 @@
+/**
+ * Worker de informes PDF
+ *
+ * Recibe mensajes { id, report, analysis, user, imagePath } desde
+ * ReportRenderService, construye el documento con services/pdfGenerator.js
+ * y envía el PDF por partes a medida que se terminan sus páginas:
+ * { id, chunk } (bloques de ~64KB), { id, done } o { id, error }.
+ */
+
+const { parentPort } = require('worker_threads');
+const pdfGenerator = require('../services/pdfGenerator');
+
+const CHUNK_SIZE = 64 * 1024;
+
+parentPort.on('message', ({ id, report, analysis, user, imagePath }) => {
+  let pending = [];
+  let pendingBytes = 0;
+
+  const flush = () => {
+    if (pendingBytes === 0) return;
+    // Memoria propia (no del pool de Buffer) para poder transferirla
+    const chunk = Buffer.allocUnsafeSlow(pendingBytes);
+    let offset = 0;
+    for (const data of pending) {
+      offset += data.copy(chunk, offset);
+    }
+    pending = [];
+    pendingBytes = 0;
+    parentPort.postMessage({ id, chunk }, [chunk.buffer]);
+  };
+
+  try {
+    const doc = pdfGenerator.openDocument(report, user);
+
+    doc.on('data', (data) => {
+      pending.push(data);
+      pendingBytes += data.length;
+      if (pendingBytes >= CHUNK_SIZE) flush();
+    });
+
+    doc.on('end', () => {
+      flush();
+      parentPort.postMessage({ id, done: true });
+    });
+
+    doc.on('error', (error) => {
+      parentPort.postMessage({ id, error: { message: error.message, stack: error.stack } });
+    });
+
+    pdfGenerator.writeDocument(doc, report, analysis, { imagePath });
+  } catch (error) {
+    parentPort.postMessage({ id, error: { message: error.message, stack: error.stack } });
+  }
+});
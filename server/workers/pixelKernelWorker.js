@@ -0,0 +1,23 @@
+/**
+ * Worker de kernels de píxeles
+ *
+ * Recibe mensajes { id, kernel, args } desde WorkerPoolService, ejecuta el
+ * kernel correspondiente de services/pixelKernels.js y responde con
+ * { id, result } o { id, error }.
+ */
+
+const { parentPort } = require('worker_threads');
+const { kernels } = require('../services/pixelKernels');
+
+parentPort.on('message', ({ id, kernel, args }) => {
+  try {
+    const fn = kernels[kernel];
+    if (!fn) {
+      throw new Error(`Kernel desconocido: ${kernel}`);
+    }
+
+    parentPort.postMessage({ id, result: fn(args) });
+  } catch (error) {
+    parentPort.postMessage({ id, error: { message: error.message, stack: error.stack } });
+  }
+});
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Generador de corpus sintético con verdad de referencia (ground truth)
+
+Renderiza miles de imágenes de cielo en paralelo (un proceso por núcleo) con
+control de resolución, tipo y número de objetos, ruido, calidad JPEG,
+regiones copy-move inyectadas y variantes de EXIF. Cada imagen queda
+descrita en manifest.jsonl (una línea JSON por imagen) con lo que contiene
+de verdad, para medir la precisión de los servicios de análisis
+(server/scripts/benchServices.js).
+
+Cada imagen se genera con su propia semilla (semilla base + índice): el
+mismo comando produce el mismo corpus sea cual sea el número de procesos.
+
+Uso:
+    python3 test/generate_corpus.py --count 2000 --out /tmp/uap_corpus
+    python3 test/generate_corpus.py --count 500 --sizes 800x600,6000x4000 \\
+        --types drone,aircraft --copy-move 0.5 --quality 60-95 --noise 0-12
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from statistics import NormalDist
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+import piexif
+
+MAX_PIXELS = 24_000_000  # 24 MP
+
+DEFAULT_SIZES = '800x600,1280x960,1920x1080,4000x3000,6000x4000'
+
+# Tipo de objeto renderizado -> categoría esperada de visualAnalysisService
+OBJECT_TYPES = {
+    'celestial': 'celestial',          # Punto brillante con halo (planeta, estrella)
+    'meteor': 'celestial',             # Estela rectilínea
+    'drone': 'drone',                  # Grupo compacto de luces de colores
+    'aircraft': 'aircraft',            # Luces de navegación roja/verde + estrobo
+    'bird': 'bird',                    # Silueta oscura de alas en V
+    'cloud': 'natural_phenomenon',     # Nube lenticular difusa
+    'disk': 'unknown',                 # Disco metálico "clásico"
+    'none': 'unknown'                  # Cielo vacío
+}
+
+# Fondos: (arriba, abajo) del degradado y densidad de estrellas
+BACKGROUNDS = {
+    'night': ((0, 8, 24), (10, 24, 48), 1.0),
+    'dusk': ((30, 40, 90), (230, 120, 60), 0.2),
+    'day': ((70, 130, 210), (170, 205, 240), 0.0)
+}
+
+# Tipos de objeto que tienen sentido en cada fondo
+BACKGROUNDS_FOR_TYPE = {
+    'celestial': ['night', 'dusk'],
+    'meteor': ['night'],
+    'drone': ['night', 'dusk'],
+    'aircraft': ['night', 'dusk'],
+    'bird': ['day', 'dusk'],
+    'cloud': ['day', 'dusk'],
+    'disk': ['night', 'dusk', 'day'],
+    'none': ['night', 'dusk', 'day']
+}
+
+EXIF_VARIANTS = ['full', 'no_gps', 'none', 'edited', 'time_mismatch']
+
+CAMERAS = [
+    ('Canon', 'Canon EOS 90D'),
+    ('NIKON CORPORATION', 'NIKON D7500'),
+    ('Apple', 'iPhone 14 Pro'),
+    ('samsung', 'SM-S918B'),
+    ('SONY', 'ILCE-7M3')
+]
+
+EDITORS = ['Adobe Photoshop 25.0 (Windows)', 'GIMP 2.10.34', 'Adobe Lightroom Classic 13.0']
+
+
+def decimal_to_dms(decimal_degree):
+    """Convierte coordenadas decimales a formato DMS (Grados, Minutos, Segundos)"""
+    decimal_degree = abs(decimal_degree)
+    degrees = int(decimal_degree)
+    minutes_decimal = (decimal_degree - degrees) * 60
+    minutes = int(minutes_decimal)
+    seconds = (minutes_decimal - minutes) * 60
+    return ((degrees, 1), (minutes, 1), (int(seconds * 100), 100))
+
+
+def parse_range(text, cast=float):
+    """'60-95' -> (60, 95); '80' -> (80, 80)"""
+    parts = str(text).split('-', 1)
+    low = cast(parts[0])
+    high = cast(parts[1]) if len(parts) > 1 else low
+    if high < low:
+        raise argparse.ArgumentTypeError(f'Rango inválido: {text}')
+    return low, high
+
+
+def parse_sizes(text):
+    sizes = []
+    for item in text.split(','):
+        width, height = (int(value) for value in item.lower().split('x'))
+        if width * height > MAX_PIXELS:
+            raise argparse.ArgumentTypeError(f'{item} supera los 24 MP')
+        sizes.append((width, height))
+    return sizes
+
+
+def parse_types(text):
+    types = [item.strip() for item in text.split(',') if item.strip()]
+    unknown = [item for item in types if item not in OBJECT_TYPES]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"Tipos desconocidos: {', '.join(unknown)} (válidos: {', '.join(OBJECT_TYPES)})")
+    return types
+
+
+# ==================== RENDERIZADO ====================
+
+def render_background(size, background, rng):
+    """Degradado vertical + estrellas (proporcionales al área)"""
+    width, height = size
+    top, bottom, star_density = BACKGROUNDS[background]
+
+    # Degradado en una columna de 256 px escalada: barato también a 24 MP
+    column = Image.new('RGB', (1, 256))
+    for y in range(256):
+        t = y / 255
+        column.putpixel((0, y), tuple(int(a + (b - a) * t) for a, b in zip(top, bottom)))
+    img = column.resize(size, Image.BILINEAR)
+
+    stars = int(width * height / 4800 * star_density)
+    if stars:
+        draw = ImageDraw.Draw(img)
+        for _ in range(stars):
+            x = rng.randrange(width)
+            y = rng.randrange(height)
+            level = rng.randint(120, 255)
+            radius = 1 if rng.random() < 0.9 else 2
+            draw.ellipse([x, y, x + radius, y + radius], fill=(level, level, level))
+    return img
+
+
+def glow(draw, cx, cy, radius, color, rings=4):
+    """Luz puntual con halo en anillos decrecientes"""
+    for ring in range(rings, 0, -1):
+        r = radius * (1 + ring * 0.8)
+        fade = 0.25 + 0.75 * (rings - ring) / rings
+        ring_color = tuple(int(channel * fade) for channel in color)
+        draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=ring_color)
+    draw.ellipse([cx - radius, cy - radius, cx + radius, cy + radius], fill=color)
+
+
+def draw_object(img, object_type, rng, scale):
+    """
+    Dibujar un objeto y devolver su descripción con bbox [x, y, ancho, alto]
+    """
+    width, height = img.size
+    draw = ImageDraw.Draw(img)
+    cx = rng.uniform(0.15, 0.85) * width
+    cy = rng.uniform(0.15, 0.75) * height
+
+    if object_type == 'celestial':
+        radius = rng.uniform(2, 6) * scale
+        color = rng.choice([(255, 255, 235), (255, 240, 200), (220, 230, 255)])
+        glow(draw, cx, cy, radius, color)
+        extent = radius * 4.2
+        bbox = [cx - extent, cy - extent, 2 * extent, 2 * extent]
+
+    elif object_type == 'meteor':
+        length = rng.uniform(0.1, 0.35) * width
+        angle = rng.uniform(0, math.pi)
+        dx, dy = math.cos(angle) * length / 2, math.sin(angle) * length / 2
+        line_width = max(1, int(rng.uniform(1, 3) * scale))
+        draw.line([cx - dx, cy - dy, cx + dx, cy + dy], fill=(235, 240, 255), width=line_width)
+        bbox = [cx - abs(dx), cy - abs(dy), 2 * abs(dx) or line_width, 2 * abs(dy) or line_width]
+
+    elif object_type == 'drone':
+        spacing = rng.uniform(8, 20) * scale
+        radius = rng.uniform(2, 4) * scale
+        colors = [(255, 40, 40), (40, 255, 80), (255, 255, 255), (60, 120, 255)]
+        for (ox, oy), color in zip([(-1, -1), (1, -1), (-1, 1), (1, 1)], colors):
+            glow(draw, cx + ox * spacing / 2, cy + oy * spacing / 2, radius, color, rings=2)
+        extent = spacing / 2 + radius * 2.6
+        bbox = [cx - extent, cy - extent, 2 * extent, 2 * extent]
+
+    elif object_type == 'aircraft':
+        span = rng.uniform(40, 120) * scale
+        radius = rng.uniform(2, 4) * scale
+        draw.line([cx - span / 2, cy, cx + span / 2, cy], fill=(60, 60, 70), width=max(1, int(scale)))
+        glow(draw, cx - span / 2, cy, radius, (255, 30, 30), rings=2)
+        glow(draw, cx + span / 2, cy, radius, (30, 255, 60), rings=2)
+        glow(draw, cx, cy - radius * 2, radius * 1.3, (255, 255, 255), rings=3)
+        extent = radius * 2.6
+        bbox = [cx - span / 2 - extent, cy - radius * 2 - extent * 1.3, span + 2 * extent, extent * 2.6 + radius * 2]
+
+    elif object_type == 'bird':
+        wing = rng.uniform(15, 45) * scale
+        lift = wing * rng.uniform(0.2, 0.5)
+        thickness = max(2, int(wing / 8))
+        color = (rng.randint(10, 40),) * 3
+        draw.line([cx - wing, cy - lift, cx, cy], fill=color, width=thickness)
+        draw.line([cx, cy, cx + wing, cy - lift], fill=color, width=thickness)
+        draw.ellipse([cx - thickness, cy - thickness, cx + thickness, cy + thickness], fill=color)
+        bbox = [cx - wing, cy - lift - thickness, 2 * wing, lift + 2 * thickness]
+
+    elif object_type == 'cloud':
+        # La nube se dibuja y desenfoca en una capa del tamaño del objeto
+        cloud_width = rng.uniform(0.25, 0.5) * width
+        cloud_height = cloud_width * rng.uniform(0.2, 0.35)
+        pad = int(cloud_height * 0.3)
+        layer_size = (int(cloud_width) + 2 * pad, int(cloud_height) + 2 * pad)
+        mask = Image.new('L', layer_size, 0)
+        ImageDraw.Draw(mask).ellipse([pad, pad, pad + cloud_width, pad + cloud_height], fill=rng.randint(170, 230))
+        mask = mask.filter(ImageFilter.GaussianBlur(pad / 2))
+        shade = rng.randint(200, 240)
+        left, top = int(cx - layer_size[0] / 2), int(cy - layer_size[1] / 2)
+        img.paste((shade, shade, min(255, shade + 8)), (left, top), mask)
+        bbox = [left, top, layer_size[0], layer_size[1]]
+
+    elif object_type == 'disk':
+        radius = rng.uniform(20, 60) * scale
+        flat = radius * rng.uniform(0.25, 0.4)
+        metal = rng.randint(150, 200)
+        draw.ellipse([cx - radius * 0.45, cy - flat * 2.2, cx + radius * 0.45, cy + flat * 0.2],
+                     fill=(metal + 30, metal + 30, metal + 40))
+        draw.ellipse([cx - radius, cy - flat, cx + radius, cy + flat], fill=(metal, metal, metal + 10))
+        for step in range(-2, 3):
+            glow(draw, cx + step * radius * 0.35, cy + flat * 0.3, max(1, radius / 20), (255, 230, 150), rings=1)
+        bbox = [cx - radius, cy - flat * 2.2, 2 * radius, flat * 3.2]
+
+    else:
+        return None
+
+    return {'type': object_type, 'bbox': clamp_bbox(bbox, width, height)}
+
+
+def clamp_bbox(bbox, width, height):
+    x, y, w, h = bbox
+    x0, y0 = max(0, int(x)), max(0, int(y))
+    x1, y1 = min(width, int(math.ceil(x + w))), min(height, int(math.ceil(y + h)))
+    return [x0, y0, max(0, x1 - x0), max(0, y1 - y0)]
+
+
+def add_noise(img, sigma, rng):
+    """
+    Ruido gaussiano de sensor, reproducible con la semilla de la imagen:
+    bytes uniformes del generador -> gaussiana por tabla (inversa de la CDF)
+    """
+    if sigma <= 0:
+        return img
+    normal = NormalDist(128, sigma)
+    table = [max(0, min(255, round(normal.inv_cdf((value + 0.5) / 256)))) for value in range(256)]
+    noise = Image.frombytes('L', img.size, rng.randbytes(img.size[0] * img.size[1])).point(table)
+    noise = Image.merge('RGB', (noise, noise, noise))
+    return ImageChops.add(img, noise, scale=1.0, offset=-128)
+
+
+def apply_copy_move(img, rng):
+    """
+    Copiar un bloque de la imagen sobre otra zona sin solape (manipulación
+    copy-move). El bloque mide ~12% del lado menor para que sobreviva al
+    redimensionado a 1200 px del análisis forense. El destino queda casi a
+    la misma altura, donde el degradado del cielo disimula el bloque.
+    """
+    width, height = img.size
+    block = max(48, int(min(width, height) * rng.uniform(0.1, 0.16)))
+    for _ in range(20):
+        sx, sy = rng.randrange(width - block), rng.randrange(height - block)
+        tx = rng.randrange(width - block)
+        ty = min(height - block, max(0, sy + rng.randint(-block // 10, block // 10)))
+        if abs(sx - tx) >= block:
+            region = img.crop((sx, sy, sx + block, sy + block))
+            img.paste(region, (tx, ty))
+            return {'applied': True, 'source': [sx, sy, block, block], 'target': [tx, ty, block, block]}
+    return {'applied': False, 'source': None, 'target': None}
+
+
+def build_exif(variant, rng, size):
+    """Bytes EXIF de la variante y su descripción para el manifiesto"""
+    if variant == 'none':
+        return None, {'variant': 'none'}
+
+    make, model = rng.choice(CAMERAS)
+    taken = datetime(2023, 1, 1) + timedelta(seconds=rng.randrange(2 * 365 * 86400))
+    original = taken.strftime('%Y:%m:%d %H:%M:%S')
+    modified = original
+    software = f'{make} firmware 1.0'
+
+    if variant == 'edited':
+        software = rng.choice(EDITORS)
+        modified = (taken + timedelta(days=rng.randint(1, 90))).strftime('%Y:%m:%d %H:%M:%S')
+
+    exif_dict = {
+        '0th': {
+            piexif.ImageIFD.Make: make,
+            piexif.ImageIFD.Model: model,
+            piexif.ImageIFD.Software: software,
+            piexif.ImageIFD.DateTime: modified,
+        },
+        'Exif': {
+            piexif.ExifIFD.DateTimeOriginal: original,
+            piexif.ExifIFD.DateTimeDigitized: original,
+            piexif.ExifIFD.FocalLength: (rng.choice([24, 35, 50, 85, 200]), 1),
+            piexif.ExifIFD.FNumber: (rng.choice([18, 28, 40, 56]), 10),
+            piexif.ExifIFD.ExposureTime: (1, rng.choice([2, 15, 60, 250])),
+            piexif.ExifIFD.ISOSpeedRatings: rng.choice([100, 400, 800, 3200]),
+            piexif.ExifIFD.PixelXDimension: size[0],
+            piexif.ExifIFD.PixelYDimension: size[1],
+        },
+        'GPS': {}
+    }
+
+    info = {
+        'variant': variant,
+        'make': make,
+        'model': model,
+        'software': software,
+        'dateTimeOriginal': original,
+        'dateTime': modified,
+        'gps': None
+    }
+
+    if variant != 'no_gps':
+        lat = round(rng.uniform(-60, 70), 5)
+        lon = round(rng.uniform(-180, 180), 5)
+        gps_time = taken
+        if variant == 'time_mismatch':
+            # La hora GPS (UTC) no cuadra con la original en ninguna zona horaria
+            gps_time = taken + timedelta(hours=rng.randint(15, 40))
+        exif_dict['GPS'] = {
+            piexif.GPSIFD.GPSLatitudeRef: b'N' if lat >= 0 else b'S',
+            piexif.GPSIFD.GPSLatitude: decimal_to_dms(lat),
+            piexif.GPSIFD.GPSLongitudeRef: b'E' if lon >= 0 else b'W',
+            piexif.GPSIFD.GPSLongitude: decimal_to_dms(lon),
+            piexif.GPSIFD.GPSAltitude: (rng.randint(0, 2500), 1),
+            piexif.GPSIFD.GPSTimeStamp: ((gps_time.hour, 1), (gps_time.minute, 1), (gps_time.second, 1)),
+            piexif.GPSIFD.GPSDateStamp: gps_time.strftime('%Y:%m:%d').encode('utf-8'),
+        }
+        info['gps'] = {'latitude': lat, 'longitude': lon, 'dateTime': gps_time.strftime('%Y:%m:%d %H:%M:%S')}
+
+    return piexif.dump(exif_dict), info
+
+
+def generate_image(task):
+    """
+    Generar una imagen del corpus (se ejecuta en un proceso del pool)
+    @returns registro del manifiesto
+    """
+    index, options = task
+    seed = options['seed'] * 1_000_003 + index
+    rng = random.Random(seed)
+
+    size = rng.choice(options['sizes'])
+    object_type = rng.choice(options['types'])
+    background = rng.choice(BACKGROUNDS_FOR_TYPE[object_type])
+    count = 0 if object_type == 'none' else rng.randint(options['min_objects'], options['max_objects'])
+    noise_sigma = round(rng.uniform(*options['noise']), 2)
+    quality = rng.randint(*options['quality'])
+    exif_variant = rng.choice(options['exif'])
+    scale = min(size) / 600
+
+    img = render_background(size, background, rng)
+    objects = [obj for obj in (draw_object(img, object_type, rng, scale) for _ in range(count)) if obj]
+    img = add_noise(img, noise_sigma, rng)
+
+    # La manipulación va después del ruido: el bloque copiado lo conserva
+    copy_move = {'applied': False, 'source': None, 'target': None}
+    if rng.random() < options['copy_move']:
+        copy_move = apply_copy_move(img, rng)
+
+    exif_bytes, exif_info = build_exif(exif_variant, rng, size)
+
+    file_name = f'img_{index:06d}.jpg'
+    save_options = {'quality': quality}
+    if exif_bytes:
+        save_options['exif'] = exif_bytes
+    img.save(os.path.join(options['out'], file_name), 'jpeg', **save_options)
+
+    return {
+        'index': index,
+        'file': file_name,
+        'seed': seed,
+        'width': size[0],
+        'height': size[1],
+        'background': background,
+        'objectType': object_type,
+        'expectedCategory': OBJECT_TYPES[object_type],
+        'objectCount': len(objects),
+        'objects': objects,
+        'noiseSigma': noise_sigma,
+        'jpegQuality': quality,
+        'copyMove': copy_move,
+        'exif': exif_info
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generador de corpus sintético con ground truth')
+    parser.add_argument('--count', type=int, default=1000, help='Número de imágenes')
+    parser.add_argument('--out', default='/tmp/uap_corpus', help='Directorio de salida')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Procesos en paralelo')
+    parser.add_argument('--seed', type=int, default=42, help='Semilla base')
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes(DEFAULT_SIZES),
+                        help=f'Resoluciones ANCHOxALTO separadas por comas, máx. 24 MP (defecto: {DEFAULT_SIZES})')
+    parser.add_argument('--types', type=parse_types, default=list(OBJECT_TYPES),
+                        help=f"Tipos de objeto (defecto: {','.join(OBJECT_TYPES)})")
+    parser.add_argument('--objects', type=lambda text: parse_range(text, int), default=(1, 3),
+                        help='Objetos por imagen, p. ej. 1-3 (defecto: 1-3)')
+    parser.add_argument('--noise', type=parse_range, default=(0, 10),
+                        help='Sigma del ruido gaussiano, p. ej. 0-10 (defecto: 0-10)')
+    parser.add_argument('--quality', type=lambda text: parse_range(text, int), default=(70, 95),
+                        help='Calidad JPEG, p. ej. 70-95 (defecto: 70-95)')
+    parser.add_argument('--copy-move', type=float, default=0.3,
+                        help='Probabilidad de inyectar una región copy-move (defecto: 0.3)')
+    parser.add_argument('--exif', default=','.join(EXIF_VARIANTS),
+                        help=f"Variantes EXIF (defecto: {','.join(EXIF_VARIANTS)})")
+    args = parser.parse_args()
+
+    exif_variants = [item.strip() for item in args.exif.split(',') if item.strip()]
+    invalid = [item for item in exif_variants if item not in EXIF_VARIANTS]
+    if invalid:
+        parser.error(f"Variantes EXIF desconocidas: {', '.join(invalid)}")
+    if args.objects[0] < 1:
+        parser.error('--objects debe empezar en 1 o más (usa --types none para cielos vacíos)')
+
+    os.makedirs(args.out, exist_ok=True)
+    options = {
+        'out': args.out,
+        'seed': args.seed,
+        'sizes': args.sizes,
+        'types': args.types,
+        'min_objects': args.objects[0],
+        'max_objects': args.objects[1],
+        'noise': args.noise,
+        'quality': args.quality,
+        'copy_move': args.copy_move,
+        'exif': exif_variants
+    }
+
+    print(f'🎨 Generando {args.count} imágenes en {args.out} ({args.workers} procesos, semilla {args.seed})')
+    start = time.time()
+    records = []
+    tasks = ((index, options) for index in range(args.count))
+
+    with Pool(args.workers) as pool:
+        for record in pool.imap_unordered(generate_image, tasks, chunksize=4):
+            records.append(record)
+            if len(records) % 100 == 0 or len(records) == args.count:
+                elapsed = time.time() - start
+                print(f'   {len(records)}/{args.count} ({len(records) / elapsed:.1f} img/s)', flush=True)
+
+    records.sort(key=lambda record: record['index'])
+    with open(os.path.join(args.out, 'manifest.jsonl'), 'w', encoding='utf-8') as manifest:
+        for record in records:
+            manifest.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    summary = {
+        'version': 1,
+        'generatedAt': datetime.now().isoformat(timespec='seconds'),
+        'count': len(records),
+        'options': {key: value for key, value in options.items() if key != 'out'},
+        'byType': {},
+        'byExif': {},
+        'copyMove': sum(1 for record in records if record['copyMove']['applied'])
+    }
+    for record in records:
+        summary['byType'][record['objectType']] = summary['byType'].get(record['objectType'], 0) + 1
+        variant = record['exif']['variant']
+        summary['byExif'][variant] = summary['byExif'].get(variant, 0) + 1
+    with open(os.path.join(args.out, 'corpus.json'), 'w', encoding='utf-8') as corpus:
+        json.dump(summary, corpus, indent=2, ensure_ascii=False)
+
+    elapsed = time.time() - start
+    print(f'✅ {len(records)} imágenes en {elapsed:.1f}s ({len(records) / elapsed:.1f} img/s)')
+    print(f"📋 Manifiesto: {os.path.join(args.out, 'manifest.jsonl')}")
+    print(f"   Tipos: {summary['byType']}")
+    print(f"   Copy-move: {summary['copyMove']} · EXIF: {summary['byExif']}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
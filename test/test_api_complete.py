@@ -2,13 +2,30 @@
 """
 Script de prueba automático para validar todas las 9 capas del sistema UAP Analysis
 Sube una imagen vía API y valida cada componente del análisis
+
+Modos:
+  python3 test/test_api_complete.py                 Validación de las 9 capas (un usuario)
+  python3 test/test_api_complete.py load [...]      Prueba de carga con usuarios virtuales
+  python3 test/test_api_complete.py compare A B     Comparar dos resultados de carga
+
+Ver `python3 test/test_api_complete.py load --help`.
 """
 
-import requests
+import argparse
+import asyncio
 import json
+import math
+import platform
+import sys
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 
+import requests
+
 # Configuración
 BASE_URL = "http://localhost:3000"
 TEST_IMAGE = "/tmp/test_uap_nyc.jpg"
@@ -461,7 +478,7 @@ def print_final_summary(results):
         print(f"\n{Colors.RED}{Colors.BOLD}❌ Sistema con problemas - Revisar logs{Colors.RESET}\n")
         return False
 
-def main():
+def run_validation():
     print_header("🧪 PRUEBA AUTOMÁTICA - Sistema UAP Analysis")
     print(f"{Colors.CYAN}Validando 9 capas de análisis con imagen de prueba{Colors.RESET}\n")
     
@@ -521,12 +538,673 @@ def main():
         print(f"{Colors.GREEN}📄 Ver análisis completo: cat {output_file} | jq .{Colors.RESET}")
         print(f"{Colors.GREEN}🌐 Interfaz web: http://localhost:3000{Colors.RESET}\n")
 
+
+# ==================== MODO CARGA ====================
+#
+# Varios usuarios virtuales (uno por hilo, lanzados desde asyncio según el
+# perfil de subida) repiten subir → analizar → esperar el final. El final se
+# detecta consultando /status (--completion poll) o con los eventos
+# WebSocket del análisis (--completion ws, requiere python-socketio); los
+# resultados de cada modo se registran por separado y compare avisa si se
+# mezclan. Los tiempos por capa salen de la telemetría del servidor
+# (timings.spans de /status) y, con WebSocket, también de la llegada de
+# cada evento layer_complete al cliente.
+
+RESULTS_VERSION = 1
+PERCENTILES = (50, 90, 95, 99)
+
+# Campos de analysisData que deben existir al completar. Training (sin casos
+# previos) y Meteorológica (sin API key) pueden faltar, como en la validación
+LAYER_FIELDS = [
+    ('Capa 1: EXIF', 'exifData'),
+    ('Capa 2: Visual AI', 'aiAnalysis'),
+    ('Capa 3: Forense', 'forensicAnalysis'),
+    ('Capa 4: Científica', 'scientificComparison'),
+    ('Capa 6: Externa', 'externalValidation'),
+    ('Capa 8: Atmosférica', 'atmosphericComparison'),
+    ('Capa 9: Confianza', 'confidence'),
+]
+
+
+def percentile(sorted_values, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(values):
+    """Resumen de latencias (ms): número, media, percentiles y máximo"""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {'count': 0}
+    summary = {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 1),
+        'min': round(values[0], 1),
+    }
+    for p in PERCENTILES:
+        summary[f'p{p}'] = round(percentile(values, p), 1)
+    summary['max'] = round(values[-1], 1)
+    return summary
+
+
+def start_offsets(users, profile, ramp, steps):
+    """Segundo de arranque de cada usuario virtual según el perfil de subida"""
+    if profile == 'constant' or ramp <= 0:
+        return [0.0] * users
+    if profile == 'linear':
+        return [ramp * i / users for i in range(users)]
+    # 'step': escalones iguales repartidos a lo largo de la subida
+    steps = max(1, min(steps, users))
+    return [ramp * math.floor(i * steps / users) / steps for i in range(users)]
+
+
+class LoadError(Exception):
+    """Fallo ya clasificado (el mensaje es el tipo de error)"""
+
+
+def classify_error(stage, response=None, error=None):
+    if isinstance(error, LoadError):
+        return str(error)
+    if response is not None:
+        return f'{stage}:http_{response.status_code}'
+    if error is not None:
+        return f'{stage}:{type(error).__name__}'
+    return stage
+
+
+class LoadRecorder:
+    """Muestras de todas las iteraciones (compartido entre hilos)"""
+
+    def __init__(self, run_start):
+        self.run_start = run_start
+        self.samples = []
+        self.requests = 0
+        self.active = {}      # vu -> [inicio, fin] relativos al arranque
+        self.lock = threading.Lock()
+
+    def now(self):
+        return time.monotonic() - self.run_start
+
+    def add(self, sample):
+        with self.lock:
+            self.samples.append(sample)
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def user_started(self, vu):
+        with self.lock:
+            self.active[vu] = [self.now(), None]
+
+    def user_stopped(self, vu):
+        with self.lock:
+            self.active[vu][1] = self.now()
+
+    def snapshot(self):
+        with self.lock:
+            completed = sum(1 for s in self.samples if s['status'] == 'completed')
+            failed = len(self.samples) - completed
+            active = sum(1 for _, end in self.active.values() if end is None)
+            return completed, failed, active
+
+
+class WebSocketWatcher:
+    """Conexión Socket.IO de un usuario virtual: eventos de sus análisis"""
+
+    def __init__(self, base_url, token):
+        import socketio  # Opcional: pip install "python-socketio[client]"
+
+        self.watches = {}
+        self.lock = threading.Lock()
+        self.client = socketio.Client(reconnection=False)
+        self.client.on('*', self.on_event)
+        self.client.connect(base_url, auth={'token': token}, transports=['websocket'])
+
+    def watch(self, analysis_id, started_at):
+        """Suscribirse antes de lanzar el análisis (sin carrera con los eventos)"""
+        watch = {'startedAt': started_at, 'layers': {}, 'done': threading.Event(), 'result': None}
+        with self.lock:
+            self.watches[analysis_id] = watch
+        ack = self.client.call('subscribe', {'analysisId': analysis_id}, timeout=10)
+        if not ack or not ack.get('ok'):
+            raise LoadError('subscribe:rejected')
+        return watch
+
+    def on_event(self, event, data=None):
+        if not isinstance(data, dict) or not str(event).startswith('analysis:'):
+            return
+        with self.lock:
+            watch = self.watches.get(str(data.get('analysisId')))
+        if not watch:
+            return
+
+        elapsed_ms = (time.monotonic() - watch['startedAt']) * 1000
+        if data.get('type') == 'layer_complete':
+            name = (data.get('layer') or {}).get('name')
+            watch['layers'].setdefault(name, round(elapsed_ms, 1))
+        elif data.get('type') in ('complete', 'error'):
+            watch['result'] = data.get('type')
+            watch['done'].set()
+
+    def forget(self, analysis_id):
+        with self.lock:
+            self.watches.pop(analysis_id, None)
+        try:
+            self.client.emit('unsubscribe', {'analysisId': analysis_id})
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+class VirtualUser:
+    """Un usuario que repite subir → analizar → esperar hasta el final de la prueba"""
+
+    def __init__(self, index, config, recorder, image_bytes):
+        self.index = index
+        self.config = config
+        self.recorder = recorder
+        self.image_bytes = image_bytes
+        self.session = requests.Session()
+        self.watcher = None
+
+    def request(self, method, path, **kwargs):
+        self.recorder.count_request()
+        return self.session.request(method, f"{self.config.base_url}{path}",
+                                    timeout=self.config.request_timeout, **kwargs)
+
+    def register(self):
+        suffix = f"{self.config.run_id}_{self.index}"
+        response = self.request('POST', '/api/auth/register', json={
+            'username': f"load_{suffix}",
+            'email': f"load_{suffix}@test.com",
+            'password': 'test123456'
+        })
+        if response.status_code != 201:
+            raise LoadError(classify_error('register', response))
+        token = response.json().get('token')
+        self.session.headers['Authorization'] = f"Bearer {token}"
+
+        if self.config.completion == 'ws':
+            self.watcher = WebSocketWatcher(self.config.base_url, token)
+
+    def image_payload(self):
+        if not self.config.unique_images:
+            return self.image_bytes
+        # Bytes tras el marcador EOI: la imagen no cambia, pero su SHA-256 sí
+        # (cada subida pasa por todas las capas sin la caché por contenido)
+        return self.image_bytes + uuid.uuid4().bytes
+
+    def run(self, deadline):
+        self.recorder.user_started(self.index)
+        try:
+            self.register()
+        except Exception as error:
+            self.recorder.add({
+                'vu': self.index, 'iteration': 0, 'startedAt': round(self.recorder.now(), 3),
+                'status': 'error', 'error': classify_error('register', error=error)
+            })
+            self.recorder.user_stopped(self.index)
+            return
+
+        iteration = 0
+        try:
+            while time.monotonic() < deadline:
+                if self.config.iterations and iteration >= self.config.iterations:
+                    break
+                iteration += 1
+                self.recorder.add(self.run_iteration(iteration))
+                if self.config.think_time > 0:
+                    time.sleep(self.config.think_time)
+        finally:
+            if self.watcher:
+                self.watcher.close()
+            self.recorder.user_stopped(self.index)
+
+    def run_iteration(self, iteration):
+        sample = {
+            'vu': self.index,
+            'iteration': iteration,
+            'startedAt': round(self.recorder.now(), 3),
+            'status': 'error',
+            'error': None,
+            'polls': 0
+        }
+        t0 = time.monotonic()
+        analysis_id = None
+
+        try:
+            # Subida
+            files = {'file': ('load_test.jpg', self.image_payload(), 'image/jpeg')}
+            response = self.request('POST', '/api/uploads', files=files,
+                                    data={'title': f'Prueba de carga {self.config.run_id}'})
+            sample['uploadMs'] = round((time.monotonic() - t0) * 1000, 1)
+            if response.status_code not in (200, 201):
+                sample['error'] = classify_error('upload', response)
+                return sample
+            analysis_id = str(response.json().get('analysis', {}).get('id'))
+
+            # Análisis (con WebSocket, suscrito antes de lanzarlo)
+            t_analyze = time.monotonic()
+            watch = self.watcher.watch(analysis_id, t_analyze) if self.watcher else None
+            response = self.request('POST', f'/api/analyze/{analysis_id}')
+            sample['analyzeMs'] = round((time.monotonic() - t_analyze) * 1000, 1)
+            if response.status_code not in (200, 201):
+                sample['error'] = classify_error('analyze', response)
+                return sample
+
+            # Espera del final
+            if watch:
+                status_data = self.wait_websocket(watch, analysis_id, t_analyze, sample)
+            else:
+                status_data = self.wait_polling(analysis_id, t_analyze, sample)
+            if status_data is None:
+                return sample
+
+            sample['endToEndMs'] = round((time.monotonic() - t0) * 1000, 1)
+            if status_data.get('status') != 'completed':
+                sample['error'] = 'analysis:error'
+                sample['errorMessage'] = (status_data.get('errorMessage') or '')[:200]
+                return sample
+
+            analysis_data = status_data.get('analysisData') or {}
+            sample['missingLayers'] = [name for name, field in LAYER_FIELDS if analysis_data.get(field) is None]
+            sample['layers'] = {
+                span['name']: span.get('ms')
+                for span in ((status_data.get('timings') or {}).get('spans') or [])
+                if span.get('kind') == 'layer'
+            }
+            sample['status'] = 'completed'
+            return sample
+
+        except Exception as error:
+            sample['error'] = classify_error('request', error=error)
+            return sample
+        finally:
+            sample['finishedAt'] = round(self.recorder.now(), 3)
+            if self.watcher and analysis_id:
+                self.watcher.forget(analysis_id)
+
+    def fetch_status(self, analysis_id, sample):
+        sample['polls'] += 1
+        response = self.request('GET', f'/api/analyze/{analysis_id}/status')
+        return response.json() if response.status_code == 200 else None
+
+    def wait_polling(self, analysis_id, t_analyze, sample):
+        deadline = t_analyze + self.config.analysis_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.config.poll_interval)
+            status_data = self.fetch_status(analysis_id, sample)
+            if status_data and status_data.get('status') in ('completed', 'error'):
+                sample['completionMs'] = round((time.monotonic() - t_analyze) * 1000, 1)
+                return status_data
+        sample['error'] = 'analysis:timeout'
+        return None
+
+    def wait_websocket(self, watch, analysis_id, t_analyze, sample):
+        remaining = t_analyze + self.config.analysis_timeout - time.monotonic()
+        if not watch['done'].wait(max(0, remaining)):
+            sample['error'] = 'analysis:timeout'
+            return None
+        sample['completionMs'] = round((time.monotonic() - t_analyze) * 1000, 1)
+        sample['clientLayers'] = dict(watch['layers'])
+        # Una sola lectura para validar las capas y traer los tiempos del servidor
+        status_data = self.fetch_status(analysis_id, sample)
+        if status_data is None:
+            sample['error'] = 'status:unavailable'
+        return status_data
+
+
+async def monitor(recorder, stop, interval=10):
+    """Progreso periódico por consola"""
+    last_completed = 0
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        completed, failed, active = recorder.snapshot()
+        rate = (completed - last_completed) * 60 / interval
+        last_completed = completed
+        print(f"  t={recorder.now():6.0f}s  usuarios activos: {active:3d}  "
+              f"completados: {completed:5d}  errores: {failed:4d}  (~{rate:.1f}/min)")
+
+
+async def run_load(config, image_bytes):
+    recorder = LoadRecorder(time.monotonic())
+    deadline = recorder.run_start + config.duration
+    offsets = start_offsets(config.users, config.profile, config.ramp, config.steps)
+    users = [VirtualUser(i, config, recorder, image_bytes) for i in range(config.users)]
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    monitor_task = asyncio.create_task(monitor(recorder, stop))
+
+    with ThreadPoolExecutor(max_workers=config.users) as executor:
+        async def launch(user, offset):
+            await asyncio.sleep(offset)
+            if time.monotonic() < deadline:
+                await loop.run_in_executor(executor, user.run, deadline)
+
+        await asyncio.gather(*(launch(user, offset) for user, offset in zip(users, offsets)))
+
+    stop.set()
+    await monitor_task
+    return recorder, recorder.now()
+
+
+def build_results(config, recorder, elapsed, started_at):
+    samples = recorder.samples
+    completed = [s for s in samples if s['status'] == 'completed']
+    iterations = [s for s in samples if s.get('iteration', 0) > 0]
+
+    # Rendimiento: análisis completados dentro de la ventana de la prueba
+    in_window = [s for s in completed if s['finishedAt'] <= config.duration]
+    steady = [s for s in in_window if s['startedAt'] >= config.ramp]
+    steady_window = config.duration - config.ramp
+
+    errors = {}
+    for sample in samples:
+        if sample['status'] != 'completed':
+            errors[sample['error']] = errors.get(sample['error'], 0) + 1
+
+    layer_names = sorted({name for s in completed for name in (s.get('layers') or {})})
+    client_layer_names = sorted({name for s in completed for name in (s.get('clientLayers') or {})})
+
+    # Línea de tiempo por cubetas: usuarios activos, completados, errores, p50
+    timeline = []
+    bucket = config.bucket
+    for start in range(0, int(math.ceil(max(elapsed, 1) / bucket)) * bucket, bucket):
+        end = start + bucket
+        finished = [s for s in samples if s.get('finishedAt') is not None and start <= s['finishedAt'] < end]
+        done = [s for s in finished if s['status'] == 'completed']
+        active = sum(1 for begin, stop in recorder.active.values()
+                     if begin < end and (stop is None or stop > start))
+        timeline.append({
+            't': start,
+            'activeUsers': active,
+            'completed': len(done),
+            'errors': len(finished) - len(done),
+            'p50EndToEndMs': summarize([s.get('endToEndMs') for s in done]).get('p50')
+        })
+
+    results = {
+        'version': RESULTS_VERSION,
+        'tool': 'test/test_api_complete.py load',
+        'runId': config.run_id,
+        'label': config.label,
+        'startedAt': started_at,
+        'finishedAt': datetime.now(timezone.utc).isoformat(),
+        'config': {
+            'baseUrl': config.base_url,
+            'users': config.users,
+            'profile': config.profile,
+            'rampSec': config.ramp,
+            'steps': config.steps,
+            'durationSec': config.duration,
+            'iterationsPerUser': config.iterations,
+            'thinkTimeSec': config.think_time,
+            'completion': config.completion,
+            'pollIntervalSec': config.poll_interval if config.completion == 'poll' else None,
+            'analysisTimeoutSec': config.analysis_timeout,
+            'uniqueImages': config.unique_images,
+            'image': config.image,
+            'imageBytes': len(config.image_bytes)
+        },
+        'environment': {
+            'client': platform.node(),
+            'python': platform.python_version()
+        },
+        'summary': {
+            'elapsedSec': round(elapsed, 1),
+            'iterations': len(iterations),
+            'completed': len(completed),
+            'failed': len(samples) - len(completed),
+            'errorRate': round((len(samples) - len(completed)) / len(samples), 4) if samples else 0,
+            'incompleteLayers': sum(1 for s in completed if s.get('missingLayers')),
+            'throughputPerMin': round(len(in_window) * 60 / config.duration, 2),
+            'steadyThroughputPerMin': round(len(steady) * 60 / steady_window, 2) if steady_window > 0 else None,
+            'httpRequests': recorder.requests,
+            'statusRequestsPerAnalysis': round(sum(s.get('polls', 0) for s in completed) / len(completed), 1) if completed else None
+        },
+        'latency': {
+            'upload': summarize([s.get('uploadMs') for s in samples]),
+            'analyzeRequest': summarize([s.get('analyzeMs') for s in samples]),
+            'completion': summarize([s.get('completionMs') for s in completed]),
+            'endToEnd': summarize([s.get('endToEndMs') for s in completed])
+        },
+        'layers': {
+            name: summarize([(s.get('layers') or {}).get(name) for s in completed])
+            for name in layer_names
+        },
+        'clientLayers': {
+            name: summarize([(s.get('clientLayers') or {}).get(name) for s in completed])
+            for name in client_layer_names
+        },
+        'errors': errors,
+        'timeline': timeline
+    }
+    if config.samples:
+        results['samples'] = samples
+    return results
+
+
+def format_latency(summary):
+    if not summary.get('count'):
+        return 'sin datos'
+    return (f"p50 {summary['p50']:.0f}ms · p95 {summary['p95']:.0f}ms · "
+            f"p99 {summary['p99']:.0f}ms · máx {summary['max']:.0f}ms (n={summary['count']})")
+
+
+def print_load_report(results):
+    summary = results['summary']
+    print_header("RESULTADOS DE LA PRUEBA DE CARGA")
+
+    print_info("Usuarios", f"{results['config']['users']} ({results['config']['profile']}, subida {results['config']['rampSec']}s)")
+    print_info("Final del análisis", results['config']['completion'])
+    print_info("Duración", f"{summary['elapsedSec']}s")
+    print_info("Análisis completados", summary['completed'])
+    print_info("Fallidos", f"{summary['failed']} ({summary['errorRate'] * 100:.1f}%)")
+    print_info("Rendimiento", f"{summary['throughputPerMin']} análisis/min")
+    if summary['steadyThroughputPerMin'] is not None:
+        print_info("Rendimiento tras la subida", f"{summary['steadyThroughputPerMin']} análisis/min")
+    print_info("Peticiones HTTP", summary['httpRequests'])
+    if summary['incompleteLayers']:
+        print_check(False, f"{summary['incompleteLayers']} análisis completados sin todas las capas")
+
+    print(f"\n{Colors.BOLD}Latencias{Colors.RESET}")
+    for name, value in results['latency'].items():
+        print(f"  {name:16s} {format_latency(value)}")
+
+    if results['layers']:
+        print(f"\n{Colors.BOLD}Capas (servidor){Colors.RESET}")
+        for name, value in results['layers'].items():
+            print(f"  {name:28s} {format_latency(value)}")
+
+    if results['clientLayers']:
+        print(f"\n{Colors.BOLD}Capas (llegada del evento WebSocket){Colors.RESET}")
+        for name, value in results['clientLayers'].items():
+            print(f"  {name:28s} {format_latency(value)}")
+
+    if results['errors']:
+        print(f"\n{Colors.BOLD}Errores{Colors.RESET}")
+        for kind, count in sorted(results['errors'].items(), key=lambda item: -item[1]):
+            print(f"  {Colors.RED}{kind}{Colors.RESET}: {count}")
+
+
+def command_load(args):
+    if args.completion == 'ws':
+        try:
+            import socketio  # noqa: F401
+        except ImportError:
+            print(f"{Colors.RED}❌ --completion ws requiere python-socketio: pip install \"python-socketio[client]\"{Colors.RESET}")
+            return 2
+
+    if not Path(args.image).exists():
+        print(f"{Colors.RED}❌ Imagen no encontrada: {args.image} (generarla con test/create_test_image.py){Colors.RESET}")
+        return 2
+
+    args.base_url = args.base_url.rstrip('/')
+    args.run_id = datetime.now().strftime('%Y%m%d%H%M%S') + '_' + uuid.uuid4().hex[:6]
+    args.image_bytes = Path(args.image).read_bytes()
+    args.ramp = min(args.ramp, args.duration)
+
+    print_header("🚦 PRUEBA DE CARGA - Sistema UAP Analysis")
+    print_info("Servidor", args.base_url)
+    print_info("Usuarios virtuales", f"{args.users} (perfil {args.profile}, subida {args.ramp}s)")
+    print_info("Duración", f"{args.duration}s")
+    print_info("Final del análisis", 'eventos WebSocket' if args.completion == 'ws' else f'consulta de /status cada {args.poll_interval}s')
+    print()
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    recorder, elapsed = asyncio.run(run_load(args, args.image_bytes))
+    results = build_results(args, recorder, elapsed, started_at)
+
+    print_load_report(results)
+
+    output = args.output or f"/tmp/uap_load_{args.run_id}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n{Colors.GREEN}📄 Resultados guardados en {output}{Colors.RESET}")
+    print(f"{Colors.GREEN}   Comparar con otra ejecución: python3 test/test_api_complete.py compare <base.json> {output}{Colors.RESET}\n")
+    return 0
+
+
+# ==================== COMPARACIÓN DE EJECUCIONES ====================
+
+# (nombre, ruta en el JSON, True si más alto es mejor)
+COMPARED_METRICS = [
+    ('Rendimiento (análisis/min)', ('summary', 'throughputPerMin'), True),
+    ('Rendimiento tras la subida', ('summary', 'steadyThroughputPerMin'), True),
+    ('Tasa de error', ('summary', 'errorRate'), False),
+    ('Final del análisis p50', ('latency', 'completion', 'p50'), False),
+    ('Final del análisis p95', ('latency', 'completion', 'p95'), False),
+    ('Final del análisis p99', ('latency', 'completion', 'p99'), False),
+    ('Extremo a extremo p50', ('latency', 'endToEnd', 'p50'), False),
+    ('Extremo a extremo p95', ('latency', 'endToEnd', 'p95'), False),
+    ('Subida p95', ('latency', 'upload', 'p95'), False),
+]
+
+
+def dig(data, path):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def command_compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print_header("COMPARACIÓN DE PRUEBAS DE CARGA")
+    print_info("Base", f"{args.base} ({base.get('label') or base.get('runId')})")
+    print_info("Candidata", f"{args.candidate} ({candidate.get('label') or candidate.get('runId')})")
+
+    # Solo son comparables ejecuciones con la misma carga
+    for key in ('users', 'profile', 'rampSec', 'durationSec', 'completion', 'uniqueImages', 'imageBytes'):
+        if base['config'].get(key) != candidate['config'].get(key):
+            print(f"{Colors.YELLOW}⚠️  Configuración distinta: {key} = {base['config'].get(key)} → {candidate['config'].get(key)}{Colors.RESET}")
+    print()
+
+    metrics = list(COMPARED_METRICS)
+    for name in sorted(set(base.get('layers', {})) & set(candidate.get('layers', {}))):
+        metrics.append((f'Capa {name} p95', ('layers', name, 'p95'), False))
+
+    regressions = 0
+    print(f"  {'Métrica':36s} {'Base':>12s} {'Candidata':>12s} {'Cambio':>9s}")
+    for label, path, higher_is_better in metrics:
+        old, new = dig(base, path), dig(candidate, path)
+        if old is None or new is None:
+            continue
+
+        # Desde 0 (p. ej. la tasa de error) cualquier subida es un cambio infinito
+        if old == 0:
+            change = 0.0 if new == 0 else math.inf
+        else:
+            change = (new - old) / abs(old) * 100
+        worse = change < -args.tolerance if higher_is_better else change > args.tolerance
+        better = change > args.tolerance if higher_is_better else change < -args.tolerance
+
+        color = Colors.RED if worse else Colors.GREEN if better else ''
+        change_text = '∞' if math.isinf(change) else f"{change:+.1f}%"
+        print(f"  {label:36s} {old:>12} {new:>12} {color}{change_text:>9s}{Colors.RESET}")
+        regressions += worse
+
+    print()
+    if regressions:
+        print(f"{Colors.RED}{Colors.BOLD}❌ {regressions} métricas empeoran más de un {args.tolerance}%{Colors.RESET}\n")
+        return 1
+    print(f"{Colors.GREEN}{Colors.BOLD}✅ Sin regresiones por encima del {args.tolerance}%{Colors.RESET}\n")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Pruebas del sistema UAP Analysis: validación de capas, carga y comparación")
+    commands = parser.add_subparsers(dest='command')
+
+    commands.add_parser('validate', help="Validar las 9 capas con un usuario (por defecto)")
+
+    load = commands.add_parser('load', help="Prueba de carga con usuarios virtuales concurrentes")
+    load.add_argument('--base-url', default=BASE_URL, help=f"Servidor (por defecto {BASE_URL})")
+    load.add_argument('--image', default=TEST_IMAGE, help=f"Imagen a subir (por defecto {TEST_IMAGE})")
+    load.add_argument('--users', type=int, default=10, help="Usuarios virtuales (por defecto 10)")
+    load.add_argument('--profile', choices=['constant', 'linear', 'step'], default='linear',
+                      help="Arranque de los usuarios: todos a la vez, uno a uno o por escalones")
+    load.add_argument('--ramp', type=int, default=30, help="Segundos de subida hasta tener todos los usuarios (por defecto 30)")
+    load.add_argument('--steps', type=int, default=4, help="Escalones del perfil 'step' (por defecto 4)")
+    load.add_argument('--duration', type=int, default=120, help="Segundos de prueba; los análisis en curso terminan después (por defecto 120)")
+    load.add_argument('--iterations', type=int, default=0, help="Máximo de análisis por usuario (0 = sin límite)")
+    load.add_argument('--think-time', type=float, default=0, help="Pausa entre análisis de un usuario (s)")
+    load.add_argument('--completion', choices=['poll', 'ws'], default='poll',
+                      help="Detectar el final consultando /status o con eventos WebSocket")
+    load.add_argument('--poll-interval', type=float, default=1.0, help="Segundos entre consultas de /status (por defecto 1)")
+    load.add_argument('--analysis-timeout', type=int, default=300, help="Segundos máximos por análisis (por defecto 300)")
+    load.add_argument('--request-timeout', type=int, default=60, help="Segundos máximos por petición HTTP (por defecto 60)")
+    load.add_argument('--shared-images', dest='unique_images', action='store_false',
+                      help="Subir siempre los mismos bytes (la caché por contenido responde tras el primero)")
+    load.add_argument('--bucket', type=int, default=10, help="Segundos por cubeta de la línea de tiempo (por defecto 10)")
+    load.add_argument('--label', default=None, help="Etiqueta de la ejecución (p. ej. commit o cambio probado)")
+    load.add_argument('--output', default=None, help="Fichero JSON de resultados (por defecto /tmp/uap_load_<id>.json)")
+    load.add_argument('--samples', action='store_true', help="Incluir cada iteración en el JSON")
+
+    compare = commands.add_parser('compare', help="Comparar dos resultados de carga")
+    compare.add_argument('base', help="JSON de la ejecución de referencia")
+    compare.add_argument('candidate', help="JSON de la ejecución a evaluar")
+    compare.add_argument('--tolerance', type=float, default=10,
+                         help="Cambio porcentual tolerado antes de contar una regresión (por defecto 10)")
+
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.command == 'load':
+        return command_load(args)
+    if args.command == 'compare':
+        return command_compare(args)
+    run_validation()
+    return 0
+
 if __name__ == "__main__":
     try:
-        main()
+        sys.exit(main())
     except KeyboardInterrupt:
         print(f"\n\n{Colors.YELLOW}⚠️  Prueba interrumpida por el usuario{Colors.RESET}\n")
+        sys.exit(130)
     except Exception as e:
         print(f"\n\n{Colors.RED}❌ Error inesperado: {e}{Colors.RESET}\n")
         import traceback
         traceback.print_exc()
+        sys.exit(1)